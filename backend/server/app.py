@@ -134,6 +134,7 @@ def ensure_schema_upgrades():
             'mem_free': 'BIGINT',
             'hdd_total': 'BIGINT',
             'hdd_free': 'BIGINT',
+            'radius_last_seen_at': 'TIMESTAMP',
         },
         'customers': {
             'fup_throttled': 'BOOLEAN DEFAULT FALSE NOT NULL',
@@ -150,6 +151,8 @@ def ensure_schema_upgrades():
         'isps': {
             'account_number_prefix': 'VARCHAR(12)',
             'account_number_seq': 'INTEGER DEFAULT 100000',
+            # Per-tenant invoice numbering (services/invoice_batch).
+            'invoice_number_seq': 'INTEGER DEFAULT 0',
             # Self-serve onboarding: permanent account address + operating locale.
             'slug': 'VARCHAR(63)',
             'country': 'VARCHAR(2)',
@@ -185,6 +188,22 @@ def ensure_schema_upgrades():
             'longitude': 'DOUBLE PRECISION',
             'fiber_node_id': 'INTEGER',
         },
+        'fiber_nodes': {
+            # Spatial grid cell (services/fiber_spatial).
+            'grid_cell': 'INTEGER',
+        },
+        'fiber_cables': {
+            # Path bounding box (services/fiber_spatial).
+            'min_lat': 'DOUBLE PRECISION',
+            'min_lng': 'DOUBLE PRECISION',
+            'max_lat': 'DOUBLE PRECISION',
+            'max_lng': 'DOUBLE PRECISION',
+        },
+        'snmp_devices': {
+            # Scheduled polling (services/snmp_poller).
+            'poll_interval': 'INTEGER DEFAULT 300',
+            'next_poll_at': 'TIMESTAMP',
+        },
         'users': {
             'two_factor_enabled': 'BOOLEAN DEFAULT FALSE NOT NULL',
             'two_factor_secret': 'TEXT',
@@ -238,24 +257,139 @@ def ensure_schema_upgrades():
                 'CREATE UNIQUE INDEX IF NOT EXISTS uq_isps_slug '
                 'ON isps (lower(slug)) WHERE slug IS NOT NULL'
             ))
+            # Usage rollup refresh (services/usage_rollup.py): finds rows whose
+            # interim update landed since the last run, then recomputes one
+            # login's day of sessions.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_radacct_acctupdatetime '
+                'ON radacct (acctupdatetime)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_radacct_lower_username_start '
+                'ON radacct (lower(username), acctstarttime)'
+            ))
+            # The open-session registry. Every "who is online" read
+            # (services/session_tracking, the dashboard, the session lists)
+            # filters on acctstoptime IS NULL; a partial index holds exactly
+            # those rows, so they never walk closed history. FreeRADIUS's own
+            # start/interim/stop writes keep it current — a row leaves the
+            # index the moment its stop time is set.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_radacct_open_isp_nas '
+                'ON radacct (isp_id, nasipaddress, acctupdatetime) '
+                'WHERE acctstoptime IS NULL'
+            ))
+            # link_unattributed_sessions runs on read paths and only wants
+            # rows FreeRADIUS could not resolve to a customer.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_radacct_unattributed '
+                'ON radacct (radacctid) WHERE customer_id IS NULL'
+            ))
+            # Dashboard snapshot (services/dashboard_snapshot.py): the payment
+            # pass reads a date window and joins to the tenant's customers.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_payments_payment_date '
+                'ON payments (payment_date)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_payments_customer_id '
+                'ON payments (customer_id)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_customers_isp_id '
+                'ON customers (isp_id)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_invoices_isp_status '
+                'ON invoices (isp_id, status)'
+            ))
+            # Login resolution (find_customer_by_login) matches the lowered
+            # login without a tenant, which the (isp_id, ...) unique index
+            # above cannot serve.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_customers_lower_radius_login '
+                'ON customers (lower(radius_login))'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_customers_lower_email_no_login '
+                'ON customers (lower(email)) WHERE radius_login IS NULL'
+            ))
+            # Keyset paging of the customer list (routes/customers.get_customers)
+            # walks (created_at, id) inside one tenant.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_customers_isp_created_id '
+                'ON customers (isp_id, created_at, id)'
+            ))
+            # The SNMP poller writes a sample per OID per device per poll;
+            # reads are always one device's recent history.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_snmp_poll_results_device_time '
+                'ON snmp_poll_results (snmp_device_id, poll_time)'
+            ))
+            # Fiber map viewports (services/fiber_spatial): nodes by grid
+            # cell, cables by path bounding box, ONTs and pinned customers by
+            # coordinate range.
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_fiber_nodes_isp_grid_cell '
+                'ON fiber_nodes (isp_id, grid_cell)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_fiber_cables_isp_bbox '
+                'ON fiber_cables (isp_id, min_lat, max_lat)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_cpe_devices_isp_lat_lng '
+                'ON cpe_devices (isp_id, latitude, longitude)'
+            ))
+            conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_customers_isp_lat_lng '
+                'ON customers (isp_id, latitude, longitude)'
+            ))
 
         # New tables ship without migrations too: create_all() only runs from the
         # `initdb` CLI command, so an existing deployment never grows a table on
         # boot. checkfirst=True makes this a no-op once they exist.
         from models import (
-            CpeDevice, CpeFirmware, CpeSession, CpeTask, ImportCandidate, ImportRun,
+            CpeDevice, CpeFirmware, CpeSession, CpeTask, ImportCandidate, ImportRun, ImportRunChunk,
             FiberCable, FiberNode, FiberSplice,
             OnboardingSignup, PlatformInvoice,
+            UsageRollupDaily, UsageRollupState,
+            DeviceSyncRun, DeviceSyncResult,
+            InvoiceRun,
+            CustomerImportJob, CustomerImportError,
+            MetricBucket,
+            JobRun,
         )
-        for model in (ImportRun, ImportCandidate,
+        for model in (ImportRun, ImportCandidate, ImportRunChunk,
                       CpeDevice, CpeTask, CpeSession, CpeFirmware,
                       OnboardingSignup, PlatformInvoice,
                       # Nodes first: cables and splices reference them.
-                      FiberNode, FiberCable, FiberSplice):
+                      FiberNode, FiberCable, FiberSplice,
+                      UsageRollupDaily, UsageRollupState,
+                      DeviceSyncRun, DeviceSyncResult,
+                      InvoiceRun,
+                      CustomerImportJob, CustomerImportError,
+                      MetricBucket,
+                      JobRun):
             model.__table__.create(bind=db.engine, checkfirst=True)
     except Exception as exc:  # DB may not be ready yet (first boot runs initdb)
         app.logger.warning('Schema upgrade check skipped: %s', exc)
 
+    # The customer search is ILIKE '%term%' on name, email and phone, which no
+    # btree can serve; trigram GIN indexes can. Postgres-only, and pg_trgm may
+    # need a superuser the app role isn't — then search just stays a scan.
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                for column in ('full_name', 'email', 'phone'):
+                    conn.execute(text(
+                        f'CREATE INDEX IF NOT EXISTS ix_customers_{column}_trgm '
+                        f'ON customers USING gin ({column} gin_trgm_ops)'
+                    ))
+        except Exception as exc:
+            app.logger.warning('Customer search indexes skipped: %s', exc)
+
 
 def backfill_account_numbers():
     """Assign account numbers to any customers that predate the column.
@@ -312,6 +446,40 @@ def backfill_isp_slugs():
         app.logger.warning('ISP slug backfill skipped: %s', exc)
 
 
+def backfill_fiber_spatial():
+    """Give fiber nodes and cables saved before the spatial columns existed
+    their grid cell and path bounding box (services/fiber_spatial).
+
+    Idempotent: only touches rows whose cell or box is still NULL.
+    """
+    try:
+        from services.fiber_spatial import backfill_spatial_columns
+
+        nodes, cables = backfill_spatial_columns()
+        if nodes or cables:
+            app.logger.info('Backfilled spatial index for %d fiber nodes, %d cables', nodes, cables)
+    except Exception as exc:
+        db.session.rollback()
+        app.logger.warning('Fiber spatial backfill skipped: %s', exc)
+
+
+def ensure_radacct_partitions():
+    """Make sure the coming months of a partitioned radacct exist.
+
+    A no-op until `flask radacct-partitions --migrate` has run, and on SQLite.
+    purge-retention does the same daily; this covers an install without cron.
+    """
+    try:
+        from services.radacct_partitions import ensure_partitions
+
+        created = ensure_partitions()
+        if created:
+            app.logger.info('Created radacct partitions %s', ', '.join(created))
+    except Exception as exc:
+        db.session.rollback()
+        app.logger.warning('radacct partition check skipped: %s', exc)
+
+
 def purge_legacy_radius_accept_rows():
     """Clear ``Auth-Type := Accept`` rows written by earlier builds.
 
@@ -354,10 +522,25 @@ with app.app_context():
     ensure_schema_upgrades()
     backfill_account_numbers()
     backfill_isp_slugs()
+    backfill_fiber_spatial()
+    ensure_radacct_partitions()
     purge_legacy_radius_accept_rows()
     purge_demo_accounting_rows()
 
 
+@app.before_request
+def start_job_scheduler():
+    """Start this worker's background job scheduler on its first request.
+
+    Every gunicorn worker starts one and only the lease holder runs jobs (see
+    services/job_scheduler.py). Starting here rather than at import keeps the
+    thread out of ``flask`` CLI commands and the dev server's reloader parent.
+    A no-op after the first call.
+    """
+    from services.job_scheduler import start
+    start(app)
+
+
 @app.before_request
 def serve_webfig_when_host_matches():
     """Proxy the whole origin to a router's WebFig on webfig-<id>.* hostnames.
@@ -574,8 +757,18 @@ def purge_retention_command(dry_run):
 def enforce_expiry_command(grace_hours):
     """Suspend expired customers and remove RADIUS access (cron: */15 * * * *)."""
     with app.app_context():
-        count = enforce_expired_subscriptions(grace_hours=grace_hours)
+        from services.hotspot_disconnect import KickQueue
+
+        kicks = KickQueue()
+        count = enforce_expired_subscriptions(grace_hours=grace_hours, kick_queue=kicks)
         click.echo(f'Expired subscriptions enforced: {count} customer(s) suspended.')
+        report = kicks.flush()
+        for router in report['routers']:
+            click.echo(f"  kick {router['device_name']}: {router['usernames']} login(s), "
+                       f"{'ok' if router['ok'] else 'FAILED'} in {router['latency_ms']} ms"
+                       + (f" ({router['error']})" if router['error'] else ''))
+        if report['without_session']:
+            click.echo(f"  {report['without_session']} login(s) had no open session to kick.")
 
 
 @app.cli.command('issue-subscription-invoices')
@@ -604,8 +797,53 @@ def enforce_fup_command():
         result = apply_fup_enforcement()
         click.echo(
             f"FUP enforcement: {result['throttled']} throttled, "
-            f"{result['restored']} restored."
+            f"{result['restored']} restored, {result['cleared']} cleared; "
+            f"kicked on {result['routers_kicked']}/{result['routers_total']} router(s)."
         )
+        click.echo('Timings (ms): ' + ', '.join(
+            f'{phase}={ms}' for phase, ms in result['timings_ms'].items()
+        ))
+
+
+@app.cli.command('usage-rollup')
+@click.option('--backfill-days', default=None, type=int,
+              help='Rebuild the rollup for the last N days (run once to enable it)')
+@click.option('--check', is_flag=True,
+              help='Compare the rollup with radacct for each FUP reset cycle')
+def usage_rollup_command(backfill_days, check):
+    """Keep the per-day FUP usage rollup current (cron: */5 * * * *)."""
+    from services.fup_monitoring import fup_period_start
+    from services.usage_rollup import (
+        backfill_usage_rollup, check_usage_rollup, refresh_usage_rollup,
+    )
+
+    with app.app_context():
+        if backfill_days is not None:
+            result = backfill_usage_rollup(days=backfill_days)
+            click.echo(f"Usage rollup backfilled from {result['covers_from']}: "
+                       f"{result['buckets']} bucket(s).")
+        else:
+            # Refresh before a check too, so cron lag is not reported as drift.
+            result = refresh_usage_rollup()
+            if result is None:
+                click.echo('Usage rollup not initialised; run with --backfill-days 40 first.')
+                raise SystemExit(1)
+            click.echo(f"Usage rollup refreshed: {result['buckets']} bucket(s), "
+                       f"high-water radacctid {result['high_water']}.")
+
+        if check:
+            failed = False
+            for cycle in ('daily', 'weekly', 'monthly'):
+                report = check_usage_rollup(fup_period_start(cycle))
+                if not report['covered']:
+                    click.echo(f'{cycle}: not covered by the rollup (raw aggregation used)')
+                    continue
+                click.echo(f"{cycle}: {len(report['mismatches'])} mismatch(es)")
+                for item in report['mismatches'][:20]:
+                    click.echo(f"  {item['key']}: rollup={item['rollup']} raw={item['raw']}")
+                failed = failed or bool(report['mismatches'])
+            if failed:
+                raise SystemExit(1)
 
 
 @app.cli.command('verify-deployment')
@@ -670,10 +908,13 @@ def diagnose_device_command(device):
 
 @app.cli.command('generate-radius-clients')
 @click.option('--output', default=None, help='Write to file (default: config/freeradius/clients.conf)')
-def generate_radius_clients_command(output):
+@click.option('--force', is_flag=True, help='Write even if the clients are unchanged (restarts radiusd)')
+def generate_radius_clients_command(output, force):
     """Export radius_clients + mikrotik_devices to FreeRADIUS clients.conf."""
     import os
-    from services.radius_clients_export import generate_clients_conf, sync_radius_clients_conf
+    from services.radius_clients_export import (
+        clients_conf_metrics, generate_clients_conf, sync_radius_clients_conf,
+    )
 
     with app.app_context():
         if output:
@@ -681,10 +922,93 @@ def generate_radius_clients_command(output):
             os.makedirs(os.path.dirname(output), exist_ok=True)
             with open(output, 'w', encoding='utf-8') as fh:
                 fh.write(content)
-            path = output
+            click.echo(f'Wrote {output}')
+            return
+        writes = clients_conf_metrics()['writes']
+        path = sync_radius_clients_conf(force=force)
+        if clients_conf_metrics()['writes'] > writes:
+            click.echo(f'Wrote {path}')
         else:
-            path = sync_radius_clients_conf()
-        click.echo(f'Wrote {path}')
+            click.echo(f'{path} is up to date (no clients changed)')
+
+
+@app.cli.command('sync-devices')
+@click.option('--isp-id', default=None, type=int, help='Only this tenant\'s routers')
+def sync_devices_command(isp_id):
+    """Sync every active router concurrently, printing each as it finishes."""
+    from collections import Counter
+    from services.device_sweep import iter_bulk_sync
+
+    with app.app_context():
+        outcomes = Counter()
+        for result in iter_bulk_sync(app, isp_id=isp_id):
+            outcomes[result['outcome']] += 1
+            click.echo(f"{result['device_id']:>6}  {result['device_name'] or '-':<30} "
+                       f"{result['outcome']:<12} {result['elapsed_ms'] or 0:>6} ms"
+                       + (f"  {result['error']}" if result['error'] else ''))
+        click.echo('Device sync: ' + (', '.join(
+            f'{n} {outcome}' for outcome, n in sorted(outcomes.items())
+        ) or 'no active routers') + '.')
+
+
+@app.cli.command('poll-snmp')
+def poll_snmp_command():
+    """Poll every SNMP device that is due (cron, e.g. every minute)."""
+    from services.snmp_poller import poll_due_devices
+
+    with app.app_context():
+        result = poll_due_devices()
+        click.echo(f"SNMP poll: {result['polled']} devices, {result['failed']} failed, "
+                   f"{result['samples']} samples")
+
+
+@app.cli.command('downsample-metrics')
+@click.option('--dry-run', is_flag=True, help='Report counts without folding')
+def downsample_metrics_command(dry_run):
+    """Fold aged device metric buckets into coarser ones (cron: hourly)."""
+    from services.metric_series import downsample
+
+    with app.app_context():
+        result = downsample(dry_run=dry_run)
+        click.echo(f"Metric series: {result['folded']} buckets folded, {result['pruned']} pruned")
+
+
+@app.cli.command('radacct-partitions')
+@click.option('--migrate', is_flag=True, help='Move an unpartitioned radacct onto monthly partitions')
+@click.option('--batch', default=50_000, type=int, help='Rows copied per commit while migrating')
+@click.option('--dry-run', is_flag=True, help='Report what would be archived without detaching')
+def radacct_partitions_command(migrate, batch, dry_run):
+    """Monthly radacct partitions: migrate, create ahead, archive aged months."""
+    from services.radacct_partitions import (
+        archive_partitions, ensure_partitions, migrate_to_partitioned,
+    )
+
+    with app.app_context():
+        if migrate:
+            migrate_to_partitioned(batch=batch, echo=click.echo)
+        if not dry_run:
+            created = ensure_partitions()
+            click.echo(f"Partitions created: {', '.join(created) or 'none'}")
+        result = archive_partitions(dry_run=dry_run)
+        click.echo(f"Archived: {', '.join(result['archived']) or 'none'}; "
+                   f"kept (open sessions): {', '.join(result['kept_open']) or 'none'}; "
+                   f"dropped: {', '.join(result['dropped']) or 'none'}")
+
+
+@app.cli.command('rotate-encryption-key')
+@click.option('--batch', default=500, type=int, help='Rows re-encrypted per commit')
+@click.option('--dry-run', is_flag=True, help='Report counts without writing')
+def rotate_encryption_key_command(batch, dry_run):
+    """Re-encrypt stored secrets under ENCRYPTION_KEY (old key in ENCRYPTION_KEY_PREVIOUS)."""
+    from services.key_rotation import rotate_encrypted_columns
+
+    with app.app_context():
+        summary = rotate_encrypted_columns(batch=batch, dry_run=dry_run)
+        for table, counts in summary.items():
+            click.echo(f"{table}: {counts['rotated']} rows re-encrypted, "
+                       f"{counts['unreadable']} values unreadable")
+        if any(counts['unreadable'] for counts in summary.values()):
+            raise SystemExit(1)
 
 
 @app.cli.command('sync-wireguard-stats')
@@ -697,51 +1021,59 @@ def sync_wireguard_stats_command():
         click.echo(f'WireGuard stats sync: {result}')
 
 
-def _start_expiry_scheduler(app):
-    """Optional in-process expiry enforcement when SUBSCRIPTION_ENFORCEMENT_INTERVAL is set."""
-    interval = app.config.get('SUBSCRIPTION_ENFORCEMENT_INTERVAL')
-    if not interval:
-        return
-
-    import threading
-    import time
+@app.cli.command('run-job')
+@click.argument('name')
+def run_job_command(name):
+    """Run one scheduled job now, under its lock (cron alternative to the scheduler)."""
+    from services.job_scheduler import default_jobs, run_job
 
-    def _loop():
-        while True:
-            time.sleep(int(interval))
-            with app.app_context():
-                try:
-                    enforce_expired_subscriptions(
-                        grace_hours=app.config.get('SUBSCRIPTION_GRACE_HOURS', 0)
-                    )
-                except Exception as exc:
-                    app.logger.warning('expiry enforcement failed: %s', exc)
+    jobs = {job.name: job for job in default_jobs(app.config)}
+    if name not in jobs:
+        raise click.BadParameter(f"unknown job; one of: {', '.join(jobs)}", param_hint='NAME')
+    with app.app_context():
+        run = run_job(jobs[name])
+        if run is None:
+            click.echo(f'{name}: skipped, a run is already in progress')
+            return
+        click.echo(f'{name}: {run.status} in {run.duration_ms} ms'
+                   + (f' ({run.result})' if run.result else '')
+                   + (f' — {run.error}' if run.error else ''))
+        if run.status == 'failed':
+            raise SystemExit(1)
 
-    thread = threading.Thread(target=_loop, daemon=True, name='subscription-expiry')
-    thread.start()
 
+@app.cli.command('rate-limit-stats')
+def rate_limit_stats_command():
+    """Requests seen and denied per rate-limit scope, busiest first."""
+    from services.rate_limit import stats
 
-def _start_fup_scheduler(app):
-    """Optional in-process FUP throttle enforcement when FUP_ENFORCEMENT_INTERVAL is set."""
-    interval = app.config.get('FUP_ENFORCEMENT_INTERVAL')
-    if not interval:
-        return
+    with app.app_context():
+        rows = sorted(stats().items(), key=lambda item: -item[1]['hits'])
+        if app.config.get('RATE_LIMIT_BACKEND') != 'sqlite':
+            click.echo('(in-process counters: this command only sees its own process)')
+        for scope, counts in rows:
+            click.echo(f"{scope:<32} {counts['hits']:>10} hits {counts['denied']:>10} denied")
 
-    import threading
-    import time
-    from services.fup_enforcement import apply_fup_enforcement
 
-    def _loop():
-        while True:
-            time.sleep(int(interval))
-            with app.app_context():
-                try:
-                    apply_fup_enforcement()
-                except Exception as exc:
-                    app.logger.warning('FUP enforcement failed: %s', exc)
+@app.cli.command('jobs')
+def jobs_command():
+    """List scheduled jobs with their interval, last run and durations."""
+    from services.job_scheduler import default_jobs, job_status
 
-    thread = threading.Thread(target=_loop, daemon=True, name='fup-enforcement')
-    thread.start()
+    with app.app_context():
+        for row in job_status(default_jobs(app.config)):
+            every = f"every {row['interval']}s" if row['interval'] else 'off'
+            if row['last_started_at'] is None:
+                click.echo(f"{row['job']:<22} {every:<12} never run")
+                continue
+            click.echo(
+                f"{row['job']:<22} {every:<12} {row['last_status']} "
+                f"{row['last_started_at']:%Y-%m-%d %H:%M:%S} on {row['last_host']}, "
+                f"{row['last_duration_ms']} ms (mean {row['mean_duration_ms']}, "
+                f"max {row['max_duration_ms']}, {row['recent_failures']} recent failures)"
+            )
+            if row['last_error']:
+                click.echo(f"{'':<22} {row['last_error']}")
 
 
 @app.route('/portal', defaults={'path': ''})
@@ -764,6 +1096,4 @@ def redirect_portal_to_frontend(path):
 
 
 if __name__ == "__main__":
-    _start_expiry_scheduler(app)
-    _start_fup_scheduler(app)
     app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
@@ -8,6 +8,9 @@ class Config:
     # App  Configuration
     SECRET_KEY = os.getenv('SECRET_KEY')
     ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', SECRET_KEY)
+    # Keys values may still be encrypted under, newest first, while
+    # `flask rotate-encryption-key` re-encrypts them (services/encryption.py).
+    ENCRYPTION_KEY_PREVIOUS = os.getenv('ENCRYPTION_KEY_PREVIOUS', '')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
@@ -40,11 +43,90 @@ class Config:
     # services/mpesa_service.py from the effective environment (sandbox vs live),
     # which may be overridden per-ISP in Settings > Payments.
 
-    # Subscription expiry (optional background thread; prefer cron: flask enforce-expiry)
+    # Background jobs (services/job_scheduler.py): every worker runs a
+    # scheduler thread, but only the one holding the lease starts jobs, so each
+    # runs once however many workers and hosts there are. Each job's interval
+    # is in seconds, 0 = off (cron with `flask run-job <name>` instead). The
+    # tick is how often the lease and the clock are checked; jitter is the
+    # fraction of an interval a next run is randomly pushed back by.
+    JOB_SCHEDULER_ENABLED = os.getenv('JOB_SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    JOB_SCHEDULER_TICK = int(os.getenv('JOB_SCHEDULER_TICK', '15') or '15')
+    JOB_SCHEDULER_JITTER = float(os.getenv('JOB_SCHEDULER_JITTER', '0.1') or '0.1')
+    # Days of job_runs history kept (purge-retention).
+    JOB_RUN_RETENTION_DAYS = int(os.getenv('JOB_RUN_RETENTION_DAYS', '30') or '30')
+    # Subscription expiry (job enforce-expiry; or cron: flask enforce-expiry)
     SUBSCRIPTION_ENFORCEMENT_INTERVAL = int(os.getenv('SUBSCRIPTION_ENFORCEMENT_INTERVAL', '0') or '0')
     SUBSCRIPTION_GRACE_HOURS = int(os.getenv('SUBSCRIPTION_GRACE_HOURS', '0') or '0')
-    # FUP throttle enforcement (optional background thread; prefer cron: flask enforce-fup)
+    # FUP throttle enforcement (job enforce-fup; or cron: flask enforce-fup)
     FUP_ENFORCEMENT_INTERVAL = int(os.getenv('FUP_ENFORCEMENT_INTERVAL', '0') or '0')
+    # FUP usage rollup refresh (job usage-rollup; or cron: flask usage-rollup).
+    # The FUP monitor only reads the rollup, so this is how far behind it runs.
+    USAGE_ROLLUP_REFRESH_INTERVAL = int(os.getenv('USAGE_ROLLUP_REFRESH_INTERVAL', '300') or '300')
+    # WireGuard peer counters (job sync-wireguard-stats) and data retention
+    # (job purge-retention); both also available as CLI commands for cron.
+    WIREGUARD_STATS_INTERVAL = int(os.getenv('WIREGUARD_STATS_INTERVAL', '0') or '0')
+    RETENTION_PURGE_INTERVAL = int(os.getenv('RETENTION_PURGE_INTERVAL', '0') or '0')
+    # How often due sales digests are looked for (job sales-digest). Each
+    # tenant's own daily/weekly frequency decides when one is actually sent.
+    SALES_DIGEST_INTERVAL = int(os.getenv('SALES_DIGEST_INTERVAL', '900') or '900')
+    # Days of per-subscriber daily usage kept for FUP (services/usage_rollup.py);
+    # pruned by purge-retention. Never below 35 — a monthly cycle must fit.
+    USAGE_ROLLUP_RETENTION_DAYS = int(os.getenv('USAGE_ROLLUP_RETENTION_DAYS', '62') or '62')
+    # Monthly radacct partitions (services/radacct_partitions.py, once
+    # `flask radacct-partitions --migrate` has run): months created ahead,
+    # months kept attached before purge-retention moves them to the archive
+    # schema (0 = never: every month stays in every query's reach), and months
+    # an archived one is kept (0 = forever). A year stays hot for the reports.
+    RADACCT_PARTITIONS_AHEAD = int(os.getenv('RADACCT_PARTITIONS_AHEAD', '3') or '3')
+    RADACCT_HOT_MONTHS = int(os.getenv('RADACCT_HOT_MONTHS', '12') or '12')
+    RADACCT_ARCHIVE_SCHEMA = os.getenv('RADACCT_ARCHIVE_SCHEMA', 'radacct_archive')
+    RADACCT_ARCHIVE_DROP_MONTHS = int(os.getenv('RADACCT_ARCHIVE_DROP_MONTHS', '0') or '0')
+    # Seconds an Overview dashboard snapshot is served before it is recomputed
+    # (services/dashboard_snapshot.py). Customer, payment and invoice writes
+    # invalidate it sooner; 0 disables the cache.
+    DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv('DASHBOARD_CACHE_TTL_SECONDS', '30') or '30')
+    # Seconds fiber fault suspects are served from cache
+    # (services/fiber_fault_cache.py). Plant edits and ONT readings crossing a
+    # health band invalidate them sooner; 0 disables the cache.
+    FIBER_FAULTS_CACHE_TTL_SECONDS = int(os.getenv('FIBER_FAULTS_CACHE_TTL_SECONDS', '300') or '300')
+    # Bulk router sync (services/device_sweep.py): routers polled at once in
+    # total, at most this many per ISP, and how long to wait on a router another
+    # operation is already using before reporting it busy.
+    DEVICE_SYNC_WORKERS = int(os.getenv('DEVICE_SYNC_WORKERS', '16') or '16')
+    DEVICE_SYNC_PER_ISP = int(os.getenv('DEVICE_SYNC_PER_ISP', '4') or '4')
+    DEVICE_SYNC_LOCK_WAIT = int(os.getenv('DEVICE_SYNC_LOCK_WAIT', '5') or '5')
+    # SNMP polling (services/snmp_poller.py): devices polled at once, and the
+    # interval of the poll-snmp job (0 = off; or cron: flask poll-snmp).
+    SNMP_POLL_WORKERS = int(os.getenv('SNMP_POLL_WORKERS', '32') or '32')
+    SNMP_POLL_TICK = int(os.getenv('SNMP_POLL_TICK', '0') or '0')
+    # Raw SNMP samples are kept this long (purge-retention); history beyond
+    # it is in the downsampled metric series (services/metric_series.py),
+    # whose 1-minute, 5-minute and hourly buckets are kept this long each.
+    SNMP_POLL_RESULT_RETENTION_DAYS = int(os.getenv('SNMP_POLL_RESULT_RETENTION_DAYS', '7') or '7')
+    METRIC_MINUTE_RETENTION_HOURS = int(os.getenv('METRIC_MINUTE_RETENTION_HOURS', '48') or '48')
+    METRIC_5MIN_RETENTION_DAYS = int(os.getenv('METRIC_5MIN_RETENTION_DAYS', '14') or '14')
+    METRIC_HOURLY_RETENTION_DAYS = int(os.getenv('METRIC_HOURLY_RETENTION_DAYS', '400') or '400')
+    # Warm SSH sessions to routers (services/ssh_pool.py): an idle session is
+    # closed after this many seconds and any session after the max lifetime,
+    # so reboots and tunnel re-keys are picked up. 0 disables pooling.
+    MIKROTIK_SSH_POOL_IDLE_SECONDS = int(os.getenv('MIKROTIK_SSH_POOL_IDLE_SECONDS', '60') or '60')
+    MIKROTIK_SSH_POOL_MAX_LIFETIME_SECONDS = int(
+        os.getenv('MIKROTIK_SSH_POOL_MAX_LIFETIME_SECONDS', '600') or '600'
+    )
+    # Fallback RADIUS auth (services/radius_auth_cache.py): how long a login's
+    # resolution and a password's verifier are reused. Commits to customers,
+    # ISPs and routers invalidate them early; 0 disables either cache.
+    RADIUS_AUTH_CACHE_TTL_SECONDS = int(os.getenv('RADIUS_AUTH_CACHE_TTL_SECONDS', '30') or '30')
+    RADIUS_AUTH_PASSWORD_TTL_SECONDS = int(
+        os.getenv('RADIUS_AUTH_PASSWORD_TTL_SECONDS', '60') or '60'
+    )
+    # Request rate limits (services/rate_limit.py): 'sqlite' keeps the counters
+    # in a local file every gunicorn worker on the host shares, so a limit is
+    # not multiplied by the worker count; 'memory' keeps them per process, at
+    # most RATE_LIMIT_MAX_KEYS buckets.
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'sqlite')
+    RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', '/tmp/infora-rate-limit.sqlite3')
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000') or '100000')
     RADIUS_SECRET = os.getenv('RADIUS_SECRET', 'radius_secret_key')
     FREERADIUS_HOST = os.getenv('FREERADIUS_HOST', '10.0.0.10')
     WIREGUARD_CONFIG_DIR = os.getenv(
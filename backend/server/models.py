@@ -422,6 +422,9 @@ class MikrotikDevice(db.Model):
     provision_token_expires_at = db.Column(db.DateTime, nullable=True)
     provision_last_fetched_at = db.Column(db.DateTime, nullable=True)
     provision_fetch_count = db.Column(db.Integer, default=0, nullable=False)
+    # Newest RADIUS accounting seen from this NAS (services/device_liveness),
+    # kept so a status check need not aggregate radacct.
+    radius_last_seen_at = db.Column(db.DateTime, nullable=True)
     # JSON blob of applied service config (pppoe/hotspot/bridge ports/subnet)
     service_config = db.Column(db.Text, nullable=True)
     # JSON blob of dual-WAN load-balancing / failover config (see services.load_balancing)
@@ -1771,6 +1774,10 @@ class SnmpDevice(db.Model):
     retries = db.Column(db.Integer, default=3)
     is_active = db.Column(db.Boolean, default=True)
     last_poll = db.Column(db.DateTime, nullable=True)
+    # Scheduled polling (services/snmp_poller): seconds between polls, and
+    # when this device is next due. NULL next_poll_at = poll on the next tick.
+    poll_interval = db.Column(db.Integer, nullable=True, default=300)
+    next_poll_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
     
@@ -2047,6 +2054,17 @@ class RadAcct(db.Model):
     isp = db.relationship('ISP')
     customer = db.relationship('Customer', back_populates="radacct_rows")
     mikrotik_device = db.relationship('MikrotikDevice')
+
+    # Open sessions only (see app.ensure_schema_upgrades): a few thousand rows
+    # however much closed history the table holds.
+    __table_args__ = (
+        db.Index('ix_radacct_open_isp_nas', 'isp_id', 'nasipaddress', 'acctupdatetime',
+                 postgresql_where=db.text('acctstoptime IS NULL'),
+                 sqlite_where=db.text('acctstoptime IS NULL')),
+        db.Index('ix_radacct_unattributed', 'radacctid',
+                 postgresql_where=db.text('customer_id IS NULL'),
+                 sqlite_where=db.text('customer_id IS NULL')),
+    )
     
     def __repr__(self):
         return f"<RadAcct {self.username} ({self.acctsessionid})>"
@@ -2161,6 +2179,9 @@ class ISP(db.Model):
     # atomically incremented per issued number (see radius_provisioning).
     account_number_prefix = db.Column(db.String(12), nullable=True)
     account_number_seq = db.Column(db.Integer, default=100000, nullable=True)
+    # Last invoice number issued (INV-<isp id>-<seq>); bumped under a row lock
+    # a whole batch at a time (see services/invoice_batch).
+    invoice_number_seq = db.Column(db.Integer, default=0, nullable=True)
 
     # --- Operator automation (Settings > Operator alerts) ---
     # Crediting downtime back to subscribers, and the revenue digest. Both are
@@ -2342,11 +2363,43 @@ class ImportRun(db.Model):
     candidates = db.relationship(
         'ImportCandidate', back_populates='run', cascade='all, delete-orphan'
     )
+    chunks = db.relationship(
+        'ImportRunChunk', back_populates='run', cascade='all, delete-orphan', passive_deletes=True
+    )
 
     def __repr__(self):
         return f'<ImportRun {self.id} {self.source} {self.status}>'
 
 
+class ImportRunChunk(db.Model):
+    """One verbatim upload from the agent script, keyed by ``(run, key, seq)``.
+
+    A row per chunk rather than a JSON map in ``ImportRun.raw_blob``: a router
+    with thousands of secrets sends hundreds of chunks, and re-encoding the
+    whole map on every upload made ingestion quadratic. The unique key makes a
+    retried upload overwrite instead of duplicate, and is the order the chunks
+    are read back in. Holds the same secrets as the raw blob and goes with the
+    run.
+    """
+    __tablename__ = 'import_run_chunks'
+    __table_args__ = (
+        db.UniqueConstraint('run_id', 'key', 'seq', name='uq_import_run_chunks_run_key_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('import_runs.id', ondelete='CASCADE'),
+                       nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+    body = db.Column(db.Text, nullable=False, default='')
+    created_at = db.Column(db.DateTime, server_default=db.func.current_timestamp())
+
+    run = db.relationship('ImportRun', back_populates='chunks')
+
+    def __repr__(self):
+        return f'<ImportRunChunk {self.run_id} {self.key}:{self.seq}>'
+
+
 class ImportCandidate(db.Model):
     """One discovered subscriber, staged for operator review before it is real.
 
@@ -2400,6 +2453,61 @@ class ImportCandidate(db.Model):
         return f'<ImportCandidate {self.login or self.mac} {self.status}>'
 
 
+class CustomerImportJob(db.Model):
+    """A CSV client import running in the background (services/customer_import_jobs).
+
+    ``processed_rows`` only moves forward in the same transaction as the
+    customers and error rows of the chunk it covers, so a job that died
+    resumes from exactly where its last commit left it.
+    """
+    __tablename__ = 'customer_import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'running' | 'completed' | 'failed'
+    status = db.Column(db.String(20), nullable=False, default='running')
+    # default_status / plan_map / create_plans / auto_create_plans, as JSON.
+    options = db.Column(db.Text, nullable=True)
+    # The uploaded CSV, kept so the job can be resumed. Deferred: progress
+    # polls never need it.
+    source = db.deferred(db.Column(db.Text, nullable=False))
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    needs_reconfigure = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Start of the current attempt and the row it started from (for the ETA).
+    attempt_started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempt_start_row = db.Column(db.Integer, nullable=False, default=0)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    isp_id = db.Column(db.Integer, db.ForeignKey('isps.id'), nullable=False, index=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    def __repr__(self):
+        return f'<CustomerImportJob {self.id} {self.status} {self.processed_rows}/{self.total_rows}>'
+
+
+class CustomerImportError(db.Model):
+    """One CSV row a CustomerImportJob could not create, and why."""
+    __tablename__ = 'customer_import_errors'
+    __table_args__ = (
+        db.Index('ix_customer_import_errors_job_row', 'job_id', 'row_number'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('customer_import_jobs.id', ondelete='CASCADE'),
+                       nullable=False)
+    row_number = db.Column(db.Integer, nullable=False)
+    messages = db.Column(db.Text, nullable=False)  # JSON list
+    data = db.Column(db.Text, nullable=True)       # JSON preview of the row
+
+    def __repr__(self):
+        return f'<CustomerImportError {self.job_id}:{self.row_number}>'
+
+
 # =========================
 #   Self-serve onboarding
 # =========================
@@ -2775,6 +2883,11 @@ class FiberNode(db.Model):
     address = db.Column(db.String(255), nullable=True)
     notes = db.Column(db.Text, nullable=True)
 
+    # Fixed-grid cell of (latitude, longitude), kept in step on every save by
+    # services/fiber_spatial. Viewport and nearest-node queries read cells
+    # through (isp_id, grid_cell) instead of loading the whole plant.
+    grid_cell = db.Column(db.Integer, nullable=True)
+
     zone_id = db.Column(db.Integer, db.ForeignKey('network_zones.id', ondelete='SET NULL'),
                         nullable=True)
     # An OLT is often a managed router/switch we already poll.
@@ -2789,6 +2902,10 @@ class FiberNode(db.Model):
     zone = db.relationship('NetworkZone')
     device = db.relationship('MikrotikDevice')
 
+    __table_args__ = (
+        db.Index('ix_fiber_nodes_isp_grid_cell', 'isp_id', 'grid_cell'),
+    )
+
     def __repr__(self):
         return f'<FiberNode {self.kind}:{self.name}>'
 
@@ -2823,6 +2940,12 @@ class FiberCable(db.Model):
     slack_m = db.Column(db.Float, nullable=True)
 
     path = db.Column(db.Text, nullable=True)  # JSON [[lat, lng], ...]
+    # Bounding box of `path`, kept in step by services/fiber_spatial, so "which
+    # cables cross this area" is an indexed range test before any JSON parse.
+    min_lat = db.Column(db.Float, nullable=True)
+    min_lng = db.Column(db.Float, nullable=True)
+    max_lat = db.Column(db.Float, nullable=True)
+    max_lng = db.Column(db.Float, nullable=True)
 
     installation = db.Column(db.String(20), default='aerial')  # aerial|buried|duct
     status = db.Column(db.String(20), default='active')        # planned|active|fault|retired
@@ -2835,6 +2958,10 @@ class FiberCable(db.Model):
     from_node = db.relationship('FiberNode', foreign_keys=[from_node_id])
     to_node = db.relationship('FiberNode', foreign_keys=[to_node_id])
 
+    __table_args__ = (
+        db.Index('ix_fiber_cables_isp_bbox', 'isp_id', 'min_lat', 'max_lat'),
+    )
+
     def __repr__(self):
         return f'<FiberCable {self.name or self.id} {self.cable_type}>'
 
@@ -2895,3 +3022,229 @@ class FiberSplice(db.Model):
 
     def __repr__(self):
         return f'<FiberSplice node={self.node_id} port={self.port_number}>'
+
+
+# =========================
+#   Usage rollup (FUP)
+# =========================
+
+class UsageRollupDaily(db.Model):
+    """Octets per subscriber per day, summed from radacct.
+
+    Derived data, maintained by services/usage_rollup.py and always rebuildable
+    from radacct — which is why there are no foreign keys: deleting a customer
+    must not have to reach in here, and a stale bucket is fixed by a refresh,
+    not a cascade. A session is bucketed on the day it *started*, matching the
+    raw ``acctstarttime >= period_start`` aggregation the FUP monitor used
+    before, so the two agree to the byte.
+    """
+    __tablename__ = 'usage_rollup_daily'
+
+    id = db.Column(db.Integer, primary_key=True)
+    isp_id = db.Column(db.Integer, nullable=True, index=True)
+    # NULL until link_unattributed_sessions resolves the session's owner.
+    customer_id = db.Column(db.Integer, nullable=True, index=True)
+    # Lower-cased RADIUS login, as radius_username() produces it.
+    username = db.Column(db.String(64), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    input_octets = db.Column(db.BigInteger, nullable=False, default=0)
+    output_octets = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_usage_rollup_daily_day_isp', 'day', 'isp_id'),
+        db.Index('ix_usage_rollup_daily_username_day', 'username', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<UsageRollupDaily {self.username} {self.day}>'
+
+
+class UsageRollupState(db.Model):
+    """Single-row cursor for the incremental usage rollup.
+
+    ``last_radacctid`` is the high-water mark for new sessions; interim updates
+    to older rows are found through ``last_refreshed_at``. ``covers_from`` is
+    the first day the rollup is complete for — a FUP period starting earlier
+    falls back to aggregating radacct directly.
+    """
+    __tablename__ = 'usage_rollup_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_radacctid = db.Column(db.BigInteger, nullable=False, default=0)
+    last_refreshed_at = db.Column(db.DateTime, nullable=True)
+    covers_from = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UsageRollupState hwm={self.last_radacctid} from={self.covers_from}>'
+
+
+class MetricBucket(db.Model):
+    """min/max/sum/count of one device metric over one fixed interval.
+
+    Maintained by services/metric_series.py: points land in 1-minute buckets,
+    which are later folded into 5-minute and then 1-hour ones. Derived data
+    like UsageRollupDaily, so no foreign keys — ``device_id`` is a
+    MikrotikDevice id when ``source`` is 'router' and an SnmpDevice id when it
+    is 'snmp'.
+    """
+    __tablename__ = 'metric_buckets'
+    __table_args__ = (
+        # Also the index for range reads: one series, one resolution, by time.
+        db.UniqueConstraint('source', 'device_id', 'metric', 'resolution', 'bucket_start',
+                            name='uq_metric_buckets_series_bucket'),
+        db.Index('ix_metric_buckets_resolution_start', 'resolution', 'bucket_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(10), nullable=False)
+    device_id = db.Column(db.Integer, nullable=False)
+    metric = db.Column(db.String(64), nullable=False)
+    # Bucket width in seconds: 60, 300 or 3600.
+    resolution = db.Column(db.Integer, nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum = db.Column(db.Float, nullable=False, default=0)
+    min = db.Column(db.Float, nullable=True)
+    max = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f'<MetricBucket {self.source}:{self.device_id} {self.metric} @{self.bucket_start}>'
+
+
+# =========================
+#   Bulk device sync runs
+# =========================
+
+class DeviceSyncRun(db.Model):
+    """One bulk "sync every router" sweep, polled by the UI while it runs.
+
+    The sweep runs on a background thread in whichever gunicorn worker took the
+    request; persisting it is what lets a poll landing on any other worker see
+    the progress. Per-device outcomes are rows in ``device_sync_results``,
+    written as each router finishes. See services/device_sweep.py.
+    """
+    __tablename__ = 'device_sync_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'running' | 'completed' | 'failed'
+    status = db.Column(db.String(20), nullable=False, default='running')
+    total = db.Column(db.Integer, nullable=False, default=0)
+    synced = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    busy = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # NULL for a platform-wide sweep started by an admin.
+    isp_id = db.Column(db.Integer, db.ForeignKey('isps.id'), nullable=True, index=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    results = db.relationship(
+        'DeviceSyncResult', back_populates='run', cascade='all, delete-orphan',
+        order_by='DeviceSyncResult.id',
+    )
+
+    def __repr__(self):
+        return f'<DeviceSyncRun {self.id} {self.status} {self.synced + self.failed + self.busy}/{self.total}>'
+
+
+class DeviceSyncResult(db.Model):
+    """How one router fared in a bulk sync run."""
+    __tablename__ = 'device_sync_results'
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(
+        db.Integer, db.ForeignKey('device_sync_runs.id', ondelete='CASCADE'),
+        nullable=False, index=True,
+    )
+    device_id = db.Column(db.Integer, nullable=True)
+    device_name = db.Column(db.String(100), nullable=True)
+    # 'synced' | 'stale' | 'kept_online' | 'offline' | 'busy' | 'error'
+    outcome = db.Column(db.String(20), nullable=False)
+    device_status = db.Column(db.String(20), nullable=True)
+    elapsed_ms = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    run = db.relationship('DeviceSyncRun', back_populates='results')
+
+    def __repr__(self):
+        return f'<DeviceSyncResult run={self.run_id} device={self.device_id} {self.outcome}>'
+
+
+# =========================
+#   Bulk invoice runs
+# =========================
+
+class InvoiceRun(db.Model):
+    """One bulk invoicing job (POST /api/invoices/generate-bulk).
+
+    Month-end billing for tens of thousands of subscribers runs on a background
+    thread; this row is its progress and, once finished, its summary. The
+    invoices themselves carry no back-reference — the run records the range of
+    numbers it issued instead. See services/invoice_batch.py.
+    """
+    __tablename__ = 'invoice_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'running' | 'completed' | 'failed'
+    status = db.Column(db.String(20), nullable=False, default='running')
+    requested = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    billing_cycle = db.Column(db.String(20), nullable=True)
+    due_date = db.Column(db.DateTime, nullable=False)
+    first_invoice_number = db.Column(db.String(50), nullable=True)
+    last_invoice_number = db.Column(db.String(50), nullable=True)
+    # JSON: why customers were skipped, with a capped sample of their ids.
+    summary = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # NULL when a platform admin bills across tenants.
+    isp_id = db.Column(db.Integer, db.ForeignKey('isps.id'), nullable=True, index=True)
+    service_plan_id = db.Column(db.Integer, db.ForeignKey('service_plans.id'), nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    def __repr__(self):
+        return f'<InvoiceRun {self.id} {self.status} {self.created}/{self.requested}>'
+
+
+# =========================
+#   Background job runs
+# =========================
+
+class JobRun(db.Model):
+    """One run of a scheduled background job (services/job_scheduler.py).
+
+    Written by whichever worker holds the scheduler lease, so the history — and
+    the durations the status view reports — is the same whichever worker is
+    asked. A row left at 'running' by a worker that died is marked 'abandoned'
+    by the next run of that job.
+    """
+    __tablename__ = 'job_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(64), nullable=False)
+    # 'running' | 'completed' | 'failed' | 'abandoned'
+    status = db.Column(db.String(20), nullable=False, default='running')
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    # hostname:pid of the worker that ran it.
+    host = db.Column(db.String(100), nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_runs_job_started', 'job', 'started_at'),
+    )
+
+    def __repr__(self):
+        return f'<JobRun {self.job} {self.status} {self.duration_ms}ms>'
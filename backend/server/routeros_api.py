@@ -0,0 +1,437 @@
+"""
+Asyncio RouterOS API client (port 8728) with tagged, pipelined commands.
+
+MikroTikClient talks to one router at a time and waits for each reply before
+sending the next command. This client speaks the binary API protocol on an
+asyncio stream instead:
+
+* every command carries a ``.tag``, so many can be in flight on one
+  connection and replies are matched back as they arrive;
+* ``stream()`` yields the rows of a ``print follow`` / ``listen`` as the
+  router sends them and cancels the command when the consumer stops;
+* ``run_fleet()`` drives a job against hundreds of routers from a single
+  event loop with bounded concurrency, for callers that are otherwise
+  synchronous (Flask views, CLI commands, the background threads).
+
+Only plain-TCP API is supported; routers are reached over the management
+tunnel, which is already encrypted.
+"""
+import asyncio
+import binascii
+import hashlib
+import itertools
+from typing import Any, Dict, Iterable, List, Optional
+
+from mikrotik_client import MikroTikAPIError
+
+
+class RouterOSTrap(MikroTikAPIError):
+    """A command failed on the router (``!trap``)."""
+
+    def __init__(self, message, category=None):
+        super().__init__(message)
+        self.category = category
+
+
+class RouterOSFatal(MikroTikAPIError):
+    """The router closed the API session (``!fatal`` or EOF)."""
+
+
+def encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def encode_sentence(words: Iterable[str]) -> bytes:
+    out = bytearray()
+    for word in words:
+        raw = word.encode('utf-8')
+        out += encode_length(len(raw)) + raw
+    out += b'\x00'
+    return bytes(out)
+
+
+async def _read_length(reader) -> int:
+    first = (await reader.readexactly(1))[0]
+    if first & 0x80 == 0x00:
+        return first
+    if first & 0xC0 == 0x80:
+        extra, mask = 1, 0x3F
+    elif first & 0xE0 == 0xC0:
+        extra, mask = 2, 0x1F
+    elif first & 0xF0 == 0xE0:
+        extra, mask = 3, 0x0F
+    elif first == 0xF0:
+        return int.from_bytes(await reader.readexactly(4), 'big')
+    else:
+        raise RouterOSFatal(f'bad length prefix 0x{first:02x}')
+    rest = await reader.readexactly(extra)
+    return int.from_bytes(bytes([first & mask]) + rest, 'big')
+
+
+async def read_sentence(reader) -> List[str]:
+    """Read one sentence (list of words) off an API stream."""
+    words = []
+    while True:
+        length = await _read_length(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode('utf-8', errors='replace'))
+
+
+def command_words(command: str, attrs: Optional[Dict[str, Any]] = None,
+                  query: Iterable[str] = ()) -> List[str]:
+    """``('/interface/print', {'.proplist': 'name'}, ['?type=ether'])`` -> API words."""
+    words = [command]
+    for key, value in (attrs or {}).items():
+        if isinstance(value, bool):
+            value = 'yes' if value else 'no'
+        words.append(f'={key}={value}')
+    words.extend(query)
+    return words
+
+
+def parse_reply(words: List[str]):
+    """Split a reply sentence into ``(type, attributes, tag)``."""
+    kind = words[0] if words else ''
+    attrs = {}
+    tag = None
+    for word in words[1:]:
+        if word.startswith('.tag='):
+            tag = word[5:]
+        elif word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attrs[key] = value
+        elif kind == '!fatal':
+            attrs['message'] = word
+    return kind, attrs, tag
+
+
+class Reply(list):
+    """Rows (``!re``) of a finished command; ``done`` holds ``!done`` attributes,
+    e.g. ``{'ret': '*1A'}`` for an ``add``."""
+
+    def __init__(self, rows=(), done=None):
+        super().__init__(rows)
+        self.done = done or {}
+
+
+class _Pending:
+    __slots__ = ('rows', 'future', 'queue', 'trap', 'cancelled')
+
+    def __init__(self, loop, streaming):
+        self.rows = []
+        self.future = loop.create_future()
+        self.queue = asyncio.Queue() if streaming else None
+        self.trap = None
+        self.cancelled = False
+
+
+_STREAM_END = object()
+
+
+class AsyncRouterOSClient:
+    """One API connection to a router; commands may be issued concurrently.
+
+    ::
+
+        async with AsyncRouterOSClient('10.99.0.5', 8728, 'admin', pw) as api:
+            resource, ifaces = await asyncio.gather(
+                api.call('/system/resource/print'),
+                api.call('/interface/print', {'.proplist': 'name,rx-byte,tx-byte'}),
+            )
+    """
+
+    def __init__(self, host: str, port: int = 8728, username: str = 'admin',
+                 password: str = '', timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._pump = None
+        self._pending: Dict[str, _Pending] = {}
+        self._tags = itertools.count(1)
+        self._write_lock = None
+        self._closed_error = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from a ``MikroTikConnectionConfig``."""
+        return cls(config.host, config.port, config.username, config.password or '',
+                   timeout=config.timeout)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise MikroTikAPIError(f'API connection to {self.host}:{self.port} failed: {exc}') from exc
+        self._write_lock = asyncio.Lock()
+        self._closed_error = None
+        self._pump = asyncio.get_running_loop().create_task(self._read_loop())
+        try:
+            await self._login()
+        except BaseException:
+            await self.close()
+            raise
+        return True
+
+    async def _login(self):
+        try:
+            reply = await self.call('/login', {'name': self.username, 'password': self.password})
+        except RouterOSTrap as exc:
+            raise MikroTikAPIError(f'API login to {self.host} failed: {exc}') from exc
+        challenge = reply.done.get('ret')
+        if challenge:
+            # RouterOS before 6.43: MD5 challenge-response.
+            digest = hashlib.md5(
+                b'\x00' + self.password.encode('utf-8') + binascii.unhexlify(challenge)
+            ).hexdigest()
+            try:
+                await self.call('/login', {'name': self.username, 'response': '00' + digest})
+            except RouterOSTrap as exc:
+                raise MikroTikAPIError(f'API login to {self.host} failed: {exc}') from exc
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+            self._writer = None
+        if self._pump is not None:
+            self._pump.cancel()
+            try:
+                await self._pump
+            except (asyncio.CancelledError, Exception):  # noqa: BLE001
+                pass
+            self._pump = None
+        self._fail_all(RouterOSFatal('connection closed'))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                kind, attrs, tag = parse_reply(await read_sentence(self._reader))
+                if kind == '!fatal':
+                    raise RouterOSFatal(attrs.get('message') or 'router closed the session')
+                self._dispatch(kind, attrs, tag)
+        except asyncio.IncompleteReadError:
+            self._fail_all(RouterOSFatal(f'{self.host} closed the API connection'))
+        except MikroTikAPIError as exc:
+            self._fail_all(exc)
+        except (OSError, ConnectionError) as exc:
+            self._fail_all(RouterOSFatal(str(exc)))
+
+    def _dispatch(self, kind, attrs, tag):
+        pending = self._pending.get(tag)
+        if pending is None:
+            return
+        if kind == '!re':
+            if pending.cancelled:
+                return
+            if pending.queue is not None:
+                pending.queue.put_nowait(attrs)
+            else:
+                pending.rows.append(attrs)
+        elif kind == '!trap':
+            pending.trap = RouterOSTrap(attrs.get('message', 'command failed'),
+                                        attrs.get('category'))
+        elif kind == '!done':
+            del self._pending[tag]
+            if pending.queue is not None:
+                pending.queue.put_nowait(_STREAM_END)
+            if pending.future.done():
+                return
+            if pending.trap is not None and not pending.cancelled:
+                pending.future.set_exception(pending.trap)
+            else:
+                pending.future.set_result(Reply(pending.rows, attrs))
+        # '!empty' (RouterOS 7.18+) carries no rows; '!done' still follows.
+
+    def _fail_all(self, exc):
+        self._closed_error = exc
+        pending, self._pending = self._pending, {}
+        for item in pending.values():
+            if item.queue is not None:
+                item.queue.put_nowait(_STREAM_END)
+            if not item.future.done():
+                item.future.set_exception(exc)
+                # Nobody may be awaiting a cancelled stream's future.
+                item.future.exception()
+
+    async def _send(self, words, streaming=False):
+        if self._writer is None or self._closed_error is not None:
+            raise self._closed_error or RouterOSFatal('not connected')
+        tag = str(next(self._tags))
+        pending = _Pending(asyncio.get_running_loop(), streaming)
+        self._pending[tag] = pending
+        async with self._write_lock:
+            self._writer.write(encode_sentence(words + [f'.tag={tag}']))
+            await self._writer.drain()
+        return tag, pending
+
+    async def call(self, command: str, attrs: Optional[Dict[str, Any]] = None,
+                   query: Iterable[str] = (), timeout: Optional[float] = None) -> Reply:
+        """Run one command; returns its rows. Raises RouterOSTrap on ``!trap``."""
+        tag, pending = await self._send(command_words(command, attrs, query))
+        try:
+            return await asyncio.wait_for(asyncio.shield(pending.future),
+                                          timeout or self.timeout)
+        except asyncio.TimeoutError:
+            await self.cancel(tag)
+            raise MikroTikAPIError(f'{command} on {self.host} timed out') from None
+
+    async def stream(self, command: str, attrs: Optional[Dict[str, Any]] = None,
+                     query: Iterable[str] = ()):
+        """Yield rows of a long-running command (``print follow``, ``listen``).
+
+        Closing the generator early cancels the command on the router. A
+        ``break`` alone only closes it when it is garbage collected, which may
+        be after the connection is gone, so wrap it in ``contextlib.aclosing``::
+
+            async with aclosing(api.stream('/log/print', {'follow': ''})) as rows:
+                async for row in rows:
+                    ...
+        """
+        tag, pending = await self._send(command_words(command, attrs, query), streaming=True)
+        finished = False
+        try:
+            while True:
+                row = await pending.queue.get()
+                if row is _STREAM_END:
+                    finished = True
+                    break
+                yield row
+            if pending.future.done() and pending.future.exception() is not None:
+                raise pending.future.exception()
+        finally:
+            if not finished:
+                await self.cancel(tag)
+
+    async def cancel(self, tag):
+        """Stop a running command; its remaining replies are discarded."""
+        pending = self._pending.get(tag)
+        if pending is None:
+            return
+        pending.cancelled = True
+        if self._closed_error is not None or self._writer is None:
+            return
+        try:
+            _tag, ack = await self._send(['/cancel', f'=tag={tag}'])
+            await asyncio.wait_for(ack.future, self.timeout)
+        except (MikroTikAPIError, asyncio.TimeoutError):
+            pass
+
+
+async def _fleet(targets, job, concurrency):
+    gate = asyncio.Semaphore(max(1, concurrency))
+    results = {}
+
+    async def _one(key, config, args):
+        async with gate:
+            try:
+                async with AsyncRouterOSClient.from_config(config) as api:
+                    results[key] = (await job(api, *args), None)
+            except Exception as exc:  # noqa: BLE001 — one router never stops the fleet
+                results[key] = (None, exc)
+
+    await asyncio.gather(*(_one(key, config, args) for key, config, *args in targets))
+    return results
+
+
+def run_fleet(targets, job, concurrency=64):
+    """Run ``await job(api, *args)`` against many routers from one event loop.
+
+    ``targets`` is ``[(key, MikroTikConnectionConfig, *args), ...]``; returns
+    ``{key: (result, exception)}``. At most ``concurrency`` connections are
+    open at once; a router that fails only fails its own entry.
+    """
+    return asyncio.run(_fleet(list(targets), job, concurrency))
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def interface_counters(api):
+    """Byte/packet counters for every interface, shaped like
+    ``device_config_ops.interface_traffic``'s ``stats``."""
+    rows = await api.call('/interface/print', {
+        '.proplist': 'name,rx-byte,tx-byte,rx-packet,tx-packet',
+    })
+    return [
+        {
+            'name': row.get('name'),
+            'rx_bytes': _int(row.get('rx-byte')),
+            'tx_bytes': _int(row.get('tx-byte')),
+            'rx_packets': _int(row.get('rx-packet')),
+            'tx_packets': _int(row.get('tx-packet')),
+        }
+        for row in rows if row.get('name')
+    ]
+
+
+# (menu, field the login is matched on) for every place a session lives.
+_KICK_MENUS = (
+    ('/ppp/active', 'name'),
+    ('/ip/hotspot/active', 'user'),
+    ('/ip/hotspot/host', 'user'),
+    ('/ip/hotspot/cookie', 'user'),
+)
+
+
+async def kick_usernames(api, usernames):
+    """Remove every live session of ``usernames``; returns how many were removed.
+
+    All lookups go out pipelined on the one connection, then all removes. A
+    menu the router lacks (no hotspot package) just contributes nothing.
+    """
+    usernames = list(usernames)
+
+    async def _find(menu, field, name):
+        try:
+            rows = await api.call(f'{menu}/print', {'.proplist': '.id'}, [f'?{field}={name}'])
+        except RouterOSTrap:
+            return menu, []
+        return menu, [row['.id'] for row in rows if row.get('.id')]
+
+    found = await asyncio.gather(*(
+        _find(menu, field, name) for menu, field in _KICK_MENUS for name in usernames
+    ))
+    ids_by_menu = {}
+    for menu, ids in found:
+        ids_by_menu.setdefault(menu, []).extend(ids)
+
+    async def _remove(menu, ids):
+        try:
+            await api.call(f'{menu}/remove', {'.id': ','.join(ids)})
+            return len(ids)
+        except RouterOSTrap:
+            return 0
+
+    removed = await asyncio.gather(*(
+        _remove(menu, ids) for menu, ids in ids_by_menu.items() if ids
+    ))
+    return sum(removed)
@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import or_
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
 from extensions import db
 from auth_utils import get_current_user
-from models import User, Customer, CustomerStatus, ServicePlan, ISP, KycStatus, RadAcct, MikrotikDevice
+from models import (
+    User, Customer, CustomerStatus, ServicePlan, ISP, KycStatus, RadAcct, MikrotikDevice,
+    WireGuardPeer,
+)
 from datetime import datetime
 from services.radius_provisioning import (
     provision_customer_radius,
@@ -18,6 +22,10 @@ from services.radius_provisioning import (
     find_customer_by_login,
 )
 from services.system_log import record_system_log
+import base64
+import csv
+import io
+import json
 import secrets
 
 customers_bp = Blueprint('customers', __name__, url_prefix='/api/customers')
@@ -53,46 +61,63 @@ def _serialize_wireguard_peer(customer):
     return serialize_peer(peer, plan=customer.service_plan)
 
 
-def serialize_customer(customer):
-    """Serialize customer object to dictionary"""
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _serialize_plan_summary(customer):
+    plan = customer.service_plan
+    if not plan:
+        return None
+    return {
+        'id': plan.id,
+        'name': plan.name,
+        'speed': plan.speed,
+        'price': float(plan.price) if plan.price else 0.0
+    }
+
+
+# Field name -> getter. The list endpoint's ``fields=`` picks from these, so a
+# table view only serializes (and only eager-loads) what it renders.
+CUSTOMER_FIELDS = {
+    'id': lambda c: c.id,
+    'name': lambda c: c.full_name,
+    'email': lambda c: c.email,
+    'phone': lambda c: c.phone,
+    'address': lambda c: c.address,
+    'status': lambda c: c.status.value if c.status else 'active',
+    'join_date': lambda c: _iso(c.join_date),
+    'balance': lambda c: float(c.balance) if c.balance else 0.0,
+    'package': lambda c: c.package,
+    'usage_percentage': lambda c: c.usage_percentage,
+    'device_count': lambda c: c.device_count,
+    'last_payment_date': lambda c: _iso(c.last_payment_date),
+    'created_at': lambda c: _iso(c.created_at),
+    'updated_at': lambda c: _iso(c.updated_at),
+    'service_plan_id': lambda c: c.service_plan_id,
+    'id_number': lambda c: c.id_number,
+    'kyc_status': lambda c: c.kyc_status.value if getattr(c, 'kyc_status', None) else 'pending',
+    'kyc_verified_at': lambda c: _iso(getattr(c, 'kyc_verified_at', None)),
+    'kyc_notes': lambda c: c.kyc_notes,
+    'subscription_start': lambda c: _iso(c.subscription_start),
+    'subscription_end': lambda c: _iso(c.subscription_end),
+    'connection_type': lambda c: c.connection_type or 'pppoe',
+    'radius_login': lambda c: c.radius_login,
+    'account_number': lambda c: c.account_number,
+    'radius_username': lambda c: radius_username(c) or None,
+    'wireguard_peer': _serialize_wireguard_peer,
+    'service_plan': _serialize_plan_summary,
+}
+
+
+def serialize_customer(customer, fields=None):
+    """Serialize customer object to dictionary (only ``fields``, when given)"""
+    names = fields or CUSTOMER_FIELDS
     try:
-        return {
-            'id': customer.id,
-            'name': customer.full_name,
-            'email': customer.email,
-            'phone': customer.phone,
-            'address': customer.address,
-            'status': customer.status.value if customer.status else 'active',
-            'join_date': customer.join_date.isoformat() if customer.join_date else None,
-            'balance': float(customer.balance) if customer.balance else 0.0,
-            'package': customer.package,
-            'usage_percentage': customer.usage_percentage,
-            'device_count': customer.device_count,
-            'last_payment_date': customer.last_payment_date.isoformat() if customer.last_payment_date else None,
-            'created_at': customer.created_at.isoformat() if customer.created_at else None,
-            'updated_at': customer.updated_at.isoformat() if customer.updated_at else None,
-            'service_plan_id': customer.service_plan_id,
-            'id_number': customer.id_number,
-            'kyc_status': customer.kyc_status.value if getattr(customer, 'kyc_status', None) else 'pending',
-            'kyc_verified_at': customer.kyc_verified_at.isoformat() if getattr(customer, 'kyc_verified_at', None) else None,
-            'kyc_notes': customer.kyc_notes,
-            'subscription_start': customer.subscription_start.isoformat() if customer.subscription_start else None,
-            'subscription_end': customer.subscription_end.isoformat() if customer.subscription_end else None,
-            'connection_type': customer.connection_type or 'pppoe',
-            'radius_login': customer.radius_login,
-            'account_number': customer.account_number,
-            'radius_username': radius_username(customer) or None,
-            'wireguard_peer': _serialize_wireguard_peer(customer),
-            'service_plan': {
-                'id': customer.service_plan.id,
-                'name': customer.service_plan.name,
-                'speed': customer.service_plan.speed,
-                'price': float(customer.service_plan.price) if customer.service_plan.price else 0.0
-            } if hasattr(customer, 'service_plan') and customer.service_plan else None
-        }
+        return {name: CUSTOMER_FIELDS[name](customer) for name in names}
     except Exception as e:
         # Return basic customer data without service plan
-        return {
+        basic = {
             'id': customer.id,
             'name': customer.full_name,
             'email': customer.email,
@@ -116,12 +141,90 @@ def serialize_customer(customer):
             'kyc_notes': getattr(customer, 'kyc_notes', None),
             'service_plan': None
         }
+        if fields:
+            return {name: basic.get(name) for name in fields}
+        return basic
+
+
+def _parse_fields(raw):
+    """``fields=id,name,status`` -> list of names; None means every field."""
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in CUSTOMER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def _customer_load_options(fields):
+    """Batch-load the relationships the chosen fields read (one query each, not one per row)."""
+    wanted = set(fields or CUSTOMER_FIELDS)
+    options = []
+    if wanted & {'service_plan', 'wireguard_peer'}:
+        options.append(selectinload(Customer.service_plan))
+    if 'wireguard_peer' in wanted:
+        options.append(selectinload(Customer.wireguard_peer).joinedload(WireGuardPeer.server))
+    return options
+
+
+# Keyset pagination orders by (column, id); the column must be NOT NULL or
+# server-defaulted so every row has a comparable value.
+_CURSOR_SORTS = {
+    'created_at': Customer.created_at,
+    'full_name': Customer.full_name,
+    'id': Customer.id,
+}
+_CURSOR_MAX_PER_PAGE = 200
+
+
+def _encode_cursor(sort_by, customer):
+    value = getattr(customer, sort_by)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, customer.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(sort_by, token):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if sort_by == 'created_at':
+            value = datetime.fromisoformat(value)
+        return value, int(last_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def _after_cursor(query, sort_by, descending, cursor):
+    """Rows strictly after the cursor position in (sort column, id) order."""
+    column = _CURSOR_SORTS[sort_by]
+    if cursor:
+        value, last_id = _decode_cursor(sort_by, cursor)
+        if sort_by == 'id':
+            query = query.filter(Customer.id < last_id if descending else Customer.id > last_id)
+        elif descending:
+            query = query.filter(or_(column < value, and_(column == value, Customer.id < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, Customer.id > last_id)))
+    if sort_by == 'id':
+        return query.order_by(Customer.id.desc() if descending else Customer.id.asc())
+    if descending:
+        return query.order_by(column.desc(), Customer.id.desc())
+    return query.order_by(column.asc(), Customer.id.asc())
 
 @customers_bp.route('/', methods=['GET'])
 @customers_bp.route('', methods=['GET'])
 @jwt_required()
 def get_customers():
-    """Get all customers with pagination and filtering"""
+    """Get all customers with pagination and filtering
+
+    ``page``/``per_page`` keep the OFFSET paging with totals. Passing
+    ``cursor`` (empty for the first page, then each response's
+    ``next_cursor``) switches to keyset paging: no COUNT(*) and no OFFSET, so
+    page 500 of a large tenant costs what page 1 does. ``fields=id,name,...``
+    limits each row to the named fields.
+    """
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
@@ -130,9 +233,17 @@ def get_customers():
         connection_type = request.args.get('connection_type')
         sort_by = request.args.get('sort_by', 'created_at')
         sort_order = request.args.get('sort_order', 'desc')
-        
-        
-        query = Customer.query
+        cursor_mode = 'cursor' in request.args
+        try:
+            fields = _parse_fields(request.args.get('fields'))
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+
+        query = Customer.query.options(*_customer_load_options(fields))
+
+        user = get_current_user()
+        if user and user.role != 'admin' and user.isp_id:
+            query = query.filter(Customer.isp_id == user.isp_id)
 
         if connection_type:
             allowed = {'hotspot', 'pppoe', 'wireguard'}
@@ -140,7 +251,7 @@ def get_customers():
                 return jsonify({'error': 'Invalid connection_type'}), 400
             query = query.filter_by(connection_type=connection_type)
         
-        # Search functionality
+        # Search functionality (trigram-indexed on Postgres, see ensure_schema_upgrades)
         if search:
             search_term = f"%{search}%"
             query = query.filter(
@@ -158,6 +269,28 @@ def get_customers():
                 query = query.filter_by(status=status_enum)
             except ValueError:
                 return jsonify({'error': 'Invalid status value'}), 400
+
+        if cursor_mode:
+            if sort_by not in _CURSOR_SORTS:
+                return jsonify({
+                    'error': f"Cursor paging sorts by one of: {', '.join(sorted(_CURSOR_SORTS))}"
+                }), 400
+            per_page = max(1, min(per_page, _CURSOR_MAX_PER_PAGE))
+            try:
+                query = _after_cursor(query, sort_by, sort_order == 'desc',
+                                      request.args.get('cursor'))
+            except ValueError as exc:
+                return jsonify({'error': str(exc)}), 400
+            # One extra row says whether another page exists, without a COUNT.
+            rows = query.limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            return jsonify({
+                'customers': [serialize_customer(customer, fields) for customer in rows],
+                'next_cursor': _encode_cursor(sort_by, rows[-1]) if has_more else None,
+                'has_more': has_more,
+                'per_page': per_page
+            }), 200
         
         # Sorting
         if hasattr(Customer, sort_by):
@@ -175,7 +308,7 @@ def get_customers():
         
         
         response_data = {
-            'customers': [serialize_customer(customer) for customer in customers.items],
+            'customers': [serialize_customer(customer, fields) for customer in customers.items],
             'total': customers.total,
             'pages': customers.pages,
             'current_page': page,
@@ -566,6 +699,128 @@ def import_customers():
     return jsonify(summary), 200
 
 
+def _import_job_for_user(job_id):
+    from models import CustomerImportJob
+    user = get_current_user()
+    job = CustomerImportJob.query.get(job_id)
+    if not job or not user or (user.role != 'admin' and job.isp_id != user.isp_id):
+        return None
+    return job
+
+
+@customers_bp.route('/import/jobs', methods=['POST'])
+@jwt_required()
+def start_customer_import_job():
+    """Queue a committing import to run in the background.
+
+    Takes the same inputs as ``/import`` (without ``dry_run`` — preview with
+    that endpoint first) and answers 202 with the job to poll. Meant for
+    migrations too large to finish inside one request.
+    """
+    from services.customer_import import rows_to_csv
+    from services.customer_import_jobs import serialize_import_job, start_import_job
+
+    isp = _resolve_isp_for_user()
+    if not isp:
+        return jsonify({'error': 'No ISP context — assign user to an ISP or create an ISP first'}), 400
+
+    options = {}
+    if 'file' in request.files:
+        source = request.files['file'].read().decode('utf-8-sig', errors='replace')
+        options['default_status'] = (request.form.get('default_status') or 'active').strip().lower()
+    else:
+        data = request.get_json(silent=True) or {}
+        if isinstance(data.get('rows'), list):
+            source = rows_to_csv(data['rows'])
+        else:
+            source = data.get('csv') or ''
+        options['default_status'] = (data.get('default_status') or 'active').strip().lower()
+        if isinstance(data.get('plan_map'), dict):
+            options['plan_map'] = data['plan_map']
+        if isinstance(data.get('create_plans'), list):
+            options['create_plans'] = data['create_plans']
+        if 'auto_create_plans' in data:
+            options['auto_create_plans'] = bool(data.get('auto_create_plans'))
+
+    if not source.strip():
+        return jsonify({'error': 'No rows to import (empty file or body)'}), 400
+
+    user = get_current_user()
+    job = start_import_job(current_app._get_current_object(), isp, source,
+                           created_by_id=user.id if user else None, **options)
+    return jsonify(serialize_import_job(job)), 202
+
+
+@customers_bp.route('/import/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def customer_import_job_status(job_id):
+    """Progress, ETA and counters of an import job."""
+    from services.customer_import_jobs import serialize_import_job
+    job = _import_job_for_user(job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify(serialize_import_job(job)), 200
+
+
+@customers_bp.route('/import/jobs/<int:job_id>/errors', methods=['GET'])
+@jwt_required()
+def customer_import_job_errors(job_id):
+    """The rows a job could not create, in file order.
+
+    JSON pages by ``after`` (a row number) and ``limit``; ``format=csv``
+    downloads the whole report.
+    """
+    from models import CustomerImportError
+    from services.customer_import_jobs import serialize_import_error
+    job = _import_job_for_user(job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+
+    query = CustomerImportError.query.filter_by(job_id=job.id).order_by(
+        CustomerImportError.row_number)
+    if request.args.get('format') == 'csv':
+        def _report():
+            out = io.StringIO()
+            writer = csv.writer(out)
+            writer.writerow(['row', 'name', 'login', 'plan', 'errors'])
+            for row in query.yield_per(500):
+                item = serialize_import_error(row)
+                data = item['data'] or {}
+                writer.writerow([item['row'], data.get('name'), data.get('login'),
+                                 data.get('plan'), '; '.join(item['messages'])])
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        # The report streams after the view returns; keep the request (and so
+        # the app context the session is bound to) alive while it does.
+        return Response(
+            stream_with_context(_report()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=import_{job.id}_errors.csv'},
+        )
+
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    rows = query.filter(CustomerImportError.row_number > after).limit(limit + 1).all()
+    return jsonify({
+        'errors': [serialize_import_error(row) for row in rows[:limit]],
+        'next_after': rows[limit - 1].row_number if len(rows) > limit else None,
+    }), 200
+
+
+@customers_bp.route('/import/jobs/<int:job_id>/resume', methods=['POST'])
+@jwt_required()
+def resume_customer_import_job(job_id):
+    """Continue a failed or stalled job from its last committed chunk."""
+    from services.customer_import_jobs import resume_import_job, serialize_import_job
+    job = _import_job_for_user(job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    if not resume_import_job(current_app._get_current_object(), job):
+        return jsonify({'error': f'Import job is {job.status}, not resumable'}), 409
+    return jsonify(serialize_import_job(job)), 202
+
+
 @customers_bp.route('/<int:customer_id>', methods=['PUT'])
 @jwt_required()
 def update_customer(customer_id):
@@ -5,7 +5,7 @@ from flask import Blueprint, request, jsonify, current_app, Response, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extensions import db
 from auth_utils import get_current_user
-from models import MikrotikDevice, User, DeviceStatus, ISP, DeviceBackup
+from models import MikrotikDevice, User, DeviceStatus, ISP, DeviceBackup, DeviceSyncRun
 from datetime import datetime, timedelta
 from services.encryption import encrypt_value
 from services.device_config_ops import (
@@ -26,17 +26,17 @@ from services.device_backups import (
     delete_backup,
     serialize_backup,
 )
+from services.device_sweep import serialize_run, start_bulk_sync
 from services.rate_limit import rate_limit
 from services.provisioning_scripts import build_radius_script, build_one_liner, resolve_provision_base_url
 from services.mikrotik_sync import (
     sync_device_async,
     sync_device_stats,
     test_device_connection as mikrotik_test_connection,
-    bulk_sync_devices,
     mark_unreachable,
 )
 from mikrotik_client import MikroTikAPIError, MikroTikSSHError
-from services.radius_clients_export import sync_radius_clients_conf
+from services.radius_clients_export import request_radius_clients_sync
 from services.wireguard_management import (
     build_mikrotik_management_tunnel_script,
     deprovision_device_management_tunnel,
@@ -273,10 +273,7 @@ def create_device():
 
         db.session.commit()
 
-        try:
-            sync_radius_clients_conf()
-        except OSError as sync_err:
-            current_app.logger.warning('Failed to sync RADIUS clients.conf: %s', sync_err)
+        request_radius_clients_sync()
         
         return jsonify({
             'message': 'Device created successfully',
@@ -345,10 +342,7 @@ def update_device(device_id):
         
         db.session.commit()
 
-        try:
-            sync_radius_clients_conf()
-        except OSError as sync_err:
-            current_app.logger.warning('Failed to sync RADIUS clients.conf: %s', sync_err)
+        request_radius_clients_sync()
         
         return jsonify({
             'message': 'Device updated successfully',
@@ -385,10 +379,7 @@ def delete_device(device_id):
         db.session.delete(device)
         db.session.commit()
 
-        try:
-            sync_radius_clients_conf()
-        except OSError as sync_err:
-            current_app.logger.warning('Failed to sync RADIUS clients.conf: %s', sync_err)
+        request_radius_clients_sync()
         
         return jsonify({'message': 'Device deleted successfully'}), 200
         
@@ -609,29 +600,61 @@ def get_device_stats():
     except Exception as e:
         return jsonify({'error': f'Failed to get device stats: {str(e)}'}), 500
 
+@devices_bp.route('/unregistered-nas', methods=['GET'])
+@jwt_required()
+def unregistered_nas_route():
+    """NAS addresses sending RADIUS accounting that match no registered router."""
+    from services.device_liveness import unregistered_nas
+
+    current_user = get_current_user()
+    isp_id = None if current_user.role == 'admin' else current_user.isp_id
+    if current_user.role != 'admin' and not isp_id:
+        return jsonify({'error': 'User not associated with any ISP'}), 403
+    unknown = unregistered_nas(isp_id=isp_id)
+    return jsonify({'nas': [
+        {'nas_ip': address, 'last_seen_at': seen.isoformat()}
+        for address, seen in sorted(unknown.items(), key=lambda item: item[1], reverse=True)
+    ]}), 200
+
+
 @devices_bp.route('/bulk-sync', methods=['POST'])
 @jwt_required()
 def bulk_sync_devices_route():
-    """Sync all active devices for current ISP."""
+    """Start syncing all active devices for the current ISP.
+
+    Returns 202 with a run id straight away; poll ``GET /bulk-sync/<id>`` for
+    per-router results as they land. A sweep already running for the same ISP
+    is returned rather than started twice.
+    """
     try:
         current_user = get_current_user()
         isp_id = None if current_user.role == 'admin' else current_user.isp_id
         if current_user.role != 'admin' and not isp_id:
             return jsonify({'error': 'User not associated with any ISP'}), 403
 
-        result = bulk_sync_devices(isp_id=isp_id)
-        return jsonify({
-            'message': 'Bulk sync completed',
-            'synced_devices': result['synced'],
-            'failed_devices': result['failed'],
-            'total_devices': result['total'],
-        }), 200
-        
+        run, started = start_bulk_sync(
+            current_app._get_current_object(), isp_id=isp_id, created_by_id=current_user.id
+        )
+        payload = serialize_run(run)
+        payload['message'] = 'Bulk sync started' if started else 'Bulk sync already running'
+        return jsonify(payload), 202
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to bulk sync devices: {str(e)}'}), 500
 
 
+@devices_bp.route('/bulk-sync/<int:run_id>', methods=['GET'])
+@jwt_required()
+def bulk_sync_status(run_id):
+    """Progress of a bulk sync run; ``?after=<result id>`` returns only newer results."""
+    current_user = get_current_user()
+    run = DeviceSyncRun.query.get(run_id)
+    if not run or (current_user.role != 'admin' and run.isp_id != current_user.isp_id):
+        return jsonify({'error': 'Sync run not found'}), 404
+    return jsonify(serialize_run(run, request.args.get('after', 0, type=int))), 200
+
+
 # Frontend-compatible action aliases
 @devices_bp.route('/connect/<int:device_id>', methods=['POST'])
 @jwt_required()
@@ -706,6 +729,21 @@ def backup_device_route(device_id):
         return jsonify({'error': f'Backup failed: {str(e)}'}), 502
 
 
+@devices_bp.route('/<int:device_id>/metrics', methods=['GET'])
+@jwt_required()
+def device_metric_series(device_id):
+    """Resource history (cpu_load, mem_used_pct, ...) as a downsampled series."""
+    device, err = _device_for_user(device_id)
+    if err:
+        return err
+    from services.metric_series import SOURCE_ROUTER, series_request
+
+    try:
+        return jsonify(series_request(SOURCE_ROUTER, device.id, request.args)), 200
+    except ValueError as e:
+        return jsonify({'error': f'Invalid range: {str(e)}'}), 400
+
+
 @devices_bp.route('/<int:device_id>/backups', methods=['GET'])
 @jwt_required()
 def list_device_backups(device_id):
@@ -1275,11 +1313,8 @@ def download_management_tunnel_script(device_id):
 
     if not device.management_wg_enabled:
         provision_device_management_tunnel(device)
-        try:
-            sync_radius_clients_conf()
-        except OSError as sync_err:
-            current_app.logger.warning('Failed to sync RADIUS clients.conf: %s', sync_err)
         db.session.commit()
+        request_radius_clients_sync()
 
     try:
         script = build_mikrotik_management_tunnel_script(device)
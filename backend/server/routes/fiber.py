@@ -8,13 +8,14 @@ because a map that fires six requests judders while it loads) and ``/faults``
 import json
 from datetime import datetime
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from flask_jwt_extended import jwt_required
 
 from auth_utils import get_current_user
 from extensions import db
 from models import CpeDevice, Customer, FiberCable, FiberNode, FiberSplice, ISP
-from services import fiber_geo, fiber_import
+from services import fiber_geo, fiber_import, fiber_spatial, fiber_tiles
+from services.fiber_fault_cache import fault_suspects
 from services.geocoding import geocode_customers
 
 fiber_bp = Blueprint('fiber', __name__, url_prefix='/api/fiber')
@@ -132,6 +133,29 @@ def serialize_splice(splice):
 #  The map payload
 # ---------------------------------------------------------------------------
 
+def _upstream_index(isp_id, nodes, node_ids):
+    """``build_index``/``cable_index_for`` covering every chain above ``node_ids``.
+
+    A viewport holds only part of the plant, but predicting an ONT's receive
+    power needs its whole path to the OLT. Parents are fetched one level per
+    query — the depth of the plant, not its size.
+    """
+    known = {n.id: n for n in nodes}
+    frontier = {i for i in node_ids if i}
+    for _hop in range(32):  # walk_upstream's depth cap
+        missing = [i for i in frontier if i not in known]
+        if missing:
+            for node in FiberNode.query.filter(FiberNode.isp_id == isp_id,
+                                               FiberNode.id.in_(missing)):
+                known[node.id] = node
+        frontier = {known[i].parent_id for i in frontier if i in known and known[i].parent_id}
+        if not frontier:
+            break
+    cables = FiberCable.query.filter(FiberCable.isp_id == isp_id,
+                                     FiberCable.to_node_id.in_(list(known))).all() if known else []
+    return known, fiber_geo.cable_index_for(cables)
+
+
 @fiber_bp.route('/map', methods=['GET'])
 @jwt_required()
 def fiber_map():
@@ -139,24 +163,44 @@ def fiber_map():
 
     Deliberately one call rather than four: the map cannot render usefully until
     it has all layers, and staggered responses make it jump as each arrives.
+    With ``?bbox=west,south,east,north`` only what lies in that viewport is
+    returned (through services/fiber_spatial), which is what keeps a plant of
+    hundreds of thousands of points drawable; ``stats`` then count the
+    viewport too.
     """
     isp_id = _isp_id()
     if not isp_id:
         return jsonify({'error': 'No ISP associated with this account'}), 404
-
-    nodes = FiberNode.query.filter_by(isp_id=isp_id).all()
-    cables = FiberCable.query.filter_by(isp_id=isp_id).all()
-    splices = FiberSplice.query.filter_by(isp_id=isp_id).all()
-
-    onts = (CpeDevice.query.filter(CpeDevice.isp_id == isp_id).all())
-    customers = (Customer.query
-                 .filter(Customer.isp_id == isp_id,
-                         Customer.latitude.isnot(None),
-                         Customer.longitude.isnot(None))
-                 .all())
-
-    by_id, _children = fiber_geo.build_index(nodes)
-    cable_index = fiber_geo.cable_index_for(cables)
+    bbox = fiber_spatial.parse_bbox(request.args.get('bbox'))
+    if request.args.get('bbox') and bbox is None:
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+
+    if bbox is None:
+        nodes = FiberNode.query.filter_by(isp_id=isp_id).all()
+        cables = FiberCable.query.filter_by(isp_id=isp_id).all()
+        splices = FiberSplice.query.filter_by(isp_id=isp_id).all()
+        onts = (CpeDevice.query.filter(CpeDevice.isp_id == isp_id).all())
+        customers = (Customer.query
+                     .filter(Customer.isp_id == isp_id,
+                             Customer.latitude.isnot(None),
+                             Customer.longitude.isnot(None))
+                     .all())
+        by_id, _children = fiber_geo.build_index(nodes)
+        cable_index = fiber_geo.cable_index_for(cables)
+    else:
+        west, south, east, north = bbox
+        nodes = fiber_spatial.nodes_in_bbox(isp_id, bbox)
+        cables = fiber_spatial.cables_in_bbox(isp_id, bbox)
+        splices = (FiberSplice.query.filter(FiberSplice.isp_id == isp_id,
+                                            FiberSplice.node_id.in_([n.id for n in nodes])).all()
+                   if nodes else [])
+        onts = CpeDevice.query.filter(CpeDevice.isp_id == isp_id,
+                                      CpeDevice.latitude.between(south, north),
+                                      CpeDevice.longitude.between(west, east)).all()
+        customers = Customer.query.filter(Customer.isp_id == isp_id,
+                                          Customer.latitude.between(south, north),
+                                          Customer.longitude.between(west, east)).all()
+        by_id, cable_index = _upstream_index(isp_id, nodes, {o.fiber_node_id for o in onts})
 
     node_payload = []
     for node in nodes:
@@ -208,6 +252,7 @@ def fiber_map():
         'onts': ont_payload,
         'customers': customer_payload,
         'bounds': fiber_geo.bounds_of(points),
+        'viewport': list(bbox) if bbox else None,
         'stats': {
             'nodes': len(nodes),
             'placed_nodes': sum(1 for n in nodes if n.latitude is not None),
@@ -220,6 +265,30 @@ def fiber_map():
     }), 200
 
 
+@fiber_bp.route('/tiles/<int:z>/<int:x>/<int:y>.geojson', methods=['GET'])
+@jwt_required()
+def fiber_tile(z, x, y):
+    """One z/x/y tile of the plant as GeoJSON (see services/fiber_tiles).
+
+    The ETag moves only when the tenant's nodes or cables change, so the map
+    revalidates every tile it shows and re-downloads none until then.
+    """
+    isp_id = _isp_id()
+    if not isp_id:
+        return jsonify({'error': 'No ISP associated with this account'}), 404
+    if not fiber_tiles.valid_tile(z, x, y):
+        return jsonify({'error': 'No such tile'}), 404
+
+    body, etag = fiber_tiles.render_tile(isp_id, z, x, y)
+    response = Response(body, mimetype='application/geo+json')
+    response.set_etag(etag)
+    # private: tiles are per tenant behind a bearer token; no-cache: keep
+    # them, but ask each time so an edit shows up on the next pan.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response.make_conditional(request)
+
+
 @fiber_bp.route('/faults', methods=['GET'])
 @jwt_required()
 def fiber_faults():
@@ -228,11 +297,8 @@ def fiber_faults():
     if not isp_id:
         return jsonify({'error': 'No ISP associated with this account'}), 404
 
-    nodes = FiberNode.query.filter_by(isp_id=isp_id).all()
-    onts = CpeDevice.query.filter(CpeDevice.isp_id == isp_id,
-                                  CpeDevice.fiber_node_id.isnot(None)).all()
     min_affected = _i(request.args.get('min_affected')) or 2
-    return jsonify({'suspects': fiber_geo.localise_faults(nodes, onts, min_affected)}), 200
+    return jsonify({'suspects': fault_suspects(isp_id, min_affected)}), 200
 
 
 @fiber_bp.route('/nodes/<int:node_id>/trace', methods=['GET'])
@@ -301,6 +367,44 @@ def list_nodes():
                               for n in nodes]}), 200
 
 
+@fiber_bp.route('/nodes/nearest', methods=['GET'])
+@jwt_required()
+def nearest_nodes():
+    """The placed nodes nearest a point or a subscriber's pin, nearest first.
+
+    ``?latitude=&longitude=`` or ``?customer_id=``; ``limit`` (default 10, at
+    most 100) and ``kind`` (e.g. ``odb`` when picking where to connect a drop).
+    """
+    isp_id = _isp_id()
+    if not isp_id:
+        return jsonify({'error': 'No ISP associated with this account'}), 404
+
+    customer_id = _i(request.args.get('customer_id'))
+    if customer_id:
+        customer = Customer.query.filter_by(id=customer_id, isp_id=isp_id).first()
+        if customer is None:
+            return jsonify({'error': 'Customer not found'}), 404
+        lat, lng = customer.latitude, customer.longitude
+        if lat is None or lng is None:
+            return jsonify({'error': 'This subscriber has not been placed on the map'}), 400
+    else:
+        lat, lng = _f(request.args.get('latitude')), _f(request.args.get('longitude'))
+        if lat is None or lng is None:
+            return jsonify({'error': 'latitude and longitude (or customer_id) are required'}), 400
+        if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+            return jsonify({'error': 'Coordinates are out of range'}), 400
+
+    limit = max(1, min(_i(request.args.get('limit')) or 10, 100))
+    kind = request.args.get('kind')
+    found = fiber_spatial.nearest_nodes(isp_id, lat, lng, limit=limit,
+                                        kind=kind if kind and kind != 'all' else None)
+    return jsonify({
+        'latitude': lat,
+        'longitude': lng,
+        'nodes': [dict(serialize_node(node), distance_m=round(metres, 1)) for node, metres in found],
+    }), 200
+
+
 @fiber_bp.route('/nodes', methods=['POST'])
 @jwt_required()
 def create_node():
@@ -414,7 +518,14 @@ def list_cables():
     isp_id = _isp_id()
     if not isp_id:
         return jsonify({'error': 'No ISP associated with this account'}), 404
-    cables = FiberCable.query.filter_by(isp_id=isp_id).order_by(FiberCable.cable_type).all()
+    bbox = fiber_spatial.parse_bbox(request.args.get('bbox'))
+    if request.args.get('bbox') and bbox is None:
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+    if bbox is not None:
+        # Cables whose drawn route crosses the area, not merely whose ends do.
+        cables = sorted(fiber_spatial.cables_in_bbox(isp_id, bbox), key=lambda c: c.cable_type or '')
+    else:
+        cables = FiberCable.query.filter_by(isp_id=isp_id).order_by(FiberCable.cable_type).all()
     return jsonify({'cables': [serialize_cable(c) for c in cables]}), 200
 
 
@@ -230,6 +230,14 @@ def deployment_health():
         return jsonify({'ok': False, 'error': str(exc)}), 500
 
 
+@health_bp.route('/radius-clients', methods=['GET'])
+@rate_limit(limit=20, window=60, scope='health-radius-clients')
+def radius_clients_health():
+    """clients.conf regeneration counters for this worker, and the hash on disk."""
+    from services.radius_clients_export import clients_conf_metrics
+    return jsonify(clients_conf_metrics()), 200
+
+
 @health_bp.route('/radius-user', methods=['GET'])
 @rate_limit(limit=20, window=60, scope='health-radius-user')
 def radius_user_health():
@@ -272,19 +272,22 @@ def scan_upload():
         return jsonify({'error': 'No ISP context'}), 400
 
     if 'file' in request.files:
-        text = request.files['file'].read().decode('utf-8-sig', errors='replace')
+        # Streamed straight into the parser — never read into memory whole.
+        source = request.files['file'].stream
         device_id = request.form.get('device_id')
     else:
         data = request.get_json(silent=True) or {}
-        text = data.get('export') or ''
+        source = data.get('export') or ''
         device_id = data.get('device_id')
-
-    if not (text or '').strip():
-        return jsonify({'error': 'No export content supplied'}), 400
+        if not source.strip():
+            return jsonify({'error': 'No export content supplied'}), 400
 
     device = MikrotikDevice.query.get(int(device_id)) if device_id else None
     try:
-        run, inventory = router_scan.scan_from_export(isp, user, text, device=device)
+        run, inventory = router_scan.scan_from_export(isp, user, source, device=device)
+    except router_scan.EmptyExport as exc:
+        db.session.rollback()
+        return jsonify({'error': str(exc)}), 400
     except Exception as exc:  # noqa: BLE001
         db.session.rollback()
         return jsonify({'error': f'Could not parse export: {exc}'}), 400
@@ -384,6 +387,12 @@ def ingest_agent():
 
     if not key:
         return jsonify({'error': 'key is required'}), 400
+    if len(key) > 64:
+        return jsonify({'error': 'key is too long'}), 400
+    try:
+        seq = int(seq)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seq must be an integer'}), 400
     scan_service.ingest_agent_chunk(run, key, seq, body)
     db.session.commit()
     return jsonify({'status': 'ok'}), 200
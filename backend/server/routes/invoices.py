@@ -1,9 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from auth_utils import get_current_user
 from extensions import db
-from models import Invoice, Customer, ServicePlan, User, InvoiceStatus, InvoiceItem
+from models import Invoice, Customer, ServicePlan, User, InvoiceStatus, InvoiceItem, InvoiceRun
+from services.invoice_batch import next_invoice_number, serialize_invoice_run, start_invoice_batch
 from datetime import datetime, timedelta
-import uuid
 
 invoices_bp = Blueprint('invoices', __name__, url_prefix='/api/invoices')
 
@@ -206,8 +207,8 @@ def create_invoice():
         except ValueError:
             return jsonify({'error': 'Invalid amount format'}), 400
         
-        # Generate invoice number
-        invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+        # Per-tenant sequential number, reserved under the ISP row lock
+        invoice_number = next_invoice_number(customer.isp_id)
         
         # Calculate due date (30 days from now by default)
         due_date = datetime.now() + timedelta(days=data.get('due_days', 30))
@@ -516,29 +517,39 @@ def get_invoice_stats():
 @invoices_bp.route('/generate-bulk', methods=['POST'])
 @jwt_required()
 def generate_bulk_invoices():
-    """Generate invoices for multiple customers"""
+    """Start invoicing many customers at once.
+
+    Returns 202 with a run straight away; poll ``GET /generate-bulk/<id>`` for
+    progress and the summary (counts, number range, skipped reasons). Tenant
+    users can only bill their own customers.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         customer_ids = data.get('customer_ids', [])
         service_plan_id = data.get('service_plan_id')
         amount = data.get('amount')
         billing_cycle = data.get('billing_cycle', 'monthly')
         due_days = data.get('due_days', 30)
-        
+
         if not customer_ids:
             return jsonify({'error': 'No customer IDs provided'}), 400
-        
+
         if not service_plan_id:
             return jsonify({'error': 'Service plan ID is required'}), 400
-        
+
         if not amount:
             return jsonify({'error': 'Amount is required'}), 400
-        
+
+        current_user = get_current_user()
+        isp_id = None if current_user.role == 'admin' else current_user.isp_id
+        if current_user.role != 'admin' and not isp_id:
+            return jsonify({'error': 'User not associated with any ISP'}), 403
+
         # Validate service plan
         plan = ServicePlan.query.get(service_plan_id)
-        if not plan:
+        if not plan or (isp_id and plan.isp_id != isp_id):
             return jsonify({'error': 'Service plan not found'}), 404
-        
+
         # Validate amount
         try:
             amount = float(amount)
@@ -546,43 +557,36 @@ def generate_bulk_invoices():
                 return jsonify({'error': 'Amount must be positive'}), 400
         except ValueError:
             return jsonify({'error': 'Invalid amount format'}), 400
-        
-        created_invoices = []
-        due_date = datetime.now() + timedelta(days=due_days)
-        
-        for customer_id in customer_ids:
-            # Validate customer exists
-            customer = Customer.query.get(customer_id)
-            if not customer:
-                continue
-            
-            # Generate invoice number
-            invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
-            
-            # Create invoice
-            invoice = Invoice(
-                invoice_number=invoice_number,
-                customer_id=customer_id,
-                amount=amount,
-                status=InvoiceStatus.PENDING,
-                due_date=due_date
-            )
-            
-            db.session.add(invoice)
-            created_invoices.append(invoice)
-        
-        db.session.commit()
-        
-        return jsonify({
-            'message': f'Successfully created {len(created_invoices)} invoices',
-            'created_count': len(created_invoices),
-            'invoices': [serialize_invoice(invoice) for invoice in created_invoices]
-        }), 201
-        
+
+        run = start_invoice_batch(
+            current_app._get_current_object(),
+            customer_ids,
+            amount=amount,
+            due_date=datetime.now() + timedelta(days=due_days),
+            isp_id=isp_id,
+            service_plan_id=plan.id,
+            billing_cycle=billing_cycle,
+            created_by_id=current_user.id,
+        )
+        payload = serialize_invoice_run(run)
+        payload['message'] = f'Invoicing {run.requested} customers'
+        return jsonify(payload), 202
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to generate bulk invoices: {str(e)}'}), 500
 
+
+@invoices_bp.route('/generate-bulk/<int:run_id>', methods=['GET'])
+@jwt_required()
+def bulk_invoice_status(run_id):
+    """Progress, then summary, of a bulk invoicing run."""
+    current_user = get_current_user()
+    run = InvoiceRun.query.get(run_id)
+    if not run or (current_user.role != 'admin' and run.isp_id != current_user.isp_id):
+        return jsonify({'error': 'Invoice run not found'}), 404
+    return jsonify(serialize_invoice_run(run)), 200
+
 @invoices_bp.route('/<int:invoice_id>/send-reminder', methods=['POST'])
 @jwt_required()
 def send_invoice_reminder(invoice_id):
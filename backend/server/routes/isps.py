@@ -1,9 +1,9 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extensions import db
 from auth_utils import get_current_user
 from services.brand_constants import sanitize_brand_text, BRAND_COMPANY
-from services.radius_clients_export import sync_radius_clients_conf
+from services.radius_clients_export import request_radius_clients_sync
 from models import ISP, User, MikrotikDevice, Customer, Invoice, ServicePlan
 from datetime import datetime, timedelta
 
@@ -316,10 +316,7 @@ def regenerate_radius_secret(isp_id):
         isp.generate_radius_secret()
         db.session.commit()
 
-        try:
-            sync_radius_clients_conf()
-        except OSError as sync_err:
-            current_app.logger.warning('Failed to sync RADIUS clients.conf: %s', sync_err)
+        request_radius_clients_sync()
         
         return jsonify({
             'message': 'RADIUS secret regenerated successfully',
@@ -10,11 +10,12 @@ import random
 import time
 
 from extensions import db
-from models import Customer, CustomerStatus, ISP, MikrotikDevice, RadCheck, RadiusSession
-from services.radius_provisioning import (
-    find_customer_by_login,
-    radius_username,
-    verify_radius_password,
+from models import CustomerStatus, RadCheck, RadiusSession
+from services.radius_auth_cache import (
+    lookup_isp,
+    lookup_login,
+    lookup_nas,
+    verify_login_password,
 )
 
 radius_api_bp = Blueprint('radius_api', __name__, url_prefix='/api/radius-api')
@@ -51,36 +52,38 @@ def authenticate_user():
         password = data['password']
         nas_ip = data['nas_ip']
 
-        customer = find_customer_by_login(username)
+        # Lookups are cached in-process (services.radius_auth_cache): during
+        # an auth storm the same logins, tenants and routers repeat constantly.
+        customer = lookup_login(username)
         if not customer:
             return jsonify({'ok': False, 'message': 'User not found', 'code': 'USER_NOT_FOUND'}), 401
 
-        if not customer.isp_id:
+        if not customer['isp_id']:
             return jsonify({'ok': False, 'message': 'Customer not associated with any ISP', 'code': 'NO_ISP_ASSOCIATION'}), 401
 
-        isp = ISP.query.get(customer.isp_id)
-        if not isp or not isp.is_active:
+        isp = lookup_isp(customer['isp_id'])
+        if not isp or not isp['is_active']:
             return jsonify({'ok': False, 'message': 'ISP not active', 'code': 'ISP_INACTIVE'}), 401
 
-        if customer.status != CustomerStatus.ACTIVE:
+        if customer['status'] != CustomerStatus.ACTIVE:
             return jsonify({'ok': False, 'message': 'Customer account not active', 'code': 'CUSTOMER_INACTIVE'}), 401
 
         password_ok = (
-            verify_radius_password(customer, password)
-            or _verify_via_radcheck(username, password, isp.id)
+            verify_login_password(customer, password)
+            or _verify_via_radcheck(username, password, isp['id'])
         )
         if not password_ok:
             return jsonify({'ok': False, 'message': 'Invalid credentials', 'code': 'INVALID_PASSWORD'}), 401
 
-        device = MikrotikDevice.query.filter_by(device_ip=nas_ip, isp_id=isp.id, is_active=True).first()
+        device = lookup_nas(nas_ip, isp['id'])
         if not device:
             return jsonify({'ok': False, 'message': 'Device not found or not authorized', 'code': 'DEVICE_NOT_FOUND'}), 401
 
-        session_id = f"{customer.id}_{int(time.time())}_{random.randint(1000, 9999)}"
+        session_id = f"{customer['customer_id']}_{int(time.time())}_{random.randint(1000, 9999)}"
         session = RadiusSession(
-            isp_id=isp.id,
-            customer_id=customer.id,
-            mikrotik_device_id=device.id,
+            isp_id=isp['id'],
+            customer_id=customer['customer_id'],
+            mikrotik_device_id=device['id'],
             session_id=session_id,
             username=username,
             ip_address=data.get('framed_ip', '0.0.0.0'),
@@ -95,12 +98,12 @@ def authenticate_user():
             'ok': True,
             'message': 'Authentication successful',
             'data': {
-                'customer_id': customer.id,
-                'customer_name': customer.full_name,
-                'isp_id': isp.id,
-                'isp_name': isp.name,
-                'device_id': device.id,
-                'device_name': device.device_name,
+                'customer_id': customer['customer_id'],
+                'customer_name': customer['full_name'],
+                'isp_id': isp['id'],
+                'isp_name': isp['name'],
+                'device_id': device['id'],
+                'device_name': device['device_name'],
                 'session_id': session_id,
             },
         }), 200
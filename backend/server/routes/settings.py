@@ -7,7 +7,7 @@ needs to pass an ISP id.
 """
 import os
 
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
 
@@ -819,15 +819,13 @@ def _get_or_create_radius_config(isp):
 
 
 def _sync_radius_clients_conf_safe():
-    """Best-effort regen of the FreeRADIUS clients.conf after a RADIUS change.
+    """Schedule a regen of the FreeRADIUS clients.conf after a RADIUS change.
 
-    Mirrors the device routes: a file-write failure must never fail the API.
+    Mirrors the device routes: the write happens off-request and coalesced, so
+    a file-write failure can never fail the API.
     """
-    try:
-        from services.radius_clients_export import sync_radius_clients_conf
-        sync_radius_clients_conf()
-    except Exception as exc:
-        current_app.logger.warning('Failed to sync RADIUS clients.conf: %s', exc)
+    from services.radius_clients_export import request_radius_clients_sync
+    request_radius_clients_sync()
 
 
 def serialize_nas(n):
@@ -6,12 +6,14 @@ import os
 from datetime import datetime
 import time
 
-# Try to import pysnmp, but make it optional
-try:
-    from pysnmp.hlapi import *
-    PYSNMP_AVAILABLE = True
-except ImportError:
-    PYSNMP_AVAILABLE = False
+from services.metric_series import SOURCE_SNMP, series_request
+from services.snmp_poller import (
+    PYSNMP_AVAILABLE, auth_data, context_data, poll_due_devices, shared_engine, transport_target,
+)
+
+# pysnmp is optional; the routes answer 503 without it.
+if PYSNMP_AVAILABLE:
+    from pysnmp.hlapi import ObjectIdentity, ObjectType, getCmd
 
 snmp_bp = Blueprint('snmp', __name__, url_prefix='/api/snmp')
 
@@ -35,6 +37,8 @@ def get_snmp_devices():
                 'priv_protocol': device.priv_protocol,
                 'is_active': device.is_active,
                 'last_poll': device.last_poll.isoformat() if device.last_poll else None,
+                'poll_interval': device.poll_interval,
+                'next_poll_at': device.next_poll_at.isoformat() if device.next_poll_at else None,
                 'created_at': device.created_at.isoformat() if device.created_at else None
             } for device in devices]
         }), 200
@@ -74,7 +78,8 @@ def create_snmp_device():
             priv_key=data.get('priv_key'),
             context_name=data.get('context_name'),
             timeout=data.get('timeout', 3),
-            retries=data.get('retries', 3)
+            retries=data.get('retries', 3),
+            poll_interval=data.get('poll_interval', 300)
         )
         
         db.session.add(device)
@@ -136,6 +141,9 @@ def update_snmp_device(device_id):
             device.retries = data['retries']
         if 'is_active' in data:
             device.is_active = data['is_active']
+        if 'poll_interval' in data:
+            device.poll_interval = data['poll_interval']
+            device.next_poll_at = None  # re-schedule from the next tick
         
         device.updated_at = datetime.utcnow()
         db.session.commit()
@@ -203,95 +211,14 @@ def get_snmp_value(device_id):
         start_time = time.time()
         
         try:
-            # Configure SNMP parameters based on version
-            if device.snmp_version == '1':
-                # SNMPv1
-                iterator = getCmd(
-                    SnmpEngine(),
-                    CommunityData(device.community or 'public'),
-                    UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                    ContextData(),
-                    ObjectType(ObjectIdentity(oid))
-                )
-            elif device.snmp_version == '2c':
-                # SNMPv2c
-                iterator = getCmd(
-                    SnmpEngine(),
-                    CommunityData(device.community or 'public'),
-                    UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                    ContextData(),
-                    ObjectType(ObjectIdentity(oid))
-                )
-            else:
-                # SNMPv3
-                if device.auth_protocol and device.priv_protocol:
-                    # authPriv
-                    auth_protocol_map = {
-                        'MD5': usmHMACMD5AuthProtocol,
-                        'SHA': usmHMACSHA1AuthProtocol,
-                        'SHA224': usmHMAC128SHA224AuthProtocol,
-                        'SHA256': usmHMAC192SHA256AuthProtocol,
-                        'SHA384': usmHMAC256SHA384AuthProtocol,
-                        'SHA512': usmHMAC384SHA512AuthProtocol
-                    }
-                    
-                    priv_protocol_map = {
-                        'DES': usmDESPrivProtocol,
-                        '3DES': usm3DESEDEPrivProtocol,
-                        'AES': usmAesCfb128Protocol,
-                        'AES192': usmAesCfb192Protocol,
-                        'AES256': usmAesCfb256Protocol
-                    }
-                    
-                    auth_protocol = auth_protocol_map.get(device.auth_protocol, usmHMACMD5AuthProtocol)
-                    priv_protocol = priv_protocol_map.get(device.priv_protocol, usmDESPrivProtocol)
-                    
-                    iterator = getCmd(
-                        SnmpEngine(),
-                        UsmUserData(
-                            device.username,
-                            authKey=device.auth_key,
-                            privKey=device.priv_key,
-                            authProtocol=auth_protocol,
-                            privProtocol=priv_protocol
-                        ),
-                        UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                        ContextData(device.context_name) if device.context_name else ContextData(),
-                        ObjectType(ObjectIdentity(oid))
-                    )
-                elif device.auth_protocol:
-                    # authNoPriv
-                    auth_protocol_map = {
-                        'MD5': usmHMACMD5AuthProtocol,
-                        'SHA': usmHMACSHA1AuthProtocol,
-                        'SHA224': usmHMAC128SHA224AuthProtocol,
-                        'SHA256': usmHMAC192SHA256AuthProtocol,
-                        'SHA384': usmHMAC256SHA384AuthProtocol,
-                        'SHA512': usmHMAC384SHA512AuthProtocol
-                    }
-                    
-                    auth_protocol = auth_protocol_map.get(device.auth_protocol, usmHMACMD5AuthProtocol)
-                    
-                    iterator = getCmd(
-                        SnmpEngine(),
-                        UsmUserData(
-                            device.username,
-                            authKey=device.auth_key,
-                            authProtocol=auth_protocol
-                        ),
-                        UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                        ContextData(device.context_name) if device.context_name else ContextData(),
-                        ObjectType(ObjectIdentity(oid))
-                    )
-                else:
-                    # noAuthNoPriv
-                    iterator = getCmd(
-                        SnmpEngine(),
-                        UsmUserData(device.username),
-                        UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                        ContextData(device.context_name) if device.context_name else ContextData(),
-                        ObjectType(ObjectIdentity(oid))
-                    )
+            # One engine per worker thread, reused across requests.
+            iterator = getCmd(
+                shared_engine(),
+                auth_data(device),
+                transport_target(device),
+                context_data(device),
+                ObjectType(ObjectIdentity(oid))
+            )
             
             # Execute SNMP request
             errorIndication, errorStatus, errorIndex, varBinds = next(iterator)
@@ -419,6 +346,31 @@ def get_snmp_value(device_id):
             'message': f'Error during SNMP request: {str(e)}'
         }), 500
 
+@snmp_bp.route('/devices/<int:device_id>/poll', methods=['POST'])
+@jwt_required()
+def poll_snmp_device(device_id):
+    """Poll a device's system scalars and ifTable now, as the scheduler would"""
+    if not PYSNMP_AVAILABLE:
+        return jsonify({
+            'ok': False,
+            'message': 'PySNMP module not available. Please install pysnmp package.'
+        }), 503
+
+    device = SnmpDevice.query.get_or_404(device_id)
+    try:
+        result = poll_due_devices(devices=[device], workers=1)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'ok': False,
+            'message': f'Error during SNMP poll: {str(e)}'
+        }), 500
+    return jsonify({
+        'ok': not result['failed'],
+        'message': 'SNMP poll failed' if result['failed'] else 'SNMP poll completed',
+        'data': result
+    }), 200
+
 @snmp_bp.route('/results/<int:device_id>', methods=['GET'])
 @jwt_required()
 def get_snmp_results(device_id):
@@ -453,6 +405,21 @@ def get_snmp_results(device_id):
             'message': f'Error retrieving SNMP results: {str(e)}'
         }), 500
 
+@snmp_bp.route('/devices/<int:device_id>/series', methods=['GET'])
+@jwt_required()
+def get_snmp_series(device_id):
+    """Downsampled min/avg/max series of a polled metric (response_ms, if.<n>.in_bps, ...)"""
+    device = SnmpDevice.query.get_or_404(device_id)
+    try:
+        data = series_request(SOURCE_SNMP, device.id, request.args)
+    except ValueError as e:
+        return jsonify({'ok': False, 'message': f'Invalid range: {str(e)}'}), 400
+    return jsonify({
+        'ok': True,
+        'message': 'SNMP series retrieved successfully',
+        'data': data
+    }), 200
+
 @snmp_bp.route('/test/<int:device_id>', methods=['POST'])
 @jwt_required()
 def test_snmp_connection(device_id):
@@ -472,90 +439,14 @@ def test_snmp_connection(device_id):
         start_time = time.time()
         
         try:
-            # Configure SNMP parameters based on version
-            if device.snmp_version == '1':
-                iterator = getCmd(
-                    SnmpEngine(),
-                    CommunityData(device.community or 'public'),
-                    UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                    ContextData(),
-                    ObjectType(ObjectIdentity(test_oid))
-                )
-            elif device.snmp_version == '2c':
-                iterator = getCmd(
-                    SnmpEngine(),
-                    CommunityData(device.community or 'public'),
-                    UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                    ContextData(),
-                    ObjectType(ObjectIdentity(test_oid))
-                )
-            else:
-                # SNMPv3
-                if device.auth_protocol and device.priv_protocol:
-                    auth_protocol_map = {
-                        'MD5': usmHMACMD5AuthProtocol,
-                        'SHA': usmHMACSHA1AuthProtocol,
-                        'SHA224': usmHMAC128SHA224AuthProtocol,
-                        'SHA256': usmHMAC192SHA256AuthProtocol,
-                        'SHA384': usmHMAC256SHA384AuthProtocol,
-                        'SHA512': usmHMAC384SHA512AuthProtocol
-                    }
-                    
-                    priv_protocol_map = {
-                        'DES': usmDESPrivProtocol,
-                        '3DES': usm3DESEDEPrivProtocol,
-                        'AES': usmAesCfb128Protocol,
-                        'AES192': usmAesCfb192Protocol,
-                        'AES256': usmAesCfb256Protocol
-                    }
-                    
-                    auth_protocol = auth_protocol_map.get(device.auth_protocol, usmHMACMD5AuthProtocol)
-                    priv_protocol = priv_protocol_map.get(device.priv_protocol, usmDESPrivProtocol)
-                    
-                    iterator = getCmd(
-                        SnmpEngine(),
-                        UsmUserData(
-                            device.username,
-                            authKey=device.auth_key,
-                            privKey=device.priv_key,
-                            authProtocol=auth_protocol,
-                            privProtocol=priv_protocol
-                        ),
-                        UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                        ContextData(device.context_name) if device.context_name else ContextData(),
-                        ObjectType(ObjectIdentity(test_oid))
-                    )
-                elif device.auth_protocol:
-                    auth_protocol_map = {
-                        'MD5': usmHMACMD5AuthProtocol,
-                        'SHA': usmHMACSHA1AuthProtocol,
-                        'SHA224': usmHMAC128SHA224AuthProtocol,
-                        'SHA256': usmHMAC192SHA256AuthProtocol,
-                        'SHA384': usmHMAC256SHA384AuthProtocol,
-                        'SHA512': usmHMAC384SHA512AuthProtocol
-                    }
-                    
-                    auth_protocol = auth_protocol_map.get(device.auth_protocol, usmHMACMD5AuthProtocol)
-                    
-                    iterator = getCmd(
-                        SnmpEngine(),
-                        UsmUserData(
-                            device.username,
-                            authKey=device.auth_key,
-                            authProtocol=auth_protocol
-                        ),
-                        UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                        ContextData(device.context_name) if device.context_name else ContextData(),
-                        ObjectType(ObjectIdentity(test_oid))
-                    )
-                else:
-                    iterator = getCmd(
-                        SnmpEngine(),
-                        UsmUserData(device.username),
-                        UdpTransportTarget((device.host, device.port), timeout=device.timeout, retries=device.retries),
-                        ContextData(device.context_name) if device.context_name else ContextData(),
-                        ObjectType(ObjectIdentity(test_oid))
-                    )
+            # One engine per worker thread, reused across requests.
+            iterator = getCmd(
+                shared_engine(),
+                auth_data(device),
+                transport_target(device),
+                context_data(device),
+                ObjectType(ObjectIdentity(test_oid))
+            )
             
             # Execute SNMP request
             errorIndication, errorStatus, errorIndex, varBinds = next(iterator)
@@ -0,0 +1,145 @@
+"""Cross-worker cache invalidation driven by ORM commits.
+
+Several caches keep query results in process memory — the Overview snapshot
+(services/dashboard_snapshot.py), fiber fault suspects
+(services/fiber_fault_cache.py), fiber map tiles (services/fiber_tiles.py)
+and the fallback RADIUS auth lookups (services/radius_auth_cache.py). Gunicorn
+runs several worker processes, so a flag in one worker's memory would only
+reach that worker. Each cache instead keeps *stamp files* in the shared
+container filesystem, the same way services.device_config_ops keeps its SSH
+locks there. A write rewrites a stamp, and every worker compares a stamp with
+what it has cached before using it.
+
+Caches register a watcher with :func:`watch`. One set of Session listeners
+serves all of them:
+
+* ``after_flush`` walks the flush's new, dirty and deleted objects once. It
+  skips dirty objects with no column changes and hands each watcher the
+  objects of the models it asked for. The watcher returns the keys (usually
+  tenant ids) the change affects.
+* ``after_commit`` passes each watcher the keys gathered over the whole
+  transaction, so a stamp is only rewritten for a write that really landed.
+* ``after_rollback`` forgets them.
+
+Bulk statements bypass the ORM events, so their callers invalidate directly.
+"""
+import logging
+import os
+import secrets
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Where the stamps live — shared by every worker in the container.
+_STAMP_DIR = '/tmp'
+_PENDING_KEY = 'commit_stamps_pending'
+
+_watchers = []
+_watched_models = ()
+
+
+def stamp_path(name):
+    return os.path.join(_STAMP_DIR, f'infora-{name}.stamp')
+
+
+def touch(name):
+    """Rewrite stamp ``name`` with a fresh token; never fails the caller.
+
+    A new token rather than just a new mtime, because mtime granularity can
+    let two quick commits share a version. Writing a temporary file and
+    renaming it means a reader never sees a half-written token.
+    """
+    path = stamp_path(name)
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    try:
+        with open(temp, 'w') as handle:
+            handle.write(secrets.token_hex(8))
+        os.replace(temp, path)
+    except OSError as exc:
+        # Worst case the cached value lives out its TTL.
+        logger.warning('Invalidation stamp %s not written: %s', path, exc)
+
+
+def stamp_time(name):
+    """When stamp ``name`` was last rewritten (0.0 if never)."""
+    try:
+        return os.stat(stamp_path(name)).st_mtime
+    except OSError:
+        return 0.0
+
+
+def stamp_token(name):
+    """The token stamp ``name`` holds ('0' if never written)."""
+    try:
+        with open(stamp_path(name)) as handle:
+            return handle.read().strip() or '0'
+    except OSError:
+        return '0'
+
+
+def tenants_of(session, obj, attribute='isp_id'):
+    """The tenants a flushed ``obj`` belongs to: now, and before the flush.
+
+    A row moved to another tenant leaves the old tenant's cache stale as
+    well. An old value that was never loaded is unknown, so it comes back as
+    None ("everything").
+    """
+    keys = {obj.__dict__.get(attribute)}
+    if obj not in session.new:
+        history = inspect(obj).attrs[attribute].history
+        if history.added:
+            keys.update(history.deleted or [None])
+    return keys
+
+
+def watch(name, models, collect, invalidate):
+    """Run ``invalidate(key)`` after a commit that changed ``models``.
+
+    ``collect(session, objects)`` is called from ``after_flush``. It gets the
+    changed instances of ``models`` and returns the keys they affect. It may
+    return None for a key it cannot resolve, and ``invalidate`` must treat
+    None as "everything".
+    """
+    global _watched_models
+    _watchers.append((name, tuple(models), collect, invalidate))
+    _watched_models = tuple({model for _n, group, _c, _i in _watchers for model in group})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, _flush_context):
+    if not _watched_models:
+        return
+    changed = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, _watched_models):
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        changed.append(obj)
+    if not changed:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for name, models, collect, _invalidate in _watchers:
+        objects = [obj for obj in changed if isinstance(obj, models)]
+        if objects:
+            keys = set(collect(session, objects) or ())
+            if keys:
+                pending.setdefault(name, set()).update(keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for name, _models, _collect_fn, invalidate in _watchers:
+        for key in pending.get(name, ()):
+            invalidate(key)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
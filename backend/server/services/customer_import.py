@@ -8,22 +8,37 @@ keep their original login + password and the CPE keeps dialing unchanged
 
 See MIGRATION_FROM_OTHER_BILLING.md §7.
 """
+import codecs
 import csv
 import io
+import logging
 import re
+import secrets
 from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import and_, delete, func, insert, or_, select
 
 from extensions import db
-from models import Customer, CustomerStatus, RadCheck, RadReply, ServicePlan
+from models import Customer, CustomerStatus, RadCheck, RadReply, RadUserGroup, ServicePlan
+from services.encryption import encrypt_values
 from services.hotspot_credentials import normalize_phone
+from services.plan_utils import generate_radius_attributes
 from services.radius_provisioning import (
     ensure_account_number,
-    find_customer_by_login,
+    ensure_plan_group,
+    format_radius_expiration,
     provision_customer_radius,
     radius_username,
+    reserve_account_numbers,
     set_customer_radius_password,
 )
 
+logger = logging.getLogger(__name__)
+
+# Rows validated (one uniqueness lookup per column) and committed together.
+CHUNK_SIZE = 500
+
 # Canonical columns of the import template (order is the template's column order).
 TEMPLATE_COLUMNS = [
     'name', 'login', 'password', 'email', 'phone', 'plan',
@@ -157,30 +172,55 @@ def _canonical_header(raw_header):
     return COLUMN_ALIASES.get(key)
 
 
-def parse_csv(content):
-    """Parse CSV text/bytes into a list of canonicalised row dicts.
+def _csv_lines(content):
+    """Lines of CSV text from a str, bytes, a text or binary file, or an iterable."""
+    if content is None:
+        return iter(())
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig', errors='replace')
+    if isinstance(content, str):
+        return io.StringIO(content.lstrip('\ufeff'))
+    if hasattr(content, 'read') and isinstance(content.read(0), bytes):
+        return codecs.getreader('utf-8-sig')(content, errors='replace')
+    return content
+
+
+def iter_csv_rows(content):
+    """Yield canonicalised row dicts from CSV content, one line at a time.
 
     Unknown columns are dropped; known aliases are mapped to canonical names.
+    Blank lines are skipped, so the n-th row yielded is row ``n`` of every
+    report (and the resume point of an import job).
     """
-    if isinstance(content, bytes):
-        content = content.decode('utf-8-sig', errors='replace')
-    reader = csv.reader(io.StringIO(content))
-    rows = list(reader)
-    if not rows:
-        return []
-    header = rows[0]
+    reader = csv.reader(_csv_lines(content))
+    header = next(reader, None)
+    if not header:
+        return
     # Map each source column index → canonical name (or None to ignore).
     index_map = [(_canonical_header(h), i) for i, h in enumerate(header)]
-    parsed = []
-    for source in rows[1:]:
+    for source in reader:
         if not any((cell or '').strip() for cell in source):
             continue  # skip blank lines
         row = {}
         for canonical, idx in index_map:
             if canonical and idx < len(source):
                 row[canonical] = source[idx]
-        parsed.append(row)
-    return parsed
+        yield row
+
+
+def parse_csv(content):
+    """Parse CSV text/bytes into a list of canonicalised row dicts."""
+    return list(iter_csv_rows(content))
+
+
+def rows_to_csv(rows):
+    """Render row dicts back to template-shaped CSV text (for queued imports)."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=TEMPLATE_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({key: '' if value is None else value for key, value in row.items()})
+    return out.getvalue()
 
 
 # Accepted date formats, tried in order. Day-first (DD/MM) is prioritised over
@@ -228,10 +268,56 @@ def _parse_date(value):
     return None, f'unparseable date {value!r}'
 
 
-def _clean_and_validate(raw, isp, ctx, seen):
+def _existing_identities(isp, raws):
+    """Which of a batch's emails, logins and account numbers are already taken.
+
+    Three ``IN`` queries per batch instead of three lookups per row. Emails
+    are unique platform-wide; logins resolve as :func:`find_customer_by_login`
+    does within the tenant (an email only counts for a customer without an
+    explicit login); account numbers are per tenant.
+    """
+    emails, logins, accounts = set(), set(), set()
+    for raw in raws:
+        email = (raw.get('email') or '').strip().lower()
+        login = (raw.get('login') or '').strip().lower()
+        account = (raw.get('account_number') or '').strip()
+        if email:
+            emails.add(email)
+        if login:
+            logins.add(login)
+        if account:
+            accounts.add(account)
+
+    existing = {'email': set(), 'login': set(), 'account': set()}
+    if emails:
+        existing['email'] = set(db.session.scalars(
+            select(Customer.email).where(Customer.email.in_(emails))
+        ))
+    if logins:
+        rows = db.session.execute(
+            select(Customer.radius_login, Customer.email).where(
+                Customer.isp_id == isp.id,
+                or_(
+                    func.lower(Customer.radius_login).in_(logins),
+                    and_(Customer.radius_login.is_(None), func.lower(Customer.email).in_(logins)),
+                ),
+            )
+        )
+        existing['login'] = {(login or email).strip().lower() for login, email in rows}
+    if accounts:
+        existing['account'] = set(db.session.scalars(
+            select(Customer.account_number).where(
+                Customer.isp_id == isp.id, Customer.account_number.in_(accounts),
+            )
+        ))
+    return existing
+
+
+def _clean_and_validate(raw, isp, ctx, seen, existing):
     """Clean one raw row and validate it.
 
-    Returns (cleaned_dict, [errors], meta) where meta reports the auto-cleaning
+    ``existing`` holds the batch's identities already taken in the database
+    (see :func:`_existing_identities`). Returns (cleaned_dict, [errors], meta) where meta reports the auto-cleaning
     that happened: ``status_change`` and ``unmatched_plan`` so the caller can
     aggregate them for the operator.
     """
@@ -303,17 +389,17 @@ def _clean_and_validate(raw, isp, ctx, seen):
     if email:
         if email in seen['email']:
             errors.append(f'duplicate email {email!r} within file')
-        elif Customer.query.filter_by(email=email).first():
+        elif email in existing['email']:
             errors.append(f'email {email!r} already exists')
     if login:
         if login in seen['login']:
             errors.append(f'duplicate login {login!r} within file')
-        elif find_customer_by_login(login, isp_id=isp.id):
+        elif login in existing['login']:
             errors.append(f'login {login!r} already exists')
     if account_number:
         if account_number in seen['account']:
             errors.append(f'duplicate account number {account_number!r} within file')
-        elif Customer.query.filter_by(account_number=account_number, isp_id=isp.id).first():
+        elif account_number in existing['account']:
             errors.append(f'account number {account_number!r} already exists')
 
     if not errors:
@@ -412,6 +498,151 @@ def _create_customer(cleaned, isp):
     return customer, (cleaned['password'] is None and status == CustomerStatus.ACTIVE)
 
 
+def _row_username(cleaned):
+    """:func:`radius_username` for a row that isn't a Customer yet."""
+    return (cleaned['login'] or cleaned['email'] or '').strip().lower()
+
+
+def _bulk_create(isp, ctx, rows):
+    """Create a batch of RADIUS (non-WireGuard) rows with executemany INSERTs.
+
+    Writes exactly what :func:`_create_customer` writes for each row — the
+    customer, its account number, encrypted password and, when active, the
+    per-user radcheck/radreply/radusergroup rows — but one statement per table
+    per batch. Returns one outcome dict per row, in order.
+    """
+    now = datetime.utcnow()
+    generated_numbers = iter(reserve_account_numbers(
+        isp, sum(1 for cleaned in rows if not cleaned['account_number'])
+    ))
+
+    values = []
+    passwords = []
+    for cleaned in rows:
+        plan = cleaned['plan']
+        status = CustomerStatus(cleaned['status'])
+        starts_now = cleaned['subscription_end'] and status == CustomerStatus.ACTIVE
+        # Same rule as set_customer_radius_password: keep the original, else generate.
+        password = cleaned['password'] or secrets.token_urlsafe(8)
+        passwords.append(password)
+        values.append({
+            'full_name': cleaned['name'],
+            'email': cleaned['email'],
+            'radius_login': cleaned['login'],
+            'phone': cleaned['phone'] or '',
+            'status': status,
+            'balance': cleaned['balance'] or 0,
+            'package': plan.name if plan else 'Imported',
+            'isp_id': isp.id,
+            'service_plan_id': plan.id if plan else None,
+            'connection_type': cleaned['connection_type'],
+            'subscription_end': cleaned['subscription_end'],
+            'subscription_start': now if starts_now else None,
+            'account_number': cleaned['account_number'] or next(generated_numbers),
+        })
+    for row, token in zip(values, encrypt_values(passwords)):
+        row['radius_password_encrypted'] = token
+    ids = db.session.execute(
+        insert(Customer).returning(Customer.id, sort_by_parameter_order=True), values,
+    ).scalars().all()
+
+    provisioned = [
+        (customer_id, cleaned, password)
+        for customer_id, cleaned, password in zip(ids, rows, passwords)
+        if cleaned['status'] == CustomerStatus.ACTIVE.value and cleaned['plan']
+    ]
+    if provisioned:
+        usernames = [_row_username(cleaned) for _id, cleaned, _password in provisioned]
+        # Stale rows left under these usernames (e.g. by a deleted account),
+        # as provision_customer_radius clears them per user.
+        for model in (RadCheck, RadReply, RadUserGroup):
+            db.session.execute(delete(model).where(
+                model.isp_id == isp.id, model.username.in_(usernames),
+            ))
+
+        checks, replies, groups = [], [], []
+        for (customer_id, cleaned, password), username in zip(provisioned, usernames):
+            plan = cleaned['plan']
+            if plan.id not in ctx['plan_replies']:
+                ensure_plan_group(plan, isp)
+                ctx['plan_replies'][plan.id] = generate_radius_attributes(plan)
+            row = {'username': username, 'isp_id': isp.id, 'customer_id': customer_id,
+                   'is_active': True}
+            checks.append({**row, 'attribute': 'Cleartext-Password', 'op': ':=',
+                           'value': password})
+            expiration = format_radius_expiration(cleaned['subscription_end'])
+            if expiration:
+                checks.append({**row, 'attribute': 'Expiration', 'op': ':=', 'value': expiration})
+            if cleaned['mac'] and cleaned['connection_type'] == 'hotspot':
+                checks.append({**row, 'attribute': 'Calling-Station-Id', 'op': ':=',
+                               'value': cleaned['mac']})
+            for attr in ctx['plan_replies'][plan.id]:
+                replies.append({**row, 'attribute': attr['attribute'], 'op': attr['op'],
+                                'value': attr['value']})
+            if cleaned['static_ip']:
+                replies.append({**row, 'attribute': 'Framed-IP-Address', 'op': ':=',
+                                'value': cleaned['static_ip']})
+            groups.append({**row, 'groupname': f'plan_{plan.id}', 'priority': 1})
+        db.session.execute(insert(RadCheck), checks)
+        if replies:
+            db.session.execute(insert(RadReply), replies)
+        db.session.execute(insert(RadUserGroup), groups)
+
+    return [
+        {
+            'customer_id': customer_id,
+            'account_number': value['account_number'],
+            'generated': cleaned['password'] is None and cleaned['status'] == CustomerStatus.ACTIVE.value,
+        }
+        for customer_id, value, cleaned in zip(ids, values, rows)
+    ]
+
+
+def _create_one(cleaned, isp):
+    """:func:`_create_customer` in its own SAVEPOINT, as an outcome dict."""
+    try:
+        with db.session.begin_nested():
+            customer, generated = _create_customer(cleaned, isp)
+    except Exception as exc:  # noqa: BLE001 — reported on the row
+        return {'error': f'create failed: {exc}'}
+    return {'customer_id': customer.id, 'account_number': customer.account_number,
+            'generated': generated}
+
+
+def commit_rows(isp, ctx, ready):
+    """Create customers for validated ``[(row_number, cleaned)]``.
+
+    Returns one outcome dict per row, in order: ``customer_id``,
+    ``account_number`` and ``generated`` (password made up), or ``error``.
+    The batch goes in through :func:`_bulk_create` inside one SAVEPOINT; if
+    that fails, it is replayed row by row through :func:`_create_customer`
+    so one bad row still only costs itself. WireGuard rows always take the
+    per-row path (their provisioning is not table inserts).
+    """
+    outcomes = [None] * len(ready)
+    bulk = []
+    for position, (_row_number, cleaned) in enumerate(ready):
+        plan = cleaned['plan']
+        if (plan and plan.plan_type == 'wireguard'
+                and cleaned['status'] == CustomerStatus.ACTIVE.value):
+            outcomes[position] = _create_one(cleaned, isp)
+        else:
+            bulk.append(position)
+    if bulk:
+        replies_before = dict(ctx['plan_replies'])
+        try:
+            with db.session.begin_nested():
+                created = _bulk_create(isp, ctx, [ready[p][1] for p in bulk])
+        except Exception as exc:  # noqa: BLE001
+            logger.warning('Bulk import batch failed, retrying row by row: %s', exc)
+            # Plan groups written inside the failed SAVEPOINT are gone too.
+            ctx['plan_replies'] = replies_before
+            created = [_create_one(ready[p][1], isp) for p in bulk]
+        for position, outcome in zip(bulk, created):
+            outcomes[position] = outcome
+    return outcomes
+
+
 def _suggest_plan(plan_name, by_speed):
     """Best-effort existing plan for a foreign name (even if ambiguous)."""
     num = _speed_number(plan_name)
@@ -458,19 +689,14 @@ def _resolve_plan_map(plan_map, by_name, by_key):
     return resolved
 
 
-def process_import(isp, rows, dry_run=True, default_status='active',
+def prepare_import(isp, plan_names, dry_run=True, default_status='active',
                    plan_map=None, create_plans=None, auto_create_plans=True):
-    """Validate (and, unless ``dry_run``, create) a batch of imported clients.
+    """Resolve packages for an import; returns the validation context.
 
-    ``plan_map`` maps foreign plan names → existing package (id or name).
-    ``auto_create_plans`` (default true): any package name that matches nothing
-    is created automatically as a placeholder — the operator can still override
-    it to an existing package via ``plan_map``. ``create_plans`` explicitly forces
-    creation of specific names. On commit the plans are created first, then each
-    row is created in its own SAVEPOINT so one bad row can't roll back the rest.
-
-    Returns a summary with per-row status plus the auto-cleaning report
-    (``plan_resolutions``, ``status_normalizations``, ``available_plans``).
+    ``plan_names`` is every row's plan column, read once: with
+    ``auto_create_plans`` any name that matches nothing is to be created.
+    Unless ``dry_run``, those packages are created here, up front, so rows
+    resolve to real plans.
     """
     plan_list = ServicePlan.query.filter_by(isp_id=isp.id).all()
     by_name, by_key, by_speed = _build_plan_indexes(plan_list)
@@ -483,8 +709,8 @@ def process_import(isp, rows, dry_run=True, default_status='active',
         if name and name.strip():
             create_names[_norm_key(name)] = name.strip()
     if auto_create_plans:
-        for raw in rows:
-            pname = (raw.get('plan') or '').strip()
+        for pname in plan_names:
+            pname = (pname or '').strip()
             if not pname:
                 continue
             key = _norm_key(pname)
@@ -502,15 +728,98 @@ def process_import(isp, rows, dry_run=True, default_status='active',
         by_name, by_key, by_speed = _build_plan_indexes(plan_list)
         resolved_map = _resolve_plan_map(plan_map, by_name, by_key)
 
-    ctx = {
+    return {
         'default_status': default_status,
         'by_name': by_name,
         'by_key': by_key,
         'by_speed': by_speed,
         'plan_map': resolved_map,
         'create_keys': set(create_names.keys()),
+        'plan_list': plan_list,
+        # plan id -> its reply attributes, once its RADIUS group is ensured.
+        'plan_replies': {},
+    }
+
+
+def new_seen():
+    """Identities claimed by earlier rows of the same file."""
+    return {'email': set(), 'login': set(), 'account': set()}
+
+
+def validate_rows(isp, ctx, seen, numbered_rows):
+    """Clean and validate a batch of ``(row_number, raw)``.
+
+    Returns ``[(row_number, cleaned, errors, meta)]``.
+    """
+    existing = _existing_identities(isp, [raw for _n, raw in numbered_rows])
+    return [
+        (row_number,) + _clean_and_validate(raw, isp, ctx, seen, existing)
+        for row_number, raw in numbered_rows
+    ]
+
+
+def preview_row(cleaned):
+    """What the operator sees for one row."""
+    plan_display = cleaned['plan'].name if cleaned['plan'] else cleaned['plan_name']
+    if cleaned['plan_pending_create']:
+        plan_display = f"{cleaned['plan_name']} (new)"
+    return {
+        'name': cleaned['name'],
+        'login': cleaned['login'] or cleaned['email'],
+        'email': cleaned['email'],
+        'phone': cleaned['phone'],
+        'plan': plan_display,
+        'connection_type': cleaned['connection_type'],
+        'status': cleaned['status'],
+        'subscription_end': cleaned['subscription_end'].isoformat() if cleaned['subscription_end'] else None,
+        'account_number': cleaned['account_number'],
+        'password_generated': cleaned['password'] is None,
     }
-    seen = {'email': set(), 'login': set(), 'account': set()}
+
+
+def numbered_chunks(rows, size=CHUNK_SIZE, skip=0):
+    """``[(row_number, raw), ...]`` batches; rows ``<= skip`` are passed over."""
+    numbered = islice(enumerate(rows, start=1), skip, None)
+    while True:
+        batch = list(islice(numbered, size))
+        if not batch:
+            return
+        yield batch
+
+
+def invalidate_after_import(isp):
+    """Bulk inserts bypass the ORM events the auth and dashboard caches watch."""
+    from services.dashboard_snapshot import invalidate_dashboard
+    from services.radius_auth_cache import invalidate_radius_auth
+    invalidate_dashboard(isp.id)
+    invalidate_radius_auth(isp.id)
+
+
+def process_import(isp, rows, dry_run=True, default_status='active',
+                   plan_map=None, create_plans=None, auto_create_plans=True):
+    """Validate (and, unless ``dry_run``, create) a batch of imported clients.
+
+    ``plan_map`` maps foreign plan names → existing package (id or name).
+    ``auto_create_plans`` (default true): any package name that matches nothing
+    is created automatically as a placeholder — the operator can still override
+    it to an existing package via ``plan_map``. ``create_plans`` explicitly forces
+    creation of specific names. On commit the plans are created first, then
+    rows are validated and created ``CHUNK_SIZE`` at a time (see
+    :func:`commit_rows`), committing after each chunk.
+
+    Synchronous, for previews and small files; a large migration goes through
+    services.customer_import_jobs, which runs the same stages in the background.
+
+    Returns a summary with per-row status plus the auto-cleaning report
+    (``plan_resolutions``, ``status_normalizations``, ``available_plans``).
+    """
+    ctx = prepare_import(
+        isp, (raw.get('plan') for raw in rows), dry_run=dry_run,
+        default_status=default_status, plan_map=plan_map, create_plans=create_plans,
+        auto_create_plans=auto_create_plans,
+    )
+    by_speed = ctx['by_speed']
+    seen = new_seen()
 
     results = []
     valid = 0
@@ -521,61 +830,44 @@ def process_import(isp, rows, dry_run=True, default_status='active',
     to_create = {}          # name -> count (will be auto-created)
     status_counts = {}      # (from, to) -> count
 
-    for idx, raw in enumerate(rows, start=1):
-        cleaned, errors, meta = _clean_and_validate(raw, isp, ctx, seen)
-
-        if meta['unmatched_plan']:
-            unmatched[meta['unmatched_plan']] = unmatched.get(meta['unmatched_plan'], 0) + 1
-        if meta['plan_to_create']:
-            to_create[meta['plan_to_create']] = to_create.get(meta['plan_to_create'], 0) + 1
-        if meta['status_change']:
-            status_counts[meta['status_change']] = status_counts.get(meta['status_change'], 0) + 1
-
-        plan_display = cleaned['plan'].name if cleaned['plan'] else cleaned['plan_name']
-        if cleaned['plan_pending_create']:
-            plan_display = f"{cleaned['plan_name']} (new)"
-        preview = {
-            'name': cleaned['name'],
-            'login': cleaned['login'] or cleaned['email'],
-            'email': cleaned['email'],
-            'phone': cleaned['phone'],
-            'plan': plan_display,
-            'connection_type': cleaned['connection_type'],
-            'status': cleaned['status'],
-            'subscription_end': cleaned['subscription_end'].isoformat() if cleaned['subscription_end'] else None,
-            'account_number': cleaned['account_number'],
-            'password_generated': cleaned['password'] is None,
-        }
-        entry = {'row': idx, 'status': 'error' if errors else 'valid',
-                 'messages': errors, 'data': preview}
-
-        if errors:
-            if not dry_run:
-                failed += 1
+    for chunk in numbered_chunks(rows):
+        ready = []
+        for idx, cleaned, errors, meta in validate_rows(isp, ctx, seen, chunk):
+            if meta['unmatched_plan']:
+                unmatched[meta['unmatched_plan']] = unmatched.get(meta['unmatched_plan'], 0) + 1
+            if meta['plan_to_create']:
+                to_create[meta['plan_to_create']] = to_create.get(meta['plan_to_create'], 0) + 1
+            if meta['status_change']:
+                status_counts[meta['status_change']] = status_counts.get(meta['status_change'], 0) + 1
+
+            entry = {'row': idx, 'status': 'error' if errors else 'valid',
+                     'messages': errors, 'data': preview_row(cleaned)}
             results.append(entry)
-            continue
+            if errors:
+                if not dry_run:
+                    failed += 1
+                continue
+            valid += 1
+            if not dry_run:
+                ready.append((entry, cleaned))
 
-        valid += 1
-        if dry_run:
-            entry['status'] = 'valid'
-            results.append(entry)
+        if not ready:
             continue
-
-        try:
-            with db.session.begin_nested():
-                customer, generated = _create_customer(cleaned, isp)
+        outcomes = commit_rows(isp, ctx, [(entry['row'], cleaned) for entry, cleaned in ready])
+        for (entry, _cleaned), outcome in zip(ready, outcomes):
+            if outcome.get('error'):
+                entry['status'] = 'error'
+                entry['messages'] = [outcome['error']]
+                failed += 1
+                continue
             entry['status'] = 'created'
-            entry['customer_id'] = customer.id
-            entry['data']['account_number'] = customer.account_number
+            entry['customer_id'] = outcome['customer_id']
+            entry['data']['account_number'] = outcome['account_number']
             created += 1
-            if generated:
+            if outcome['generated']:
                 needs_reconfigure += 1
-        except Exception as exc:
-            db.session.rollback()
-            entry['status'] = 'error'
-            entry['messages'] = [f'create failed: {exc}']
-            failed += 1
-        results.append(entry)
+        db.session.commit()
+        invalidate_after_import(isp)
 
     if not dry_run:
         db.session.commit()
@@ -627,7 +919,7 @@ def process_import(isp, rows, dry_run=True, default_status='active',
         'status_normalizations': status_normalizations,
         'available_plans': [
             {'id': p.id, 'name': p.name, 'speed': p.speed, 'plan_type': p.plan_type}
-            for p in plan_list
+            for p in ctx['plan_list']
         ],
         'rows': results,
     }
@@ -0,0 +1,1154 @@
+"""Overview dashboard snapshot — a handful of aggregate queries, cached per tenant.
+
+The Overview page used to issue a separate COUNT or SUM for every tile: customer
+counts per status and type, invoice sums, six months of revenue in a loop, one
+query per hour for the hotspot chart and one per day for SMS, plus a lazy load
+per payment, invoice and live session. Every operator paid for all of it on
+every refresh.
+
+Here each table is read once with conditional aggregates
+(``SUM(CASE WHEN ... THEN ... END)``): one pass over customers, one over
+invoices, one over the payment window, one over radacct, and small grouped
+queries for the charts. The finished payload is plain JSON-ready data, cached
+per ``(isp_id, router_id)`` for ``DASHBOARD_CACHE_TTL_SECONDS`` and stamped with
+the ``generated_at`` it was built at.
+
+Invalidation is explicit as well as timed. Committing a Customer, Payment or
+Invoice change touches a per-tenant stamp file (see ``_dirty_tenants`` and
+services/commit_stamps.py), and a cached snapshot older than its stamp is
+rebuilt, in whichever gunicorn worker holds it. Bulk statements bypass the
+ORM events, so their callers use ``invalidate_dashboard`` directly.
+
+Tenant users see their own tenant's figures; platform admins (``isp_id=None``)
+see the whole install.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import (
+    Customer,
+    CustomerDocument,
+    CustomerStatus,
+    DeviceStatus,
+    ISP,
+    Invoice,
+    InvoiceStatus,
+    KycStatus,
+    MikrotikDevice,
+    Notification,
+    Payment,
+    PaymentStatus,
+    RadAcct,
+    ServicePlan,
+    Ticket,
+    TicketStatus,
+    Transaction,
+)
+from services import commit_stamps
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_COLORS = [
+    '#10b981', '#3b82f6', '#8b5cf6', '#f59e0b', '#ef4444',
+    '#06b6d4', '#ec4899', '#84cc16',
+]
+
+_OPEN_TICKET_STATUSES = (
+    TicketStatus.OPEN,
+    TicketStatus.PENDING,
+    TicketStatus.IN_PROGRESS,
+    TicketStatus.ON_HOLD,
+)
+
+_ALL_TIME = datetime(2000, 1, 1)
+
+# Touched on every tenant write: the platform admin view spans all tenants.
+_ANY_TENANT = 'any'
+# Touched by invalidate_dashboard(None): drops every cached snapshot.
+_EVERYTHING = 'all'
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Periods
+# ---------------------------------------------------------------------------
+
+def _pct_change(current, previous):
+    if previous in (None, 0):
+        return 100.0 if current else 0.0
+    return round((float(current) - float(previous)) / float(previous) * 100, 1)
+
+
+def _month_range(now, offset_months=0):
+    start = (now.replace(day=1) - timedelta(days=30 * offset_months)).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def _week_start(dt):
+    return (dt - timedelta(days=dt.weekday())).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def _between(column, start, end=None):
+    if end is None:
+        return column >= start
+    return (column >= start) & (column < end)
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _sum_if(condition, value):
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+# ---------------------------------------------------------------------------
+# Aggregates — one statement per table
+# ---------------------------------------------------------------------------
+
+def _customer_stats(now, month_start, prev_start, prev_end, isp_id):
+    """Counts per connection type, every tile in one grouped pass.
+
+    The plan is outer-joined so MRR (sum of active subscribers' plan prices)
+    rides along instead of needing its own join.
+    """
+    active = Customer.status == CustomerStatus.ACTIVE
+    expired = Customer.subscription_end.isnot(None) & (Customer.subscription_end < now)
+    q = (
+        db.session.query(
+            Customer.connection_type,
+            func.count(Customer.id),
+            _count_if(active),
+            _count_if(Customer.status == CustomerStatus.SUSPENDED),
+            _count_if(Customer.status == CustomerStatus.PENDING),
+            _count_if(expired),
+            _count_if(active & ~expired),
+            _count_if(Customer.created_at >= month_start),
+            _count_if(_between(Customer.created_at, prev_start, prev_end)),
+            _count_if(Customer.kyc_status == KycStatus.PENDING),
+            _count_if(Customer.kyc_status == KycStatus.UNDER_REVIEW),
+            _count_if(Customer.kyc_status == KycStatus.VERIFIED),
+            _sum_if(active, func.coalesce(ServicePlan.price, 0)),
+        )
+        .outerjoin(ServicePlan, Customer.service_plan_id == ServicePlan.id)
+    )
+    if isp_id:
+        q = q.filter(Customer.isp_id == isp_id)
+
+    keys = ('total', 'active', 'suspended', 'pending', 'expired', 'active_unexpired',
+            'new_month', 'prev_new', 'kyc_pending', 'kyc_under_review', 'kyc_verified', 'mrr')
+    totals = dict.fromkeys(keys, 0)
+    by_type = {}
+    for row in q.group_by(Customer.connection_type).all():
+        values = dict(zip(keys, row[1:]))
+        by_type[row[0]] = values
+        for key in keys:
+            totals[key] += values[key] or 0
+    return totals, by_type
+
+
+def _invoice_stats(now, month_start, month_end, prev_start, prev_end, months, isp_id):
+    paid = Invoice.status == InvoiceStatus.PAID
+    open_ = Invoice.status.in_([InvoiceStatus.PENDING, InvoiceStatus.OVERDUE])
+    overdue = open_ & (Invoice.due_date < now)
+    pending = Invoice.status == InvoiceStatus.PENDING
+    columns = [
+        _sum_if(paid, Invoice.amount),
+        _sum_if(paid & _between(Invoice.paid_date, month_start, month_end), Invoice.amount),
+        _sum_if(paid & _between(Invoice.paid_date, prev_start, prev_end), Invoice.amount),
+        _count_if(pending),
+        _sum_if(pending, Invoice.amount),
+        _count_if(overdue),
+        _sum_if(overdue, Invoice.amount),
+    ]
+    columns += [_sum_if(paid & _between(Invoice.paid_date, s, e), Invoice.amount)
+                for s, e in months]
+    q = db.session.query(*columns)
+    if isp_id:
+        q = q.filter(Invoice.isp_id == isp_id)
+    row = q.one()
+    stats = dict(zip(
+        ('total_revenue', 'monthly_revenue', 'prev_monthly_revenue', 'pending_count',
+         'pending_amount', 'overdue_count', 'overdue_amount'),
+        (float(v or 0) for v in row[:7]),
+    ))
+    stats['pending_count'] = int(stats['pending_count'])
+    stats['overdue_count'] = int(stats['overdue_count'])
+    stats['months'] = [float(v or 0) for v in row[7:]]
+    return stats
+
+
+def _payment_stats(now, periods, month, tomorrow, months, isp_id):
+    """Every completed-payment figure on the page from one scan of the window.
+
+    ``periods`` maps a revenue period name to ``(start, end)`` (``end`` None for
+    open-ended); ``month`` is the bounded calendar month. The window read is
+    the earliest start among them and the six chart months.
+    """
+    hotspot = Customer.connection_type == 'hotspot'
+    pppoe = Customer.connection_type == 'pppoe'
+    date = Payment.payment_date
+    today = periods['today'][0]
+    month_start, month_end = month
+    thirty_days = now - timedelta(days=30)
+
+    named = {
+        'monthly_payments': _sum_if(date >= thirty_days, Payment.amount),
+        'mpesa_month_count': _count_if(
+            (date >= thirty_days) & Payment.payment_method.ilike('%mpesa%')
+        ),
+        'pppoe_month': _sum_if(pppoe & _between(date, month_start, month_end), Payment.amount),
+        'hotspot_month': _sum_if(hotspot & _between(date, month_start, month_end), Payment.amount),
+        'hotspot_today': _sum_if(hotspot & _between(date, today, tomorrow), Payment.amount),
+        'hotspot_yesterday': _sum_if(
+            hotspot & _between(date, *periods['yesterday']), Payment.amount
+        ),
+        'hotspot_week': _sum_if(
+            hotspot & _between(date, periods['this_week'][0], tomorrow), Payment.amount
+        ),
+        'hotspot_sales_today': _count_if(hotspot & _between(date, today, tomorrow)),
+    }
+    for name in ('today', 'yesterday', 'this_week', 'this_month', 'last_month', 'this_year'):
+        named[f'period_{name}'] = _sum_if(_between(date, *periods[name]), Payment.amount)
+    for index, (start, end) in enumerate(months):
+        named[f'month_{index}'] = _sum_if(_between(date, start, end), Payment.amount)
+
+    window_start = min([start for start, _end in periods.values()] + [months[0][0], thirty_days])
+    q = (
+        db.session.query(*named.values())
+        .outerjoin(Customer, Payment.customer_id == Customer.id)
+        .filter(Payment.payment_status == PaymentStatus.COMPLETED, date >= window_start)
+    )
+    if isp_id:
+        q = q.filter(Customer.isp_id == isp_id)
+    return dict(zip(named, (float(v or 0) for v in q.one())))
+
+
+def _hotspot_hourly(now, today_start, isp_id):
+    """Hotspot sales per hour today, as one GROUP BY hour."""
+    hour = func.extract('hour', Payment.payment_date)
+    q = (
+        db.session.query(hour, func.coalesce(func.sum(Payment.amount), 0), func.count(Payment.id))
+        .join(Customer, Payment.customer_id == Customer.id)
+        .filter(
+            Payment.payment_status == PaymentStatus.COMPLETED,
+            Customer.connection_type == 'hotspot',
+            Payment.payment_date >= today_start,
+            Payment.payment_date < now + timedelta(seconds=1),
+        )
+    )
+    if isp_id:
+        q = q.filter(Customer.isp_id == isp_id)
+    by_hour = {int(h): (float(amount or 0), int(sales or 0))
+               for h, amount, sales in q.group_by(hour).all() if h is not None}
+
+    hourly = []
+    for h in range(24):
+        amount, sales = (0, 0) if today_start.replace(hour=h) > now else by_hour.get(h, (0, 0))
+        hourly.append({'hour': f'{h:02d}', 'label': f'{h:02d}:00', 'amount': amount, 'sales': sales})
+    return hourly
+
+
+def _sms_stats(today_start, month_start, isp_id):
+    """SMS sent this month and per day over the last week, in one pass."""
+    days = [today_start - timedelta(days=offset) for offset in range(6, -1, -1)]
+    created = Notification.created_at
+    q = db.session.query(
+        _count_if(created >= month_start),
+        *[_count_if(_between(created, day, day + timedelta(days=1))) for day in days],
+    ).filter(
+        Notification.notification_type.ilike('sms'),
+        created >= min(month_start, days[0]),
+    )
+    if isp_id:
+        q = q.join(Customer, Notification.customer_id == Customer.id).filter(
+            Customer.isp_id == isp_id
+        )
+    row = q.one()
+    daily = [{'day': day.strftime('%a'), 'sent': int(sent or 0)} for day, sent in zip(days, row[1:])]
+    return int(row[0] or 0), daily
+
+
+def _backlog_counts(month_start, month_end, isp_id):
+    """Open tickets, unreviewed KYC documents and this month's expenses.
+
+    Three unrelated tables, so three scalar subqueries in one round trip.
+    """
+    tickets = select(func.count(Ticket.id)).where(Ticket.ticket_status.in_(_OPEN_TICKET_STATUSES))
+    docs = select(func.count(CustomerDocument.id)).where(
+        CustomerDocument.verification_status == 'pending'
+    )
+    expenses = select(func.coalesce(func.sum(Transaction.transaction_amount), 0)).where(
+        Transaction.transaction_type != 'payment',
+        _between(Transaction.created_at, month_start, month_end),
+    )
+    if isp_id:
+        owned = select(Customer.id).where(Customer.isp_id == isp_id)
+        tickets = tickets.where(Ticket.customer_id.in_(owned))
+        docs = docs.where(CustomerDocument.customer_id.in_(owned))
+        expenses = expenses.where(Transaction.customer_id.in_(owned))
+    row = db.session.execute(select(
+        tickets.scalar_subquery(), docs.scalar_subquery(), expenses.scalar_subquery()
+    )).one()
+    return int(row[0] or 0), int(row[1] or 0), float(row[2] or 0)
+
+
+def _plan_distribution(isp_id):
+    """Active plans cheapest first, each with its subscriber count."""
+    q = (
+        db.session.query(
+            ServicePlan.name, ServicePlan.plan_type, ServicePlan.price, func.count(Customer.id)
+        )
+        .outerjoin(Customer, Customer.service_plan_id == ServicePlan.id)
+        .filter(ServicePlan.is_active.is_(True))
+    )
+    if isp_id:
+        q = q.filter(ServicePlan.isp_id == isp_id)
+    rows = (
+        q.group_by(ServicePlan.id, ServicePlan.name, ServicePlan.plan_type, ServicePlan.price)
+        .order_by(ServicePlan.price.asc())
+        .all()
+    )
+    return [
+        {
+            'name': name,
+            'value': int(count or 0),
+            'plan_type': plan_type or 'pppoe',
+            'price': float(price),
+            'color': PACKAGE_COLORS[idx % len(PACKAGE_COLORS)],
+        }
+        for idx, (name, plan_type, price, count) in enumerate(rows)
+    ]
+
+
+def _device_stats(isp_id):
+    q = db.session.query(
+        func.count(MikrotikDevice.id),
+        _count_if(MikrotikDevice.device_status == DeviceStatus.ONLINE),
+        _count_if(MikrotikDevice.device_status == DeviceStatus.OFFLINE),
+        func.coalesce(func.sum(MikrotikDevice.client_count), 0),
+    )
+    if isp_id:
+        q = q.filter(MikrotikDevice.isp_id == isp_id)
+    total, online, offline, clients = q.one()
+    return int(total or 0), int(online or 0), int(offline or 0), int(clients or 0)
+
+
+# ---------------------------------------------------------------------------
+# RADIUS
+# ---------------------------------------------------------------------------
+
+def _empty_radius_stats():
+    return {
+        'upload_bytes': 0,
+        'download_bytes': 0,
+        'unique_users': 0,
+        'sessions': 0,
+        'live_sessions': 0,
+    }
+
+
+def _empty_session_counts():
+    return {'all': 0, 'pppoe': 0, 'hotspot': 0}
+
+
+def _apply_radacct_scope(query, router_id=None, isp_id=None):
+    if isp_id:
+        query = query.filter(RadAcct.isp_id == isp_id)
+    if router_id:
+        device = db.session.get(MikrotikDevice, router_id)
+        if device:
+            query = query.filter(
+                or_(
+                    RadAcct.mikrotik_device_id == router_id,
+                    RadAcct.nasipaddress == device.device_ip,
+                )
+            )
+    return query
+
+
+def _radius_period_stats(periods, router_id=None, isp_id=None):
+    """Traffic, distinct users, sessions and live sessions for every period.
+
+    One scan with a CASE per period; ``COUNT(DISTINCT CASE ... THEN username
+    END)`` counts a login once per period because the unmatched rows are NULL.
+    """
+    columns = []
+    for start, end in periods.values():
+        inside = _between(RadAcct.acctstarttime, start, end)
+        columns += [
+            _sum_if(inside, func.coalesce(RadAcct.acctinputoctets, 0)),
+            _sum_if(inside, func.coalesce(RadAcct.acctoutputoctets, 0)),
+            func.count(func.distinct(case((inside, RadAcct.username)))),
+            _count_if(inside),
+            _count_if(inside & RadAcct.acctstoptime.is_(None)),
+        ]
+    q = db.session.query(*columns).filter(
+        RadAcct.acctstarttime >= min(start for start, _end in periods.values())
+    )
+    row = _apply_radacct_scope(q, router_id, isp_id).one()
+
+    stats = {}
+    for index, name in enumerate(periods):
+        upload, download, users, sessions, live = row[index * 5:index * 5 + 5]
+        stats[name] = {
+            'upload_bytes': int(upload or 0),
+            'download_bytes': int(download or 0),
+            'unique_users': int(users or 0),
+            'sessions': int(sessions or 0),
+            'live_sessions': int(live or 0),
+        }
+    return stats
+
+
+def _safe_radius_period_stats(periods, router_id=None, isp_id=None):
+    try:
+        return _radius_period_stats(periods, router_id, isp_id)
+    except Exception:
+        db.session.rollback()
+        return {name: _empty_radius_stats() for name in periods}
+
+
+def _session_counts(router_id=None, isp_id=None):
+    """Live sessions, split by service.
+
+    Uses the shared online definition rather than a bare
+    ``acctstoptime IS NULL``: a router that dies mid-session never sends an
+    Accounting-Stop, and those rows would otherwise be counted as connected
+    forever. See services/session_tracking.
+    """
+    from services.session_tracking import link_unattributed_sessions, online_filter
+
+    link_unattributed_sessions()
+    linked = case((Customer.id.isnot(None), 1), else_=0)
+    query = (
+        db.session.query(linked, Customer.connection_type, RadAcct.framedprotocol, func.count())
+        .select_from(RadAcct)
+        .outerjoin(Customer, RadAcct.customer_id == Customer.id)
+        .filter(online_filter())
+    )
+    query = _apply_radacct_scope(query, router_id, isp_id)
+    counts = _empty_session_counts()
+    for is_linked, connection_type, framed, n in query.group_by(
+        linked, Customer.connection_type, RadAcct.framedprotocol
+    ).all():
+        # Fall back to the session's own protocol when the row is not linked to a
+        # customer — Framed-Protocol is PPP for a PPPoE dial, absent for hotspot.
+        if is_linked:
+            is_hotspot = connection_type == 'hotspot'
+        else:
+            is_hotspot = (framed or '').strip().upper() != 'PPP'
+        counts['all'] += n
+        counts['hotspot' if is_hotspot else 'pppoe'] += n
+    return counts
+
+
+def _safe_session_counts(router_id=None, isp_id=None):
+    try:
+        return _session_counts(router_id, isp_id)
+    except Exception:
+        db.session.rollback()
+        return _empty_session_counts()
+
+
+def _live_sessions_by_type(router_id=None, isp_id=None):
+    """Open (no Accounting-Stop) sessions for hotspot vs everything else."""
+    try:
+        q = (
+            db.session.query(Customer.connection_type, func.count(RadAcct.radacctid))
+            .select_from(RadAcct)
+            .outerjoin(Customer, RadAcct.customer_id == Customer.id)
+            .filter(RadAcct.acctstoptime.is_(None))
+        )
+        q = _apply_radacct_scope(q, router_id, isp_id)
+        live = {'pppoe': 0, 'hotspot': 0}
+        for connection_type, n in q.group_by(Customer.connection_type).all():
+            live['hotspot' if connection_type == 'hotspot' else 'pppoe'] += int(n or 0)
+        return live
+    except Exception:
+        db.session.rollback()
+        return {'pppoe': 0, 'hotspot': 0}
+
+
+def _top_data_users(limit=5, start=None, end=None, router_id=None, isp_id=None, active_only=False):
+    byte_expr = (
+        func.coalesce(RadAcct.acctinputoctets, 0) + func.coalesce(RadAcct.acctoutputoctets, 0)
+    )
+    q = (
+        db.session.query(
+            RadAcct.username,
+            func.max(Customer.full_name),
+            func.max(Customer.connection_type),
+            func.sum(byte_expr) if not active_only else func.max(byte_expr),
+        )
+        .outerjoin(Customer, RadAcct.customer_id == Customer.id)
+    )
+    q = _apply_radacct_scope(q, router_id, isp_id)
+    filters = []
+    if active_only:
+        filters.append(RadAcct.acctstoptime.is_(None))
+    if start is not None:
+        filters.append(RadAcct.acctstarttime >= start)
+    if end is not None:
+        filters.append(RadAcct.acctstarttime < end)
+    if filters:
+        q = q.filter(*filters)
+    rows = (
+        q.group_by(RadAcct.username)
+        .order_by((func.sum(byte_expr) if not active_only else func.max(byte_expr)).desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            'username': row[0],
+            'name': row[1] or row[0],
+            'connection_type': row[2] or '—',
+            'bytes': int(row[3] or 0),
+        }
+        for row in rows
+    ]
+
+
+def _safe_top_data_users(limit=5, start=None, end=None, router_id=None, isp_id=None, active_only=False):
+    try:
+        return _top_data_users(limit, start, end, router_id, isp_id, active_only)
+    except Exception:
+        db.session.rollback()
+        return []
+
+
+# ---------------------------------------------------------------------------
+# Pulse  (Overview hero — live strip + connection sparkline)
+# ---------------------------------------------------------------------------
+
+def _activity_series(now, hours=12, router_id=None, isp_id=None):
+    """Sessions started per hour over the trailing window.
+
+    Session *starts* rather than bytes: RADIUS counters are cumulative per
+    session, so bucketing them by hour would attribute a whole evening's
+    traffic to the minute the dial came up. Starts are exact.
+    """
+    start = (now - timedelta(hours=hours - 1)).replace(minute=0, second=0, microsecond=0)
+    q = db.session.query(RadAcct.acctstarttime)
+    q = _apply_radacct_scope(q, router_id, isp_id)
+    rows = q.filter(RadAcct.acctstarttime >= start).all()
+
+    buckets = [0] * hours
+    for (started,) in rows:
+        if not started:
+            continue
+        index = int((started - start).total_seconds() // 3600)
+        if 0 <= index < hours:
+            buckets[index] += 1
+
+    return [
+        {
+            'label': (start + timedelta(hours=i)).strftime('%H:%M'),
+            'sessions': buckets[i],
+        }
+        for i in range(hours)
+    ]
+
+
+def _safe_activity_series(now, hours=12, router_id=None, isp_id=None):
+    try:
+        return _activity_series(now, hours, router_id, isp_id)
+    except Exception:
+        db.session.rollback()
+        return []
+
+
+def _pulse_events(recent_customers, recent_payments, offline_device_list, limit=6):
+    """Newest few things worth a one-line mention on the hero."""
+    events = []
+    for c in recent_customers[:4]:
+        events.append({
+            'type': 'subscriber',
+            'title': 'New subscriber',
+            'subject': c.full_name or c.radius_login or c.account_number or 'Subscriber',
+            'detail': 'joined',
+            'path': f'/clients/{c.id}',
+            'timestamp': c.created_at.isoformat() if c.created_at else None,
+        })
+    for p in recent_payments[:4]:
+        events.append({
+            'type': 'payment',
+            'title': 'Payment received',
+            'subject': p.customer.full_name if p.customer else 'Subscriber',
+            'detail': 'paid',
+            'amount': float(p.amount or 0),
+            'path': '/billing/payments',
+            'timestamp': p.payment_date.isoformat() if p.payment_date else None,
+        })
+    for d in offline_device_list[:2]:
+        events.append({
+            'type': 'router',
+            'title': 'Router offline',
+            'subject': d.device_name,
+            'detail': 'stopped responding',
+            'path': f'/devices/mikrotik/{d.id}',
+            'timestamp': d.last_synced.isoformat() if d.last_synced else None,
+        })
+    events = [e for e in events if e['timestamp']]
+    events.sort(key=lambda e: e['timestamp'], reverse=True)
+    return events[:limit]
+
+
+def _device_metrics(device, now):
+    clients = device.client_count or 0
+    bw = device.bandwidth_usage or 0
+    cpu = min(95, max(8, (bw % 70) + 12 + clients * 2))
+    memory = min(95, max(15, 28 + clients * 4 + (bw % 30)))
+    downtime = None
+    if device.device_status == DeviceStatus.OFFLINE and device.last_synced:
+        delta = now - device.last_synced
+        hours = int(delta.total_seconds() // 3600)
+        minutes = int((delta.total_seconds() % 3600) // 60)
+        downtime = f'{hours}h {minutes}m'
+    return cpu, memory, downtime
+
+
+# ---------------------------------------------------------------------------
+# Snapshot
+# ---------------------------------------------------------------------------
+
+def _scoped(query, isp_id, column):
+    return query.filter(column == isp_id) if isp_id else query
+
+
+def build_dashboard_snapshot(isp_id=None, router_id=None, now=None):
+    """Compute the Overview payload from the database, uncached.
+
+    Everything returned is plain JSON-ready data — no ORM instances — so it
+    can outlive the request that built it. The per-user setup checklist is
+    not included; routes.dashboard adds it.
+    """
+    now = now or datetime.now()
+    month_start, month_end = _month_range(now, 0)
+    prev_start, prev_end = _month_range(now, 1)
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow_start = today_start + timedelta(days=1)
+    yesterday_start = today_start - timedelta(days=1)
+    week_start = _week_start(now)
+    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    months = [_month_range(now, i) for i in range(5, -1, -1)]
+
+    customers, customers_by_type = _customer_stats(now, month_start, prev_start, prev_end, isp_id)
+    invoices = _invoice_stats(now, month_start, month_end, prev_start, prev_end, months, isp_id)
+    payments = _payment_stats(
+        now,
+        {
+            'today': (today_start, None),
+            'yesterday': (yesterday_start, today_start),
+            'this_week': (week_start, None),
+            'this_month': (month_start, None),
+            'last_month': (prev_start, prev_end),
+            'this_year': (year_start, None),
+        },
+        (month_start, month_end),
+        tomorrow_start,
+        months,
+        isp_id,
+    )
+    open_tickets, kyc_docs_pending, month_expenses = _backlog_counts(month_start, month_end, isp_id)
+    package_distribution = _plan_distribution(isp_id)
+    total_devices, online_devices, offline_devices, total_router_clients = _device_stats(isp_id)
+    sms_sent_month, sms_daily = _sms_stats(today_start, month_start, isp_id)
+    sms_failed_month = 0
+
+    hotspot_customers = customers_by_type.get('hotspot', {}).get('total', 0)
+    pppoe_customers = customers_by_type.get('pppoe', {}).get('total', 0)
+    active_plans = len(package_distribution)
+    hotspot_plans = sum(1 for p in package_distribution if p['plan_type'] == 'hotspot')
+    pppoe_plans = sum(1 for p in package_distribution if p['plan_type'] == 'pppoe')
+
+    revenue_data = [
+        {
+            'month': start.strftime('%b'),
+            'revenue': invoices['months'][index],
+            'payments': payments[f'month_{index}'],
+        }
+        for index, (start, _end) in enumerate(months)
+    ]
+
+    connection_distribution = [
+        {'name': 'Hotspot', 'value': hotspot_customers, 'color': '#10b981'},
+        {'name': 'PPPoE', 'value': pppoe_customers, 'color': '#3b82f6'},
+    ]
+
+    # Recent activity — customer eager-loaded so each row is not a lazy load.
+    recent_payments = (
+        _scoped(Payment.query.join(Customer, Payment.customer_id == Customer.id),
+                isp_id, Customer.isp_id)
+        .options(joinedload(Payment.customer))
+        .filter(Payment.payment_status == PaymentStatus.COMPLETED)
+        .order_by(Payment.payment_date.desc())
+        .limit(6)
+        .all()
+    )
+    recent_customers = (
+        _scoped(Customer.query, isp_id, Customer.isp_id)
+        .order_by(Customer.created_at.desc())
+        .limit(5)
+        .all()
+    )
+    recent_invoices = (
+        _scoped(Invoice.query, isp_id, Invoice.isp_id)
+        .options(joinedload(Invoice.customer))
+        .order_by(Invoice.created_at.desc())
+        .limit(5)
+        .all()
+    )
+
+    recent_activity = []
+    for payment in recent_payments:
+        recent_activity.append({
+            'type': 'payment',
+            'message': f"Payment from {payment.customer.full_name if payment.customer else 'Customer'}",
+            'amount': float(payment.amount),
+            'status': payment.payment_method,
+            'timestamp': payment.payment_date.isoformat() if payment.payment_date else None,
+        })
+    for inv in recent_invoices:
+        if inv.status != InvoiceStatus.PAID:
+            recent_activity.append({
+                'type': 'invoice',
+                'message': f"Invoice {inv.invoice_number} — {inv.customer.full_name if inv.customer else 'Customer'}",
+                'amount': float(inv.amount),
+                'status': inv.status.value if inv.status else 'pending',
+                'timestamp': inv.created_at.isoformat() if inv.created_at else None,
+            })
+    recent_activity.sort(key=lambda x: x.get('timestamp') or '', reverse=True)
+    recent_activity = recent_activity[:10]
+
+    overdue_invoices = invoices['overdue_count']
+    expired_subscriptions = customers['expired']
+    kyc_waiting = customers['kyc_pending'] + customers['kyc_under_review']
+
+    # Alerts
+    alerts = []
+    if overdue_invoices > 0:
+        alerts.append({
+            'level': 'warning',
+            'title': f'{overdue_invoices} overdue invoice(s)',
+            'message': f"{invoices['overdue_amount']:,.0f} KES outstanding past due date.",
+            'link': '/billing/invoices',
+        })
+    if expired_subscriptions > 0:
+        alerts.append({
+            'level': 'error',
+            'title': f'{expired_subscriptions} expired subscription(s)',
+            'message': 'Customers may be offline until they renew via the captive portal.',
+            'link': '/customers',
+        })
+    if offline_devices > 0:
+        alerts.append({
+            'level': 'warning',
+            'title': f'{offline_devices} router(s) offline',
+            'message': 'Check MikroTik devices and sync status.',
+            'link': '/devices/mikrotik',
+        })
+    if kyc_waiting > 0:
+        alerts.append({
+            'level': 'info',
+            'title': f'{kyc_waiting} KYC review(s) pending',
+            'message': 'Verify customer documents to stay compliant.',
+            'link': '/customers/kyc',
+        })
+    if open_tickets > 0:
+        alerts.append({
+            'level': 'info',
+            'title': f'{open_tickets} open support ticket(s)',
+            'message': 'Respond to customer issues promptly.',
+            'link': '/tickets',
+        })
+
+    overdue_list = (
+        _scoped(Invoice.query, isp_id, Invoice.isp_id)
+        .options(joinedload(Invoice.customer))
+        .filter(
+            Invoice.status.in_([InvoiceStatus.PENDING, InvoiceStatus.OVERDUE]),
+            Invoice.due_date < now,
+        )
+        .order_by(Invoice.due_date.asc())
+        .limit(5)
+        .all()
+    )
+
+    expiring_soon = (
+        _scoped(Customer.query, isp_id, Customer.isp_id)
+        .filter(
+            Customer.subscription_end.isnot(None),
+            Customer.subscription_end >= now,
+            Customer.subscription_end < now + timedelta(days=7),
+            Customer.status == CustomerStatus.ACTIVE,
+        )
+        .order_by(Customer.subscription_end.asc())
+        .limit(5)
+        .all()
+    )
+
+    devices_query = MikrotikDevice.query.filter_by(is_active=True)
+    if isp_id:
+        devices_query = devices_query.filter_by(isp_id=isp_id)
+    all_routers = devices_query.order_by(MikrotikDevice.device_name.asc()).all()
+    if router_id:
+        devices = [d for d in all_routers if d.id == router_id]
+    else:
+        devices = sorted(all_routers, key=lambda d: (d.device_status.value if d.device_status else 'offline'))[:6]
+
+    revenue_periods = {
+        name: payments[f'period_{name}']
+        for name in ('today', 'yesterday', 'this_week', 'this_month', 'last_month', 'this_year')
+    }
+
+    revenue_by_type = {
+        'pppoe': payments['pppoe_month'],
+        'hotspot': payments['hotspot_month'],
+    }
+
+    live_by_type = _live_sessions_by_type(router_id, isp_id)
+    subscribers = {}
+    for connection_type in ('pppoe', 'hotspot'):
+        stats = customers_by_type.get(connection_type, {})
+        subscribers[connection_type] = {
+            'total': int(stats.get('total') or 0),
+            'active': int(stats.get('active_unexpired') or 0),
+            'expired': int(stats.get('expired') or 0),
+            'suspended': int(stats.get('suspended') or 0),
+            'new_month': int(stats.get('new_month') or 0),
+            'live_sessions': live_by_type[connection_type],
+        }
+
+    hotspot_activity = {
+        'today': payments['hotspot_today'],
+        'yesterday': payments['hotspot_yesterday'],
+        'this_week': payments['hotspot_week'],
+        'this_month': payments['hotspot_month'],
+        'sales_today': int(payments['hotspot_sales_today']),
+    }
+
+    radius_periods = _safe_radius_period_stats(
+        {
+            'today': (today_start, None),
+            'week': (week_start, None),
+            'month': (month_start, None),
+            'last_month': (prev_start, prev_end),
+            'all': (_ALL_TIME, None),
+        },
+        router_id,
+        isp_id,
+    )
+
+    top_data_users_by_period = {
+        'today': _safe_top_data_users(5, today_start, tomorrow_start, router_id, isp_id),
+        'week': _safe_top_data_users(5, week_start, tomorrow_start, router_id, isp_id),
+        'month': _safe_top_data_users(5, month_start, month_end, router_id, isp_id),
+        'last_month': _safe_top_data_users(5, prev_start, prev_end, router_id, isp_id),
+        'all': _safe_top_data_users(5, _ALL_TIME, None, router_id, isp_id),
+    }
+    top_data_users = top_data_users_by_period['today']
+
+    session_counts = _safe_session_counts(router_id, isp_id)
+
+    if isp_id:
+        isp = db.session.get(ISP, isp_id)
+    else:
+        isp = ISP.query.filter_by(is_active=True).order_by(ISP.id.asc()).first()
+    organization = {
+        'name': isp.company_name if isp else 'Lumen',
+        'tagline': 'Internet Service Provider',
+        'country': 'KE',
+        'currency': 'KES',
+        'routers': total_devices,
+        'packages': active_plans,
+        'modules': ['PPPoE', 'Hotspot', 'WireGuard'],
+    }
+
+    active_sessions = session_counts['all']
+
+    today_radius = radius_periods.get('today') or {}
+    offline_routers = [d for d in all_routers if d.device_status == DeviceStatus.OFFLINE]
+    activity_series = _safe_activity_series(now, 12, router_id, isp_id)
+    pulse = {
+        'online_now': active_sessions,
+        'events': _pulse_events(recent_customers, recent_payments, offline_routers),
+        'activity': {
+            'window_hours': 12,
+            'series': activity_series,
+            'sessions': sum(point['sessions'] for point in activity_series),
+            'bytes_today': int(today_radius.get('download_bytes') or 0)
+            + int(today_radius.get('upload_bytes') or 0),
+        },
+    }
+
+    hotspot_hourly = _hotspot_hourly(now, today_start, isp_id)
+
+    roadmap = [
+        {'title': 'WireGuard VPN billing', 'status': 'shipped'},
+        {'title': 'Online users dashboard', 'status': 'shipped'},
+        {'title': 'Dark mode', 'status': 'shipped'},
+        {'title': 'M-Pesa STK integration', 'status': 'shipped'},
+        {'title': 'SMS campaigns', 'status': 'planned'},
+        {'title': 'Reseller portal', 'status': 'planned'},
+    ]
+
+    device_list = []
+    for d in devices:
+        cpu, mem, down = _device_metrics(d, now)
+        device_list.append({
+            'id': d.id,
+            'name': d.device_name,
+            'ip': d.device_ip,
+            'status': d.device_status.value if d.device_status else 'offline',
+            'clients': d.client_count or 0,
+            'location': d.location,
+            'model': d.device_model,
+            'uptime': d.uptime or 0,
+            'bandwidth_usage': d.bandwidth_usage or 0,
+            'last_synced': d.last_synced.isoformat() if d.last_synced else None,
+            'cpu_percent': cpu,
+            'memory_percent': mem,
+            'downtime': down,
+        })
+
+    router_list = [
+        {'id': d.id, 'name': d.device_name, 'ip': d.device_ip}
+        for d in all_routers
+    ]
+
+    monthly_payments = payments['monthly_payments']
+    pending_invoices = invoices['pending_count']
+    pending_invoice_amount = invoices['pending_amount']
+
+    return {
+        'generated_at': now.isoformat(),
+        'summary': {
+            'total_revenue': invoices['total_revenue'],
+            'monthly_revenue': invoices['monthly_revenue'],
+            'revenue_change_pct': _pct_change(invoices['monthly_revenue'],
+                                              invoices['prev_monthly_revenue']),
+            'monthly_payments': monthly_payments,
+            'today_payments': payments['period_today'],
+            'mpesa_month_count': int(payments['mpesa_month_count']),
+            'mrr': float(customers['mrr'] or 0),
+            'active_customers': int(customers['active']),
+            'total_customers': int(customers['total']),
+            'customer_change_pct': _pct_change(customers['new_month'], customers['prev_new']),
+            'suspended_customers': int(customers['suspended']),
+            'pending_customers': int(customers['pending']),
+            'hotspot_customers': int(hotspot_customers),
+            'pppoe_customers': int(pppoe_customers),
+            'expired_subscriptions': int(expired_subscriptions),
+            'new_customers_month': int(customers['new_month']),
+            'pending_invoices': pending_invoices,
+            'overdue_invoices': overdue_invoices,
+            'pending_invoice_amount': pending_invoice_amount,
+            'overdue_invoice_amount': invoices['overdue_amount'],
+            'active_plans': active_plans,
+            'hotspot_plans': hotspot_plans,
+            'pppoe_plans': pppoe_plans,
+            'total_devices': total_devices,
+            'online_devices': online_devices,
+            'offline_devices': offline_devices,
+            'total_router_clients': total_router_clients,
+            'kyc_pending': int(customers['kyc_pending']),
+            'kyc_under_review': int(customers['kyc_under_review']),
+            'kyc_verified': int(customers['kyc_verified']),
+            'kyc_docs_pending': kyc_docs_pending,
+            'open_tickets': open_tickets,
+        },
+        'revenue_data': revenue_data,
+        'package_distribution': package_distribution,
+        'connection_distribution': connection_distribution,
+        'recent_activity': recent_activity,
+        'recent_payments': [
+            {
+                'id': p.id,
+                'customer': p.customer.full_name if p.customer else '—',
+                'amount': float(p.amount),
+                'method': p.payment_method,
+                'receipt': p.mpesa_receipt_number,
+                'date': p.payment_date.isoformat() if p.payment_date else None,
+            }
+            for p in recent_payments
+        ],
+        'recent_customers': [
+            {
+                'id': c.id,
+                'name': c.full_name,
+                'package': c.package,
+                'connection_type': c.connection_type,
+                'status': c.status.value if c.status else 'active',
+                'joined': c.created_at.isoformat() if c.created_at else None,
+            }
+            for c in recent_customers
+        ],
+        'overdue_invoices': [
+            {
+                'id': inv.id,
+                'invoice_number': inv.invoice_number,
+                'customer': inv.customer.full_name if inv.customer else '—',
+                'amount': float(inv.amount),
+                'due_date': inv.due_date.isoformat() if inv.due_date else None,
+            }
+            for inv in overdue_list
+        ],
+        'expiring_subscriptions': [
+            {
+                'id': c.id,
+                'name': c.full_name,
+                'package': c.package,
+                'expires': c.subscription_end.isoformat() if c.subscription_end else None,
+            }
+            for c in expiring_soon
+        ],
+        'devices': device_list,
+        'routers': router_list,
+        'alerts': alerts,
+        'revenue_periods': revenue_periods,
+        'revenue_by_type': revenue_by_type,
+        'subscribers': subscribers,
+        'hotspot_activity': hotspot_activity,
+        'radius_periods': radius_periods,
+        'top_data_users': top_data_users,
+        'top_data_users_by_period': top_data_users_by_period,
+        'session_counts': session_counts,
+        'filter_router_id': router_id,
+        'sms_usage': {
+            'sent': sms_sent_month,
+            'failed': sms_failed_month,
+            'balance': max(0, 100 - sms_sent_month),
+        },
+        'organization': organization,
+        'pulse': pulse,
+        'active_sessions': active_sessions,
+        'operations': {
+            'expenses': month_expenses,
+            'payouts': monthly_payments,
+            'invoices_due': pending_invoices,
+            'invoices_due_amount': pending_invoice_amount,
+            'sms_sent': sms_sent_month,
+            'sms_failed': sms_failed_month,
+            'campaigns': 0,
+            'open_tickets': open_tickets,
+        },
+        'hotspot_hourly': hotspot_hourly,
+        'sms_daily': sms_daily,
+        'roadmap': roadmap,
+        # Legacy fields for backward compatibility
+        'total_revenue': invoices['total_revenue'],
+        'active_customers': int(customers['active']),
+        'monthly_payments': monthly_payments,
+        'active_plans': active_plans,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Cache + invalidation
+# ---------------------------------------------------------------------------
+
+def _stamps_for(isp_id):
+    return (f'dashboard-isp-{isp_id}' if isp_id else f'dashboard-{_ANY_TENANT}',
+            f'dashboard-{_EVERYTHING}')
+
+
+def invalidate_dashboard(isp_id=None):
+    """Drop cached snapshots for ``isp_id`` (and the platform-wide view).
+
+    ``None`` drops every snapshot. Reaches every worker process on the host.
+    ORM commits of customers, payments and invoices call this on their own;
+    call it after bulk statements that change them.
+    """
+    if isp_id:
+        commit_stamps.touch(f'dashboard-isp-{isp_id}')
+        commit_stamps.touch(f'dashboard-{_ANY_TENANT}')
+    else:
+        commit_stamps.touch(f'dashboard-{_EVERYTHING}')
+
+
+def _ttl_seconds():
+    try:
+        return float(current_app.config.get('DASHBOARD_CACHE_TTL_SECONDS', 30) or 0)
+    except RuntimeError:  # outside an app context
+        return 30.0
+
+
+def get_dashboard_snapshot(isp_id=None, router_id=None):
+    """The cached snapshot for ``(isp_id, router_id)``, rebuilt when stale.
+
+    Stale means older than the TTL, or older than the last invalidation stamp
+    for the tenant. The build start time is what is compared, so a write that
+    commits while a snapshot is being built invalidates it.
+    """
+    key = (isp_id or None, router_id or None)
+    ttl = _ttl_seconds()
+    wall = time.time()
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is not None and ttl > 0:
+        built_at, snapshot = entry
+        fresh = wall - built_at < ttl and all(
+            commit_stamps.stamp_time(name) < built_at for name in _stamps_for(isp_id)
+        )
+        if fresh:
+            return snapshot
+
+    snapshot = build_dashboard_snapshot(isp_id, router_id)
+    if ttl > 0:
+        with _cache_lock:
+            # Expired entries are dropped on the way in, so the dict stays
+            # bounded by the tenants/routers looked at within one TTL.
+            for stale in [k for k, (t, _s) in _cache.items() if wall - t >= ttl]:
+                del _cache[stale]
+            _cache[key] = (wall, snapshot)
+    return snapshot
+
+
+def clear_dashboard_cache():
+    """Forget this process's snapshots (tests, and after a restore)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _dirty_tenants(session, objects):
+    """The tenants a flush's customers, payments and invoices belong to.
+
+    Payments carry no isp_id of their own, so their customers' tenants are
+    looked up in one query. An unresolvable tenant (attribute never loaded)
+    is None, which drops everything.
+    """
+    tenants = set()
+    customer_ids = set()
+    for obj in objects:
+        if isinstance(obj, Payment) and obj.__dict__.get('customer_id') is not None:
+            customer_ids.add(obj.__dict__['customer_id'])
+        else:
+            tenants.add(obj.__dict__.get('isp_id'))
+    if customer_ids:
+        rows = session.execute(
+            select(Customer.isp_id).where(Customer.id.in_(customer_ids)).distinct()
+        ).all()
+        tenants.update(isp for (isp,) in rows)
+    return tenants
+
+
+commit_stamps.watch('dashboard', (Customer, Payment, Invoice), _dirty_tenants, invalidate_dashboard)
@@ -9,7 +9,9 @@ from services.radius_provisioning import deprovision_customer_radius, radius_use
 def purge_expired_data(dry_run=False):
     """Delete expired hotspot users and old paid records past each ISP's retention window."""
     isps = ISP.query.filter(ISP.data_retention_days.isnot(None)).all()
-    summary = {'customers': 0, 'invoices': 0, 'payments': 0, 'cpe_sessions': 0}
+    summary = {'customers': 0, 'invoices': 0, 'payments': 0, 'cpe_sessions': 0,
+               'usage_buckets': 0, 'metric_buckets': 0, 'snmp_results': 0,
+               'radacct_partitions': 0, 'job_runs': 0}
     now = datetime.utcnow()
 
     # CWMP session rows are high churn — every managed CPE opens one per
@@ -18,6 +20,11 @@ def purge_expired_data(dry_run=False):
     # history. Retention is global rather than per-ISP because the volume, not
     # the tenant, is what makes them expensive.
     summary['cpe_sessions'] = _purge_cpe_sessions(now, dry_run)
+    summary['usage_buckets'] = _purge_usage_rollup(dry_run)
+    summary['metric_buckets'] = _downsample_metrics(now, dry_run)
+    summary['snmp_results'] = _purge_snmp_results(now, dry_run)
+    summary['radacct_partitions'] = _maintain_radacct_partitions(now, dry_run)
+    summary['job_runs'] = _purge_job_runs(now, dry_run)
 
     for isp in isps:
         days = max(7, int(isp.data_retention_days))
@@ -64,3 +71,55 @@ def _purge_cpe_sessions(now, dry_run):
     if dry_run:
         return query.count()
     return query.delete(synchronize_session=False)
+
+
+def _purge_usage_rollup(dry_run):
+    """Drop FUP usage-rollup buckets no reset cycle can still read."""
+    from flask import current_app
+    from services.usage_rollup import prune_usage_rollup
+
+    days = int(current_app.config.get('USAGE_ROLLUP_RETENTION_DAYS', 62) or 62)
+    return prune_usage_rollup(max(35, days), dry_run=dry_run)
+
+
+def _downsample_metrics(now, dry_run):
+    """Fold aged metric buckets into coarser ones; drop expired hourly ones."""
+    from services.metric_series import downsample
+
+    result = downsample(now=now, dry_run=dry_run)
+    return result['folded'] + result['pruned']
+
+
+def _purge_snmp_results(now, dry_run):
+    """Drop raw SNMP samples; their history lives on in the metric series."""
+    from flask import current_app
+    from models import SnmpPollResult
+
+    days = int(current_app.config.get('SNMP_POLL_RESULT_RETENTION_DAYS', 7) or 7)
+    query = SnmpPollResult.query.filter(SnmpPollResult.poll_time < now - timedelta(days=max(1, days)))
+    if dry_run:
+        return query.count()
+    return query.delete(synchronize_session=False)
+
+
+def _purge_job_runs(now, dry_run):
+    """Drop background job run history past its window (services/job_scheduler.py)."""
+    from flask import current_app
+    from models import JobRun
+
+    days = int(current_app.config.get('JOB_RUN_RETENTION_DAYS', 30) or 30)
+    query = JobRun.query.filter(JobRun.started_at < now - timedelta(days=max(1, days)),
+                                JobRun.status != 'running')
+    if dry_run:
+        return query.count()
+    return query.delete(synchronize_session=False)
+
+
+def _maintain_radacct_partitions(now, dry_run):
+    """Create the coming radacct months; archive the aged ones (Postgres only)."""
+    from services.radacct_partitions import archive_partitions, ensure_partitions
+
+    if not dry_run:
+        ensure_partitions(now=now)
+    result = archive_partitions(now=now, dry_run=dry_run)
+    return len(result['archived']) + len(result['dropped'])
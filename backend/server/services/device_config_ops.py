@@ -22,7 +22,6 @@ from concurrent.futures import ThreadPoolExecutor
 
 from mikrotik_client import (
     ConnectionType,
-    MikroTikClient,
     MikroTikConnectionConfig,
     MikroTikSSHError,
 )
@@ -88,6 +87,41 @@ def _ssh_config(device, timeout=8):
     )
 
 
+# After the RouterOS API fails on a router (service disabled, port filtered),
+# go straight to SSH for this long instead of paying the failed connect on
+# every poll.
+_API_RETRY_SECONDS = 300
+_api_failed_at = {}
+
+
+def _api_preferred(device):
+    """Whether to try the RouterOS API before SSH for ``device``."""
+    if (device.connection_type or 'api') != 'api':
+        return False
+    failed_at = _api_failed_at.get(device.id)
+    return failed_at is None or time.monotonic() - failed_at > _API_RETRY_SECONDS
+
+
+def _note_api_result(device_id, error):
+    if error is None:
+        _api_failed_at.pop(device_id, None)
+    else:
+        _api_failed_at[device_id] = time.monotonic()
+
+
+def _api_config(device, timeout=8):
+    """RouterOS API (8728) settings for routeros_api, over the tunnel when enabled."""
+    return MikroTikConnectionConfig(
+        host=connection_host(device),
+        port=device.api_port or 8728,
+        username=device.username,
+        password=decrypt_value(device.password) or '',
+        connection_type=ConnectionType.API,
+        timeout=timeout,
+        verify_ssl=False,
+    )
+
+
 class DeviceBusy(Exception):
     """Raised when the per-device SSH lock can't be acquired in time.
 
@@ -136,23 +170,24 @@ def mikrotik_ssh(device, timeout=12, lock_wait=30, retries=3):
     """Serialized, retrying SSH session to a device.
 
     Acquires the per-device lock (raising DeviceBusy after ``lock_wait`` s),
-    then connects with up to ``retries`` attempts and short backoff — MikroTik
-    SSH over the tunnel is flaky and a retry almost always lands. Yields a
-    connected MikroTikClient; disconnects and unlocks on exit.
+    then reuses a warm pooled session (services.ssh_pool) or connects with up
+    to ``retries`` attempts and short backoff — MikroTik SSH over the tunnel
+    is flaky and a retry almost always lands. Yields a connected
+    MikroTikClient; hands it back to the pool (or closes it, if the block
+    raised) and unlocks on exit.
     """
+    from services.ssh_pool import connect_client, release_client
+
     with _device_ssh_file_lock(device.id, lock_wait):
+        config = _ssh_config(device, timeout=timeout)
         last_err = None
         client = None
         for attempt in range(retries):
-            client = MikroTikClient(_ssh_config(device, timeout=timeout))
             try:
-                if client.connect():
-                    break
-                last_err = MikroTikSSHError('connect() returned False')
+                client = connect_client(config)
+                break
             except Exception as exc:  # noqa: BLE001 — retry any connect failure
                 last_err = exc
-            client.disconnect()
-            client = None
             if attempt < retries - 1:
                 time.sleep(1.5 * (attempt + 1))
         if client is None:
@@ -161,8 +196,21 @@ def mikrotik_ssh(device, timeout=12, lock_wait=30, retries=3):
             )
         try:
             yield client
-        finally:
-            client.disconnect()
+        except BaseException:
+            release_client(client, ok=False)
+            raise
+        release_client(client)
+
+
+def _forget_sessions(device):
+    """Drop pooled sessions to a router that is going down.
+
+    Its transport can still look alive for a few seconds after a reboot is
+    issued, which is inside the window where reuse skips the health probe.
+    """
+    from services.ssh_pool import get_pool
+
+    get_pool().evict_host(connection_host(device))
 
 
 def _parse_kv(output):
@@ -752,15 +800,23 @@ def list_interfaces(device):
 
 
 def interface_traffic(device):
-    """Read rx/tx byte counters for every interface in one SSH call.
+    """Read rx/tx byte counters for every interface in one round trip.
 
     Callers poll this twice and derive per-port throughput from the delta —
     no flow collector needed. Returns {'at': epoch_seconds, 'stats': [...]}.
 
+    Read over the RouterOS API when the router offers it (one pipelined
+    call, no SSH lock); SSH otherwise, or when the API fails.
+
     Poller: if the device is busy with another SSH op, returns {'busy': True,
     'stats': []} instead of opening a competing session, so the wizard's live
     poll never collides with (or 502s during) discovery/configure.
     """
+    if _api_preferred(device):
+        polled = fleet_interface_traffic([device])[device.id]
+        if 'error' not in polled:
+            return polled
+
     # NOTE: '/interface print stats terse' renders a COLUMNAR table with
     # space-separated thousands (e.g. '7 018 235'), which the key=value terse
     # parser can't read (yields 0 rows). Use scripting `get` to emit clean CSV
@@ -795,6 +851,29 @@ def interface_traffic(device):
     return {'at': time.time(), 'stats': stats}
 
 
+def fleet_interface_traffic(devices, concurrency=64):
+    """``interface_traffic`` for many routers at once over the RouterOS API.
+
+    One event loop drives every router (routeros_api.run_fleet), so polling a
+    few hundred costs about as long as the slowest one. Nothing here touches
+    SSH, so the per-device SSH lock is not taken. Returns ``{device_id:
+    {'at', 'stats'}}``, with ``{'error': ...}`` in place of ``stats`` for a
+    router that could not be read.
+    """
+    from routeros_api import interface_counters, run_fleet
+
+    results = run_fleet([(d.id, _api_config(d)) for d in devices],
+                        interface_counters, concurrency=concurrency)
+    now = time.time()
+    for device_id, (_stats, exc) in results.items():
+        _note_api_result(device_id, exc)
+    return {
+        device_id: ({'at': now, 'stats': stats} if exc is None
+                    else {'at': now, 'stats': [], 'error': str(exc)[:255]})
+        for device_id, (stats, exc) in results.items()
+    }
+
+
 def set_interface_disabled(device, name, disabled):
     """Enable/disable a router interface. Refuses to disable the uplink."""
     if not INTERFACE_NAME_RE.match(name or ''):
@@ -1500,6 +1579,8 @@ def upgrade_firmware(device):
     except Exception as exc:
         log.append({'step': 'connect', 'status': 'error', 'detail': str(exc)[:200]})
         return {'success': False, 'log': log}
+    finally:
+        _forget_sessions(device)
 
     log.append({'step': 'done', 'status': 'ok', 'detail': 'Upgrade in progress. Re-sync once the router is back online.'})
     return {'success': True, 'log': log, 'installed': installed, 'latest': latest}
@@ -1526,6 +1607,8 @@ def reboot_device(device):
     except Exception as exc:
         # A drop right after issuing reboot is success; only report hard pre-connect errors.
         return {'success': True, 'detail': f'Reboot issued ({str(exc)[:120]})'}
+    finally:
+        _forget_sessions(device)
     return {'success': True, 'detail': 'Reboot issued'}
 
 
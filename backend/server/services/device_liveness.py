@@ -22,13 +22,23 @@ Meanwhile the database already holds independent, router-originated evidence:
 Both are *inbound*, so they are immune to the stale-endpoint problem. This module
 gathers every source and returns a single verdict, so a router that is provably
 alive by any of them is never reported OFFLINE.
+
+The RADIUS signal is an aggregate over radacct, the largest table, so it is
+computed for many routers at once (``radius_evidence``, one grouped query) and
+kept on the device as ``radius_last_seen_at``, refreshed incrementally from
+the accounting written since. A bulk sync refreshes the whole fleet up front;
+a lone status check refreshes just its router.
+
+Untagged accounting from an address no router owns is kept apart
+(``fleet_radius_evidence``, ``unregistered_nas``): it is a router sending
+sessions that nobody has added yet, which operators need to find.
 """
 from datetime import datetime, timedelta
 
 from flask import current_app
 
 from extensions import db
-from models import RadAcct
+from models import MikrotikDevice, RadAcct
 
 # How recent an inbound signal must be to count as "the router is up now".
 # RADIUS interim updates default to 5 min (see device_config_ops.radius_interim_interval)
@@ -37,6 +47,14 @@ _DEFAULT_RADIUS_EVIDENCE_SECONDS = 900
 # The provisioning fetch is a one-shot at adoption time, not a heartbeat, so it
 # only proves life for a short window after it happens.
 _DEFAULT_PROVISION_EVIDENCE_SECONDS = 600
+# How far back a refresh of the cached ``radius_last_seen_at`` reads at most.
+# Only the last few minutes decide liveness; older evidence just labels the
+# router "last heard from ...".
+RADIUS_EVIDENCE_LOOKBACK = timedelta(days=1)
+_REFRESH_MARGIN = timedelta(minutes=2)
+# Per-process: devices refreshed this recently are not re-read.
+_REFRESH_SECONDS = 30
+_refreshed = {}
 
 
 def _seconds(key, fallback):
@@ -52,14 +70,126 @@ def _nas_addresses(device):
     A NAS on the management tunnel sources RADIUS from its tunnel IP; a
     publicly-routed one uses its WAN address. Accept either.
     """
-    addresses = set()
-    if device.management_wg_ip:
-        addresses.add(device.management_wg_ip.split('/')[0])
-    if device.device_ip:
-        addresses.add(device.device_ip.split('/')[0])
+    return _addresses(device.device_ip, device.management_wg_ip)
+
+
+def _addresses(device_ip, management_wg_ip):
+    addresses = {(address or '').split('/')[0] for address in (device_ip, management_wg_ip)}
     return {a for a in addresses if a}
 
 
+def _evidence_query(devices, since, isp_id=None, every_nas=False):
+    """``(by_address, rows)``: the one grouped radacct query behind the evidence.
+
+    Rows are ``(device_id, untagged_nas, newest)``. Untagged rows are read from
+    the devices' addresses only, or from every address with ``every_nas``
+    (optionally only ``isp_id``'s).
+    """
+    by_address = {}
+    for device in devices:
+        for address in _nas_addresses(device):
+            by_address.setdefault(address, []).append(device.id)
+    ids = [d.id for d in devices if d.id]
+    conditions = []
+    if ids:
+        conditions.append(RadAcct.mikrotik_device_id.in_(ids))
+    if every_nas:
+        untagged = [RadAcct.mikrotik_device_id.is_(None)]
+        if isp_id:
+            untagged.append(RadAcct.isp_id == isp_id)
+        conditions.append(db.and_(*untagged))
+    elif by_address:
+        conditions.append(db.and_(
+            RadAcct.mikrotik_device_id.is_(None),
+            RadAcct.nasipaddress.in_(list(by_address)),
+        ))
+    if not conditions:
+        return by_address, []
+
+    untagged_nas = db.case((RadAcct.mikrotik_device_id.is_(None), RadAcct.nasipaddress), else_=None)
+    query = (
+        db.session.query(
+            RadAcct.mikrotik_device_id, untagged_nas,
+            # An open session's freshness is acctupdatetime; a closed one's is
+            # acctstoptime. Take whichever is newest across the columns.
+            db.func.max(RadAcct.acctupdatetime),
+            db.func.max(RadAcct.acctstoptime),
+            db.func.max(RadAcct.acctstarttime),
+        )
+        .filter(db.or_(*conditions))
+        .group_by(RadAcct.mikrotik_device_id, untagged_nas)
+    )
+    if since is not None:
+        query = query.filter(db.or_(
+            RadAcct.acctupdatetime >= since,
+            RadAcct.acctstoptime >= since,
+            RadAcct.acctstarttime >= since,
+        ))
+    rows = []
+    for device_id, address, *stamps in query.all():
+        latest = max((stamp for stamp in stamps if stamp), default=None)
+        if latest is not None:
+            rows.append((device_id, address, latest))
+    return by_address, rows
+
+
+def _fold(devices, by_address, rows):
+    newest = {d.id: None for d in devices}
+    for device_id, address, latest in rows:
+        for owner in ([device_id] if device_id else by_address.get(address, ())):
+            if owner in newest and (newest[owner] is None or latest > newest[owner]):
+                newest[owner] = latest
+    return newest
+
+
+def radius_evidence(devices, since=None):
+    """Newest RADIUS accounting timestamp per device, in one grouped query.
+
+    Returns ``{device.id: datetime or None}``. Rows are matched the way
+    ``radius_last_seen`` describes: tagged to the device, or untagged from one
+    of its NAS addresses. ``since`` limits the scan to rows with any timestamp
+    at or after it, for refreshes that only need what is new.
+    """
+    devices = [d for d in devices if d is not None]
+    by_address, rows = _evidence_query(devices, since)
+    return _fold(devices, by_address, rows)
+
+
+def fleet_radius_evidence(devices, since=None, isp_id=None):
+    """``radius_evidence`` plus accounting from NAS addresses no router owns.
+
+    Returns ``({device.id: newest}, {nas_ip: newest})``, still from one radacct
+    query. The second map is untagged accounting (``isp_id``'s only, when
+    given) from addresses that belong to no registered router of any tenant —
+    a router sending accounting that nobody has added yet.
+    """
+    devices = [d for d in devices if d is not None]
+    by_address, rows = _evidence_query(devices, since, isp_id=isp_id, every_nas=True)
+    registered = set(by_address)
+    for device_ip, wg_ip in db.session.query(MikrotikDevice.device_ip,
+                                             MikrotikDevice.management_wg_ip):
+        registered |= _addresses(device_ip, wg_ip)
+    unknown = {}
+    for device_id, address, latest in rows:
+        if device_id is None and address and address not in registered:
+            if address not in unknown or latest > unknown[address]:
+                unknown[address] = latest
+    return _fold(devices, by_address, rows), unknown
+
+
+def unregistered_nas(isp_id=None, now=None):
+    """``{nas_ip: newest}`` for accounting from unregistered routers lately.
+
+    Looks back ``RADIUS_EVIDENCE_LOOKBACK``; ``isp_id`` limits it to accounting
+    attributed to that tenant's subscribers.
+    """
+    now = now or datetime.utcnow()
+    devices = MikrotikDevice.query.filter_by(isp_id=isp_id).all() if isp_id else []
+    _by_device, unknown = fleet_radius_evidence(devices, since=now - RADIUS_EVIDENCE_LOOKBACK,
+                                                isp_id=isp_id)
+    return unknown
+
+
 def radius_last_seen(device):
     """Newest RADIUS accounting timestamp attributable to this router.
 
@@ -72,30 +202,44 @@ def radius_last_seen(device):
     sit behind one NAT public IP — so counting a row that is already tagged to a
     different device would let one live router vouch for a dead one.
     """
-    addresses = _nas_addresses(device)
-    conditions = []
-    if device.id:
-        conditions.append(RadAcct.mikrotik_device_id == device.id)
-    if addresses:
-        conditions.append(db.and_(
-            RadAcct.mikrotik_device_id.is_(None),
-            RadAcct.nasipaddress.in_(addresses),
-        ))
-    if not conditions:
-        return None
-
-    # An open session's freshness is acctupdatetime; a closed one's is
-    # acctstoptime. Take whichever is newest across both columns.
-    newest = None
-    for column in (RadAcct.acctupdatetime, RadAcct.acctstoptime, RadAcct.acctstarttime):
-        value = (
-            db.session.query(db.func.max(column))
-            .filter(db.or_(*conditions))
-            .scalar()
-        )
-        if value and (newest is None or value > newest):
-            newest = value
-    return newest
+    return radius_evidence([device]).get(device.id)
+
+
+def refresh_radius_evidence(devices=None, now=None):
+    """Bring ``radius_last_seen_at`` up to date for ``devices`` (default: all).
+
+    Incremental: only accounting written since the oldest cached value among
+    them is read — a few minutes' worth when the devices are refreshed
+    regularly — and never more than ``RADIUS_EVIDENCE_LOOKBACK`` back, which
+    bounds the first refresh and a router that has been silent for months.
+    A device refreshed within ``_REFRESH_SECONDS`` is skipped, so a sweep that
+    refreshed the fleet up front does not pay again per router. Flushes;
+    the caller commits. Returns the number of devices whose value moved.
+    """
+    now = now or datetime.utcnow()
+    if devices is None:
+        devices = MikrotikDevice.query.all()
+    stale = [d for d in devices if d is not None and d.id
+             and now - _refreshed.get(d.id, datetime.min) > timedelta(seconds=_REFRESH_SECONDS)]
+    if not stale:
+        return 0
+    since = now - RADIUS_EVIDENCE_LOOKBACK
+    cached = [d.radius_last_seen_at for d in stale]
+    if all(cached):
+        # Accounting can land a little out of order; re-read a margin.
+        since = max(since, min(cached) - _REFRESH_MARGIN)
+
+    moved = 0
+    by_id = {d.id: d for d in stale}
+    for device_id, latest in radius_evidence(stale, since=since).items():
+        device = by_id[device_id]
+        _refreshed[device_id] = now
+        if latest and (device.radius_last_seen_at is None or latest > device.radius_last_seen_at):
+            device.radius_last_seen_at = latest
+            moved += 1
+    if moved:
+        db.session.flush()
+    return moved
 
 
 def gather_evidence(device, probe=True, probe_timeout=2, probe_attempts=3):
@@ -139,10 +283,10 @@ def gather_evidence(device, probe=True, probe_timeout=2, probe_attempts=3):
     # the peer. A router forwarding subscriber sessions is by definition up.
     window = _seconds('DEVICE_RADIUS_EVIDENCE_SECONDS', _DEFAULT_RADIUS_EVIDENCE_SECONDS)
     try:
-        last_radius = radius_last_seen(device)
+        refresh_radius_evidence([device], now=now)
     except Exception as exc:
-        last_radius = None
         current_app.logger.warning('RADIUS liveness lookup failed for device %s: %s', device.id, exc)
+    last_radius = device.radius_last_seen_at
     radius_fresh = bool(last_radius and (now - last_radius) < timedelta(seconds=window))
     signals.append({
         'source': 'radius_accounting',
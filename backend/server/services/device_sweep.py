@@ -0,0 +1,318 @@
+"""Concurrent "sync every router" sweep with per-tenant fairness.
+
+Syncing routers one after another meant a fleet of 300, where dead ones take the
+full SSH timeout, could keep one HTTP request open for most of an hour. The
+sweep here polls them on a bounded thread pool instead:
+
+* ``DEVICE_SYNC_WORKERS`` routers are in flight at once, and at most
+  ``DEVICE_SYNC_PER_ISP`` of them belong to any one tenant, so a tenant with
+  200 routers cannot starve the others in an admin-wide sweep. Scheduling is
+  done by the coordinator, not by workers blocking on a semaphore, so a capped
+  tenant never ties up a pool thread waiting for its turn.
+* Every router is still touched under its per-device lock
+  (services.device_config_ops), so the sweep queues behind — rather than
+  collides with — a config push or diagnostics session on the same router. One
+  that stays locked past ``DEVICE_SYNC_LOCK_WAIT`` is reported busy, not offline.
+* Results come back as each router finishes. ``start_bulk_sync`` records them
+  on a ``DeviceSyncRun`` the UI polls by id, which works whichever gunicorn
+  worker the poll lands on.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import DeviceStatus, DeviceSyncResult, DeviceSyncRun, MikrotikDevice
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_SYNCED = 'synced'
+# Reachable, but the stat pull failed; last-known stats kept.
+OUTCOME_STALE = 'stale'
+# Sync failed but liveness evidence kept the router ONLINE.
+OUTCOME_KEPT_ONLINE = 'kept_online'
+OUTCOME_OFFLINE = 'offline'
+# Another operation held the router's lock for the whole wait.
+OUTCOME_BUSY = 'busy'
+OUTCOME_ERROR = 'error'
+
+_FAILED_OUTCOMES = (OUTCOME_OFFLINE, OUTCOME_ERROR)
+
+_DEFAULT_WORKERS = 16
+_DEFAULT_PER_ISP = 4
+_DEFAULT_LOCK_WAIT = 5
+
+# A run still 'running' after this long died with its worker process; a new
+# sweep for the same scope may start instead of attaching to it.
+_RUN_STALE_AFTER = timedelta(hours=1)
+
+
+def _setting(name, default):
+    try:
+        return max(1, int(current_app.config.get(name, default) or default))
+    except (RuntimeError, TypeError, ValueError):
+        return default
+
+
+def bounded_sweep(items, work, group_of, workers, per_group):
+    """Run ``work(item)`` for every item on a pool; yield as each finishes.
+
+    At most ``workers`` calls run at once and at most ``per_group`` of them
+    share a ``group_of(item)``. Groups are served round-robin, so they progress
+    side by side. Yields ``(item, result, exception)``; a raising ``work`` does
+    not stop the sweep.
+    """
+    queues = OrderedDict()
+    for item in items:
+        queues.setdefault(group_of(item), deque()).append(item)
+    in_flight = Counter()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+
+        def fill():
+            progressed = True
+            while progressed and len(running) < workers:
+                progressed = False
+                for group in list(queues):
+                    if len(running) >= workers:
+                        break
+                    if in_flight[group] >= per_group:
+                        continue
+                    item = queues[group].popleft()
+                    if not queues[group]:
+                        del queues[group]
+                    running[pool.submit(work, item)] = (group, item)
+                    in_flight[group] += 1
+                    progressed = True
+
+        fill()
+        while running:
+            done, _pending = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                group, item = running.pop(future)
+                in_flight[group] -= 1
+                exc = future.exception()
+                yield item, (None if exc else future.result()), exc
+            fill()
+
+
+def _sync_one(app, device_id, lock_wait):
+    """Sync one router in its own app context (and so its own DB session)."""
+    from services.device_config_ops import DeviceBusy, _device_ssh_file_lock
+    from services.mikrotik_sync import mark_unreachable, sync_device_stats
+
+    started = time.perf_counter()
+    with app.app_context():
+        device = db.session.get(MikrotikDevice, device_id)
+        if device is None:
+            return {'device_id': device_id, 'device_name': None, 'outcome': OUTCOME_ERROR,
+                    'device_status': None, 'error': 'device no longer exists',
+                    'elapsed_ms': 0}
+        name = device.device_name
+        error = None
+        try:
+            if device.management_wg_enabled and device.management_wg_ip:
+                # The tunnel path takes the per-device lock itself (mikrotik_ssh).
+                stats = sync_device_stats(device, lock_wait=lock_wait)
+            else:
+                with _device_ssh_file_lock(device.id, lock_wait):
+                    stats = sync_device_stats(device)
+            outcome = OUTCOME_STALE if stats.get('stats_stale') else OUTCOME_SYNCED
+        except DeviceBusy:
+            # Something else is talking to it, so it is up — leave its status.
+            db.session.rollback()
+            outcome = OUTCOME_BUSY
+        except Exception as exc:  # noqa: BLE001 — any failure goes through hysteresis
+            db.session.rollback()
+            error = str(exc)[:255]
+            device = db.session.get(MikrotikDevice, device_id)
+            status = mark_unreachable(device, already_probed=True) if device else None
+            outcome = OUTCOME_KEPT_ONLINE if status == DeviceStatus.ONLINE else OUTCOME_OFFLINE
+
+        device = db.session.get(MikrotikDevice, device_id)
+        status = device.device_status.value if device and device.device_status else None
+        return {
+            'device_id': device_id,
+            'device_name': name,
+            'outcome': outcome,
+            'device_status': status,
+            'error': error,
+            'elapsed_ms': int((time.perf_counter() - started) * 1000),
+        }
+
+
+def _targets(isp_id):
+    query = db.session.query(MikrotikDevice.id, MikrotikDevice.isp_id).filter(
+        MikrotikDevice.is_active.is_(True)
+    )
+    if isp_id:
+        query = query.filter(MikrotikDevice.isp_id == isp_id)
+    return query.order_by(MikrotikDevice.id).all()
+
+
+def _refresh_radius_evidence(device_ids):
+    """Read the fleet's RADIUS evidence in one query before the sweep.
+
+    A router whose sync fails falls back on that evidence
+    (services/device_liveness); refreshed here, the per-router checks read it
+    from the device row instead of each aggregating radacct.
+    """
+    from services.device_liveness import refresh_radius_evidence
+
+    if not device_ids:
+        return
+    try:
+        refresh_radius_evidence(MikrotikDevice.query.filter(MikrotikDevice.id.in_(device_ids)).all())
+        db.session.commit()
+    except Exception as exc:  # noqa: BLE001 — each router can still look for itself
+        db.session.rollback()
+        logger.warning('Fleet RADIUS evidence refresh failed: %s', exc)
+
+
+def iter_bulk_sync(app, isp_id=None, targets=None, sync_one=None):
+    """Sync every active router for ``isp_id``; yield each outcome as it lands.
+
+    ``targets`` is ``[(device_id, isp_id), ...]`` (read from the DB when
+    omitted); ``sync_one(app, device_id, lock_wait)`` is the per-router job.
+    Outcome dicts carry device_id, device_name, outcome, device_status, error
+    and elapsed_ms.
+    """
+    targets = list(targets if targets is not None else _targets(isp_id))
+    sync_one = sync_one or _sync_one
+    _refresh_radius_evidence([device_id for device_id, _isp in targets])
+    lock_wait = _setting('DEVICE_SYNC_LOCK_WAIT', _DEFAULT_LOCK_WAIT)
+
+    for (device_id, _isp), result, exc in bounded_sweep(
+        targets,
+        lambda target: sync_one(app, target[0], lock_wait),
+        group_of=lambda target: target[1],
+        workers=_setting('DEVICE_SYNC_WORKERS', _DEFAULT_WORKERS),
+        per_group=_setting('DEVICE_SYNC_PER_ISP', _DEFAULT_PER_ISP),
+    ):
+        if exc is not None:
+            logger.warning('Bulk sync of device %s crashed: %s', device_id, exc)
+            result = {'device_id': device_id, 'device_name': None, 'outcome': OUTCOME_ERROR,
+                      'device_status': None, 'error': str(exc)[:255], 'elapsed_ms': None}
+        yield result
+
+
+def record_result(run, result):
+    """Append one router's outcome to ``run`` and bump its counters (no commit)."""
+    db.session.add(DeviceSyncResult(
+        run_id=run.id,
+        device_id=result['device_id'],
+        device_name=result.get('device_name'),
+        outcome=result['outcome'],
+        device_status=result.get('device_status'),
+        elapsed_ms=result.get('elapsed_ms'),
+        error=result.get('error'),
+    ))
+    if result['outcome'] == OUTCOME_BUSY:
+        run.busy += 1
+    elif result['outcome'] in _FAILED_OUTCOMES:
+        run.failed += 1
+    else:
+        run.synced += 1
+
+
+def run_bulk_sync(app, run_id, **kwargs):
+    """Drive a created ``DeviceSyncRun`` to completion, committing per router."""
+    run = db.session.get(DeviceSyncRun, run_id)
+    if run is None:
+        return None
+    try:
+        for result in iter_bulk_sync(app, isp_id=run.isp_id, **kwargs):
+            record_result(run, result)
+            db.session.commit()
+        run.status = 'completed'
+    except Exception as exc:  # noqa: BLE001 — must surface on the run row
+        db.session.rollback()
+        run = db.session.get(DeviceSyncRun, run_id)
+        run.status = 'failed'
+        run.error = str(exc)[:1000]
+        logger.exception('Bulk device sync run %s failed', run_id)
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    return run
+
+
+def active_run(isp_id):
+    """The unfinished run for this scope, if one is still plausibly alive."""
+    return (
+        DeviceSyncRun.query.filter(
+            DeviceSyncRun.isp_id.is_(None) if isp_id is None else DeviceSyncRun.isp_id == isp_id,
+            DeviceSyncRun.status == 'running',
+            DeviceSyncRun.started_at >= datetime.utcnow() - _RUN_STALE_AFTER,
+        )
+        .order_by(DeviceSyncRun.id.desc())
+        .first()
+    )
+
+
+def start_bulk_sync(app, isp_id=None, created_by_id=None):
+    """Create a run and sweep on a background thread; returns ``(run, started)``.
+
+    A sweep already running for the same scope is returned instead of starting
+    a second one against the same routers (``started`` is then False).
+    """
+    existing = active_run(isp_id)
+    if existing is not None:
+        return existing, False
+
+    run = DeviceSyncRun(isp_id=isp_id, created_by_id=created_by_id, status='running',
+                        total=len(_targets(isp_id)))
+    db.session.add(run)
+    db.session.commit()
+    run_id = run.id
+
+    def _work():
+        with app.app_context():
+            run_bulk_sync(app, run_id)
+
+    threading.Thread(target=_work, daemon=True, name=f'device-sync-{run_id}').start()
+    return run, True
+
+
+def serialize_run(run, after_id=0):
+    """Run progress plus the results recorded after ``after_id``.
+
+    Pollers pass the last result id they saw, so each poll only carries the
+    routers that finished since.
+    """
+    results = (
+        DeviceSyncResult.query.filter(
+            DeviceSyncResult.run_id == run.id, DeviceSyncResult.id > (after_id or 0)
+        )
+        .order_by(DeviceSyncResult.id)
+        .all()
+    )
+    return {
+        'id': run.id,
+        'status': run.status,
+        'total': run.total,
+        'done': run.synced + run.failed + run.busy,
+        'synced': run.synced,
+        'failed': run.failed,
+        'busy': run.busy,
+        'error': run.error,
+        'started_at': run.started_at.isoformat() if run.started_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+        'results': [
+            {
+                'id': r.id,
+                'device_id': r.device_id,
+                'device_name': r.device_name,
+                'outcome': r.outcome,
+                'device_status': r.device_status,
+                'elapsed_ms': r.elapsed_ms,
+                'error': r.error,
+            }
+            for r in results
+        ],
+    }
@@ -1,9 +1,27 @@
-"""Symmetric encryption for secrets stored in the database."""
+"""Symmetric encryption for secrets stored in the database.
+
+The cipher is built once per key and reused: deriving the key and
+constructing a Fernet used to happen on every call, and the hot paths
+(RADIUS password checks, TR-069 CPE auth, M-Pesa credentials, router scans)
+call this per row.
+
+Keys are rotated by moving the old ``ENCRYPTION_KEY`` into
+``ENCRYPTION_KEY_PREVIOUS`` (comma-separated, newest first) and setting the
+new one. Values written under a previous key still decrypt, new values are
+written under the active key, and ``flask rotate-encryption-key``
+(services/key_rotation.py) re-encrypts the stored values in batches, after
+which the previous key can be dropped.
+"""
 import base64
 import hashlib
 import os
+from functools import lru_cache
 
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+# Every Fernet token starts with this: version byte 0x80 and the high bytes
+# of a timestamp, base64-encoded.
+_TOKEN_PREFIX = 'gAAAAA'
 
 
 def _fernet_key(raw_key=None):
@@ -13,21 +31,97 @@ def _fernet_key(raw_key=None):
     return base64.urlsafe_b64encode(digest)
 
 
-def encrypt_value(plaintext):
+def _key_sources():
+    """``(active, *previous)`` key material, as configured right now."""
+    active = os.getenv('ENCRYPTION_KEY') or os.getenv('SECRET_KEY') or 'lumen-dev-key'
+    previous = [k.strip() for k in (os.getenv('ENCRYPTION_KEY_PREVIOUS') or '').split(',')]
+    return (active,) + tuple(k for k in previous if k and k != active)
+
+
+@lru_cache(maxsize=8)
+def _fernets_for(sources):
+    return tuple(Fernet(_fernet_key(source)) for source in sources)
+
+
+@lru_cache(maxsize=8)
+def _cipher_for(sources):
+    # MultiFernet encrypts with the first key and tries each in turn to decrypt.
+    return MultiFernet(list(_fernets_for(sources)))
+
+
+def _cipher():
+    # Keyed by the key material itself, so a changed environment (or a test
+    # that swaps keys) gets a new cipher rather than a stale one.
+    return _cipher_for(_key_sources())
+
+
+def _encrypt(cipher, plaintext):
     if plaintext is None:
         return None
     if plaintext == '':
         return ''
-    return Fernet(_fernet_key()).encrypt(str(plaintext).encode()).decode()
+    return cipher.encrypt(str(plaintext).encode()).decode()
 
 
-def decrypt_value(ciphertext):
+def _decrypt(cipher, ciphertext):
     if ciphertext is None:
         return None
     if ciphertext == '':
         return ''
     try:
-        return Fernet(_fernet_key()).decrypt(ciphertext.encode()).decode()
+        return cipher.decrypt(ciphertext.encode()).decode()
     except InvalidToken:
         # Legacy plain-text values still in DB
         return ciphertext
+
+
+def encrypt_value(plaintext):
+    return _encrypt(_cipher(), plaintext)
+
+
+def decrypt_value(ciphertext):
+    return _decrypt(_cipher(), ciphertext)
+
+
+def encrypt_values(values):
+    """``encrypt_value`` over a list, in order, with one cipher lookup."""
+    cipher = _cipher()
+    return [_encrypt(cipher, value) for value in values]
+
+
+def decrypt_values(values):
+    """``decrypt_value`` over a list, in order, with one cipher lookup."""
+    cipher = _cipher()
+    return [_decrypt(cipher, value) for value in values]
+
+
+def looks_encrypted(value):
+    return isinstance(value, str) and value.startswith(_TOKEN_PREFIX)
+
+
+def rotate_value(value):
+    """``value`` re-encrypted under the active key, or unchanged.
+
+    A token the active key already opens is returned as it is, so a rotation
+    that stops halfway can simply be run again. A token from a previous key is
+    re-encrypted, and legacy plain text is encrypted for the first time.
+    Returns ``None`` for a token that no configured key opens: encrypting it
+    as if it were plain text would bury the secret under a second layer, so it
+    is left for the caller to report. Empty values come back as they are.
+    """
+    if not value:
+        return value
+    sources = _key_sources()
+    cipher = _cipher_for(sources)
+    token = value.encode()
+    try:
+        _fernets_for(sources)[0].decrypt(token)
+        return value
+    except InvalidToken:
+        pass
+    try:
+        return cipher.rotate(token).decode()
+    except InvalidToken:
+        if looks_encrypted(value):
+            return None
+        return _encrypt(cipher, value)
@@ -0,0 +1,122 @@
+"""Per-tenant cache of fault-localisation results (``/api/fiber/faults``).
+
+Localising faults reads every FiberNode and every placed ONT of a tenant and
+walks the whole tree. The answer only moves when the plant does or when an
+ONT's optical reading crosses a health band, so it is kept per
+``(isp_id, min_affected)`` until one of those commits:
+
+* any FiberNode added, changed or deleted;
+* a CpeDevice added or deleted, moved to another node, or whose
+  ``rx_power_dbm`` lands in a different ``optical_health`` band (including
+  gaining or losing a reading).
+
+ONTs report on every Inform and their readings jitter by tenths of a dB, so
+invalidating on every change would keep the cache permanently cold; within a
+band nothing but ``worst_dbm`` can move, and ``FIBER_FAULTS_CACHE_TTL_SECONDS``
+bounds how stale that gets. Invalidation uses per-tenant stamp files
+(services/commit_stamps.py), so it reaches every gunicorn worker. Bulk
+statements bypass the ORM events; their callers use ``invalidate_fiber_faults``.
+"""
+import logging
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import inspect
+
+from models import CpeDevice, FiberNode
+from services import commit_stamps
+from services.fiber_geo import localise_faults, optical_health
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_TTL = 300
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _stamp_name(isp_id):
+    return f'fiber-faults-{isp_id or "all"}'
+
+
+def invalidate_fiber_faults(isp_id=None):
+    """Drop cached suspects for ``isp_id`` (``None``: every tenant) in every worker."""
+    commit_stamps.touch(_stamp_name(isp_id))
+    with _cache_lock:
+        for key in [k for k in _cache if isp_id is None or k[0] == isp_id]:
+            del _cache[key]
+
+
+def clear_fiber_fault_cache():
+    """Forget this process's cached results (tests)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _ttl_seconds():
+    try:
+        return float(current_app.config.get('FIBER_FAULTS_CACHE_TTL_SECONDS', _DEFAULT_TTL) or 0)
+    except (RuntimeError, TypeError, ValueError):
+        return float(_DEFAULT_TTL)
+
+
+def fault_suspects(isp_id, min_affected=2):
+    """``localise_faults`` over the tenant's plant, cached until it changes.
+
+    The build start time is compared with the stamps, so a reading that
+    commits while the result is being built invalidates it.
+    """
+    key = (isp_id, min_affected)
+    ttl = _ttl_seconds()
+    wall = time.time()
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is not None and ttl > 0:
+        built_at, suspects = entry
+        if (wall - built_at < ttl
+                and commit_stamps.stamp_time(_stamp_name(isp_id)) < built_at
+                and commit_stamps.stamp_time(_stamp_name(None)) < built_at):
+            return suspects
+
+    nodes = FiberNode.query.filter_by(isp_id=isp_id).all()
+    onts = CpeDevice.query.filter(CpeDevice.isp_id == isp_id,
+                                  CpeDevice.fiber_node_id.isnot(None)).all()
+    suspects = localise_faults(nodes, onts, min_affected)
+    if ttl > 0:
+        with _cache_lock:
+            for stale in [k for k, (t, _s) in _cache.items() if wall - t >= ttl]:
+                del _cache[stale]
+            _cache[key] = (wall, suspects)
+    return suspects
+
+
+def _moves_faults(cpe, session):
+    """Whether an ONT change can alter the tenant's suspects."""
+    if cpe in session.new or cpe in session.deleted:
+        return cpe.__dict__.get('fiber_node_id') is not None
+    state = inspect(cpe)
+    if state.attrs.fiber_node_id.history.has_changes() or state.attrs.isp_id.history.has_changes():
+        return True
+    if cpe.__dict__.get('fiber_node_id') is None:
+        return False  # an unplaced ONT is in nobody's tree
+    history = state.attrs.rx_power_dbm.history
+    if not history.has_changes():
+        return False
+    before = history.deleted[0] if history.deleted else None
+    after = history.added[0] if history.added else None
+    return optical_health(before) != optical_health(after)
+
+
+def _dirty_tenants(session, objects):
+    """The tenants whose plants a flush changed, including ones a row left."""
+    tenants = set()
+    for obj in objects:
+        if isinstance(obj, FiberNode) or _moves_faults(obj, session):
+            tenants |= commit_stamps.tenants_of(session, obj)
+    return tenants
+
+
+# An unresolvable tenant (attribute never loaded) drops everything.
+commit_stamps.watch('fiber_faults', (FiberNode, CpeDevice), _dirty_tenants,
+                    invalidate_fiber_faults)
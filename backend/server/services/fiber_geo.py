@@ -218,6 +218,37 @@ def optical_health(rx_dbm):
 #  Fault localisation — the reason this is worth building
 # ---------------------------------------------------------------------------
 
+def _post_order(nodes, children):
+    """``(node, depth, parent)`` for every node once, children before parents.
+
+    Iterative, so a 30-level plant cannot hit the recursion limit. Nodes no
+    root reaches (a parent cycle in the data) are entered at the first one
+    met, with ``parent`` None, and a node already visited is never entered
+    twice — so summing each node into its ``parent`` counts every ONT once.
+    """
+    ids = {n.id for n in nodes}
+    roots = [n for n in nodes if not n.parent_id or n.parent_id not in ids]
+    seen = set()
+    order = []
+    for start in roots + nodes:
+        if start.id in seen:
+            continue
+        seen.add(start.id)
+        stack = [(start, 1, None, False)]
+        while stack:
+            node, depth, parent, expanded = stack.pop()
+            if expanded:
+                order.append((node, depth, parent))
+                continue
+            stack.append((node, depth, parent, True))
+            for child in children.get(node.id, ()):
+                if child.id not in seen:
+                    seen.add(child.id)
+                    # walk_upstream's cap, so depths match what a trace reports.
+                    stack.append((child, min(depth + 1, 32), node, False))
+    return order
+
+
 def localise_faults(nodes, cpe_devices, min_affected=2):
     """Find the node each cluster of degraded ONTs points at.
 
@@ -227,30 +258,50 @@ def localise_faults(nodes, cpe_devices, min_affected=2):
 
     Returns suspects deepest-first: the lowest node that explains the damage is
     the one to visit.
+
+    Subtree totals are summed bottom-up in one post-order pass rather than by
+    collecting each node's descendants, so the whole plant costs O(nodes + ONTs)
+    instead of O(nodes × subtree) — the difference between milliseconds and
+    minutes on a plant with tens of thousands of ODBs.
     """
-    by_id, children = build_index(nodes)
+    children = build_index(nodes)[1]
 
-    # Attach each ONT to its recorded node.
-    onts_by_node = defaultdict(list)
+    # Per node: ONTs recorded on it, readings, degraded readings, worst reading.
+    totals = defaultdict(lambda: [0, 0, 0, None])
     for cpe in cpe_devices:
-        if cpe.fiber_node_id:
-            onts_by_node[cpe.fiber_node_id].append(cpe)
+        if not cpe.fiber_node_id:
+            continue
+        own = totals[cpe.fiber_node_id]
+        own[0] += 1
+        reading = cpe.rx_power_dbm
+        if reading is None:
+            continue
+        own[1] += 1
+        if optical_health(reading) in ('marginal', 'critical'):
+            own[2] += 1
+        if own[3] is None or reading < own[3]:
+            own[3] = reading
+
+    depths = {}
+    for node, depth, parent in _post_order(nodes, children):
+        depths[node.id] = depth
+        below = totals.get(node.id)
+        if parent is None or below is None or not below[0]:
+            continue
+        above = totals[parent.id]
+        above[0] += below[0]
+        above[1] += below[1]
+        above[2] += below[2]
+        if below[3] is not None and (above[3] is None or below[3] < above[3]):
+            above[3] = below[3]
 
     suspects = []
     for node in nodes:
-        subtree = [node] + descendants(node.id, children)
-        onts = [c for nid in (n.id for n in subtree) for c in onts_by_node.get(nid, [])]
-        if len(onts) < min_affected:
-            continue
-
-        readings = [c.rx_power_dbm for c in onts if c.rx_power_dbm is not None]
-        if not readings:
-            continue
-        degraded = [r for r in readings if optical_health(r) in ('marginal', 'critical')]
-        if len(degraded) < min_affected:
+        onts, readings, degraded, worst = totals.get(node.id) or (0, 0, 0, None)
+        if onts < min_affected or not readings or degraded < min_affected:
             continue
 
-        share = len(degraded) / len(readings)
+        share = degraded / readings
         # Only a node whose whole subtree is suffering is evidence about *that*
         # node; a partial hit is better explained by something further down.
         if share < 0.8:
@@ -262,11 +313,11 @@ def localise_faults(nodes, cpe_devices, min_affected=2):
             'node_kind': node.kind,
             'latitude': node.latitude,
             'longitude': node.longitude,
-            'affected': len(degraded),
-            'total_onts': len(readings),
+            'affected': degraded,
+            'total_onts': readings,
             'share': round(share, 2),
-            'worst_dbm': min(readings),
-            'depth': len(walk_upstream(node, by_id)),
+            'worst_dbm': worst,
+            'depth': depths.get(node.id, 1),
         })
 
     # Deepest first: the most specific node that explains it.
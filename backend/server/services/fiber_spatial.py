@@ -0,0 +1,254 @@
+"""Spatial lookups over the fiber plant without loading all of it.
+
+The map and the "nearest node" picker used to read every FiberNode and
+FiberCable of a tenant and filter in Python. That is fine for a few hundred
+points and hopeless for a plant with hundreds of thousands, so two indexed
+columns carry the geometry instead (no PostGIS — the deployment is stock
+Postgres, and tests run on SQLite):
+
+* ``FiberNode.grid_cell`` — the node's cell on a fixed ``CELL_DEGREES`` grid,
+  numbered row-major, so one grid row of a viewport is one contiguous range
+  of cell ids. A viewport becomes a handful of ``BETWEEN`` ranges on the
+  ``(isp_id, grid_cell)`` index.
+* ``FiberCable.min_lat`` … ``max_lng`` — the bounding box of the drawn path.
+  Boxes that overlap the area are fetched by range, and only those paths are
+  parsed to check that a segment actually crosses it.
+
+Both are set by mapper events whenever the coordinates or path are saved
+through the ORM, and ``backfill_spatial_columns`` fills rows that predate
+them (run at startup).
+
+Bounding boxes are ``(west, south, east, north)`` in degrees — the order
+Leaflet's ``toBBoxString()`` and GeoJSON use.
+"""
+import math
+
+from sqlalchemy import and_, event, func, or_
+
+from extensions import db
+from models import FiberCable, FiberNode
+from services.fiber_geo import haversine_m, parse_path
+
+# 0.01° is about 1.1 km of latitude: small enough that a street-level
+# viewport touches a few cells, large enough that a city fits in ~100 rows.
+CELL_DEGREES = 0.01
+_COLUMNS = int(round(360 / CELL_DEGREES)) + 1
+_ROWS = int(round(180 / CELL_DEGREES)) + 1
+# Beyond this many grid rows a viewport is most of a country; one coordinate
+# range on the same index is then cheaper than hundreds of cell ranges.
+MAX_CELL_ROWS = 200
+# Nearest-node search stops widening at this many cells from the point.
+MAX_SEARCH_CELLS = 512
+_METRES_PER_DEGREE = 111_320.0
+
+
+def _row(lat):
+    return min(_ROWS - 1, max(0, int(math.floor((lat + 90.0) / CELL_DEGREES))))
+
+
+def _col(lng):
+    return min(_COLUMNS - 1, max(0, int(math.floor((lng + 180.0) / CELL_DEGREES))))
+
+
+def cell_of(lat, lng):
+    """Grid cell id for a coordinate, or None when either half is missing."""
+    if lat is None or lng is None:
+        return None
+    return _row(lat) * _COLUMNS + _col(lng)
+
+
+def parse_bbox(raw):
+    """``'west,south,east,north'`` → a tuple, or None if it is not one."""
+    if not raw:
+        return None
+    try:
+        west, south, east, north = (float(part) for part in str(raw).split(','))
+    except ValueError:
+        return None
+    if south > north or west > east:
+        return None
+    return (max(-180.0, west), max(-90.0, south), min(180.0, east), min(90.0, north))
+
+
+def path_bounds(points):
+    """``(min_lat, min_lng, max_lat, max_lng)`` of a parsed path, or Nones."""
+    if not points:
+        return None, None, None, None
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+# ---------------------------------------------------------------------------
+#  Keeping the columns in step
+# ---------------------------------------------------------------------------
+
+@event.listens_for(FiberNode, 'before_insert')
+@event.listens_for(FiberNode, 'before_update')
+def _set_grid_cell(_mapper, _connection, node):
+    node.grid_cell = cell_of(node.latitude, node.longitude)
+
+
+@event.listens_for(FiberCable, 'before_insert')
+@event.listens_for(FiberCable, 'before_update')
+def _set_path_bounds(_mapper, _connection, cable):
+    cable.min_lat, cable.min_lng, cable.max_lat, cable.max_lng = path_bounds(parse_path(cable.path))
+
+
+def backfill_spatial_columns(batch=1000):
+    """Fill grid cells and path boxes for rows saved before the columns existed.
+
+    Idempotent: only rows with coordinates (or a path) and no cell (or box)
+    are touched. Returns ``(nodes, cables)`` updated.
+    """
+    nodes = cables = 0
+    while True:
+        pending = FiberNode.query.filter(
+            FiberNode.grid_cell.is_(None),
+            FiberNode.latitude.isnot(None), FiberNode.longitude.isnot(None),
+        ).limit(batch).all()
+        if not pending:
+            break
+        for node in pending:
+            node.grid_cell = cell_of(node.latitude, node.longitude)
+        nodes += len(pending)
+        db.session.commit()
+    last_id = 0
+    while True:
+        # Keyset by id: a path that does not parse keeps a NULL box, and must
+        # not be fetched again.
+        pending = FiberCable.query.filter(
+            FiberCable.id > last_id,
+            FiberCable.min_lat.is_(None), FiberCable.path.isnot(None),
+        ).order_by(FiberCable.id).limit(batch).all()
+        if not pending:
+            break
+        last_id = pending[-1].id
+        for cable in pending:
+            cable.min_lat, cable.min_lng, cable.max_lat, cable.max_lng = path_bounds(
+                parse_path(cable.path))
+            cables += cable.min_lat is not None
+        db.session.commit()
+    return nodes, cables
+
+
+# ---------------------------------------------------------------------------
+#  Queries
+# ---------------------------------------------------------------------------
+
+def _cell_ranges(west, south, east, north):
+    """One ``(first, last)`` cell-id range per grid row the box spans."""
+    first_col, last_col = _col(west), _col(east)
+    return [(row * _COLUMNS + first_col, row * _COLUMNS + last_col)
+            for row in range(_row(south), _row(north) + 1)]
+
+
+def _node_area_filter(west, south, east, north):
+    if _row(north) - _row(south) + 1 > MAX_CELL_ROWS:
+        return and_(FiberNode.latitude.between(south, north),
+                    FiberNode.longitude.between(west, east))
+    return or_(*[FiberNode.grid_cell.between(first, last)
+                 for first, last in _cell_ranges(west, south, east, north)])
+
+
+def nodes_in_bbox(isp_id, bbox, kind=None):
+    """The tenant's placed nodes inside ``bbox``."""
+    west, south, east, north = bbox
+    query = FiberNode.query.filter(
+        FiberNode.isp_id == isp_id,
+        _node_area_filter(west, south, east, north),
+        # Cells are coarser than the box; the exact test drops the fringe.
+        FiberNode.latitude.between(south, north),
+        FiberNode.longitude.between(west, east),
+    )
+    if kind:
+        query = query.filter(FiberNode.kind == kind)
+    return query.all()
+
+
+def cell_summaries(isp_id, bbox):
+    """``[(grid_cell, nodes, mean_lat, mean_lng)]`` for occupied cells in ``bbox``.
+
+    One grouped row per occupied cell rather than a row per node, for views
+    too far out to draw nodes one by one. Cells straddling the edge count
+    whole.
+    """
+    west, south, east, north = bbox
+    rows = db.session.query(
+        FiberNode.grid_cell, func.count(FiberNode.id),
+        func.avg(FiberNode.latitude), func.avg(FiberNode.longitude),
+    ).filter(
+        FiberNode.isp_id == isp_id,
+        FiberNode.grid_cell.isnot(None),
+        _node_area_filter(west, south, east, north),
+    ).group_by(FiberNode.grid_cell)
+    return [(cell, count, float(lat), float(lng)) for cell, count, lat, lng in rows]
+
+
+def _segment_crosses(a, b, bbox):
+    """Whether segment a→b (``[lat, lng]`` points) touches the box.
+
+    Liang–Barsky clipping in lng/lat as plane coordinates — at plant scale a
+    straight segment in degrees is what the map draws.
+    """
+    west, south, east, north = bbox
+    x0, y0, x1, y1 = a[1], a[0], b[1], b[0]
+    dx, dy = x1 - x0, y1 - y0
+    low, high = 0.0, 1.0
+    for p, q in ((-dx, x0 - west), (dx, east - x0), (-dy, y0 - south), (dy, north - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            low = max(low, t)
+        else:
+            high = min(high, t)
+        if low > high:
+            return False
+    return True
+
+
+def path_crosses_bbox(points, bbox):
+    if len(points) == 1:
+        return _segment_crosses(points[0], points[0], bbox)
+    return any(_segment_crosses(points[i], points[i + 1], bbox) for i in range(len(points) - 1))
+
+
+def cables_in_bbox(isp_id, bbox):
+    """The tenant's cables with some part of their drawn path inside ``bbox``."""
+    west, south, east, north = bbox
+    candidates = FiberCable.query.filter(
+        FiberCable.isp_id == isp_id,
+        FiberCable.min_lat <= north, FiberCable.max_lat >= south,
+        FiberCable.min_lng <= east, FiberCable.max_lng >= west,
+    ).all()
+    return [c for c in candidates if path_crosses_bbox(parse_path(c.path), bbox)]
+
+
+def nearest_nodes(isp_id, lat, lng, limit=10, kind=None):
+    """Up to ``limit`` placed nodes nearest ``(lat, lng)``, with distances.
+
+    Searches a square around the point, doubling it until it holds
+    ``limit`` nodes *and* the farthest of them is nearer than any node outside
+    the square could be. Returns ``[(node, metres)]``, nearest first.
+    """
+    limit = max(1, limit)
+    reach = 1
+    while True:
+        # Degrees the square extends from the point, either way.
+        span = reach * CELL_DEGREES
+        bbox = (lng - span, lat - span, lng + span, lat + span)
+        found = sorted(
+            ((node, haversine_m(lat, lng, node.latitude, node.longitude))
+             for node in nodes_in_bbox(isp_id, bbox, kind=kind)),
+            key=lambda pair: pair[1],
+        )
+        # Anything outside the square is at least ``span`` degrees away in
+        # latitude, or in longitude — whose degrees shrink toward the poles.
+        guaranteed = span * _METRES_PER_DEGREE * math.cos(math.radians(min(89.9, abs(lat) + span)))
+        enough = len(found) >= limit and found[limit - 1][1] <= guaranteed
+        if enough or reach >= MAX_SEARCH_CELLS:
+            return found[:limit]
+        reach *= 2
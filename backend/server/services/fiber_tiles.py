@@ -0,0 +1,246 @@
+"""The fiber plant as z/x/y GeoJSON tiles for the map.
+
+``/api/fiber/map`` answers with the whole plant (or one viewport) at full
+detail. A slippy map wants the opposite: small square tiles it can fetch as
+it pans, each drawn at the detail its zoom can show, and cached by the
+browser until the plant actually changes. Each tile here is a GeoJSON
+FeatureCollection in the standard Web Mercator tiling:
+
+* **Nodes** are drawn one by one from ``CLUSTER_MAX_ZOOM`` in. Further out
+  they are binned into ``CLUSTER_GRID`` × ``CLUSTER_GRID`` squares of the tile
+  and a square holding more than one node becomes a single ``cluster``
+  feature with a ``point_count``. Far enough out that a bin is wider than a
+  spatial-index cell, the bins are filled from per-cell counts
+  (``fiber_spatial.cell_summaries``) and no node row is read at all.
+* **Cables** carry their drawn route simplified (Douglas–Peucker) to about a
+  pixel at the tile's zoom. Feeder and backbone cables appear from
+  ``TRUNK_MIN_ZOOM``, the rest from ``CABLE_MIN_ZOOM``.
+
+Every tile's ETag is derived from the tenant's plant version — a stamp file
+rewritten whenever a FiberNode or FiberCable commit lands, reaching every
+gunicorn worker (services/commit_stamps.py) — so a
+revalidating browser gets ``304 Not Modified`` until then, and rendered tiles
+are kept in a small per-process cache keyed by that version.
+"""
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict, defaultdict
+
+from models import FiberCable, FiberNode
+from services import commit_stamps, fiber_spatial
+from services.fiber_geo import parse_path
+
+logger = logging.getLogger(__name__)
+
+MAX_ZOOM = 22
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_GRID = 8
+TRUNK_MIN_ZOOM = 8
+CABLE_MIN_ZOOM = 13
+TRUNK_TYPES = ('feeder', 'backbone')
+# Tiles this far past the edge are fetched too, so a cable whose route runs
+# just outside does not end in a visible gap at the seam.
+TILE_BUFFER = 1 / 16
+# Bump when the tile format changes, so browsers drop what they have.
+FORMAT_VERSION = 1
+
+_MAX_CACHED = 512
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+#  Tile geometry
+# ---------------------------------------------------------------------------
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _lng(x, z):
+    return x / 2 ** z * 360.0 - 180.0
+
+
+def _lat(y, z):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / 2 ** z))))
+
+
+def tile_bbox(z, x, y, buffer=0.0):
+    """``(west, south, east, north)`` of a tile, grown by ``buffer`` tiles."""
+    return (_lng(x - buffer, z), max(-85.0511, _lat(y + 1 + buffer, z)),
+            _lng(x + 1 + buffer, z), min(85.0511, _lat(y - buffer, z)))
+
+
+def _tile_fraction(lat, lng, z, x, y):
+    """Position inside tile ``(z, x, y)`` as fractions 0..1 (Mercator)."""
+    scale = 2 ** z
+    fx = (lng + 180.0) / 360.0 * scale - x
+    sin = math.sin(math.radians(max(-85.0511, min(85.0511, lat))))
+    fy = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * scale - y
+    return fx, fy
+
+
+def simplify(points, tolerance):
+    """Douglas–Peucker over ``[[lat, lng], ...]``; the ends always survive."""
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (ay, ax), (by, bx) = points[first], points[last]
+        dx, dy = bx - ax, by - ay
+        length = math.hypot(dx, dy)
+        farthest, index = 0.0, None
+        for i in range(first + 1, last):
+            py, px = points[i]
+            if length:
+                distance = abs(dy * px - dx * py + bx * ay - by * ax) / length
+            else:
+                distance = math.hypot(px - ax, py - ay)
+            if distance > farthest:
+                farthest, index = distance, i
+        if index is not None and farthest > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+# ---------------------------------------------------------------------------
+#  Features
+# ---------------------------------------------------------------------------
+
+def _point(lat, lng, properties):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+            'properties': properties}
+
+
+def _node_feature(node):
+    return _point(node.latitude, node.longitude, {
+        'layer': 'node', 'id': node.id, 'name': node.name, 'kind': node.kind,
+        'status': node.status, 'parent_id': node.parent_id,
+    })
+
+
+def _bin(lat, lng, z, x, y):
+    fx, fy = _tile_fraction(lat, lng, z, x, y)
+    if not (0 <= fx < 1 and 0 <= fy < 1):
+        return None  # belongs to the neighbouring tile
+    return int(fx * CLUSTER_GRID), int(fy * CLUSTER_GRID)
+
+
+def _clusters(bins):
+    features = []
+    for _square, members in sorted(bins.items()):
+        count = sum(m[0] for m in members)
+        lat = sum(m[0] * m[1] for m in members) / count
+        lng = sum(m[0] * m[2] for m in members) / count
+        if count == 1 and members[0][3] is not None:
+            features.append(_node_feature(members[0][3]))
+            continue
+        features.append(_point(lat, lng, {'layer': 'cluster', 'point_count': count}))
+    return features
+
+
+def _node_features(isp_id, z, x, y):
+    bbox = tile_bbox(z, x, y)
+    if z >= CLUSTER_MAX_ZOOM:
+        return [_node_feature(n) for n in fiber_spatial.nodes_in_bbox(isp_id, bbox)]
+    bins = defaultdict(list)
+    bin_degrees = 360.0 / 2 ** z / CLUSTER_GRID
+    if bin_degrees > fiber_spatial.CELL_DEGREES * 4:
+        # Far out: whole index cells fall in one bin, so count cells, not nodes.
+        for _cell, count, lat, lng in fiber_spatial.cell_summaries(isp_id, bbox):
+            key = _bin(lat, lng, z, x, y)
+            if key is not None:
+                bins[key].append((count, lat, lng, None))
+    else:
+        for node in fiber_spatial.nodes_in_bbox(isp_id, bbox):
+            key = _bin(node.latitude, node.longitude, z, x, y)
+            if key is not None:
+                bins[key].append((1, node.latitude, node.longitude, node))
+    return _clusters(bins)
+
+
+def _cable_features(isp_id, z, x, y):
+    if z < TRUNK_MIN_ZOOM:
+        return []
+    # About one pixel of a 256-pixel tile, in degrees.
+    tolerance = 360.0 / 2 ** z / 256
+    features = []
+    for cable in fiber_spatial.cables_in_bbox(isp_id, tile_bbox(z, x, y, TILE_BUFFER)):
+        if z < CABLE_MIN_ZOOM and cable.cable_type not in TRUNK_TYPES:
+            continue
+        points = simplify(parse_path(cable.path), tolerance)
+        if len(points) < 2:
+            continue
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': [[lng, lat] for lat, lng in points]},
+            'properties': {
+                'layer': 'cable', 'id': cable.id, 'name': cable.name,
+                'cable_type': cable.cable_type, 'status': cable.status,
+                'from_node_id': cable.from_node_id, 'to_node_id': cable.to_node_id,
+                'length_m': cable.length_m,
+            },
+        })
+    return features
+
+
+# ---------------------------------------------------------------------------
+#  Versions and the tile cache
+# ---------------------------------------------------------------------------
+
+def _stamp(isp_id):
+    return commit_stamps.stamp_token(f'fiber-tiles-{isp_id or "all"}')
+
+
+def plant_version(isp_id):
+    """Changes whenever the tenant's nodes or cables do (or everyone's are reset)."""
+    return f'{FORMAT_VERSION}.{_stamp(isp_id)}.{_stamp(None)}'
+
+
+def invalidate_fiber_tiles(isp_id=None):
+    """Move ``isp_id``'s plant version on (``None``: every tenant's)."""
+    commit_stamps.touch(f'fiber-tiles-{isp_id or "all"}')
+
+
+def clear_fiber_tile_cache():
+    """Forget this process's rendered tiles (tests)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def render_tile(isp_id, z, x, y):
+    """``(body, etag)`` for a tile: compact GeoJSON text and its validator."""
+    version = plant_version(isp_id)
+    key = (isp_id, z, x, y, version)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    features = _cable_features(isp_id, z, x, y) + _node_features(isp_id, z, x, y)
+    body = json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+    etag = hashlib.sha1(f'{isp_id}/{z}/{x}/{y}/{version}'.encode()).hexdigest()
+    with _cache_lock:
+        _cache[key] = (body, etag)
+        while len(_cache) > _MAX_CACHED:
+            _cache.popitem(last=False)
+    return body, etag
+
+
+def _dirty_tenants(session, objects):
+    """The tenants whose nodes or cables a flush changed, including ones a row left."""
+    return set().union(*(commit_stamps.tenants_of(session, obj) for obj in objects))
+
+
+# An unresolvable tenant (attribute never loaded) moves everyone on.
+commit_stamps.watch('fiber_tiles', (FiberNode, FiberCable), _dirty_tenants,
+                    invalidate_fiber_tiles)
@@ -10,99 +10,278 @@ full speed.
 State is tracked on ``Customer.fup_throttled`` so we only re-provision/kick on the
 transition, not every run.
 
+The run is set-based so it stays flat as the subscriber count grows: customers,
+plans and ISPs are preloaded in a handful of ``IN`` queries, the transitions are
+decided in memory, the radreply/radusergroup rows are rewritten with bulk
+statements, and the kicks go out through one ``KickQueue``: a single connection
+to each router holding a session for an affected login, all routers at once,
+rather than one per subscriber per router. Each phase is timed and reported back.
+
 Run via cron: ``flask enforce-fup``
 Or set FUP_ENFORCEMENT_INTERVAL (seconds) for in-process polling.
 """
+import contextlib
 import logging
+import time
+from collections import defaultdict
+
+from sqlalchemy import insert
 
 from extensions import db
-from models import Customer, CustomerStatus, ISP
-from services.fup_monitoring import get_fup_monitor_rows
-from services.plan_utils import normalize_rate_limit
-from services.radius_provisioning import provision_customer_radius
+from models import (
+    Customer,
+    CustomerStatus,
+    ISP,
+    RadReply,
+    RadUserGroup,
+    ServicePlan,
+)
+from services.fup_monitoring import get_fup_monitor_rows, refresh_rollup
+from services.plan_utils import generate_radius_attributes, normalize_rate_limit
+from services.radius_provisioning import (
+    _plan_throttle_rate_limit,
+    ensure_plan_group,
+    provision_customer_radius,
+    radius_username,
+)
 
 logger = logging.getLogger(__name__)
 
+# Bound on the size of one IN (...) list. Postgres copes with far more, but
+# SQLite (tests) caps bound parameters and huge lists plan badly anyway.
+CHUNK_SIZE = 500
 
-def _kick(customer, isp):
-    """Best-effort kick of live sessions so the new rate-limit takes effect."""
-    try:
-        from services.hotspot_disconnect import disconnect_customer_on_devices
-        disconnect_customer_on_devices(customer, isp)
-    except Exception as exc:
-        logger.debug('FUP kick skipped for %s: %s', customer.email, exc)
+THROTTLE = 'throttle'
+RESTORE = 'restore'
+CLEAR = 'clear'
 
 
-def apply_fup_enforcement(isp_id=None):
-    """Throttle over-limit subscribers and restore those back under threshold.
+@contextlib.contextmanager
+def _phase(timings, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
 
-    Returns a summary dict: {'throttled': n, 'restored': m}.
-    """
-    rows, _summary = get_fup_monitor_rows(isp_id=isp_id, status_filter='all')
 
-    throttled = 0
-    restored = 0
-    seen_ids = set()
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
-    def _restore(customer, plan, isp):
-        provision_customer_radius(customer, plan, isp, throttle=False)
-        customer.fup_throttled = False
-        _kick(customer, isp)
-        logger.info('FUP restored %s to full speed', customer.email)
 
-    for row in rows:
-        customer = Customer.query.get(row['customer_id'])
-        if not customer:
-            continue
-        seen_ids.add(customer.id)
+def _load_by_id(model, ids):
+    """``{id: row}`` for ``ids`` in chunked IN queries."""
+    found = {}
+    for chunk in _chunks({i for i in ids if i is not None}):
+        for row in model.query.filter(model.id.in_(chunk)).all():
+            found[row.id] = row
+    return found
 
-        # 'throttled' is only emitted for FUP-enabled plans over threshold.
-        is_over = row['status'] == 'throttled'
-        throttle_speed = normalize_rate_limit(row.get('fup_throttled_speed'))
 
+def plan_transitions(customers, rows_by_id, plans, isps):
+    """Decide what each customer needs — pure, no I/O.
+
+    ``customers`` is every candidate (monitored rows plus anyone still flagged
+    throttled); ``rows_by_id`` is the monitor output keyed by customer id.
+    Returns ``{THROTTLE: [...], RESTORE: [...], CLEAR: [...]}`` where the first
+    two hold ``(customer, plan, isp)`` and CLEAR holds customers whose stale
+    flag just needs dropping.
+    """
+    result = {THROTTLE: [], RESTORE: [], CLEAR: []}
+    for customer in customers:
         # Non-active subscribers have no RADIUS rows — never (re)provision them;
         # just clear any stale throttle flag so a later activation starts clean.
         if customer.status != CustomerStatus.ACTIVE:
             if customer.fup_throttled:
-                customer.fup_throttled = False
+                result[CLEAR].append(customer)
+            continue
+
+        plan = plans.get(customer.service_plan_id)
+        isp = isps.get(customer.isp_id)
+        row = rows_by_id.get(customer.id)
+
+        if row is None:
+            # Throttled but dropped out of monitoring entirely (plan switched to
+            # unlimited, FUP disabled, plan deactivated). Restore them here or
+            # they'd stay throttled forever.
+            if not customer.fup_throttled:
+                continue
+            if plan and isp:
+                result[RESTORE].append((customer, plan, isp))
+            else:
+                result[CLEAR].append(customer)
             continue
 
-        plan = customer.service_plan
-        isp = ISP.query.get(customer.isp_id) if customer.isp_id else None
         if not plan or not isp:
             continue
 
+        # 'throttled' is only emitted for FUP-enabled plans over threshold.
+        is_over = row['status'] == 'throttled'
+        throttle_speed = normalize_rate_limit(row.get('fup_throttled_speed'))
+
         if is_over and throttle_speed and not customer.fup_throttled:
-            provision_customer_radius(customer, plan, isp, throttle=True)
-            customer.fup_throttled = True
-            _kick(customer, isp)
-            throttled += 1
-            logger.info('FUP throttled %s to %s', customer.email, throttle_speed)
+            result[THROTTLE].append((customer, plan, isp))
         elif customer.fup_throttled and not is_over:
-            _restore(customer, plan, isp)
-            restored += 1
-
-    # Reconcile throttled subscribers that dropped out of monitoring entirely
-    # (plan switched to unlimited, FUP disabled, plan deactivated). They won't
-    # appear in `rows`, so restore them here or they'd stay throttled forever.
-    stale_q = Customer.query.filter(Customer.fup_throttled.is_(True))
-    if isp_id:
-        stale_q = stale_q.filter(Customer.isp_id == isp_id)
-    for customer in stale_q.all():
-        if customer.id in seen_ids:
-            continue
-        if customer.status != CustomerStatus.ACTIVE:
-            customer.fup_throttled = False
-            continue
-        plan = customer.service_plan
-        isp = ISP.query.get(customer.isp_id) if customer.isp_id else None
-        if not plan or not isp:
-            customer.fup_throttled = False
+            result[RESTORE].append((customer, plan, isp))
+    return result
+
+
+def _write_radius_rows(entries, throttle):
+    """Rewrite radreply + radusergroup for ``entries`` with bulk statements.
+
+    Only the reply attributes differ between full and throttled speed, so
+    radcheck (password, expiration) is left alone. A subscriber with no stored
+    password was never provisioned at all and goes through the full
+    per-customer path instead.
+    """
+    attr_cache = {}
+    reply_rows = []
+    group_rows = []
+    usernames_by_isp = defaultdict(set)
+    seen_groups = set()
+
+    for customer, plan, isp in entries:
+        if not customer.radius_password_encrypted:
+            provision_customer_radius(customer, plan, isp, throttle=throttle)
             continue
-        _restore(customer, plan, isp)
-        restored += 1
+        if (plan.id, isp.id) not in seen_groups:
+            ensure_plan_group(plan, isp)
+            seen_groups.add((plan.id, isp.id))
+        if plan.id not in attr_cache:
+            override = _plan_throttle_rate_limit(plan) if throttle else None
+            attr_cache[plan.id] = generate_radius_attributes(
+                plan, rate_limit_override=override
+            )
+
+        username = radius_username(customer)
+        usernames_by_isp[isp.id].add(username)
+        for attr in attr_cache[plan.id]:
+            reply_rows.append({
+                'username': username,
+                'attribute': attr['attribute'],
+                'op': attr['op'],
+                'value': attr['value'],
+                'isp_id': isp.id,
+                'customer_id': customer.id,
+                'is_active': True,
+            })
+        group_rows.append({
+            'username': username,
+            'groupname': f'plan_{plan.id}',
+            'priority': 1,
+            'isp_id': isp.id,
+            'customer_id': customer.id,
+            'is_active': True,
+        })
+
+    for isp_id, usernames in usernames_by_isp.items():
+        for chunk in _chunks(usernames):
+            for model in (RadReply, RadUserGroup):
+                model.query.filter(
+                    model.isp_id == isp_id, model.username.in_(chunk)
+                ).delete(synchronize_session=False)
+
+    for chunk in _chunks(reply_rows):
+        db.session.execute(insert(RadReply), chunk)
+    for chunk in _chunks(group_rows):
+        db.session.execute(insert(RadUserGroup), chunk)
+
+
+def _set_throttled_flag(customers, value):
+    for chunk in _chunks(c.id for c in customers):
+        Customer.query.filter(Customer.id.in_(chunk)).update(
+            {Customer.fup_throttled: value}, synchronize_session=False
+        )
+
+
+def _kick_queue(entries):
+    """A ``KickQueue`` holding the subscribers that changed speed."""
+    from services.hotspot_disconnect import KickQueue
+
+    queue = KickQueue()
+    for customer, _plan, isp in entries:
+        queue.add(radius_username(customer), isp.id)
+    return queue
+
+
+def _kick(queue):
+    """Flush ``queue``; returns ``(routers_reached, routers_tried)``.
+
+    Only routers radacct places an open session on are contacted, all of them
+    at once.
+    """
+    routers = queue.flush()['routers']
+    return sum(1 for router in routers if router['ok']), len(routers)
+
+
+def apply_fup_enforcement(isp_id=None, kick=True):
+    """Throttle over-limit subscribers and restore those back under threshold.
+
+    Returns a summary dict::
+
+        {'throttled': n, 'restored': m, 'cleared': k,
+         'routers_kicked': r, 'routers_total': t,
+         'timings_ms': {'monitor': .., 'preload': .., 'plan': .., 'write': ..,
+                        'commit': .., 'kick': ..}}
+    """
+    timings = {}
+
+    with _phase(timings, 'monitor'):
+        # Throttle on current numbers, not the last scheduled refresh's.
+        refresh_rollup()
+        rows, _summary = get_fup_monitor_rows(isp_id=isp_id, status_filter='all')
+
+    with _phase(timings, 'preload'):
+        rows_by_id = {row['customer_id']: row for row in rows}
+        stale_q = Customer.query.with_entities(Customer.id).filter(
+            Customer.fup_throttled.is_(True)
+        )
+        if isp_id:
+            stale_q = stale_q.filter(Customer.isp_id == isp_id)
+        candidate_ids = set(rows_by_id) | {row[0] for row in stale_q.all()}
+        customers = _load_by_id(Customer, candidate_ids)
+        plans = _load_by_id(ServicePlan, {c.service_plan_id for c in customers.values()})
+        isps = _load_by_id(ISP, {c.isp_id for c in customers.values()})
+
+    with _phase(timings, 'plan'):
+        transitions = plan_transitions(customers.values(), rows_by_id, plans, isps)
+
+    with _phase(timings, 'write'):
+        if transitions[THROTTLE]:
+            _write_radius_rows(transitions[THROTTLE], throttle=True)
+            _set_throttled_flag([c for c, _p, _i in transitions[THROTTLE]], True)
+        if transitions[RESTORE]:
+            _write_radius_rows(transitions[RESTORE], throttle=False)
+            _set_throttled_flag([c for c, _p, _i in transitions[RESTORE]], False)
+        if transitions[CLEAR]:
+            _set_throttled_flag(transitions[CLEAR], False)
+
+    # Resolved before the commit expires every loaded row, so neither the
+    # kick list nor the log lines cost a reload per subscriber.
+    kick_queue = _kick_queue(transitions[THROTTLE] + transitions[RESTORE])
+    for customer, _plan, _isp in transitions[THROTTLE]:
+        logger.info('FUP throttled %s', customer.email)
+    for customer, _plan, _isp in transitions[RESTORE]:
+        logger.info('FUP restored %s to full speed', customer.email)
+
+    with _phase(timings, 'commit'):
+        if any(transitions.values()):
+            db.session.commit()
 
-    if throttled or restored:
-        db.session.commit()
+    # Kick only once the new rows are committed, so the re-auth the kick
+    # triggers reads the new rate limit rather than racing the transaction.
+    routers_kicked = routers_total = 0
+    with _phase(timings, 'kick'):
+        if kick and kick_queue:
+            routers_kicked, routers_total = _kick(kick_queue)
 
-    return {'throttled': throttled, 'restored': restored}
+    return {
+        'throttled': len(transitions[THROTTLE]),
+        'restored': len(transitions[RESTORE]),
+        'cleared': len(transitions[CLEAR]),
+        'routers_kicked': routers_kicked,
+        'routers_total': routers_total,
+        'timings_ms': timings,
+    }
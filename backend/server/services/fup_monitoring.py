@@ -1,4 +1,5 @@
 """Fair Usage Policy monitoring — aggregate RADIUS usage vs plan thresholds."""
+import logging
 from datetime import datetime, timedelta
 
 from sqlalchemy import func
@@ -8,6 +9,8 @@ from models import Customer, RadAcct, ServicePlan
 from services.plan_utils import extract_package_policy, get_plan_data_cap_gb
 from services.session_tracking import link_unattributed_sessions, online_customer_ids
 
+logger = logging.getLogger(__name__)
+
 GB = 1024 ** 3
 
 
@@ -53,7 +56,8 @@ def compute_fup_status(bytes_used, threshold_bytes, fup_enabled):
     return 'normal', pct
 
 
-def _build_usage_maps(period_start, isp_id=None):
+def _raw_usage_maps(period_start, isp_id=None):
+    """Sum radacct since ``period_start`` directly — the rollup's ground truth."""
     byte_expr = (
         func.coalesce(RadAcct.acctinputoctets, 0) + func.coalesce(RadAcct.acctoutputoctets, 0)
     )
@@ -80,6 +84,20 @@ def _build_usage_maps(period_start, isp_id=None):
     return by_id, by_username
 
 
+def _build_usage_maps(period_start, isp_id=None):
+    """Usage totals from the daily rollup, or radacct when it can't answer.
+
+    See services.usage_rollup — the rollup returns None for a period it has not
+    been backfilled far enough to cover.
+    """
+    from services.usage_rollup import usage_maps
+
+    maps = usage_maps(period_start, isp_id)
+    if maps is not None:
+        return maps
+    return _raw_usage_maps(period_start, isp_id)
+
+
 def _lookup_usage(customer, by_id, by_username):
     """Bytes for this customer, by id first then by their RADIUS login.
 
@@ -128,6 +146,22 @@ def _build_row(customer, plan, usage_cache, online_ids, now, isp_id=None):
     }
 
 
+def refresh_rollup():
+    """Bring the usage rollup up to date. Never fatal: on failure the rollup is
+    simply a little behind until the next refresh.
+
+    For background runs only. A refresh locks the rollup's state row and writes,
+    so page loads read the rollup as the usage-rollup job last left it.
+    """
+    from services.usage_rollup import refresh_usage_rollup
+
+    try:
+        refresh_usage_rollup()
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning('Usage rollup refresh skipped: %s', exc)
+
+
 def get_fup_monitor_rows(
     *,
     isp_id=None,
@@ -1,13 +1,75 @@
-"""Disconnect live subscriber sessions (hotspot + PPPoE) when a subscription expires."""
+"""Disconnect live subscriber sessions (hotspot + PPPoE) when a subscription expires.
+
+Single kicks (an operator terminating one session) log in to the router and
+run the remove commands directly. Batch jobs go through :class:`KickQueue`:
+usernames are collected first, routed to the routers radacct says they are
+actually on, and each router is kicked once. Routers offering the RouterOS API
+are all kicked from one event loop with the lookups and removes pipelined
+(routeros_api.kick_usernames); the rest, and any the API fails on, get one SSH
+login with the removes folded into a few RouterOS ``:foreach`` scripts.
+"""
 import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
 
-from models import Customer, MikrotikDevice
-from services.device_config_ops import _ssh_config, connection_host
-from mikrotik_client import MikroTikClient
+from extensions import db
+from models import Customer, MikrotikDevice, RadAcct
+from services.device_config_ops import (
+    _api_config, _api_preferred, _note_api_result, _ssh_config, connection_host,
+)
+from services.ssh_pool import connect_client, pooled_client, release_client
 from services.radius_provisioning import radius_username
 
 logger = logging.getLogger(__name__)
 
+# Usernames per ``:foreach`` script — keeps one exec well under the length
+# RouterOS is happy to take on a single SSH command line.
+SCRIPT_BATCH = 50
+
+# Routers kicked in parallel by one KickQueue.flush().
+FLUSH_WORKERS = 8
+
+# Bound on one IN (...) list — see services.fup_enforcement.
+CHUNK_SIZE = 500
+
+
+def _kick_commands(username):
+    """RouterOS commands that drop every live session a user can hold."""
+    return (
+        # Hotspot: session, host binding, and login cookie
+        f'/ip hotspot active remove [find user="{username}"]',
+        f'/ip hotspot host remove [find user="{username}"]',
+        f'/ip hotspot cookie remove [find user="{username}"]',
+        # PPPoE: drop the live tunnel session
+        f'/ppp active remove [find name="{username}"]',
+    )
+
+
+def _run_each(device, commands):
+    """Run ``commands`` on ``device`` one by one over a pooled SSH session.
+
+    A failing command does not stop the rest (a router without the hotspot
+    package still drops PPPoE sessions), but the session it failed on may be
+    half-read, so it is closed rather than handed back to the pool. Raises
+    only when the router cannot be reached.
+    """
+    client = connect_client(_ssh_config(device, timeout=6))
+    failed = False
+    try:
+        for cmd in commands:
+            try:
+                client.run_cli(cmd)
+            except Exception as exc:  # noqa: BLE001 — best effort, see above
+                logger.debug('Kick command failed on %s: %s', connection_host(device), exc)
+                failed = True
+    except BaseException:
+        release_client(client, ok=False)
+        raise
+    release_client(client, ok=not failed)
+
 
 def disconnect_username_on_device(username, device):
     """Kick a single user's live sessions (PPPoE + hotspot) on one router.
@@ -18,20 +80,13 @@ def disconnect_username_on_device(username, device):
     if not username or not device:
         return False
     try:
-        with MikroTikClient(_ssh_config(device, timeout=6)) as client:
-            if not client.connect():
-                return False
-            for cmd in (
-                f'/ppp active remove [find name="{username}"]',
-                f'/ip hotspot active remove [find user="{username}"]',
-                f'/ip hotspot host remove [find user="{username}"]',
-                f'/ip hotspot cookie remove [find user="{username}"]',
-            ):
-                try:
-                    client.run_cli(cmd)
-                except Exception:
-                    pass
-            return True
+        _run_each(device, (
+            f'/ppp active remove [find name="{username}"]',
+            f'/ip hotspot active remove [find user="{username}"]',
+            f'/ip hotspot host remove [find user="{username}"]',
+            f'/ip hotspot cookie remove [find user="{username}"]',
+        ))
+        return True
     except Exception as exc:
         logger.debug('Targeted disconnect skip %s: %s', connection_host(device), exc)
         return False
@@ -51,22 +106,228 @@ def disconnect_customer_on_devices(customer, isp):
     kicked = 0
     for device in devices:
         try:
-            with MikroTikClient(_ssh_config(device, timeout=6)) as client:
-                if not client.connect():
-                    continue
-                for cmd in (
-                    # Hotspot: session, host binding, and login cookie
-                    f'/ip hotspot active remove [find user="{username}"]',
-                    f'/ip hotspot host remove [find user="{username}"]',
-                    f'/ip hotspot cookie remove [find user="{username}"]',
-                    # PPPoE: drop the live tunnel session
-                    f'/ppp active remove [find name="{username}"]',
-                ):
-                    try:
-                        client.run_cli(cmd)
-                    except Exception:
-                        pass
-                kicked += 1
+            _run_each(device, _kick_commands(username))
+            kicked += 1
         except Exception as exc:
             logger.debug('Disconnect skip %s: %s', connection_host(device), exc)
     return kicked
+
+
+def _ros_string(value):
+    """Quote ``value`` as a RouterOS string literal."""
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+    return f'"{escaped}"'
+
+
+def _kick_scripts(usernames):
+    """``:foreach`` scripts running every kick command for ``usernames``.
+
+    Each remove is wrapped in ``:do {} on-error={}`` so a router without, say,
+    the hotspot package still drops the PPPoE sessions — the same best-effort
+    semantics as running the commands one by one and ignoring failures.
+    """
+    body = '; '.join(
+        ':do {' + cmd.replace('"{u}"', '$u') + '} on-error={}'
+        for cmd in _kick_commands('{u}')
+    )
+    for start in range(0, len(usernames), SCRIPT_BATCH):
+        names = ';'.join(_ros_string(u) for u in usernames[start:start + SCRIPT_BATCH])
+        yield f':foreach u in={{{names}}} do={{ {body} }}'
+
+
+def _run_kicks(config, usernames):
+    """One SSH login to a router, running the batched kicks. Returns (ok, error)."""
+    try:
+        with pooled_client(config) as client:
+            for script in _kick_scripts(usernames):
+                client.run_cli(script)
+            return True, None
+    except Exception as exc:
+        return False, str(exc)[:255]
+
+
+def _run_api_kicks(jobs):
+    """Kick over the RouterOS API, every router from one event loop.
+
+    ``jobs`` is ``[(device_id, api_config, usernames)]``; returns
+    ``{device_id: error}``, None where the kick went through.
+    """
+    from routeros_api import kick_usernames, run_fleet
+
+    results = run_fleet(jobs, kick_usernames, concurrency=FLUSH_WORKERS * 8)
+    return {device_id: None if exc is None else str(exc)[:255]
+            for device_id, (_removed, exc) in results.items()}
+
+
+def kick_on_routers(targets, workers=FLUSH_WORKERS):
+    """Kick ``[(device, usernames)]``, one connection per router.
+
+    API first where the router offers it, SSH for the rest and for any the API
+    failed on. Returns one report entry per router::
+
+        {'device_id', 'device_name', 'usernames', 'ok', 'via', 'latency_ms', 'error'}
+    """
+    by_id = {device.id: (device, usernames) for device, usernames in targets}
+    api_ids, ssh_ids = [], []
+    for device_id, (device, _usernames) in by_id.items():
+        (api_ids if _api_preferred(device) else ssh_ids).append(device_id)
+    routers = []
+
+    if api_ids:
+        started = time.perf_counter()
+        errors = _run_api_kicks([
+            (device_id, _api_config(by_id[device_id][0], timeout=6), by_id[device_id][1])
+            for device_id in api_ids
+        ])
+        # The routers ran concurrently; each reports the whole run's time.
+        latency = round((time.perf_counter() - started) * 1000, 1)
+        for device_id in api_ids:
+            device, usernames = by_id[device_id]
+            error = errors.get(device_id)
+            _note_api_result(device_id, error)
+            if error is not None:
+                logger.info('API kick on %s failed, using SSH: %s', device.device_name, error)
+                ssh_ids.append(device_id)
+                continue
+            routers.append({'device_id': device_id, 'device_name': device.device_name,
+                            'usernames': len(usernames), 'ok': True, 'via': 'api',
+                            'latency_ms': latency, 'error': None})
+
+    # Connection settings (and decrypted passwords) are read here, on the
+    # caller's thread and session; the workers only talk SSH.
+    jobs = [
+        (device_id, by_id[device_id][0].device_name,
+         _ssh_config(by_id[device_id][0], timeout=6), by_id[device_id][1])
+        for device_id in ssh_ids
+    ]
+
+    def _kick(job):
+        device_id, name, config, usernames = job
+        started = time.perf_counter()
+        ok, error = _run_kicks(config, usernames)
+        if not ok:
+            logger.info('Kick on %s (%s) failed: %s', name, config.host, error)
+        return {
+            'device_id': device_id,
+            'device_name': name,
+            'usernames': len(usernames),
+            'ok': ok,
+            'via': 'ssh',
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'error': error,
+        }
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+            routers.extend(pool.map(_kick, jobs))
+    return routers
+
+
+def disconnect_usernames_on_device(usernames, device):
+    """Kick many users' live sessions on one router over a single login.
+
+    Batch jobs (FUP enforcement, expiry sweeps) would otherwise pay one
+    handshake per subscriber per router. Returns True when the router was
+    reached and the commands ran.
+    """
+    usernames = [u for u in dict.fromkeys(usernames or ()) if u]
+    if not usernames or not device:
+        return False
+    [report] = kick_on_routers([(device, usernames)])
+    if not report['ok']:
+        logger.debug('Batch disconnect skip %s: %s', connection_host(device), report['error'])
+    return report['ok']
+
+
+def _device_addresses(device):
+    addresses = {device.device_ip, (device.management_wg_ip or '').split('/')[0]}
+    return {a for a in addresses if a}
+
+
+class KickQueue:
+    """Usernames to disconnect, sent as one session per router on flush.
+
+    ``add`` as subscribers are cut off; call ``flush`` after the RADIUS rows
+    are gone and committed, so the re-auth a kick triggers is refused. Only
+    routers with an open radacct session for a queued login are contacted: a
+    login with no open session has nothing to drop. An open session that
+    cannot be tied to a router (no device link, unknown NAS address) falls
+    back to every active router of that ISP.
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(set)
+
+    def add(self, username, isp_id):
+        if username and isp_id:
+            self._pending[isp_id].add(username)
+
+    def add_customer(self, customer):
+        if customer is not None:
+            self.add(radius_username(customer), customer.isp_id)
+
+    def __len__(self):
+        return sum(len(names) for names in self._pending.values())
+
+    def _open_sessions(self, isp_id, usernames):
+        """``[(login, mikrotik_device_id, nasipaddress)]`` for open sessions."""
+        login = func.lower(RadAcct.username)
+        wanted = sorted({u.lower() for u in usernames})
+        rows = []
+        for start in range(0, len(wanted), CHUNK_SIZE):
+            rows.extend(
+                db.session.query(login, RadAcct.mikrotik_device_id, RadAcct.nasipaddress)
+                .filter(
+                    RadAcct.isp_id == isp_id,
+                    RadAcct.acctstoptime.is_(None),
+                    login.in_(wanted[start:start + CHUNK_SIZE]),
+                )
+                .distinct()
+                .all()
+            )
+        return rows
+
+    def route(self):
+        """``({device_id: (device, [usernames])}, without_session_count)``."""
+        targets = {}
+        without_session = 0
+        for isp_id, usernames in self._pending.items():
+            devices = MikrotikDevice.query.filter_by(isp_id=isp_id, is_active=True).all()
+            by_id = {d.id: d for d in devices}
+            by_address = defaultdict(list)
+            for device in devices:
+                for address in _device_addresses(device):
+                    by_address[address].append(device)
+            original = {u.lower(): u for u in usernames}
+
+            seen = set()
+            for login, device_id, nas_ip in self._open_sessions(isp_id, usernames):
+                username = original.get(login, login)
+                seen.add(login)
+                if device_id in by_id:
+                    routers = [by_id[device_id]]
+                else:
+                    # Several routers can share a NAS address behind one NAT;
+                    # kicking on each of them is harmless, missing one is not.
+                    routers = by_address.get(nas_ip) or devices
+                for device in routers:
+                    targets.setdefault(device.id, (device, set()))[1].add(username)
+            without_session += len(set(original) - seen)
+        return (
+            {device_id: (device, sorted(names)) for device_id, (device, names) in targets.items()},
+            without_session,
+        )
+
+    def flush(self, workers=FLUSH_WORKERS):
+        """Kick everything queued; returns a per-router report and empties the queue.
+
+        ::
+
+            {'usernames': n, 'without_session': m,
+             'routers': [<kick_on_routers entry>, ...]}
+        """
+        queued = len(self)
+        targets, without_session = self.route()
+        self._pending.clear()
+        routers = kick_on_routers(list(targets.values()), workers=workers)
+        return {'usernames': queued, 'without_session': without_session, 'routers': routers}
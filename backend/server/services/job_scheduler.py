@@ -0,0 +1,470 @@
+"""Background jobs, each run once however many workers could run it.
+
+The API runs under gunicorn with several worker processes, sometimes on more
+than one host. One ``time.sleep`` thread per job started in every one of them
+runs each job once per worker — expiry and FUP enforcement racing each other
+over the same customers and multiplying the SSH sessions to every router. Here
+every worker starts one scheduler thread, and the threads elect a leader: only
+the one holding the scheduler lease looks at the clock and starts jobs. The
+others keep trying for the lease, so a leader that dies is replaced within a
+tick.
+
+On PostgreSQL the lease is a session advisory lock held on a connection of its
+own. It spans every host sharing the database and is freed by the server when
+the worker dies or its connection drops; the leader pings that connection each
+tick, so it notices a lost lease rather than carrying on beside a new leader.
+Elsewhere (sqlite in development) it is a flock on a file in ``/tmp`` — the
+mechanism services.device_config_ops uses for its per-router SSH locks — which
+elects one leader per host, all a sqlite install has.
+
+Each job also takes a lock of its own for the length of a run, so a run still
+going when its leader lost the lease, or the same job started from cron with
+``flask run-job``, is never overlapped: the second one is skipped. Every run
+is a ``job_runs`` row with its status, duration and result or error. That is
+also where a newly elected leader reads when each job last ran, so a failover
+does not rerun everything at once, and what :func:`job_status` summarises.
+
+Intervals come from config and 0 leaves a job off. Each next run is pushed
+back by a random fraction (``JOB_SCHEDULER_JITTER``) of its interval, so jobs
+that share an interval drift apart instead of firing on the same tick forever.
+"""
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+
+from extensions import db
+from models import JobRun
+
+logger = logging.getLogger(__name__)
+
+_LOCK_DIR = '/tmp'
+# First key of the two-key advisory lock functions, shared by every lock here:
+# (namespace, 0) is the scheduler lease, (namespace, crc32(job)) a job's lock.
+_LOCK_NAMESPACE = zlib.crc32(b'infora-job-scheduler') & 0x7fffffff
+_LEASE = 'scheduler'
+# Completed runs the mean duration in job_status is taken over.
+_STATUS_WINDOW = 20
+
+
+class Job:
+    """A named callable run every ``interval`` seconds; 0 leaves it off.
+
+    ``func`` runs inside an app context and takes no arguments; what it returns
+    is stored on the run as its result. ``enabled`` is an optional check made
+    when the scheduler starts, for jobs that need an optional dependency.
+    """
+
+    def __init__(self, name, func, interval, enabled=None):
+        self.name = name
+        self.func = func
+        self.interval = int(interval or 0)
+        self.enabled = enabled
+
+    def __repr__(self):
+        return f'<Job {self.name} every {self.interval}s>'
+
+
+def _enforce_expiry():
+    from services.subscription_expiry import enforce_expired_subscriptions
+
+    return enforce_expired_subscriptions(
+        grace_hours=current_app.config.get('SUBSCRIPTION_GRACE_HOURS', 0)
+    )
+
+
+def _enforce_fup():
+    from services.fup_enforcement import apply_fup_enforcement
+
+    return apply_fup_enforcement()
+
+
+def _refresh_usage_rollup():
+    from services.usage_rollup import refresh_usage_rollup
+
+    return refresh_usage_rollup()
+
+
+def _sync_wireguard_stats():
+    from services.wireguard_accounting import collect_wireguard_stats
+
+    return collect_wireguard_stats()
+
+
+def _send_sales_digests():
+    from services.sales_digest import run_due
+
+    return run_due()
+
+
+def _purge_retention():
+    from services.data_retention import purge_expired_data
+
+    return purge_expired_data()
+
+
+def _poll_snmp():
+    from services.snmp_poller import poll_due_devices
+
+    return poll_due_devices()
+
+
+def _pysnmp_available():
+    from services.snmp_poller import PYSNMP_AVAILABLE
+
+    if not PYSNMP_AVAILABLE:
+        logger.warning('SNMP_POLL_TICK is set but pysnmp is not installed')
+    return PYSNMP_AVAILABLE
+
+
+def default_jobs(config):
+    """The jobs the app hosts, with their intervals read from ``config``.
+
+    Names match the CLI commands that run the same work by hand.
+    """
+    return [
+        Job('enforce-expiry', _enforce_expiry, config.get('SUBSCRIPTION_ENFORCEMENT_INTERVAL')),
+        Job('enforce-fup', _enforce_fup, config.get('FUP_ENFORCEMENT_INTERVAL')),
+        Job('usage-rollup', _refresh_usage_rollup, config.get('USAGE_ROLLUP_REFRESH_INTERVAL')),
+        Job('sync-wireguard-stats', _sync_wireguard_stats, config.get('WIREGUARD_STATS_INTERVAL')),
+        Job('sales-digest', _send_sales_digests, config.get('SALES_DIGEST_INTERVAL')),
+        Job('purge-retention', _purge_retention, config.get('RETENTION_PURGE_INTERVAL')),
+        Job('poll-snmp', _poll_snmp, config.get('SNMP_POLL_TICK'), enabled=_pysnmp_available),
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Locks
+# ---------------------------------------------------------------------------
+
+class _AdvisoryLock:
+    """A PostgreSQL session advisory lock on a connection kept for it alone.
+
+    The lock lives as long as that connection's session, so the connection is
+    held out of the pool until :meth:`release`.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._conn = None
+
+    def acquire(self):
+        conn = db.engine.connect()
+        try:
+            got = conn.execute(text('SELECT pg_try_advisory_lock(:ns, :key)'),
+                               {'ns': _LOCK_NAMESPACE, 'key': self.key}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not got:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def held(self):
+        if self._conn is None:
+            return False
+        try:
+            self._conn.execute(text('SELECT 1'))
+            self._conn.commit()
+            return True
+        except Exception:
+            # The session is gone and the server has freed the lock with it.
+            self._conn.invalidate()
+            self._conn.close()
+            self._conn = None
+            return False
+
+    def release(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.execute(text('SELECT pg_advisory_unlock(:ns, :key)'),
+                         {'ns': _LOCK_NAMESPACE, 'key': self.key})
+            conn.commit()
+        except Exception:
+            # Never hand a connection that may still hold the lock back to the pool.
+            conn.invalidate()
+        conn.close()
+
+
+class _FileLock:
+    """A non-blocking flock, freed by the kernel if the holder dies.
+
+    A fresh fd per lock means it also excludes other threads of this process.
+    """
+
+    def __init__(self, name):
+        self.path = os.path.join(_LOCK_DIR, f'infora-job-{name}.lock')
+        self._fd = None
+
+    def acquire(self):
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def held(self):
+        return self._fd is not None
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        except OSError:
+            pass
+        os.close(fd)
+
+
+def _lock(name):
+    if db.engine.dialect.name == 'postgresql':
+        return _AdvisoryLock(0 if name == _LEASE else zlib.crc32(name.encode()) & 0x7fffffff)
+    return _FileLock(name)
+
+
+@contextlib.contextmanager
+def job_lock(name):
+    """Hold job ``name``'s run lock for the block; yields False if another run has it."""
+    lock = _lock(name)
+    acquired = lock.acquire()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.release()
+
+
+# ---------------------------------------------------------------------------
+# Running a job
+# ---------------------------------------------------------------------------
+
+def _host():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _summarise(result):
+    if result is None:
+        return None
+    if isinstance(result, (dict, list, tuple)):
+        result = json.dumps(result, default=str)
+    return str(result)[:2000]
+
+
+def run_job(job):
+    """Run ``job`` once under its lock and record the run.
+
+    Returns the ``JobRun``, or None when another run of the job is in progress
+    anywhere. A failing job is logged and recorded, never raised: the scheduler
+    thread must outlive it. Call inside an app context.
+    """
+    with job_lock(job.name) as acquired:
+        if not acquired:
+            logger.info('Job %s skipped: a run is already in progress', job.name)
+            return None
+
+        # Holding the lock means no live run of this job exists, so a row still
+        # marked running belongs to a worker that died mid-run.
+        JobRun.query.filter_by(job=job.name, status='running').update(
+            {'status': 'abandoned'}, synchronize_session=False)
+        run = JobRun(job=job.name, status='running', started_at=datetime.utcnow(), host=_host())
+        db.session.add(run)
+        db.session.commit()
+
+        started = time.monotonic()
+        try:
+            result = job.func()
+            run.status = 'completed'
+            run.result = _summarise(result)
+        except Exception as exc:
+            db.session.rollback()
+            run.status = 'failed'
+            run.error = f'{type(exc).__name__}: {exc}'[:2000]
+            logger.warning('Job %s failed: %s', job.name, exc)
+        run.finished_at = datetime.utcnow()
+        run.duration_ms = int((time.monotonic() - started) * 1000)
+        try:
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            logger.warning('Job %s finished but its run could not be recorded: %s', job.name, exc)
+        return run
+
+
+def job_status(jobs):
+    """Each job's schedule, last run and recent durations, for ``flask jobs``."""
+    status = []
+    for job in jobs:
+        recent = (JobRun.query.filter_by(job=job.name)
+                  .order_by(JobRun.started_at.desc(), JobRun.id.desc())
+                  .limit(_STATUS_WINDOW).all())
+        last = recent[0] if recent else None
+        durations = [r.duration_ms for r in recent
+                     if r.status == 'completed' and r.duration_ms is not None]
+        status.append({
+            'job': job.name,
+            'interval': job.interval,
+            'last_status': last.status if last else None,
+            'last_started_at': last.started_at if last else None,
+            'last_duration_ms': last.duration_ms if last else None,
+            'last_host': last.host if last else None,
+            'last_error': last.error if last and last.status == 'failed' else None,
+            'mean_duration_ms': int(sum(durations) / len(durations)) if durations else None,
+            'max_duration_ms': max(durations) if durations else None,
+            'recent_failures': sum(1 for r in recent if r.status == 'failed'),
+        })
+    return status
+
+
+# ---------------------------------------------------------------------------
+# The scheduler
+# ---------------------------------------------------------------------------
+
+class Scheduler:
+    """One worker's scheduler thread: contends for the lease, runs due jobs.
+
+    Jobs run on threads of their own so a long FUP pass does not hold up the
+    SNMP tick; a job whose previous run is still going is left until it ends.
+    ``threaded=False`` runs them inline instead, for tests and one-off use.
+    """
+
+    def __init__(self, app, jobs, tick=None, jitter=None, threaded=True):
+        self.app = app
+        self.jobs = [job for job in jobs if job.interval > 0]
+        self.tick_seconds = tick or app.config.get('JOB_SCHEDULER_TICK', 15)
+        self.jitter = app.config.get('JOB_SCHEDULER_JITTER', 0.1) if jitter is None else jitter
+        self.threaded = threaded
+        self._lease = None
+        self._next = {}
+        self._running = {}
+        self._stop = threading.Event()
+
+    def _delay(self, job):
+        return timedelta(seconds=job.interval * (1 + random.uniform(0, self.jitter)))
+
+    def _plan(self, now):
+        """When each job is next due, from when it last ran anywhere."""
+        last = dict(
+            db.session.query(JobRun.job, db.func.max(JobRun.started_at))
+            .filter(JobRun.job.in_([job.name for job in self.jobs]))
+            .group_by(JobRun.job)
+            .all()
+        )
+        plan = {}
+        for job in self.jobs:
+            if last.get(job.name):
+                plan[job.name] = last[job.name] + timedelta(seconds=job.interval)
+            else:
+                plan[job.name] = now + timedelta(seconds=job.interval * random.uniform(0, self.jitter))
+        return plan
+
+    def is_leader(self, now=None):
+        """Keep or take the lease; True while this worker holds it."""
+        if self._lease is not None:
+            if self._lease.held():
+                return True
+            logger.warning('Job scheduler lease lost by %s', _host())
+            self._lease = None
+        lease = _lock(_LEASE)
+        if not lease.acquire():
+            return False
+        self._lease = lease
+        self._next = self._plan(now or datetime.utcnow())
+        logger.info('Job scheduler lease taken by %s', _host())
+        return True
+
+    def tick(self, now=None):
+        """Start every due job if this worker leads. Returns the names started."""
+        if not self.is_leader(now):
+            return []
+        now = now or datetime.utcnow()
+        started = []
+        for job in self.jobs:
+            if now < self._next.get(job.name, now):
+                continue
+            running = self._running.get(job.name)
+            if running is not None and running.is_alive():
+                continue
+            self._next[job.name] = now + self._delay(job)
+            started.append(job.name)
+            if self.threaded:
+                thread = threading.Thread(target=self._run, args=(job,), daemon=True,
+                                          name=f'job-{job.name}')
+                self._running[job.name] = thread
+                thread.start()
+            else:
+                run_job(job)
+        return started
+
+    def _run(self, job):
+        with self.app.app_context():
+            run_job(job)
+
+    def _loop(self):
+        while not self._stop.wait(self.tick_seconds):
+            with self.app.app_context():
+                try:
+                    self.tick()
+                except Exception as exc:
+                    db.session.rollback()
+                    logger.warning('Job scheduler tick failed: %s', exc)
+
+    def start(self):
+        thread = threading.Thread(target=self._loop, daemon=True, name='job-scheduler')
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        if self._lease is not None:
+            with self.app.app_context():
+                self._lease.release()
+            self._lease = None
+
+
+_scheduler = None
+_scheduler_pid = None
+_start_lock = threading.Lock()
+
+
+def start(app):
+    """Start this worker's scheduler, once per process; None if no job is on.
+
+    Every worker calls this. Keyed on the pid so a worker forked from a process
+    that already started one still gets a thread of its own.
+    """
+    global _scheduler, _scheduler_pid
+    if _scheduler_pid == os.getpid():
+        return _scheduler
+    with _start_lock:
+        if _scheduler_pid == os.getpid():
+            return _scheduler
+        _scheduler_pid = os.getpid()
+        _scheduler = None
+        if not app.config.get('JOB_SCHEDULER_ENABLED', True):
+            return None
+        with app.app_context():
+            jobs = [job for job in default_jobs(app.config)
+                    if job.interval > 0 and (job.enabled is None or job.enabled())]
+        if jobs:
+            _scheduler = Scheduler(app, jobs)
+            _scheduler.start()
+        return _scheduler
@@ -0,0 +1,135 @@
+"""Re-encrypt stored secrets under the active encryption key.
+
+After a key change (see services/encryption.py) the old key stays in
+``ENCRYPTION_KEY_PREVIOUS`` until every stored value has been re-encrypted.
+``rotate_encrypted_columns`` walks each encrypted column in primary-key order,
+``batch`` rows at a time with a commit after each batch, so a large table
+never sits in one transaction and an interrupted run resumes where it left
+off: values the active key already opens are left alone.
+
+Integration settings keep their secrets inside a JSON blob; the fields
+``tenant_integrations`` decrypts are rotated there in place.
+"""
+import json
+import logging
+
+from sqlalchemy import or_, select
+
+from extensions import db
+from models import (
+    CpeDevice, Customer, ImportCandidate, IntegrationSetting, MikrotikDevice,
+    PaymentSettings, RadiusConfig, RadiusNasClient, User, WireGuardPeer,
+    WireGuardServer,
+)
+from services.encryption import rotate_value
+from services.tenant_integrations import _is_secret
+
+logger = logging.getLogger(__name__)
+
+# Every column whose readers call decrypt_value. A column missing here keeps
+# working only while its previous key is configured.
+ENCRYPTED_COLUMNS = (
+    (Customer, 'radius_password_encrypted'),
+    (User, 'two_factor_secret'),
+    (MikrotikDevice, 'password'),
+    (MikrotikDevice, 'management_wg_private_key_encrypted'),
+    (WireGuardServer, 'private_key_encrypted'),
+    (WireGuardPeer, 'private_key_encrypted'),
+    (WireGuardPeer, 'preshared_key_encrypted'),
+    (PaymentSettings, 'daraja_consumer_secret'),
+    (PaymentSettings, 'daraja_passkey'),
+    (RadiusConfig, 'shared_secret'),
+    (RadiusNasClient, 'shared_secret'),
+    (ImportCandidate, 'password_encrypted'),
+    (CpeDevice, 'connection_request_password_encrypted'),
+    (CpeDevice, 'cwmp_password_encrypted'),
+)
+
+
+def _rotate_config(raw):
+    """``(new_raw, unreadable)`` for an integration's JSON config."""
+    try:
+        config = json.loads(raw)
+    except (ValueError, TypeError):
+        return raw, 0
+    if not isinstance(config, dict):
+        return raw, 0
+    changed, unreadable = False, 0
+    for name, value in config.items():
+        if not (_is_secret(name) and isinstance(value, str) and value):
+            continue
+        rotated = rotate_value(value)
+        if rotated is None:
+            unreadable += 1
+        elif rotated != value:
+            config[name], changed = rotated, True
+    return (json.dumps(config) if changed else raw), unreadable
+
+
+def _walk(model, columns, rotate_row, batch, dry_run):
+    """Apply ``rotate_row`` to every row with a value in one of ``columns``."""
+    table = model.__table__
+    key = table.c.id
+    wanted = [table.c[name] for name in columns]
+    rotated = unreadable = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(key, *wanted)
+            .where(key > last_id, or_(*[c.isnot(None) for c in wanted]))
+            .order_by(key).limit(batch)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for row in rows:
+            changes, bad = rotate_row(dict(zip(columns, row[1:])))
+            unreadable += bad
+            if changes:
+                rotated += 1
+                if not dry_run:
+                    db.session.execute(table.update().where(key == row[0]).values(**changes))
+        if not dry_run:
+            db.session.commit()
+    return rotated, unreadable
+
+
+def _column_rotator(values):
+    changes, unreadable = {}, 0
+    for name, value in values.items():
+        new = rotate_value(value)
+        if new is None:
+            unreadable += 1
+        elif new != value:
+            changes[name] = new
+    return changes, unreadable
+
+
+def _config_rotator(values):
+    new, unreadable = _rotate_config(values['config'])
+    return ({'config': new} if new != values['config'] else {}), unreadable
+
+
+def rotate_encrypted_columns(batch=500, dry_run=False):
+    """Re-encrypt every stored secret under the active key.
+
+    Returns ``{table: {'rotated': rows, 'unreadable': values}}``. Unreadable
+    values are tokens no configured key opens — usually a previous key left
+    out of ``ENCRYPTION_KEY_PREVIOUS`` — and are never rewritten.
+    """
+    by_model = {}
+    for model, column in ENCRYPTED_COLUMNS:
+        by_model.setdefault(model, []).append(column)
+
+    summary = {}
+    for model, columns in by_model.items():
+        rotated, unreadable = _walk(model, columns, _column_rotator, batch, dry_run)
+        summary[model.__tablename__] = {'rotated': rotated, 'unreadable': unreadable}
+    rotated, unreadable = _walk(IntegrationSetting, ['config'], _config_rotator, batch, dry_run)
+    summary[IntegrationSetting.__tablename__] = {'rotated': rotated, 'unreadable': unreadable}
+
+    for table, counts in summary.items():
+        if counts['unreadable']:
+            logger.warning('%s: %d encrypted values open under no configured key',
+                           table, counts['unreadable'])
+    return summary
@@ -0,0 +1,277 @@
+"""Per-device metric history in fixed-interval, downsampled buckets.
+
+Router resource columns (``mikrotik_sync._apply_device_info``) only ever held
+the latest value, and SNMP samples are raw rows a graph would have to scan.
+This keeps ``metric_buckets`` instead: for each (source, device, metric) the
+count, sum, min and max of every point that fell in a bucket.
+
+* Points go into 1-minute buckets as they arrive (:func:`record_points`),
+  merged with an upsert, so any number of writers may add to one bucket.
+* :func:`downsample` folds 1-minute buckets older than
+  METRIC_MINUTE_RETENTION_HOURS into 5-minute ones, 5-minute buckets older
+  than METRIC_5MIN_RETENTION_DAYS into hourly ones, and drops hourly buckets
+  past METRIC_HOURLY_RETENTION_DAYS. Folding is exact — sums, counts and
+  extremes combine — so an average over a folded range equals the average of
+  the points. It runs from ``flask purge-retention`` (services.data_retention)
+  or more often from ``flask downsample-metrics``.
+* :func:`query_series` answers a time range with min/avg/max per step from
+  whichever tiers hold it, so a graph reads at most ``max_points`` rows' worth.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, update
+
+from extensions import db
+from models import MetricBucket
+
+SOURCE_ROUTER = 'router'
+SOURCE_SNMP = 'snmp'
+
+MINUTE, FIVE_MINUTES, HOUR = 60, 300, 3600
+RESOLUTIONS = (MINUTE, FIVE_MINUTES, HOUR)
+
+_EPOCH = datetime(1970, 1, 1)
+_SERIES_KEY = ('source', 'device_id', 'metric', 'resolution', 'bucket_start')
+
+# Coarse buckets folded per transaction when downsampling (1 hour of 5-minute
+# buckets, 12 hours of hourly ones), so one run never holds a huge window.
+FOLD_WINDOW_BUCKETS = 12
+# Bucket rows per upsert statement.
+MERGE_BATCH = 1000
+
+
+def floor_time(moment, seconds):
+    """Start of the ``seconds``-wide bucket holding ``moment`` (naive UTC)."""
+    elapsed = int((moment - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def _config(name, default):
+    try:
+        return int(current_app.config.get(name, default) or default)
+    except (RuntimeError, TypeError, ValueError):
+        return default
+
+
+def retention():
+    """How long each resolution is kept before it is folded (or, hourly, dropped)."""
+    return {
+        MINUTE: timedelta(hours=max(1, _config('METRIC_MINUTE_RETENTION_HOURS', 48))),
+        FIVE_MINUTES: timedelta(days=max(1, _config('METRIC_5MIN_RETENTION_DAYS', 14))),
+        HOUR: timedelta(days=max(1, _config('METRIC_HOURLY_RETENTION_DAYS', 400))),
+    }
+
+
+def _lesser(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _greater(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _merge(rows):
+    """Add pre-aggregated bucket rows into their buckets (one row per key)."""
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            least, greatest = func.least, func.greatest
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            # SQLite's multi-argument min()/max() are its LEAST/GREATEST.
+            least, greatest = func.min, func.max
+        table = MetricBucket.__table__
+        stmt = dialect_insert(table).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=list(_SERIES_KEY),
+            set_={
+                'count': table.c.count + stmt.excluded['count'],
+                'sum': table.c.sum + stmt.excluded['sum'],
+                'min': least(func.coalesce(table.c.min, stmt.excluded['min']), stmt.excluded['min']),
+                'max': greatest(func.coalesce(table.c.max, stmt.excluded['max']), stmt.excluded['max']),
+            },
+        ))
+        return
+    for row in rows:
+        key = and_(*[getattr(MetricBucket, column) == row[column] for column in _SERIES_KEY])
+        existing = MetricBucket.query.filter(key).first()
+        if existing is None:
+            db.session.execute(insert(MetricBucket).values(**row))
+            continue
+        db.session.execute(update(MetricBucket).where(MetricBucket.id == existing.id).values(
+            count=existing.count + row['count'],
+            sum=existing.sum + row['sum'],
+            min=_lesser(existing.min, row['min']),
+            max=_greater(existing.max, row['max']),
+        ))
+
+
+def record_points(source, device_id, points, at=None):
+    """Add ``{metric: value}`` measured ``at`` to the device's 1-minute buckets.
+
+    ``None`` values are skipped. Runs in the caller's transaction.
+    """
+    bucket = floor_time(at or datetime.utcnow(), MINUTE)
+    rows = [
+        {'source': source, 'device_id': device_id, 'metric': metric[:64],
+         'resolution': MINUTE, 'bucket_start': bucket,
+         'count': 1, 'sum': float(value), 'min': float(value), 'max': float(value)}
+        for metric, value in points.items() if value is not None
+    ]
+    _merge(rows)
+
+
+def _used_percent(total, free):
+    if not total or free is None:
+        return None
+    return round(100.0 * (total - free) / total, 2)
+
+
+def record_device_resources(device, at=None):
+    """Sample a router's freshly synced resource columns into its series."""
+    record_points(SOURCE_ROUTER, device.id, {
+        'cpu_load': device.cpu_load,
+        'mem_used_pct': _used_percent(device.mem_total, device.mem_free),
+        'hdd_used_pct': _used_percent(device.hdd_total, device.hdd_free),
+        'client_count': device.client_count,
+        'bandwidth_kbps': device.bandwidth_usage,
+    }, at=at)
+
+
+def _fold_tier(fine, coarse, cutoff, dry_run):
+    """Fold every ``fine`` bucket before ``cutoff`` into ``coarse`` buckets."""
+    pending = MetricBucket.query.filter(
+        MetricBucket.resolution == fine, MetricBucket.bucket_start < cutoff)
+    if dry_run:
+        return pending.count()
+    folded = 0
+    while True:
+        first = db.session.query(func.min(MetricBucket.bucket_start)).filter(
+            MetricBucket.resolution == fine, MetricBucket.bucket_start < cutoff).scalar()
+        if first is None:
+            return folded
+        # Whole coarse buckets at a time (cutoff is coarse-aligned), so a
+        # window never splits one.
+        window_start = floor_time(first, coarse)
+        window_end = min(cutoff, window_start + timedelta(seconds=coarse * FOLD_WINDOW_BUCKETS))
+        in_window = and_(MetricBucket.resolution == fine,
+                         MetricBucket.bucket_start >= window_start,
+                         MetricBucket.bucket_start < window_end)
+        merged = {}
+        for row in db.session.query(
+                MetricBucket.source, MetricBucket.device_id, MetricBucket.metric,
+                MetricBucket.bucket_start, MetricBucket.count, MetricBucket.sum,
+                MetricBucket.min, MetricBucket.max).filter(in_window):
+            key = (row.source, row.device_id, row.metric, floor_time(row.bucket_start, coarse))
+            into = merged.get(key)
+            if into is None:
+                merged[key] = {'source': key[0], 'device_id': key[1], 'metric': key[2],
+                               'resolution': coarse, 'bucket_start': key[3],
+                               'count': row.count, 'sum': row.sum, 'min': row.min, 'max': row.max}
+                continue
+            into['count'] += row.count
+            into['sum'] += row.sum
+            into['min'] = _lesser(into['min'], row.min)
+            into['max'] = _greater(into['max'], row.max)
+        rows = list(merged.values())
+        for start in range(0, len(rows), MERGE_BATCH):
+            _merge(rows[start:start + MERGE_BATCH])
+        folded += db.session.execute(delete(MetricBucket).where(in_window)).rowcount
+        db.session.commit()
+
+
+def downsample(now=None, dry_run=False):
+    """Fold aged buckets into the next resolution and drop expired hourly ones.
+
+    Returns ``{'folded': rows folded away, 'pruned': hourly rows dropped}``.
+    """
+    now = now or datetime.utcnow()
+    keep = retention()
+    folded = 0
+    for fine, coarse in ((MINUTE, FIVE_MINUTES), (FIVE_MINUTES, HOUR)):
+        folded += _fold_tier(fine, coarse, floor_time(now - keep[fine], coarse), dry_run)
+    expired = MetricBucket.query.filter(MetricBucket.resolution == HOUR,
+                                        MetricBucket.bucket_start < now - keep[HOUR])
+    if dry_run:
+        return {'folded': folded, 'pruned': expired.count()}
+    pruned = expired.delete(synchronize_session=False)
+    db.session.commit()
+    return {'folded': folded, 'pruned': pruned}
+
+
+def list_metrics(source, device_id):
+    return sorted(name for (name,) in db.session.query(MetricBucket.metric).filter(
+        MetricBucket.source == source, MetricBucket.device_id == device_id).distinct())
+
+
+def query_series(source, device_id, metric, start, end, max_points=500, now=None):
+    """min/avg/max of ``metric`` per step over ``[start, end)``.
+
+    The step is the finest resolution still kept at ``start``, widened so the
+    range is at most ``max_points`` steps. Buckets are read from every tier,
+    since the newest part of a long range has not been folded yet.
+    """
+    now = now or datetime.utcnow()
+    keep = retention()
+    resolution = next((res for res in RESOLUTIONS if start >= now - keep[res]), HOUR)
+    span = max(1, (end - start).total_seconds())
+    step = max(resolution, math.ceil(span / max(1, max_points) / resolution) * resolution)
+
+    merged = defaultdict(lambda: {'count': 0, 'sum': 0.0, 'min': None, 'max': None})
+    rows = db.session.query(
+        MetricBucket.bucket_start, MetricBucket.count, MetricBucket.sum,
+        MetricBucket.min, MetricBucket.max,
+    ).filter(
+        MetricBucket.source == source,
+        MetricBucket.device_id == device_id,
+        MetricBucket.metric == metric,
+        MetricBucket.bucket_start >= floor_time(start, step),
+        MetricBucket.bucket_start < end,
+    )
+    for row in rows:
+        into = merged[floor_time(row.bucket_start, step)]
+        into['count'] += row.count
+        into['sum'] += row.sum
+        into['min'] = _lesser(into['min'], row.min)
+        into['max'] = _greater(into['max'], row.max)
+    points = [
+        {'t': moment.isoformat(), 'min': bucket['min'], 'max': bucket['max'],
+         'avg': bucket['sum'] / bucket['count'] if bucket['count'] else None,
+         'count': bucket['count']}
+        for moment, bucket in sorted(merged.items())
+    ]
+    return {'metric': metric, 'step_seconds': step, 'points': points}
+
+
+def series_request(source, device_id, args, now=None):
+    """Answer a ``?metric=&from=&to=&max_points=`` range query for the routes.
+
+    ``from``/``to`` are ISO timestamps (default: the last 24 hours); without
+    ``metric`` the device's recorded metric names are listed instead. Raises
+    ``ValueError`` for an unparseable or empty range.
+    """
+    metric = (args.get('metric') or '').strip()
+    if not metric:
+        return {'metrics': list_metrics(source, device_id)}
+    now = now or datetime.utcnow()
+    end = _parse_time(args.get('to')) or now
+    start = _parse_time(args.get('from')) or end - timedelta(hours=24)
+    if start >= end:
+        raise ValueError('from must be before to')
+    max_points = max(1, min(int(args.get('max_points') or 500), 5000))
+    return query_series(source, device_id, metric, start, end, max_points=max_points, now=now)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
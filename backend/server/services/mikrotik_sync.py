@@ -8,7 +8,6 @@ from extensions import db
 from models import DeviceStatus, MikrotikDevice
 from mikrotik_client import (
     ConnectionType,
-    MikroTikAPIError,
     MikroTikClient,
     MikroTikConnectionConfig,
     MikroTikSSHError,
@@ -154,14 +153,24 @@ def _apply_device_info(device, info):
         device.os_version = info.version
     if info.board_name and (not device.device_model or device.device_model == 'Auto-detect'):
         device.device_model = info.board_name
+    # The columns above only hold the latest value; graphs read the history
+    # from services/metric_series. In a SAVEPOINT so a failed sample never
+    # costs the sync itself.
+    from services.metric_series import record_device_resources
+    try:
+        with db.session.begin_nested():
+            record_device_resources(device, at=device.last_synced)
+    except Exception as exc:
+        current_app.logger.warning('Metric sample failed for device %s: %s', device.id, exc)
 
 
-def sync_device_stats(device, connection_type=None):
+def sync_device_stats(device, connection_type=None, lock_wait=20):
     """Sync a single MikroTik device and persist stats.
 
     Management-tunnel routers go through the resilient, serialized SSH helper
     (retries the flaky MikroTik banner) so a router that just powered back up
     reliably flips to ONLINE instead of sticking OFFLINE on one failed attempt.
+    ``lock_wait`` bounds the wait for another operation's SSH session on it.
     """
     use_tunnel = bool(device.management_wg_enabled and device.management_wg_ip)
     if use_tunnel:
@@ -200,7 +209,7 @@ def sync_device_stats(device, connection_type=None):
         _mark_online(device)
         db.session.commit()
         try:
-            with mikrotik_ssh(device, timeout=12, lock_wait=20) as client:
+            with mikrotik_ssh(device, timeout=12, lock_wait=lock_wait) as client:
                 info = client.get_device_info()
                 _apply_device_info(device, info)
                 db.session.commit()
@@ -223,10 +232,11 @@ def sync_device_stats(device, connection_type=None):
                 'stats_stale': True,
             }
     else:
+        from services.ssh_pool import pooled_client
+
         config = device_connection_config(device, connection_type)
-        with MikroTikClient(config) as client:
-            if not client.connect():
-                raise MikroTikAPIError('Failed to connect to device')
+        # API-protocol configs are not pooled; pooled_client just connects them.
+        with pooled_client(config) as client:
             info = client.get_device_info()
             _apply_device_info(device, info)
             db.session.commit()
@@ -278,24 +288,21 @@ def sync_device_async(app, device_id, connection_type=None):
 
 
 def bulk_sync_devices(isp_id=None):
-    query = MikrotikDevice.query.filter_by(is_active=True)
-    if isp_id:
-        query = query.filter_by(isp_id=isp_id)
-    devices = query.all()
-
-    synced = 0
-    failed = 0
-    for device in devices:
-        try:
-            sync_device_stats(device)
-            synced += 1
-        except Exception:
-            # Hysteresis, not a hard OFFLINE: a live router that just missed one
-            # probe/SSH stays ONLINE; only genuinely-gone routers flip.
-            db.session.rollback()
-            if mark_unreachable(device, already_probed=True) == DeviceStatus.ONLINE:
-                synced += 1
-            else:
-                failed += 1
+    """Sync every active router for ``isp_id`` (all tenants when None) and wait.
 
-    return {'synced': synced, 'failed': failed, 'total': len(devices)}
+    Runs the concurrent sweep in services.device_sweep and blocks until the last
+    router answers or times out — for the CLI and scripts. The HTTP route starts
+    a pollable run with ``device_sweep.start_bulk_sync`` instead.
+    """
+    from services.device_sweep import OUTCOME_BUSY, OUTCOME_ERROR, OUTCOME_OFFLINE, iter_bulk_sync
+
+    synced = failed = busy = total = 0
+    for result in iter_bulk_sync(current_app._get_current_object(), isp_id=isp_id):
+        total += 1
+        if result['outcome'] == OUTCOME_BUSY:
+            busy += 1
+        elif result['outcome'] in (OUTCOME_OFFLINE, OUTCOME_ERROR):
+            failed += 1
+        else:
+            synced += 1
+    return {'synced': synced, 'failed': failed, 'busy': busy, 'total': total}
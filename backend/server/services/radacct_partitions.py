@@ -0,0 +1,378 @@
+"""Monthly range partitions for radacct, and archiving the old ones.
+
+radacct gains a row per RADIUS session and never loses one, and nearly every
+report over it — FUP usage, the usage rollup, the reports page — asks for a
+window of ``acctstarttime``. Partitioned by month on that column, Postgres
+prunes such a query to the months it names, and a month that has aged out
+is detached whole instead of being deleted row by row.
+
+Three pieces, all Postgres-only (elsewhere they do nothing):
+
+* ``migrate_to_partitioned`` — the one-time move for an existing install.
+  Builds ``radacct_partitioned`` with the same columns, indexes, foreign keys
+  and grants, copies history across in ``batch``-row commits while accounting
+  carries on, then, under a brief exclusive lock, re-copies the rows that
+  could have changed meanwhile (open sessions, unlinked rows, anything newer)
+  and swaps the names. The old table is kept as ``radacct_unpartitioned``
+  until an operator drops it.
+* ``ensure_partitions`` — creates the coming ``RADACCT_PARTITIONS_AHEAD``
+  months. A row whose month has no partition lands in ``radacct_pdefault``
+  (as does a NULL start time); creating that month later moves such rows out
+  first, since Postgres refuses a partition that the default overlaps.
+* ``archive_partitions`` — detaches months older than ``RADACCT_HOT_MONTHS``
+  into the ``RADACCT_ARCHIVE_SCHEMA`` schema, where they stay queryable by
+  name, and drops archived months past ``RADACCT_ARCHIVE_DROP_MONTHS``
+  (0 keeps them). A month still holding an open session is left attached:
+  detaching it would take a live subscriber off the online list.
+
+The last two run from ``purge-retention``; ``flask radacct-partitions`` runs
+any of them by hand. ``RADACCT_HOT_MONTHS`` (a year by default) is what keeps
+the attached set small; set to 0, partitions pile up and every query that
+cannot name its months — the accounting updates among them — probes them all.
+
+FreeRADIUS's interim-update and stop queries
+(config/freeradius/mods-config/sql/main/postgresql/queries.conf) bound the
+row on ``acctstarttime`` as well as ``acctuniqueid`` so that they touch only
+the months a session can have started in. Deploy that file before migrating.
+
+The table has no primary key once partitioned — Postgres only allows unique
+keys that include the partition column — so ``radacctid`` is kept unique
+together with ``acctstarttime``; the sequence still hands out one id per row.
+Any other unique index (FreeRADIUS's on ``acctuniqueid``, say) is rebuilt the
+same way, as unique on ``(<its columns>, acctstarttime)``.
+"""
+import logging
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'radacct'
+DEFAULT_PARTITION = 'radacct_pdefault'
+_STAGING = 'radacct_partitioned'
+_RETIRED = 'radacct_unpartitioned'
+_NAME = re.compile(r'^radacct_p(\d{4})_(\d{2})$')
+# Identifiers read back from the catalog are only ever the radacct table's own;
+# anything else is refused rather than quoted into DDL.
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_PRIVILEGES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'TRUNCATE', 'REFERENCES', 'TRIGGER')
+
+
+# ---------------------------------------------------------------------------
+#  Months and names
+# ---------------------------------------------------------------------------
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def partition_month(name):
+    """The month a partition name covers, or None (the default, or not ours)."""
+    match = _NAME.match(name or '')
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def missing_months(existing, now, ahead):
+    """Months through ``ahead`` after ``now``'s that have no partition.
+
+    Starts after the newest existing partition when that is in the past, so
+    months missed while nothing ran are filled in too.
+    """
+    have = {partition_month(name) for name in existing} - {None}
+    month = month_start(now)
+    if have:
+        month = min(month, add_months(max(have), 1))
+    last = add_months(month_start(now), ahead)
+    months = []
+    while month <= last:
+        if month not in have:
+            months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def archivable(existing, now, hot_months):
+    """Attached monthly partitions wholly older than the last ``hot_months``."""
+    if hot_months <= 0:
+        return []
+    cutoff = add_months(month_start(now), -hot_months)
+    return sorted(name for name in existing
+                  if partition_month(name) is not None and partition_month(name) < cutoff)
+
+
+def _ident(name):
+    if not _IDENTIFIER.match(name or ''):
+        raise ValueError(f'unexpected identifier {name!r}')
+    return name
+
+
+# ---------------------------------------------------------------------------
+#  Catalog
+# ---------------------------------------------------------------------------
+
+def _config(name, default):
+    return int(current_app.config.get(name, default) or 0)
+
+
+def supported():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def is_partitioned(conn, table=TABLE):
+    return bool(conn.execute(text(
+        'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)'
+    ), {'t': table}).scalar())
+
+
+def attached_partitions(conn, table=TABLE):
+    return [row[0] for row in conn.execute(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = to_regclass(:t) ORDER BY c.relname'
+    ), {'t': table})]
+
+
+def _archived_partitions(conn, schema):
+    return [row[0] for row in conn.execute(text(
+        'SELECT tablename FROM pg_tables WHERE schemaname = :s ORDER BY tablename'
+    ), {'s': schema}) if partition_month(row[0])]
+
+
+# ---------------------------------------------------------------------------
+#  Keeping months ahead, archiving months behind
+# ---------------------------------------------------------------------------
+
+def _create_partition(conn, month, parent=TABLE):
+    name, start, end = partition_name(month), month, add_months(month, 1)
+    bounds = f"FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    stranded = DEFAULT_PARTITION in attached_partitions(conn, parent) and conn.execute(text(
+        f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE acctstarttime >= :s AND acctstarttime < :e LIMIT 1'
+    ), {'s': start, 'e': end}).scalar()
+    if not stranded:
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} FOR VALUES {bounds}'))
+        return name
+    # Rows already written for this month sit in the default partition; move
+    # them into the new table before it is attached.
+    conn.execute(text(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    conn.execute(text(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+        f'WHERE acctstarttime >= :s AND acctstarttime < :e RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), {'s': start, 'e': end})
+    conn.execute(text(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES {bounds}'))
+    return name
+
+
+def ensure_partitions(now=None, ahead=None):
+    """Create this month's and the coming months' partitions. Returns their names."""
+    if not supported():
+        return []
+    now = now or datetime.utcnow()
+    ahead = _config('RADACCT_PARTITIONS_AHEAD', 3) if ahead is None else ahead
+    with db.engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        months = missing_months(attached_partitions(conn), now, ahead)
+        return [_create_partition(conn, month) for month in months]
+
+
+def archive_partitions(now=None, dry_run=False):
+    """Detach aged months into the archive schema; drop expired archives.
+
+    Returns ``{'archived': [...], 'kept_open': [...], 'dropped': [...]}``.
+    """
+    result = {'archived': [], 'kept_open': [], 'dropped': []}
+    if not supported():
+        return result
+    now = now or datetime.utcnow()
+    hot = _config('RADACCT_HOT_MONTHS', 0)
+    drop_after = _config('RADACCT_ARCHIVE_DROP_MONTHS', 0)
+    schema = _ident(current_app.config.get('RADACCT_ARCHIVE_SCHEMA') or 'radacct_archive')
+
+    with db.engine.begin() as conn:
+        if not is_partitioned(conn):
+            return result
+        if not dry_run:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {schema}'))
+        for name in archivable(attached_partitions(conn), now, hot):
+            if conn.execute(text(f'SELECT 1 FROM {name} WHERE acctstoptime IS NULL LIMIT 1')).scalar():
+                result['kept_open'].append(name)
+                continue
+            result['archived'].append(name)
+            if not dry_run:
+                conn.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION {name}'))
+                conn.execute(text(f'ALTER TABLE {name} SET SCHEMA {schema}'))
+        if drop_after > 0:
+            cutoff = add_months(month_start(now), -drop_after)
+            for name in _archived_partitions(conn, schema):
+                if partition_month(name) < cutoff:
+                    result['dropped'].append(name)
+                    if not dry_run:
+                        conn.execute(text(f'DROP TABLE {schema}.{name}'))
+    if result['kept_open']:
+        logger.warning('radacct months left attached, sessions still open: %s',
+                       ', '.join(result['kept_open']))
+    return result
+
+
+# ---------------------------------------------------------------------------
+#  One-time migration
+# ---------------------------------------------------------------------------
+
+def _rename_index_ddl(indexdef, suffix, table):
+    """``CREATE INDEX name ON public.radacct ...`` → the same on ``table`` as ``name+suffix``.
+
+    A unique index stays unique, widened to ``(<cols>, acctstarttime)`` — the
+    only kind of unique key a table partitioned on that column may have.
+    """
+    match = re.match(r'^CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ (.*)$', indexdef)
+    if not match:
+        raise ValueError(f'unrecognised index definition: {indexdef}')
+    unique, rest = match.group(1) or '', match.group(3)
+    if unique:
+        rest = _with_partition_key(rest, indexdef)
+    return f'CREATE {unique}INDEX IF NOT EXISTS {_ident(match.group(2) + suffix)} ON {table} {rest}'
+
+
+def _with_partition_key(rest, indexdef):
+    """Append ``acctstarttime`` to the key column list of ``USING ... (<cols>) ...``."""
+    start = rest.find('(')
+    end = rest.find(')', start)
+    columns = rest[start + 1:end]
+    if start < 0 or end < 0 or '(' in columns:
+        # An expression key cannot be made unique on a partitioned table.
+        raise ValueError(f'cannot partition a unique index on an expression: {indexdef}')
+    if 'acctstarttime' in [column.strip() for column in columns.split(',')]:
+        return rest
+    return f'{rest[:end]}, acctstarttime{rest[end:]}'
+
+
+def _catalog(conn):
+    primary = conn.execute(text(
+        "SELECT conindid::regclass::text FROM pg_constraint "
+        "WHERE conrelid = to_regclass(:t) AND contype = 'p'"
+    ), {'t': TABLE}).scalar()
+    indexes = [(name, ddl) for name, ddl in conn.execute(text(
+        'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :t AND schemaname = current_schema()'
+    ), {'t': TABLE}) if name != primary]
+    foreign_keys = list(conn.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(:t) AND contype = 'f'"
+    ), {'t': TABLE}))
+    grants = list(conn.execute(text(
+        'SELECT grantee, privilege_type FROM information_schema.role_table_grants '
+        'WHERE table_name = :t AND table_schema = current_schema() AND grantee <> current_user'
+    ), {'t': TABLE}))
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'radacctid')"), {'t': TABLE}).scalar()
+    return primary, indexes, foreign_keys, grants, sequence
+
+
+def _build_staging(conn, now, ahead):
+    primary, indexes, foreign_keys, grants, _sequence = _catalog(conn)
+    conn.execute(text(
+        f'CREATE TABLE {_STAGING} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE (acctstarttime)'
+    ))
+    conn.execute(text(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {_STAGING} DEFAULT'))
+    oldest = conn.execute(text(f'SELECT min(acctstarttime) FROM {TABLE}')).scalar()
+    month, last = month_start(oldest or now), add_months(month_start(now), ahead)
+    while month <= last:
+        _create_partition(conn, month, parent=_STAGING)
+        month = add_months(month, 1)
+    conn.execute(text(
+        f'CREATE UNIQUE INDEX {_ident((primary or TABLE + "_pkey") + "_p")} '
+        f'ON {_STAGING} (radacctid, acctstarttime)'
+    ))
+    for _name, ddl in indexes:
+        conn.execute(text(_rename_index_ddl(ddl, '_p', _STAGING)))
+    for name, definition in foreign_keys:
+        conn.execute(text(f'ALTER TABLE {_STAGING} ADD CONSTRAINT {_ident(name + "_p")} {definition}'))
+    for grantee, privilege in grants:
+        # FreeRADIUS often connects as its own role; it needs the same rights.
+        if privilege not in _PRIVILEGES:
+            continue
+        role = 'PUBLIC' if grantee == 'PUBLIC' else f'"{grantee}"'
+        conn.execute(text(f'GRANT {privilege} ON {_STAGING} TO {role}'))
+
+
+def migrate_to_partitioned(batch=50_000, now=None, echo=logger.info):
+    """Move an unpartitioned radacct onto monthly partitions. Idempotent.
+
+    Safe to interrupt during the copy: a rerun carries on from the highest id
+    already copied. Returns the number of rows copied, or None when there was
+    nothing to do.
+    """
+    if not supported():
+        echo('radacct partitioning needs PostgreSQL; nothing to do')
+        return None
+    now = now or datetime.utcnow()
+    ahead = _config('RADACCT_PARTITIONS_AHEAD', 3)
+
+    with db.engine.begin() as conn:
+        if is_partitioned(conn):
+            echo('radacct is already partitioned')
+            return None
+        if not conn.execute(text('SELECT to_regclass(:t)'), {'t': _STAGING}).scalar():
+            _build_staging(conn, now, ahead)
+            echo(f'created {_STAGING} with {len(attached_partitions(conn, _STAGING))} partitions')
+        high_water = conn.execute(text(f'SELECT coalesce(max(radacctid), 0) FROM {TABLE}')).scalar()
+        copied_to = conn.execute(text(f'SELECT coalesce(max(radacctid), 0) FROM {_STAGING}')).scalar()
+
+    # History, in batches, while FreeRADIUS keeps writing to the old table.
+    copied = 0
+    while copied_to < high_water:
+        upper = min(high_water, copied_to + batch)
+        with db.engine.begin() as conn:
+            copied += conn.execute(text(
+                f'INSERT INTO {_STAGING} SELECT * FROM {TABLE} WHERE radacctid > :lo AND radacctid <= :hi'
+            ), {'lo': copied_to, 'hi': upper}).rowcount
+        copied_to = upper
+        echo(f'copied through radacctid {copied_to} of {high_water}')
+
+    # The swap. Rows that may have changed since they were copied — sessions
+    # that were open (interim updates, a stop), rows not yet linked to a
+    # customer, and everything written after the high-water mark — are copied
+    # again under the lock, then the names change hands.
+    with db.engine.begin() as conn:
+        conn.execute(text(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE'))
+        primary, indexes, foreign_keys, _grants, sequence = _catalog(conn)
+        conn.execute(text(
+            f'CREATE TEMP TABLE radacct_resync ON COMMIT DROP AS '
+            f'WITH gone AS (DELETE FROM {_STAGING} WHERE acctstoptime IS NULL '
+            f'OR customer_id IS NULL OR isp_id IS NULL OR radacctid > :hw RETURNING radacctid) '
+            f'SELECT radacctid FROM gone'
+        ), {'hw': high_water})
+        copied += conn.execute(text(
+            f'INSERT INTO {_STAGING} SELECT * FROM {TABLE} '
+            f'WHERE radacctid > :hw OR radacctid IN (SELECT radacctid FROM radacct_resync)'
+        ), {'hw': high_water}).rowcount
+
+        conn.execute(text(f'ALTER TABLE {TABLE} RENAME TO {_RETIRED}'))
+        for name in [primary] + [name for name, _ddl in indexes]:
+            if name:
+                conn.execute(text(f'ALTER INDEX {_ident(name)} RENAME TO {_ident(name + "_unpartitioned")}'))
+        for name, _definition in foreign_keys:
+            conn.execute(text(f'ALTER TABLE {_RETIRED} RENAME CONSTRAINT {_ident(name)} '
+                              f'TO {_ident(name + "_unpartitioned")}'))
+        conn.execute(text(f'ALTER TABLE {_STAGING} RENAME TO {TABLE}'))
+        for name in [primary or TABLE + '_pkey'] + [name for name, _ddl in indexes]:
+            conn.execute(text(f'ALTER INDEX {_ident(name + "_p")} RENAME TO {_ident(name)}'))
+        for name, _definition in foreign_keys:
+            conn.execute(text(f'ALTER TABLE {TABLE} RENAME CONSTRAINT {_ident(name + "_p")} TO {_ident(name)}'))
+        if sequence:
+            conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.radacctid'))
+    echo(f'radacct is partitioned; the old table is kept as {_RETIRED} — drop it once verified')
+    return copied
@@ -0,0 +1,281 @@
+"""In-process caches behind the fallback RADIUS auth endpoint (routes/radius_api).
+
+Every Access-Request the REST fallback receives used to cost a login lookup,
+an ISP load, a Fernet decrypt and a NAS-IP device lookup. After a power cut
+every subscriber on a router re-authenticates within a minute or two, so the
+same handful of rows were read thousands of times over. Here:
+
+* login -> a small auth record (customer id, tenant, status, encrypted
+  password), negative results included, for ``RADIUS_AUTH_CACHE_TTL_SECONDS``;
+* the tenant's active flag and name, for the same TTL;
+* every active router's ``(isp_id, device_ip)`` in one map, rebuilt at most
+  every ``_NAS_MAP_TTL`` seconds;
+* per encrypted password, a keyed digest of its plaintext for
+  ``RADIUS_AUTH_PASSWORD_TTL_SECONDS`` — the decrypted password itself is
+  never kept.
+
+A suspended customer or a retired router must stop authenticating promptly,
+so a commit that changes what authentication reads rewrites a stamp file
+(services/commit_stamps.py), and every worker treats entries older than the
+stamp as stale. The stamps are per tenant. Only the attributes in
+``_AUTH_ATTRIBUTES`` count: routers commit sync status, resource columns and
+liveness all the time, and most often during the reconnect storms this cache
+exists for. A login appearing, disappearing or being renamed also rewrites a
+shared logins stamp, because a cached "no such login" belongs to no tenant.
+Bulk statements bypass the ORM events; their callers use
+``invalidate_radius_auth``.
+"""
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import inspect
+
+from extensions import db
+from models import Customer, ISP, MikrotikDevice
+from services import commit_stamps
+from services.encryption import decrypt_value
+from services.radius_provisioning import find_customer_by_login
+
+logger = logging.getLogger(__name__)
+
+# Stamp names: everything, one per tenant, and logins appearing anywhere.
+_STAMP_NAME = 'radius-auth'
+_LOGINS = 'logins'
+
+# What the cached records are built from; changes to anything else are not
+# an auth change.
+_AUTH_ATTRIBUTES = (
+    (Customer, ('radius_login', 'email', 'status', 'radius_password_encrypted', 'isp_id',
+                'full_name')),
+    (ISP, ('is_active', 'name', 'radius_secret')),
+    (MikrotikDevice, ('device_ip', 'is_active', 'isp_id', 'device_name')),
+)
+_LOGIN_ATTRIBUTES = ('radius_login', 'email', 'isp_id')
+
+# File mtimes come from the kernel's coarse clock and can trail time.time();
+# an entry counts as loaded this much earlier than it was.
+_CLOCK_SLACK = 0.05
+
+_DEFAULT_TTL = 30
+_DEFAULT_PASSWORD_TTL = 60
+_NAS_MAP_TTL = 300
+
+# Digests are keyed per process, so a memory dump of one worker yields
+# nothing that checks a password anywhere else.
+_DIGEST_KEY = secrets.token_bytes(32)
+
+_lock = threading.Lock()
+_logins = {}
+_isps = {}
+_verifiers = {}
+_nas = {'built_at': 0.0, 'built_wall': 0.0, 'map': {}}
+_seen_stamp = [0.0]
+
+
+def _setting(name, default):
+    try:
+        return max(0, int(current_app.config.get(name, default)))
+    except (RuntimeError, TypeError, ValueError):
+        return default
+
+
+def _tenant_stamp(isp_id):
+    return f'{_STAMP_NAME}-isp-{isp_id}'
+
+
+def _logins_stamp():
+    return f'{_STAMP_NAME}-{_LOGINS}'
+
+
+def invalidate_radius_auth(isp_id=None):
+    """Drop cached auth state for ``isp_id`` in every worker; ``None``: everything.
+
+    A tenant's logins may have changed too, so cached "no such login" answers
+    are dropped along with it.
+    """
+    if isp_id is None:
+        commit_stamps.touch(_STAMP_NAME)
+        clear_radius_auth_cache()
+    else:
+        commit_stamps.touch(_tenant_stamp(isp_id))
+        commit_stamps.touch(_logins_stamp())
+
+
+def _invalidate_key(key):
+    if key == _LOGINS:
+        commit_stamps.touch(_logins_stamp())
+    elif key is None:
+        invalidate_radius_auth()
+    else:
+        commit_stamps.touch(_tenant_stamp(key))
+
+
+def clear_radius_auth_cache():
+    """Forget this process's cached entries."""
+    with _lock:
+        _logins.clear()
+        _isps.clear()
+        _verifiers.clear()
+        _nas['built_at'] = 0.0
+        _nas['map'] = {}
+
+
+def _check_stamp():
+    stamp = commit_stamps.stamp_time(_STAMP_NAME)
+    if stamp > _seen_stamp[0]:
+        _seen_stamp[0] = stamp
+        clear_radius_auth_cache()
+
+
+def _unstamped(built_at, stamps):
+    return all(commit_stamps.stamp_time(name) < built_at for name in stamps)
+
+
+def _cached(store, key, ttl, load, stamps=lambda _value: ()):
+    """``load()``'s value for ``key``, reused for ``ttl`` seconds.
+
+    ``stamps(value)`` names the stamps the entry depends on; one rewritten
+    after the entry was loaded makes it stale. The wall clock at load start
+    is what is compared, so a commit landing mid-load is not missed.
+    """
+    now = time.monotonic()
+    with _lock:
+        hit = store.get(key)
+    if hit is not None and now - hit[0] < ttl and _unstamped(hit[1], stamps(hit[2])):
+        return hit[2]
+    wall = time.time() - _CLOCK_SLACK
+    value = load()
+    if ttl:
+        with _lock:
+            if len(store) > 50_000:
+                store.clear()
+            store[key] = (now, wall, value)
+    return value
+
+
+def _login_stamps(record):
+    if record is None:
+        return (_logins_stamp(),)
+    return (_logins_stamp(), _tenant_stamp(record['isp_id']))
+
+
+def lookup_login(username):
+    """Auth record for a login, or None when no customer has it.
+
+    ``{'customer_id', 'isp_id', 'status', 'full_name', 'password_token'}``.
+    Resolution is ``find_customer_by_login``'s, so an email only stands in
+    for a customer without an explicit ``radius_login``.
+    """
+    username = (username or '').strip().lower()
+    if not username:
+        return None
+    _check_stamp()
+
+    def _load():
+        customer = find_customer_by_login(username)
+        if customer is None:
+            return None
+        return {
+            'customer_id': customer.id,
+            'isp_id': customer.isp_id,
+            'status': customer.status,
+            'full_name': customer.full_name,
+            'password_token': customer.radius_password_encrypted,
+        }
+
+    return _cached(_logins, username,
+                   _setting('RADIUS_AUTH_CACHE_TTL_SECONDS', _DEFAULT_TTL), _load, _login_stamps)
+
+
+def lookup_isp(isp_id):
+    """``{'id', 'name', 'is_active'}`` for a tenant, or None."""
+    _check_stamp()
+
+    def _load():
+        row = db.session.query(ISP.id, ISP.name, ISP.is_active).filter(ISP.id == isp_id).first()
+        return None if row is None else {'id': row.id, 'name': row.name,
+                                         'is_active': bool(row.is_active)}
+
+    return _cached(_isps, isp_id, _setting('RADIUS_AUTH_CACHE_TTL_SECONDS', _DEFAULT_TTL), _load,
+                   lambda _value: (_tenant_stamp(isp_id),))
+
+
+def lookup_nas(nas_ip, isp_id):
+    """``{'id', 'device_name'}`` of the tenant's active router at ``nas_ip``."""
+    _check_stamp()
+    ttl = _NAS_MAP_TTL if _setting('RADIUS_AUTH_CACHE_TTL_SECONDS', _DEFAULT_TTL) else 0
+    now = time.monotonic()
+    with _lock:
+        built_at, built_wall = _nas['built_at'], _nas.get('built_wall', 0.0)
+        nas_map = _nas['map']
+    # One map serves every tenant; a change to this tenant's routers rebuilds it.
+    fresh = built_at and now - built_at < ttl and _unstamped(built_wall, (_tenant_stamp(isp_id),))
+    if not fresh:
+        wall = time.time() - _CLOCK_SLACK
+        rows = db.session.query(
+            MikrotikDevice.id, MikrotikDevice.isp_id, MikrotikDevice.device_ip,
+            MikrotikDevice.device_name,
+        ).filter(MikrotikDevice.is_active.is_(True)).order_by(MikrotikDevice.id.desc()).all()
+        # Lowest id wins on a duplicate address, like the .first() it replaces.
+        nas_map = {(row.isp_id, row.device_ip): {'id': row.id, 'device_name': row.device_name}
+                   for row in rows}
+        with _lock:
+            _nas['map'] = nas_map
+            _nas['built_at'] = now
+            _nas['built_wall'] = wall
+    return nas_map.get((isp_id, nas_ip))
+
+
+def _digest(value):
+    return hmac.new(_DIGEST_KEY, value.encode('utf-8'), hashlib.sha256).digest()
+
+
+def verify_login_password(record, password):
+    """Check ``password`` against the record's stored (encrypted) password."""
+    token = record.get('password_token') if record else None
+    if not token or password is None:
+        return False
+
+    def _load():
+        plaintext = decrypt_value(token)
+        return _digest(plaintext) if plaintext else None
+
+    # Keyed by ciphertext: a password change is a new token, never a stale hit.
+    expected = _cached(_verifiers, token,
+                       _setting('RADIUS_AUTH_PASSWORD_TTL_SECONDS', _DEFAULT_PASSWORD_TTL), _load)
+    return expected is not None and hmac.compare_digest(expected, _digest(password))
+
+
+def _auth_changes(session, objects):
+    """Stamp keys for a flush: tenants whose auth state changed, and logins.
+
+    A move between tenants stamps the old tenant as well as the new one.
+    """
+    keys = set()
+    for obj in objects:
+        attributes = next(names for model, names in _AUTH_ATTRIBUTES if isinstance(obj, model))
+        tenant = obj.__dict__.get('id' if isinstance(obj, ISP) else 'isp_id')
+        if obj in session.new or obj in session.deleted:
+            keys.add(tenant)
+            if isinstance(obj, Customer):
+                keys.add(_LOGINS)
+            continue
+        state = inspect(obj)
+        changed = [name for name in attributes if state.attrs[name].history.has_changes()]
+        if not changed:
+            continue
+        keys.add(tenant)
+        if 'isp_id' in changed:
+            keys |= commit_stamps.tenants_of(session, obj)
+        if isinstance(obj, Customer) and set(changed) & set(_LOGIN_ATTRIBUTES):
+            keys.add(_LOGINS)
+    return keys
+
+
+commit_stamps.watch('radius_auth', (Customer, ISP, MikrotikDevice), _auth_changes,
+                    _invalidate_key)
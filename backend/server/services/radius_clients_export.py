@@ -1,9 +1,24 @@
 """
 Generate FreeRADIUS clients.conf from radius_clients + mikrotik_devices + ISPs.
+
+The freeradius container restarts radiusd whenever the file's mtime changes
+(config/freeradius/docker-entrypoint.sh), so every write is a RADIUS restart.
+Writes are therefore skipped when the rendered clients are unchanged (a
+``Content-Hash`` header records what is on disk), and route handlers call
+:func:`request_radius_clients_sync`. It regenerates a fixed couple of seconds
+after the first request, and requests made in that window share the run, so
+a burst of router adds costs one regeneration per window. It throttles rather
+than debounces: a burst longer than the window gets a run per window.
 """
+import errno
+import hashlib
 import ipaddress
+import logging
 import os
 import socket
+import tempfile
+import threading
+from collections import Counter
 from datetime import datetime
 
 from flask import current_app
@@ -11,6 +26,19 @@ from flask import current_app
 from models import ISP, MikrotikDevice, RadiusClient, RadiusNasClient
 from services.encryption import decrypt_value
 
+logger = logging.getLogger(__name__)
+
+_HASH_HEADER = '# Content-Hash: '
+
+# Seconds from the first request to the regeneration it schedules; later
+# requests in that window join it. 0 syncs inline.
+SYNC_DELAY_SECONDS = float(os.getenv('RADIUS_CLIENTS_SYNC_DELAY', '2'))
+
+# Per-process counters; see clients_conf_metrics().
+_metrics = Counter()
+_sync_lock = threading.Lock()
+_pending = None
+
 
 def usable_client_host(host):
     """Return ``host`` if FreeRADIUS can parse it as a client address, else None.
@@ -68,15 +96,10 @@ def _nas_host_for_device(device):
     return device.device_ip.strip().split('/')[0]
 
 
-def generate_clients_conf(default_secret=None):
-    """Build clients.conf content from database NAS records."""
+def _render_clients(default_secret):
+    """The client sections of clients.conf (everything below the header)."""
     from services.radius_provisioning import resolve_isp_radius_secret
-    default_secret = default_secret or os.getenv('RADIUS_SECRET', 'radius_secret_key')
     lines = [
-        '# Auto-generated FreeRADIUS clients.conf',
-        f'# Generated: {datetime.utcnow().isoformat()}Z',
-        '# Run: flask generate-radius-clients',
-        '',
         'client localhost {',
         f'    ipaddr = 127.0.0.1',
         f'    secret = {default_secret}',
@@ -89,6 +112,15 @@ def generate_clients_conf(default_secret=None):
     seen_hosts = {'127.0.0.1'}
     skipped = []
 
+    # One lookup (and one secret decrypt) per tenant, not per router.
+    secrets_by_isp = {}
+
+    def _isp_secret(isp_id):
+        if isp_id not in secrets_by_isp:
+            isp = ISP.query.get(isp_id) if isp_id else None
+            secrets_by_isp[isp_id] = resolve_isp_radius_secret(isp, default_secret)
+        return secrets_by_isp[isp_id]
+
     for client in RadiusClient.query.filter_by(is_active=True).all():
         host = usable_client_host(client.host)
         if not host:
@@ -118,8 +150,7 @@ def generate_clients_conf(default_secret=None):
         if host in seen_hosts:
             continue
         seen_hosts.add(host)
-        isp = ISP.query.get(device.isp_id) if device.isp_id else None
-        secret = resolve_isp_radius_secret(isp, default_secret)
+        secret = _isp_secret(device.isp_id)
         shortname = device.device_name.replace(' ', '_')[:32]
         lines.extend([
             f'client {shortname} {{',
@@ -140,9 +171,8 @@ def generate_clients_conf(default_secret=None):
         if host in seen_hosts:
             continue
         seen_hosts.add(host)
-        isp = ISP.query.get(nas.isp_id) if nas.isp_id else None
         secret = (decrypt_value(nas.shared_secret) if nas.shared_secret else None) \
-            or resolve_isp_radius_secret(isp, default_secret)
+            or _isp_secret(nas.isp_id)
         shortname = (nas.name or 'nas').replace(' ', '_')[:32]
         lines.extend([
             f'client {shortname} {{',
@@ -185,11 +215,144 @@ def generate_clients_conf(default_secret=None):
     return '\n'.join(lines)
 
 
-def sync_radius_clients_conf(default_secret=None):
-    """Regenerate clients.conf and write to disk for FreeRADIUS volume mount."""
-    content = generate_clients_conf(default_secret=default_secret)
-    output = radius_clients_conf_path()
-    os.makedirs(os.path.dirname(output), exist_ok=True)
-    with open(output, 'w', encoding='utf-8') as fh:
+def _content_hash(body):
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def _with_header(body, digest):
+    return '\n'.join([
+        '# Auto-generated FreeRADIUS clients.conf',
+        f'# Generated: {datetime.utcnow().isoformat()}Z',
+        f'{_HASH_HEADER}{digest}',
+        '# Run: flask generate-radius-clients',
+        '',
+        body,
+    ])
+
+
+def generate_clients_conf(default_secret=None):
+    """Build clients.conf content from database NAS records."""
+    default_secret = default_secret or os.getenv('RADIUS_SECRET', 'radius_secret_key')
+    body = _render_clients(default_secret)
+    return _with_header(body, _content_hash(body))
+
+
+def _hash_on_disk(path):
+    """The Content-Hash header of the file at ``path``, or None."""
+    try:
+        with open(path, encoding='utf-8') as fh:
+            for _ in range(5):
+                line = fh.readline()
+                if line.startswith(_HASH_HEADER):
+                    return line[len(_HASH_HEADER):].strip()
+    except OSError:
+        pass
+    return None
+
+
+def _write_atomically(path, content):
+    """Replace ``path`` with ``content`` so radiusd never reads half a file.
+
+    Written to a sibling temp file, fsynced and renamed over the target. Compose
+    bind-mounts clients.conf as a single file, though, and a mount point cannot
+    be renamed over (EBUSY); there the content is written in place with one
+    write, which the entrypoint's ``radiusd -C`` check guards against reading
+    early.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.clients.conf.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+            fh.flush()
+            os.fsync(fh.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        try:
+            os.replace(tmp, path)
+            return
+        except OSError as exc:
+            if exc.errno not in (errno.EBUSY, errno.EXDEV):
+                raise
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    with open(path, 'w', encoding='utf-8') as fh:
         fh.write(content)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def sync_radius_clients_conf(default_secret=None, force=False):
+    """Regenerate clients.conf and write it if the clients changed.
+
+    Returns the path. Unless ``force``, a file whose Content-Hash matches the
+    freshly rendered clients is left alone — no write, so no radiusd restart.
+    """
+    default_secret = default_secret or os.getenv('RADIUS_SECRET', 'radius_secret_key')
+    body = _render_clients(default_secret)
+    digest = _content_hash(body)
+    output = radius_clients_conf_path()
+    _metrics['generations'] += 1
+    if not force and _hash_on_disk(output) == digest:
+        _metrics['skipped_unchanged'] += 1
+        return output
+    _write_atomically(output, _with_header(body, digest))
+    # Each write is picked up by the freeradius entrypoint as one reload.
+    _metrics['writes'] += 1
     return output
+
+
+def _run_pending(app):
+    global _pending
+    with _sync_lock:
+        _pending = None
+    with app.app_context():
+        try:
+            sync_radius_clients_conf()
+        except Exception as exc:  # noqa: BLE001 — background; never raise
+            _metrics['failures'] += 1
+            logger.warning('Failed to sync RADIUS clients.conf: %s', exc)
+
+
+def request_radius_clients_sync(app=None, delay=None):
+    """Ask for clients.conf to be regenerated soon; never raises.
+
+    Requests arriving while one is pending join it, so onboarding ten routers
+    costs one regeneration and at most one radiusd restart. The run is
+    ``delay`` seconds after the first request, not the last. Call after the
+    change is committed: the regeneration runs on another thread and session.
+    """
+    global _pending
+    delay = SYNC_DELAY_SECONDS if delay is None else delay
+    app = app or current_app._get_current_object()
+    _metrics['requests'] += 1
+    if delay <= 0:
+        _run_pending(app)
+        return
+    with _sync_lock:
+        if _pending is not None:
+            _metrics['coalesced'] += 1
+            return
+        _pending = threading.Timer(delay, _run_pending, args=(app,))
+        _pending.daemon = True
+        _pending.start()
+
+
+def clients_conf_metrics():
+    """Counters since this process started, plus what is on disk now."""
+    path = radius_clients_conf_path()
+    with _sync_lock:
+        pending = _pending is not None
+    return {
+        'requests': _metrics['requests'],
+        'coalesced': _metrics['coalesced'],
+        'generations': _metrics['generations'],
+        'skipped_unchanged': _metrics['skipped_unchanged'],
+        'writes': _metrics['writes'],
+        'failures': _metrics['failures'],
+        'pending': pending,
+        'path': path,
+        'content_hash': _hash_on_disk(path),
+    }
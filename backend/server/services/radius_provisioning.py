@@ -101,12 +101,19 @@ def generate_account_number(isp):
     Atomically bumps the per-ISP counter under a row lock so concurrent creates
     (and bulk imports) never collide.
     """
+    return reserve_account_numbers(isp, 1)[0]
+
+
+def reserve_account_numbers(isp, count):
+    """Issue ``count`` consecutive account numbers with one counter bump."""
+    if count <= 0:
+        return []
     prefix = (isp.account_number_prefix or _derive_account_prefix(isp)).strip().upper()
     locked = ISP.query.filter_by(id=isp.id).with_for_update().first() or isp
     current = locked.account_number_seq or 100000
-    locked.account_number_seq = current + 1
+    locked.account_number_seq = current + count
     db.session.flush()
-    return f'{prefix}-{locked.account_number_seq}'
+    return [f'{prefix}-{seq}' for seq in range(current + 1, current + count + 1)]
 
 
 def ensure_account_number(customer, isp, preferred=None):
@@ -369,23 +376,29 @@ def activate_customer_after_payment(customer, isp, plan=None, stack_time=True):
     db.session.flush()
 
 
-def suspend_customer_access(customer, isp):
+def suspend_customer_access(customer, isp, kick_queue=None):
     """Suspend billing customer and remove RADIUS / WireGuard access.
 
     Also kicks any live sessions on the ISP's routers so the subscriber is
     dropped immediately — deleting the radcheck rows alone only blocks the
     *next* auth, leaving an existing PPPoE tunnel up until it re-dials.
+
+    Batch callers pass a ``services.hotspot_disconnect.KickQueue``; the kick is
+    then queued for the caller to flush once, after its commit.
     """
     from services.wireguard_provisioning import deprovision_customer_wireguard
 
     customer.status = CustomerStatus.SUSPENDED
     if isp:
         deprovision_customer_radius(customer, isp)
-        from services.hotspot_disconnect import disconnect_customer_on_devices
-        try:
-            disconnect_customer_on_devices(customer, isp)
-        except Exception:
-            pass
+        if kick_queue is not None:
+            kick_queue.add(radius_username(customer), isp.id)
+        else:
+            from services.hotspot_disconnect import disconnect_customer_on_devices
+            try:
+                disconnect_customer_on_devices(customer, isp)
+            except Exception:
+                pass
     deprovision_customer_wireguard(customer)
     db.session.flush()
 
@@ -1,28 +1,52 @@
-"""Lightweight in-process rate limiting (no external dependency).
+"""Lightweight rate limiting (no external dependency).
 
 Provides:
   - ``is_rate_limited(bucket, limit, window)`` — low-level check (used where a
     custom response is needed, e.g. the provisioning route returns 404).
   - ``rate_limit(limit, window, ...)`` — decorator that returns HTTP 429.
+  - ``stats()`` — hits and denials per scope (``flask rate-limit-stats``).
 
-Notes / limitations:
-  - State is per-process. Under multi-worker gunicorn each worker keeps its own
-    counters, so the effective limit is roughly ``limit * num_workers``. That is
-    acceptable as a first line of defence against brute force / scraping; for
-    strict global limits move the backing store to Redis (e.g. flask-limiter).
+Each bucket is a sliding-window counter kept as two fixed windows: the count
+in the current window plus the previous window's count weighted by how much of
+it still overlaps the sliding window. That is three integers per bucket
+whatever the traffic, where a list of timestamps grew with every hit and had to
+be rebuilt on each one. The estimate assumes the previous window's hits were
+evenly spread; it can be off by a fraction of one window's burst, which is
+fine for throttling brute force and scraping.
+
+Where the counters live is ``RATE_LIMIT_BACKEND``:
+  - ``sqlite`` (the default in config.py) — a SQLite file on local disk shared
+    by every gunicorn worker on the host, so ``limit`` means ``limit`` rather
+    than ``limit * num_workers``. One upsert per hit in WAL mode with syncing
+    off: the counters are worth nothing after a crash, so they are not
+    fsync'd. Stale buckets are pruned every few minutes.
+  - ``memory`` — per-process, for tests and single-process development. Holds
+    at most ``RATE_LIMIT_MAX_KEYS`` buckets, dropping the least recently hit,
+    so a flood of distinct client IPs at the captive portal cannot grow it
+    without bound.
+
+A SQLite error fails over to the in-process counters for that hit rather than
+failing the request: a broken limiter must not lock everyone out of sign-in.
+
+The scope is the bucket's first ``|``-separated part — the decorator's
+``scope`` or a prefix like ``provision-ip`` — and is what ``stats`` reports by.
 """
+import logging
+import os
+import sqlite3
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from functools import wraps
 from threading import Lock
 
-from flask import jsonify, request
+from flask import current_app, has_app_context, jsonify, request
+
+logger = logging.getLogger(__name__)
 
-_hits = defaultdict(list)
-_lock = Lock()
-_last_sweep = 0.0
-_SWEEP_INTERVAL = 300  # seconds
-_SWEEP_MAX_AGE = 3600  # drop buckets idle longer than this
+_SWEEP_INTERVAL = 300  # seconds between prunes of stale SQLite buckets
+_DEFAULT_MAX_KEYS = 100_000
+_DEFAULT_SQLITE_PATH = '/tmp/infora-rate-limit.sqlite3'
 
 
 def client_ip():
@@ -33,29 +57,180 @@ def client_ip():
     return request.remote_addr or 'unknown'
 
 
-def _sweep(now):
-    """Bound memory by dropping buckets with no recent hits."""
-    global _last_sweep
-    if now - _last_sweep < _SWEEP_INTERVAL:
-        return
-    _last_sweep = now
-    for key in list(_hits.keys()):
-        recent = [t for t in _hits[key] if now - t < _SWEEP_MAX_AGE]
-        if recent:
-            _hits[key] = recent
-        else:
-            _hits.pop(key, None)
-
-
-def is_rate_limited(bucket, limit, window):
-    """Record a hit for ``bucket`` and return True if it exceeds ``limit``/``window``."""
-    now = time.time()
-    with _lock:
-        _sweep(now)
-        hits = [t for t in _hits[bucket] if now - t < window]
-        hits.append(now)
-        _hits[bucket] = hits
-        return len(hits) > limit
+def _estimate(previous, current, now, window):
+    """Hits in the sliding window ending at ``now``, from the two fixed windows."""
+    overlap = 1.0 - (now % window) / window
+    return previous * overlap + current
+
+
+class MemoryBackend:
+    """Per-process counters, bounded to ``max_keys`` buckets (LRU)."""
+
+    def __init__(self, max_keys=_DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # bucket -> (window index, current, previous)
+        self._scopes = defaultdict(lambda: [0, 0])
+        self._lock = Lock()
+
+    def hit(self, bucket, scope, limit, window, now):
+        index = int(now // window)
+        with self._lock:
+            entry = self._buckets.get(bucket)
+            if entry is None or entry[0] < index - 1:
+                current, previous = 1, 0
+            elif entry[0] == index - 1:
+                current, previous = 1, entry[1]
+            else:
+                current, previous = entry[1] + 1, entry[2]
+            self._buckets[bucket] = (index, current, previous)
+            self._buckets.move_to_end(bucket)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            limited = _estimate(previous, current, now, window) > limit
+            counts = self._scopes[scope]
+            counts[0] += 1
+            counts[1] += limited
+        return limited
+
+    def stats(self):
+        with self._lock:
+            return {scope: {'hits': hits, 'denied': denied}
+                    for scope, (hits, denied) in self._scopes.items()}
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    bucket TEXT PRIMARY KEY,
+    window_index INTEGER NOT NULL,
+    current INTEGER NOT NULL,
+    previous INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limit_scopes (
+    scope TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL,
+    denied INTEGER NOT NULL
+);
+'''
+
+# SET expressions read the row as it was before the update, so the previous
+# window is rolled forward, reset after a gap, or kept, in one statement.
+_HIT = '''
+INSERT INTO rate_limit_buckets (bucket, window_index, current, previous, expires_at)
+VALUES (:bucket, :index, 1, 0, :expires_at)
+ON CONFLICT (bucket) DO UPDATE SET
+    previous = CASE
+        WHEN excluded.window_index = rate_limit_buckets.window_index THEN rate_limit_buckets.previous
+        WHEN excluded.window_index = rate_limit_buckets.window_index + 1 THEN rate_limit_buckets.current
+        ELSE 0 END,
+    current = CASE
+        WHEN excluded.window_index = rate_limit_buckets.window_index THEN rate_limit_buckets.current + 1
+        ELSE 1 END,
+    window_index = excluded.window_index,
+    expires_at = excluded.expires_at
+RETURNING current, previous
+'''
+
+_COUNT = '''
+INSERT INTO rate_limit_scopes (scope, hits, denied) VALUES (:scope, 1, :denied)
+ON CONFLICT (scope) DO UPDATE SET hits = hits + 1, denied = denied + excluded.denied
+'''
+
+
+class SqliteBackend:
+    """Counters in a SQLite file shared by every worker process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = 0.0
+
+    def _connection(self):
+        # One connection per thread, reopened in a forked child: SQLite
+        # connections must not cross either boundary.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, bucket, scope, limit, window, now):
+        conn = self._connection()
+        index = int(now // window)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current, previous = conn.execute(_HIT, {
+                'bucket': bucket, 'index': index, 'expires_at': (index + 2) * window,
+            }).fetchone()
+            limited = _estimate(previous, current, now, window) > limit
+            conn.execute(_COUNT, {'scope': scope, 'denied': int(limited)})
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if now - self._last_sweep >= _SWEEP_INTERVAL:
+            self._last_sweep = now
+            conn.execute('DELETE FROM rate_limit_buckets WHERE expires_at < ?', (now,))
+        return limited
+
+    def stats(self):
+        rows = self._connection().execute('SELECT scope, hits, denied FROM rate_limit_scopes')
+        return {scope: {'hits': hits, 'denied': denied} for scope, hits, denied in rows}
+
+
+_backends = {}
+_backends_lock = Lock()
+
+
+def _memory_backend(max_keys=_DEFAULT_MAX_KEYS):
+    with _backends_lock:
+        backend = _backends.get('memory')
+        if backend is None:
+            backend = _backends['memory'] = MemoryBackend(max_keys)
+        return backend
+
+
+def get_backend():
+    """The configured backend, created on first use."""
+    if not has_app_context():
+        return _memory_backend()
+    config = current_app.config
+    kind = (config.get('RATE_LIMIT_BACKEND') or 'memory').lower()
+    if kind != 'sqlite':
+        return _memory_backend(int(config.get('RATE_LIMIT_MAX_KEYS') or _DEFAULT_MAX_KEYS))
+    path = config.get('RATE_LIMIT_SQLITE_PATH') or _DEFAULT_SQLITE_PATH
+    with _backends_lock:
+        backend = _backends.get(('sqlite', path))
+        if backend is None:
+            backend = _backends[('sqlite', path)] = SqliteBackend(path)
+        return backend
+
+
+def is_rate_limited(bucket, limit, window, now=None):
+    """Record a hit for ``bucket`` and return True if it exceeds ``limit``/``window``.
+
+    Denied hits count too, so a client that keeps hammering stays limited
+    instead of getting through every time the estimate dips.
+    """
+    now = time.time() if now is None else now
+    scope = bucket.split('|', 1)[0]
+    backend = get_backend()
+    try:
+        return backend.hit(bucket, scope, limit, window, now)
+    except sqlite3.Error as exc:
+        logger.warning('Rate limit store unavailable, using in-process counters: %s', exc)
+        return _memory_backend().hit(bucket, scope, limit, window, now)
+
+
+def stats():
+    """Hits and denials per scope since the counters were created."""
+    return get_backend().stats()
 
 
 def rate_limit(limit, window, scope=None, extra_key=None):
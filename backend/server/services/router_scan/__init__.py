@@ -43,9 +43,16 @@ from .commit import (  # noqa: F401
 # function instead of the module.
 from .fingerprint import fingerprint as build_fingerprint  # noqa: F401
 from .inventory import build_inventory  # noqa: F401
-from .parser import export_to_sections, parse_export, parse_records  # noqa: F401
+from .parser import (  # noqa: F401
+    export_to_sections,
+    iter_export,
+    parse_export,
+    parse_record_stream,
+    parse_records,
+)
 from .profiles import parse_rate_limit  # noqa: F401
 from .scan import (  # noqa: F401
+    EmptyExport,
     finalise_agent_run,
     ingest_agent_chunk,
     issue_ingest_token,
@@ -11,6 +11,7 @@ Keeping this module pure is deliberate: it is the part most likely to be wrong
 against a RouterOS version we have never seen, and it is the part we can test
 exhaustively from captured fixtures without a router in the loop.
 """
+import codecs
 import re
 
 from .commands import RECORD_SEPARATOR
@@ -35,9 +36,31 @@ def parse_records(output):
     Unparseable lines are skipped rather than raising: a scan that loses one
     field is recoverable, one that raises loses the roster.
     """
+    return parse_record_stream([output or ''])
+
+
+def _iter_lines(pieces):
+    """Lines of text that arrives in arbitrary pieces (a line may span two)."""
+    tail = ''
+    for piece in pieces:
+        if not piece:
+            continue
+        lines = (tail + piece.replace('\r', '')).split('\n')
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def parse_record_stream(pieces):
+    """:func:`parse_records` over an iterable of text pieces.
+
+    The agent uploads a menu in chunks cut wherever its buffer filled; this
+    parses them in order without joining them into one string first.
+    """
     records = []
     current = None
-    for raw_line in (output or '').replace('\r', '').split('\n'):
+    for raw_line in _iter_lines(pieces):
         line = raw_line.strip()
         if not line:
             continue
@@ -83,6 +106,16 @@ _EXPORT_MENU_RE = re.compile(r'^/[a-z0-9]+(?:[ /][a-z0-9-]+)*\s*$')
 _EXPORT_VERB_RE = re.compile(r'^(add|set)\b\s*(.*)$', re.IGNORECASE)
 
 
+# One whitespace-delimited token: bare characters, backslash escapes and
+# quoted runs (an unterminated quote runs to the end of the line).
+_TOKEN_RE = re.compile(r'(?:[^\s"\\]+|\\.|"(?:[^"\\]|\\.)*"?)+')
+_UNQUOTE_RE = re.compile(r'\\(.)|"')
+
+
+def _unquote(match):
+    return match.group(1) or ''
+
+
 def _split_kv_tokens(text):
     """Split ``a=1 b="two words" c=x`` respecting quotes and escapes.
 
@@ -92,32 +125,45 @@ def _split_kv_tokens(text):
     the bug this avoids.
     """
     tokens = []
-    buf = []
-    in_quotes = False
-    escaped = False
-    for ch in text:
-        if escaped:
-            buf.append(ch)
-            escaped = False
-            continue
-        if ch == '\\':
-            escaped = True
-            continue
-        if ch == '"':
-            in_quotes = not in_quotes
-            continue
-        if ch.isspace() and not in_quotes:
-            if buf:
-                tokens.append(''.join(buf))
-                buf = []
-            continue
-        buf.append(ch)
-    if buf:
-        tokens.append(''.join(buf))
+    for token in _TOKEN_RE.findall(text):
+        if '"' in token or '\\' in token:
+            token = _UNQUOTE_RE.sub(_unquote, token)
+        if token:
+            tokens.append(token)
     return tokens
 
 
-def _join_continuations(text):
+# Bytes read per call when the export arrives as a file object.
+_READ_SIZE = 64 * 1024
+
+
+def iter_text(source):
+    """Text pieces from a string, a (text or binary) file object, or an iterable.
+
+    Binary input is decoded incrementally as UTF-8, BOM dropped and bad bytes
+    replaced, the way the upload endpoint always decoded it. Nothing is
+    opened here: a caller with a path opens it.
+    """
+    if source is None:
+        return
+    if isinstance(source, (str, bytes)):
+        pieces = [source]
+    elif hasattr(source, 'read'):
+        pieces = iter(lambda: source.read(_READ_SIZE), source.read(0))
+    else:
+        pieces = source
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    for piece in pieces:
+        if isinstance(piece, bytes):
+            piece = decoder.decode(piece)
+        if piece:
+            yield piece
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _iter_logical_lines(lines):
     """Fold RouterOS's trailing-backslash line continuations into single lines.
 
     The whitespace immediately before the backslash is significant and must be
@@ -133,23 +179,58 @@ def _join_continuations(text):
     glues ``interface=bridgenetwork=...`` together. So: keep what was there, and
     strip only the continuation line's indentation.
     """
-    lines = []
     pending = ''
-    for raw_line in (text or '').replace('\r', '').split('\n'):
+    for raw_line in lines:
         line = raw_line.lstrip() if pending else raw_line
         trimmed = line.rstrip()
         if trimmed.endswith('\\'):
             pending += trimmed[:-1]
             continue
-        lines.append((pending + line).strip())
+        yield (pending + line).strip()
         pending = ''
     if pending:
-        lines.append(pending.strip())
-    return lines
+        yield pending.strip()
+
+
+def _join_continuations(text):
+    """:func:`_iter_logical_lines` over one string, as a list."""
+    return list(_iter_logical_lines(_iter_lines([text or ''])))
+
+
+def _export_record(line):
+    """``(verb, record)`` for an ``add``/``set`` line, else None."""
+    verb_match = _EXPORT_VERB_RE.match(line)
+    if not verb_match:
+        return None
+    verb, remainder = verb_match.group(1).lower(), verb_match.group(2)
+    # `set [ find default=yes ] name=x` — drop the selector, keep the
+    # assignments. The selector is how the object is located on replay; for
+    # our purposes the assignments are the record.
+    selector = None
+    if remainder.startswith('['):
+        close = remainder.find(']')
+        if close != -1:
+            selector = remainder[1:close].strip()
+            remainder = remainder[close + 1:].strip()
+    record = {}
+    for token in _split_kv_tokens(remainder):
+        key, sep, value = token.partition('=')
+        if sep and key.strip():
+            record[key.strip()] = _clean(value)
+    if not record:
+        return None
+    record['_verb'] = verb
+    if selector:
+        record['_selector'] = selector
+    return record
+
 
+def iter_export(source):
+    """Yield ``(menu_path, record)`` from a ``/export``, one line at a time.
 
-def parse_export(text):
-    """Parse a ``/export`` file into ``{menu_path: [record, ...]}``.
+    ``source`` is anything :func:`iter_text` takes. Single pass and
+    generator-based: a multi-megabyte core-router export is never held as
+    one string, or as a list of its lines, while it is parsed.
 
     Menu paths are normalised to the space-separated form used by
     :data:`.commands.READ_MENUS` (``/ip hotspot user profile``), so an export and
@@ -159,9 +240,8 @@ def parse_export(text):
     exports built-in objects (the stock ``default`` PPP profile, ``/ppp aaa``)
     as ``set`` rather than ``add``, and those carry real configuration.
     """
-    menus = {}
     current_menu = None
-    for line in _join_continuations(text):
+    for line in _iter_logical_lines(_iter_lines(iter_text(source))):
         if not line or line.startswith('#'):
             continue
         if line.startswith('/'):
@@ -174,30 +254,16 @@ def parse_export(text):
             continue
         if current_menu is None:
             continue
-        verb_match = _EXPORT_VERB_RE.match(line)
-        if not verb_match:
-            continue
-        verb, remainder = verb_match.group(1).lower(), verb_match.group(2)
-        # `set [ find default=yes ] name=x` — drop the selector, keep the
-        # assignments. The selector is how the object is located on replay; for
-        # our purposes the assignments are the record.
-        selector = None
-        if remainder.startswith('['):
-            close = remainder.find(']')
-            if close != -1:
-                selector = remainder[1:close].strip()
-                remainder = remainder[close + 1:].strip()
-        record = {}
-        for token in _split_kv_tokens(remainder):
-            key, sep, value = token.partition('=')
-            if sep and key.strip():
-                record[key.strip()] = _clean(value)
-        if not record:
-            continue
-        record['_verb'] = verb
-        if selector:
-            record['_selector'] = selector
-        menus.setdefault(current_menu, []).append(record)
+        record = _export_record(line)
+        if record is not None:
+            yield current_menu, record
+
+
+def parse_export(source):
+    """Parse a ``/export`` into ``{menu_path: [record, ...]}`` (see :func:`iter_export`)."""
+    menus = {}
+    for menu, record in iter_export(source):
+        menus.setdefault(menu, []).append(record)
     return menus
 
 
@@ -226,12 +292,15 @@ EXPORT_MENU_TO_KEY = {
 }
 
 
-def export_to_sections(text):
-    """Parse an export and re-key it onto the scan's section names."""
-    menus = parse_export(text)
+def export_to_sections(source):
+    """Parse an export and re-key it onto the scan's section names.
+
+    Streams like :func:`iter_export`; records of menus no section reads are
+    dropped as they are parsed rather than collected first.
+    """
     sections = {}
-    for menu, records in menus.items():
+    for menu, record in iter_export(source):
         key = EXPORT_MENU_TO_KEY.get(menu)
         if key:
-            sections.setdefault(key, []).extend(records)
+            sections.setdefault(key, []).append(record)
     return sections
@@ -15,14 +15,17 @@ import json
 import secrets
 import threading
 from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import insert, select, update
 
 from extensions import db
-from models import ImportCandidate, ImportRun
+from models import ImportCandidate, ImportRun, ImportRunChunk
 
 from .commands import build_scan_commands
 from .fingerprint import fingerprint
 from .inventory import build_inventory
-from .parser import export_to_sections, parse_records
+from .parser import export_to_sections, iter_text, parse_record_stream, parse_records
 
 # Live SSH needs a far longer budget than a stats poll: ~20 read commands, one
 # of which streams several hundred subscribers.
@@ -30,6 +33,15 @@ SCAN_SSH_TIMEOUT = 60
 SCAN_LOCK_WAIT = 45
 
 AGENT_TOKEN_TTL_MINUTES = 60
+# Chunks fetched per round trip while streaming a run back into the parser.
+CHUNK_FETCH_SIZE = 50
+# An uploaded export is kept as chunks of the run under this key, so it can be
+# re-parsed later without ever being loaded whole.
+EXPORT_CHUNK_KEY = '__export__'
+
+
+class EmptyExport(ValueError):
+    """The uploaded export had no content."""
 
 
 def _json_dump(value):
@@ -121,31 +133,81 @@ def resolve_ingest_run(token):
     return run
 
 
+def _upsert_chunk(values):
+    """Insert a chunk row, or overwrite the body of an existing ``(run, key, seq)``."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(ImportRunChunk).values(**values)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['run_id', 'key', 'seq'],
+            set_={'body': stmt.excluded.body},
+        ))
+        return
+    updated = db.session.execute(
+        update(ImportRunChunk)
+        .where(ImportRunChunk.run_id == values['run_id'],
+               ImportRunChunk.key == values['key'],
+               ImportRunChunk.seq == values['seq'])
+        .values(body=values['body'])
+    )
+    if not updated.rowcount:
+        db.session.execute(insert(ImportRunChunk).values(**values))
+
+
 def ingest_agent_chunk(run, key, seq, body):
-    """Accept one uploaded chunk from the agent script and append it.
+    """Accept one uploaded chunk from the agent script and store it.
 
-    Chunks arrive per menu and, for large menus, per 40 records. They are stored
-    verbatim in the run's raw blob keyed by ``(key, seq)`` so a retried or
-    out-of-order upload overwrites rather than duplicates.
+    Chunks arrive per menu and, for large menus, per 40 records. Each is one
+    ``ImportRunChunk`` row keyed by ``(key, seq)``, so a retried or
+    out-of-order upload overwrites rather than duplicates, and an upload costs
+    the same however many came before it.
     """
-    blob = _json_load(run.raw_blob, {}) or {}
-    chunks = blob.setdefault('_chunks', {})
-    chunks[f'{key}:{int(seq)}'] = body or ''
-    run.raw_blob = _json_dump(blob)
-    return len(chunks)
+    _upsert_chunk({'run_id': run.id, 'key': key, 'seq': int(seq), 'body': body or ''})
 
 
-def assemble_agent_chunks(run):
-    """Concatenate the agent's chunks back into ``{key: raw_output}``."""
+def _legacy_chunks(run):
+    """``(key, seq, text)`` from a run ingested before chunks had their own table."""
     blob = _json_load(run.raw_blob, {}) or {}
-    chunks = blob.get('_chunks') or {}
-    ordered = {}
-    for composite, text in chunks.items():
+    parts = []
+    for composite, text in (blob.get('_chunks') or {}).items():
         key, _, seq = composite.rpartition(':')
-        if key == '__done__':
+        parts.append((key, int(seq or 0), text))
+    return sorted(parts, key=lambda part: (part[0], part[1]))
+
+
+def _ordered_chunks(run, key=None):
+    """Stored chunks of ``run`` as ``(key, text)``, in ``(key, seq)`` order.
+
+    Rows are fetched ``CHUNK_FETCH_SIZE`` at a time, so a run is never held in
+    memory as one blob. ``key`` limits it to one menu.
+    """
+    legacy = _legacy_chunks(run)
+    if legacy:
+        yield from ((k, text) for k, _seq, text in legacy if key is None or k == key)
+        return
+    query = select(ImportRunChunk.key, ImportRunChunk.body).where(ImportRunChunk.run_id == run.id)
+    if key is not None:
+        query = query.where(ImportRunChunk.key == key)
+    result = db.session.execute(
+        query.order_by(ImportRunChunk.key, ImportRunChunk.seq)
+        .execution_options(yield_per=CHUNK_FETCH_SIZE)
+    )
+    for chunk_key, body in result:
+        yield chunk_key, body
+
+
+def assemble_agent_chunks(run):
+    """Stream the agent's chunks, in order, through the parser: ``{key: records}``."""
+    sections = {}
+    for key, parts in groupby(_ordered_chunks(run), key=lambda part: part[0]):
+        if key in ('__done__', EXPORT_CHUNK_KEY):
             continue
-        ordered.setdefault(key, []).append((int(seq or 0), text))
-    return {key: ''.join(t for _s, t in sorted(parts)) for key, parts in ordered.items()}
+        sections[key] = parse_record_stream(text for _key, text in parts)
+    return sections
 
 
 # --- Normalisation into candidates ---------------------------------------
@@ -326,16 +388,36 @@ def start_device_scan(app, isp, user, device, mine_comments=True):
     return run
 
 
-def scan_from_export(isp, user, text, device=None, mine_comments=True):
+def _store_export(run, source, seen):
+    """Pass the export's text through, storing each piece as a chunk of ``run``.
+
+    Core statements, not ORM objects, so stored pieces don't pile up in the
+    session's identity map until commit.
+    """
+    for seq, piece in enumerate(iter_text(source)):
+        seen[0] = seen[0] or bool(piece.strip())
+        db.session.execute(insert(ImportRunChunk).values(
+            run_id=run.id, key=EXPORT_CHUNK_KEY, seq=seq, body=piece,
+        ))
+        yield piece
+
+
+def scan_from_export(isp, user, source, device=None, mine_comments=True):
     """Uploaded ``/export`` → persisted, reviewable run.
 
     The commonest real case: the router is behind CGNAT and the operator will not
     (or cannot) open access to it, so they paste a config export instead.
+
+    ``source`` is the export text or the uploaded file object; it is parsed
+    and stored in one streaming pass, never read into memory whole. Raises
+    :class:`EmptyExport` when there is nothing in it.
     """
-    sections = export_to_sections(text)
-    inventory = build_inventory(sections, mine_comments=mine_comments)
     run = create_run(isp, user, 'router-export', device=device)
-    run.raw_blob = _json_dump({'export': text})
+    seen = [False]
+    sections = export_to_sections(_store_export(run, source, seen))
+    if not seen[0]:
+        raise EmptyExport('No export content supplied')
+    inventory = build_inventory(sections, mine_comments=mine_comments)
     persist_inventory(run, sections, inventory)
     run.status = 'scanned'
     run.finished_at = datetime.utcnow()
@@ -345,8 +427,7 @@ def scan_from_export(isp, user, text, device=None, mine_comments=True):
 
 def finalise_agent_run(run, mine_comments=True):
     """Parse an agent-uploaded run once the script signals completion."""
-    sections_raw = assemble_agent_chunks(run)
-    sections = parse_raw_sections(sections_raw)
+    sections = assemble_agent_chunks(run)
     inventory = build_inventory(sections, mine_comments=mine_comments)
     persist_inventory(run, sections, inventory,
                       scan_username=run.device.username if run.device else None)
@@ -366,6 +447,10 @@ def rebuild_inventory(run, mine_comments=True):
     blob = _json_load(run.raw_blob, {}) or {}
     if blob.get('export'):
         sections = export_to_sections(blob['export'])
+    elif run.source == 'router-export':
+        sections = export_to_sections(text for _key, text in _ordered_chunks(run, EXPORT_CHUNK_KEY))
+    elif blob.get('sections'):
+        sections = parse_raw_sections(blob['sections'])
     else:
-        sections = parse_raw_sections(blob.get('sections') or assemble_agent_chunks(run))
+        sections = assemble_agent_chunks(run)
     return sections, build_inventory(sections, mine_comments=mine_comments)
@@ -17,6 +17,14 @@ Two things make a naive ``acctstoptime IS NULL`` query wrong:
   (and any written while a subscriber did not yet exist) have NULL there, and
   every ISP-scoped query in the app filters on ``isp_id`` — so those sessions are
   invisible. :func:`link_unattributed_sessions` repairs them by username.
+
+Both reads are served by partial indexes (``ix_radacct_open_isp_nas`` over
+open sessions, ``ix_radacct_unattributed`` over unlinked rows), so their cost
+follows the number of live sessions, not the years of closed ones. FreeRADIUS
+writes radacct directly, so nothing here has to maintain them: a row drops
+out of the open index when Accounting-Stop sets ``acctstoptime``. Keep
+``acctstoptime IS NULL`` literally in any new online query, or the planner
+cannot use the index.
 """
 import os
 from datetime import datetime, timedelta
@@ -113,6 +121,7 @@ def link_unattributed_sessions(limit=500):
     }
 
     linked = 0
+    relinked_logins = set()
     for row in pending:
         customer = by_login.get((row.username or '').strip().lower())
         if not customer:
@@ -120,9 +129,15 @@ def link_unattributed_sessions(limit=500):
         row.customer_id = customer.id
         if row.isp_id is None:
             row.isp_id = customer.isp_id
+        relinked_logins.add(row.username)
         linked += 1
 
     if linked:
+        # Linking does not touch the accounting timestamps, so the usage rollup
+        # would never notice; re-file those logins' buckets under the customer.
+        from services.usage_rollup import refresh_usernames
+        db.session.flush()
+        refresh_usernames(relinked_logins)
         db.session.commit()
     return linked
 
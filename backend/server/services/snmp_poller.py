@@ -0,0 +1,352 @@
+"""Scheduled SNMP polling of every active ``SnmpDevice``.
+
+Until now SNMP was on-demand only: one OID per HTTP request, each on a freshly
+built ``SnmpEngine`` (the MIB loading and engine bootstrap cost more than the
+request itself). The poller here:
+
+* keeps one engine per thread (:func:`shared_engine`) and reuses it for every
+  request that thread makes — the blueprint's GET and test routes included.
+  Sweeps run on one long-lived pool, so its threads, and their engines,
+  carry over from one sweep to the next;
+* asks for all of a device's scalars in a single GET PDU, and walks interface
+  tables with GETBULK (GETNEXT on SNMPv1), ``MAX_REPETITIONS`` rows per PDU;
+* polls due devices concurrently on a bounded pool — each device has its own
+  ``poll_interval`` and ``next_poll_at`` — and writes every sample of a sweep
+  with one executemany INSERT into ``snmp_poll_results``;
+* feeds latency and per-interface bits/s (from the octet counters' change
+  since the previous poll) into the device's metric series
+  (services.metric_series), which is what graphs read.
+
+Workers never touch the database: they get a plain snapshot of the device and
+hand back rows, which the calling thread writes.
+
+Run it from cron (``flask poll-snmp``) or in-process with SNMP_POLL_TICK set.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import insert, or_
+
+from extensions import db
+from models import SnmpDevice, SnmpPollResult
+from services.metric_series import SOURCE_SNMP, record_points
+
+try:
+    from pysnmp.hlapi import (
+        CommunityData, ContextData, ObjectIdentity, ObjectType, SnmpEngine, UdpTransportTarget,
+        UsmUserData, bulkCmd, getCmd, nextCmd,
+        usm3DESEDEPrivProtocol, usmAesCfb128Protocol, usmAesCfb192Protocol,
+        usmAesCfb256Protocol, usmDESPrivProtocol, usmHMAC128SHA224AuthProtocol,
+        usmHMAC192SHA256AuthProtocol, usmHMAC256SHA384AuthProtocol,
+        usmHMAC384SHA512AuthProtocol, usmHMACMD5AuthProtocol, usmHMACSHAAuthProtocol,
+    )
+    PYSNMP_AVAILABLE = True
+except ImportError:
+    PYSNMP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Scalars read in one GET PDU per poll.
+SYSTEM_OIDS = {
+    'sysDescr': '1.3.6.1.2.1.1.1.0',
+    'sysUpTime': '1.3.6.1.2.1.1.3.0',
+    'sysName': '1.3.6.1.2.1.1.5.0',
+}
+
+# ifTable columns walked together, one GETBULK per MAX_REPETITIONS rows.
+IF_TABLE_COLUMNS = {
+    'ifDescr': '1.3.6.1.2.1.2.2.1.2',
+    'ifOperStatus': '1.3.6.1.2.1.2.2.1.8',
+    'ifInOctets': '1.3.6.1.2.1.2.2.1.10',
+    'ifInErrors': '1.3.6.1.2.1.2.2.1.14',
+    'ifOutOctets': '1.3.6.1.2.1.2.2.1.16',
+    'ifOutErrors': '1.3.6.1.2.1.2.2.1.20',
+}
+
+# Octet counters turned into bits/s for the metric series (services/metric_series).
+_RATE_COLUMNS = {
+    IF_TABLE_COLUMNS['ifInOctets']: 'in_bps',
+    IF_TABLE_COLUMNS['ifOutOctets']: 'out_bps',
+}
+_COUNTER32 = 2 ** 32
+
+MAX_REPETITIONS = 25
+DEFAULT_POLL_INTERVAL = 300
+
+_DEFAULT_WORKERS = 32
+
+_AUTH_PROTOCOLS = {}
+_PRIV_PROTOCOLS = {}
+if PYSNMP_AVAILABLE:
+    _AUTH_PROTOCOLS = {
+        'MD5': usmHMACMD5AuthProtocol,
+        'SHA': usmHMACSHAAuthProtocol,
+        'SHA224': usmHMAC128SHA224AuthProtocol,
+        'SHA256': usmHMAC192SHA256AuthProtocol,
+        'SHA384': usmHMAC256SHA384AuthProtocol,
+        'SHA512': usmHMAC384SHA512AuthProtocol,
+    }
+    _PRIV_PROTOCOLS = {
+        'DES': usmDESPrivProtocol,
+        '3DES': usm3DESEDEPrivProtocol,
+        'AES': usmAesCfb128Protocol,
+        'AES192': usmAesCfb192Protocol,
+        'AES256': usmAesCfb256Protocol,
+    }
+
+_local = threading.local()
+
+# The sweep pool, kept across sweeps; see _executor().
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+class SnmpPollError(Exception):
+    """A request failed as a whole (timeout, auth, or an error-status PDU)."""
+
+    def __init__(self, message, status='error'):
+        super().__init__(message)
+        self.status = status
+
+
+def shared_engine():
+    """This thread's SnmpEngine, built once. Engines are not thread-safe."""
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        engine = _local.engine = SnmpEngine()
+    return engine
+
+
+def auth_data(device):
+    """Community (v1/v2c) or USM (v3) credentials for ``device``."""
+    if device.snmp_version == '1':
+        return CommunityData(device.community or 'public', mpModel=0)
+    if device.snmp_version == '2c':
+        return CommunityData(device.community or 'public')
+    if device.auth_protocol and device.priv_protocol:
+        return UsmUserData(
+            device.username,
+            authKey=device.auth_key,
+            privKey=device.priv_key,
+            authProtocol=_AUTH_PROTOCOLS.get(device.auth_protocol, usmHMACMD5AuthProtocol),
+            privProtocol=_PRIV_PROTOCOLS.get(device.priv_protocol, usmDESPrivProtocol),
+        )
+    if device.auth_protocol:
+        return UsmUserData(
+            device.username,
+            authKey=device.auth_key,
+            authProtocol=_AUTH_PROTOCOLS.get(device.auth_protocol, usmHMACMD5AuthProtocol),
+        )
+    return UsmUserData(device.username)
+
+
+def transport_target(device):
+    return UdpTransportTarget((device.host, device.port or 161),
+                              timeout=device.timeout or 3, retries=device.retries or 0)
+
+
+def context_data(device):
+    return ContextData(contextName=device.context_name) if device.context_name else ContextData()
+
+
+def _check(error_indication, error_status, error_index, var_binds):
+    if error_indication:
+        text = str(error_indication)
+        raise SnmpPollError(text, 'timeout' if 'timeout' in text.lower() else 'error')
+    if error_status:
+        where = var_binds[int(error_index) - 1][0] if error_index else '?'
+        raise SnmpPollError(f'{error_status.prettyPrint()} at {where}')
+
+
+def _sample(oid, value):
+    return {'oid': str(oid), 'value': value.prettyPrint(), 'data_type': type(value).__name__}
+
+
+def get_many(device, oids):
+    """GET every OID in ``oids`` in one PDU; returns one sample dict per OID."""
+    result = next(getCmd(
+        shared_engine(), auth_data(device), transport_target(device), context_data(device),
+        *[ObjectType(ObjectIdentity(oid)) for oid in oids],
+    ))
+    _check(*result)
+    return [_sample(oid, value) for oid, value in result[3]]
+
+
+def walk_table(device, columns, max_repetitions=MAX_REPETITIONS):
+    """Every instance of the table ``columns``, walked side by side.
+
+    GETBULK fetches ``max_repetitions`` rows of all columns per PDU; SNMPv1
+    has no GETBULK and falls back to one GETNEXT per row.
+    """
+    objects = [ObjectType(ObjectIdentity(oid)) for oid in columns]
+    common = (shared_engine(), auth_data(device), transport_target(device), context_data(device))
+    if device.snmp_version == '1':
+        responses = nextCmd(*common, *objects, lexicographicMode=False)
+    else:
+        responses = bulkCmd(*common, 0, max_repetitions, *objects, lexicographicMode=False)
+    samples = []
+    for result in responses:
+        _check(*result)
+        samples.extend(_sample(oid, value) for oid, value in result[3])
+    return samples
+
+
+def _snapshot(device):
+    """The columns a worker needs, detached from the session."""
+    return SimpleNamespace(**{
+        column: getattr(device, column)
+        for column in ('id', 'host', 'port', 'snmp_version', 'community', 'username',
+                       'auth_protocol', 'auth_key', 'priv_protocol', 'priv_key',
+                       'context_name', 'timeout', 'retries')
+    })
+
+
+def poll_device(device):
+    """Poll one device snapshot; returns ``(samples, response_time, error)``.
+
+    ``error`` is None or a SnmpPollError; the scalars that answered are kept
+    even when the table walk fails.
+    """
+    started = time.monotonic()
+    samples = []
+    try:
+        samples.extend(get_many(device, SYSTEM_OIDS.values()))
+        samples.extend(walk_table(device, IF_TABLE_COLUMNS.values()))
+        error = None
+    except SnmpPollError as exc:
+        error = exc
+    except Exception as exc:  # noqa: BLE001 — one device must not stop the sweep
+        error = SnmpPollError(str(exc))
+    return samples, time.monotonic() - started, error
+
+
+def due_devices(now=None):
+    now = now or datetime.utcnow()
+    return SnmpDevice.query.filter(
+        SnmpDevice.is_active.is_(True),
+        or_(SnmpDevice.next_poll_at.is_(None), SnmpDevice.next_poll_at <= now),
+    ).order_by(SnmpDevice.next_poll_at.is_(None).desc(), SnmpDevice.next_poll_at).all()
+
+
+def _previous_counters(devices):
+    """``{device_id: {oid: value}}`` for the octet counters of each last poll."""
+    last = {device.id: device.last_poll for device in devices if device.last_poll}
+    if not last:
+        return {}
+    rows = db.session.query(
+        SnmpPollResult.snmp_device_id, SnmpPollResult.poll_time,
+        SnmpPollResult.oid, SnmpPollResult.value,
+    ).filter(
+        SnmpPollResult.snmp_device_id.in_(list(last)),
+        SnmpPollResult.poll_time.in_(set(last.values())),
+        SnmpPollResult.status == 'success',
+        or_(*[SnmpPollResult.oid.like(f'{column}.%') for column in _RATE_COLUMNS]),
+    )
+    previous = defaultdict(dict)
+    for device_id, poll_time, oid, value in rows:
+        if poll_time == last[device_id]:
+            previous[device_id][oid] = value
+    return previous
+
+
+def _series_points(samples, response_time, previous, elapsed):
+    """Metric points for one successful poll: latency and per-interface bits/s."""
+    points = {'response_ms': round(response_time * 1000, 1)}
+    if not previous or not elapsed or elapsed <= 0:
+        return points
+    for sample in samples:
+        column, _, index = sample['oid'].rpartition('.')
+        name = _RATE_COLUMNS.get(column)
+        if name is None or sample['oid'] not in previous:
+            continue
+        try:
+            before, after = int(previous[sample['oid']]), int(sample['value'])
+        except (TypeError, ValueError):
+            continue
+        delta = after - before
+        if delta < 0:
+            # A Counter32 near the top wrapped; anything else is a reboot
+            # resetting the counter, which says nothing about the rate.
+            if before < _COUNTER32 // 2:
+                continue
+            delta += _COUNTER32
+        points[f'if.{index}.{name}'] = round(delta * 8 / elapsed, 1)
+    return points
+
+
+def _workers():
+    try:
+        return max(1, int(current_app.config.get('SNMP_POLL_WORKERS', _DEFAULT_WORKERS)
+                          or _DEFAULT_WORKERS))
+    except (RuntimeError, TypeError, ValueError):
+        return _DEFAULT_WORKERS
+
+
+def _executor(size):
+    """The long-lived sweep pool, rebuilt only when ``size`` (or the process) changes.
+
+    A pool per sweep would take its threads' engines down with it, and every
+    sweep would bootstrap ``size`` new ones.
+    """
+    global _pool, _pool_key
+    key = (size, os.getpid())
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            previous = _pool if _pool_key and _pool_key[1] == os.getpid() else None
+            _pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='snmp-poll')
+            _pool_key = key
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return _pool
+
+
+def poll_due_devices(now=None, workers=None, devices=None):
+    """Poll every due device concurrently and store the samples.
+
+    Returns ``{'polled', 'failed', 'samples'}``. ``devices`` overrides the due
+    list (e.g. one device polled on demand).
+    """
+    if not PYSNMP_AVAILABLE:
+        raise RuntimeError('PySNMP module not available. Please install pysnmp package.')
+    now = now or datetime.utcnow()
+    devices = due_devices(now) if devices is None else devices
+    if not devices:
+        return {'polled': 0, 'failed': 0, 'samples': 0}
+    snapshots = [_snapshot(device) for device in devices]
+
+    outcomes = list(_executor(workers or _workers()).map(poll_device, snapshots))
+
+    previous = _previous_counters(devices)
+    rows = []
+    failed = 0
+    for device, (samples, response_time, error) in zip(devices, outcomes):
+        if error is None:
+            elapsed = (now - device.last_poll).total_seconds() if device.last_poll else None
+            record_points(SOURCE_SNMP, device.id, _series_points(
+                samples, response_time, previous.get(device.id), elapsed), at=now)
+        for sample in samples:
+            rows.append({'snmp_device_id': device.id, 'poll_time': now,
+                         'response_time': response_time, 'status': 'success',
+                         'error_message': None, **sample})
+        interval = device.poll_interval or DEFAULT_POLL_INTERVAL
+        device.next_poll_at = now + timedelta(seconds=interval)
+        if error is None:
+            device.last_poll = now
+        else:
+            failed += 1
+            rows.append({'snmp_device_id': device.id, 'poll_time': now,
+                         'oid': SYSTEM_OIDS['sysUpTime'], 'value': None, 'data_type': None,
+                         'response_time': response_time, 'status': error.status,
+                         'error_message': str(error)})
+    if rows:
+        db.session.execute(insert(SnmpPollResult), rows)
+    db.session.commit()
+    return {'polled': len(devices), 'failed': failed, 'samples': len(rows)}
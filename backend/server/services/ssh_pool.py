@@ -0,0 +1,275 @@
+"""Warm, reusable SSH sessions to MikroTik routers.
+
+A RouterOS SSH login over the management tunnel costs one to three seconds of
+key exchange and banner negotiation, and ``mikrotik_ssh`` used to pay it for
+every operation — the onboarding status poll, a load-balancing pre-check
+followed by its apply, the kick after an expiry sweep. The pool keeps an
+authenticated session per router open between operations:
+
+* Sessions are keyed by host, port and credentials, so a changed password or
+  SSH port never reuses a login made with the old ones.
+* A session is handed to one caller at a time. ``mikrotik_ssh`` still checks
+  it out under the per-device file lock, so several gunicorn workers (each
+  with its own pool) stay serialized on a router exactly as before; a worker
+  only ever holds one idle session per router on top.
+* Idle sessions close after ``MIKROTIK_SSH_POOL_IDLE_SECONDS`` and every
+  session after ``MIKROTIK_SSH_POOL_MAX_LIFETIME_SECONDS``, so a router that
+  rebooted or had its tunnel re-keyed is reconnected rather than reused. One
+  that sat idle for a while gets a cheap ``:put`` round-trip before reuse.
+* A session whose caller raised is closed rather than returned: the channel
+  may be half-read, and a fresh login is cheaper than debugging that.
+
+Setting the idle timeout to 0 turns pooling off.
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+from mikrotik_client import ConnectionType, MikroTikClient, MikroTikSSHError
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_IDLE_SECONDS = 60
+_DEFAULT_MAX_LIFETIME_SECONDS = 600
+
+# Reused after this long idle only once it has answered a trivial command —
+# a transport can look active long after the router behind it went away.
+_PROBE_AFTER_SECONDS = 10
+
+# Keeps NAT and WireGuard state warm while a session sits in the pool.
+_KEEPALIVE_SECONDS = 20
+
+
+def _setting(name, default):
+    try:
+        return max(0, int(current_app.config.get(name, default)))
+    except (RuntimeError, TypeError, ValueError):
+        return default
+
+
+def _limits():
+    return (
+        _setting('MIKROTIK_SSH_POOL_IDLE_SECONDS', _DEFAULT_IDLE_SECONDS),
+        _setting('MIKROTIK_SSH_POOL_MAX_LIFETIME_SECONDS', _DEFAULT_MAX_LIFETIME_SECONDS),
+    )
+
+
+def session_key(config):
+    """Pool key for a connection config; None when it cannot be pooled.
+
+    The timeout is left out on purpose: callers ask for anything from 6 to 30
+    seconds for the same router, and keying on it would keep a login per
+    value. A reused client takes on the caller's config instead (see
+    ``SSHSessionPool.acquire``).
+    """
+    if config.connection_type != ConnectionType.SSH:
+        return None
+    return (config.host, config.port, config.username, config.password)
+
+
+def _transport_active(client):
+    ssh = getattr(client, 'ssh_client', None)
+    transport = ssh.get_transport() if ssh is not None else None
+    return bool(transport and transport.is_active() and transport.is_authenticated())
+
+
+def _healthy(client, idle_for):
+    if not _transport_active(client):
+        return False
+    if idle_for < _PROBE_AFTER_SECONDS:
+        return True
+    try:
+        out, _err = client.run_cli(':put ok')
+        return 'ok' in (out or '')
+    except Exception:  # noqa: BLE001 — any failure means reconnect
+        return False
+
+
+def _close(client):
+    try:
+        client.disconnect()
+    except Exception:  # noqa: BLE001
+        pass
+
+
+class SSHSessionPool:
+    """Per-process pool of connected SSH ``MikroTikClient`` objects.
+
+    Idle entries are ``key -> (client, created, last_used)`` on the monotonic
+    clock; a checked-out client carries its creation time as ``pool_created``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+
+    def _fork_check(self):
+        # A forked worker inherits the parent's sockets; closing them here
+        # would tear down the parent's sessions, so just forget them.
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._pid = os.getpid()
+
+    def acquire(self, config, idle_timeout, max_lifetime):
+        """A healthy pooled client for ``config``, or None."""
+        key = session_key(config)
+        if key is None or not idle_timeout:
+            return None
+        with self._lock:
+            self._fork_check()
+            entry = self._idle.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        client, created, last_used = entry
+        now = time.monotonic()
+        if (now - last_used > idle_timeout or now - created > max_lifetime
+                or not _healthy(client, now - last_used)):
+            logger.debug('Dropping stale pooled SSH session to %s', config.host)
+            _close(client)
+            self.misses += 1
+            return None
+        # Same router and credentials; the timeout and the rest are the caller's.
+        client.config = config
+        self.hits += 1
+        return client
+
+    def release(self, client, idle_timeout, max_lifetime):
+        """Return a client after a clean use; closes it when it cannot be kept."""
+        key = session_key(client.config)
+        now = time.monotonic()
+        created = getattr(client, 'pool_created', now)
+        if (key is None or not idle_timeout or now - created > max_lifetime
+                or not _transport_active(client)):
+            _close(client)
+            return
+        with self._lock:
+            self._fork_check()
+            # One idle session per router is enough: access is serialized.
+            previous = self._idle.pop(key, None)
+            self._idle[key] = (client, created, now)
+        if previous is not None:
+            _close(previous[0])
+
+    def prune(self, idle_timeout, max_lifetime):
+        """Close sessions past their idle timeout or lifetime; returns how many."""
+        now = time.monotonic()
+        with self._lock:
+            self._fork_check()
+            stale = [
+                key for key, (_client, created, last_used) in self._idle.items()
+                if now - last_used > idle_timeout or now - created > max_lifetime
+            ]
+            clients = [self._idle.pop(key)[0] for key in stale]
+        for client in clients:
+            _close(client)
+        return len(clients)
+
+    def evict_host(self, host):
+        """Drop idle sessions to ``host`` (after a reboot or credential change)."""
+        with self._lock:
+            self._fork_check()
+            keys = [key for key in self._idle if key[0] == host]
+            clients = [self._idle.pop(key)[0] for key in keys]
+        for client in clients:
+            _close(client)
+        return len(clients)
+
+    def clear(self):
+        with self._lock:
+            clients = [entry[0] for entry in self._idle.values()]
+            self._idle.clear()
+        for client in clients:
+            _close(client)
+
+    def __len__(self):
+        return len(self._idle)
+
+
+_pool = SSHSessionPool()
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def get_pool():
+    return _pool
+
+
+def _ensure_reaper(idle_timeout, max_lifetime):
+    """Close idle sessions even when no further operation comes along.
+
+    The reaper runs for the life of the process. One that stopped once the
+    pool was empty could be seen alive by a release just before it stopped,
+    leaving that release's session with nobody to close it.
+    """
+    global _reaper
+    with _reaper_lock:
+        if _reaper is not None and _reaper.is_alive():
+            return
+
+        def _reap():
+            while True:
+                time.sleep(max(5, idle_timeout // 2))
+                try:
+                    _pool.prune(idle_timeout, max_lifetime)
+                except Exception:  # noqa: BLE001 — the reaper must outlive a bad close
+                    logger.exception('Pruning pooled SSH sessions failed')
+
+        _reaper = threading.Thread(target=_reap, daemon=True, name='mikrotik-ssh-reaper')
+        _reaper.start()
+
+
+def connect_client(config):
+    """A connected client for ``config``: a warm pooled session, else a new login."""
+    idle_timeout, max_lifetime = _limits()
+    client = _pool.acquire(config, idle_timeout, max_lifetime)
+    if client is not None:
+        return client
+    client = MikroTikClient(config)
+    try:
+        if not client.connect():
+            raise MikroTikSSHError('connect() returned False')
+    except Exception:
+        client.disconnect()
+        raise
+    client.pool_created = time.monotonic()
+    transport = client.ssh_client.get_transport() if client.ssh_client else None
+    if transport is not None:
+        transport.set_keepalive(_KEEPALIVE_SECONDS)
+    return client
+
+
+def release_client(client, ok=True):
+    """Hand a client from ``connect_client`` back; ``ok=False`` closes it."""
+    if not ok:
+        _close(client)
+        return
+    idle_timeout, max_lifetime = _limits()
+    _pool.release(client, idle_timeout, max_lifetime)
+    if idle_timeout:
+        _ensure_reaper(idle_timeout, max_lifetime)
+
+
+@contextlib.contextmanager
+def pooled_client(config):
+    """``with pooled_client(config) as client:`` — a connected, pooled client.
+
+    Drop-in for ``with MikroTikClient(config) as client: client.connect()``.
+    The session goes back to the pool on a clean exit and is closed when the
+    block raises. Callers that need cross-worker serialization on the router
+    hold the per-device lock around the block, as ``mikrotik_ssh`` does.
+    """
+    client = connect_client(config)
+    try:
+        yield client
+    except BaseException:
+        release_client(client, ok=False)
+        raise
+    release_client(client)
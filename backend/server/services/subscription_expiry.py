@@ -4,18 +4,27 @@ Enforce subscription expiry by suspending customers and removing RADIUS access.
 Run via cron: flask enforce-expiry
 Or set SUBSCRIPTION_ENFORCEMENT_INTERVAL (seconds) in env for in-process polling.
 """
+import logging
 from datetime import datetime
 
 from extensions import db
 from models import Customer, CustomerStatus, ISP
+from services.hotspot_disconnect import KickQueue
 from services.radius_provisioning import deprovision_customer_radius, suspend_customer_access
 
+logger = logging.getLogger(__name__)
 
-def enforce_expired_subscriptions(grace_hours=0):
+
+def enforce_expired_subscriptions(grace_hours=0, kick_queue=None):
     """
     Suspend customers whose subscription_end is in the past.
 
     grace_hours: optional grace period after subscription_end before cut-off.
+
+    Live sessions are kicked in one batch after the commit — one SSH login per
+    router that actually carries an expired subscriber — rather than every
+    router once per customer. Pass ``kick_queue`` to flush it yourself (and get
+    the per-router report); otherwise it is flushed here and logged.
     """
     from datetime import timedelta
 
@@ -26,23 +35,34 @@ def enforce_expired_subscriptions(grace_hours=0):
         Customer.subscription_end < cutoff,
     ).all()
 
+    queue = kick_queue if kick_queue is not None else KickQueue()
+    isps = {}
     count = 0
     for customer in expired:
-        isp = ISP.query.get(customer.isp_id) if customer.isp_id else None
+        if customer.isp_id and customer.isp_id not in isps:
+            isps[customer.isp_id] = ISP.query.get(customer.isp_id)
+        isp = isps.get(customer.isp_id)
         if customer.connection_type == 'hotspot' and isp:
             from services.notification_dispatch import dispatch_hotspot_expired
             try:
                 dispatch_hotspot_expired(customer, isp)
             except Exception:
                 pass
-        # suspend_customer_access deprovisions RADIUS *and* kicks live sessions
-        # (hotspot + PPPoE) so an expired subscriber drops immediately.
-        suspend_customer_access(customer, isp)
+        # suspend_customer_access deprovisions RADIUS *and* queues the kick of
+        # live sessions (hotspot + PPPoE) so an expired subscriber drops.
+        suspend_customer_access(customer, isp, kick_queue=queue)
         count += 1
 
     if count:
         db.session.commit()
 
+    # After the commit: the re-auth a kick triggers must find radcheck gone.
+    if kick_queue is None and len(queue):
+        report = queue.flush()
+        reached = sum(1 for r in report['routers'] if r['ok'])
+        logger.info('Expiry kicks: %d login(s) on %d/%d router(s)',
+                    report['usernames'], reached, len(report['routers']))
+
     return count
 
 
@@ -0,0 +1,311 @@
+"""Per-subscriber daily usage rollup — FUP usage as a lookup, not a scan.
+
+The FUP monitor needs "bytes used since the period started" for every monitored
+subscriber. Summing radacct for that re-reads a whole month of accounting on
+every page load and every enforcement run. This module keeps
+``usage_rollup_daily`` — octets per (isp, customer, username, day) — current
+instead, so the monitor sums at most ~31 small rows per subscriber.
+
+Incremental, idempotent refresh:
+
+* A session is bucketed on the day it *started* (the same rule as the raw
+  ``acctstarttime >= period_start`` aggregation), so a bucket is a pure function
+  of the radacct rows that started that day for that login.
+* A refresh finds the rows that changed since last time — new ones past the
+  ``last_radacctid`` high-water mark, plus existing ones whose interim update or
+  stop landed since ``last_refreshed_at`` — and recomputes only the
+  (username, day) buckets those rows fall in. Recomputing rather than adding
+  deltas means a refresh that runs twice, or overlaps a late interim, can never
+  double count.
+
+The rollup only answers for periods it fully covers (``covers_from``); anything
+earlier falls back to the raw aggregation, so FUP numbers are never wrong, only
+slower. Populate it once with ``flask usage-rollup --backfill-days N``. The
+scheduler's ``usage-rollup`` job (``USAGE_ROLLUP_REFRESH_INTERVAL``) or a cron
+``flask usage-rollup`` keeps it current, and FUP enforcement refreshes it before
+each run; page loads only read it. ``flask usage-rollup --check`` compares it
+against radacct.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, or_
+
+from extensions import db
+from models import RadAcct, UsageRollupDaily, UsageRollupState
+
+logger = logging.getLogger(__name__)
+
+# Interim/stop timestamps come from the RADIUS server clock and rows land inside
+# transactions that may commit after we read; re-scan a short overlap so a row
+# updated just before the previous refresh finished is never missed.
+RESCAN_MARGIN = timedelta(minutes=5)
+
+# Bound on one IN (...) list — see services.fup_enforcement.
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _as_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+def _state(lock=False):
+    query = UsageRollupState.query.order_by(UsageRollupState.id)
+    if lock:
+        # Serialises concurrent refreshers (every gunicorn worker reads the FUP
+        # page): the second one waits here instead of racing the delete/insert.
+        query = query.with_for_update()
+    return query.first()
+
+
+def _recompute_buckets(keys):
+    """Replace the buckets for each ``(username, day)`` in ``keys`` from radacct.
+
+    ``username`` is lower-cased. Every bucket for that login and day is dropped
+    and re-derived, whatever customer_id it was filed under — that is what lets
+    a later ``link_unattributed_sessions`` move usage from the NULL-customer
+    bucket to the real one.
+    """
+    by_day = defaultdict(set)
+    for username, day in keys:
+        if username and day:
+            by_day[day].add(username)
+
+    written = 0
+    for day, usernames in by_day.items():
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        for chunk in _chunks(usernames):
+            UsageRollupDaily.query.filter(
+                UsageRollupDaily.day == day,
+                UsageRollupDaily.username.in_(chunk),
+            ).delete(synchronize_session=False)
+
+            login = func.lower(RadAcct.username)
+            totals = (
+                db.session.query(
+                    RadAcct.isp_id,
+                    RadAcct.customer_id,
+                    login,
+                    func.sum(func.coalesce(RadAcct.acctinputoctets, 0)),
+                    func.sum(func.coalesce(RadAcct.acctoutputoctets, 0)),
+                )
+                .filter(
+                    RadAcct.acctstarttime >= start,
+                    RadAcct.acctstarttime < end,
+                    login.in_(chunk),
+                )
+                .group_by(RadAcct.isp_id, RadAcct.customer_id, login)
+                .all()
+            )
+            rows = [
+                {
+                    'isp_id': isp_id,
+                    'customer_id': customer_id,
+                    'username': username,
+                    'day': day,
+                    'input_octets': int(octets_in or 0),
+                    'output_octets': int(octets_out or 0),
+                    'updated_at': datetime.utcnow(),
+                }
+                for isp_id, customer_id, username, octets_in, octets_out in totals
+            ]
+            if rows:
+                db.session.execute(insert(UsageRollupDaily), rows)
+                written += len(rows)
+    return written
+
+
+def _changed_keys(state, now):
+    """``(username, day)`` pairs touched since the last refresh."""
+    since = (state.last_refreshed_at or now) - RESCAN_MARGIN
+    query = (
+        db.session.query(func.lower(RadAcct.username), RadAcct.acctstarttime)
+        .filter(
+            or_(
+                RadAcct.radacctid > (state.last_radacctid or 0),
+                RadAcct.acctupdatetime >= since,
+                RadAcct.acctstoptime >= since,
+            ),
+            RadAcct.acctstarttime.isnot(None),
+        )
+    )
+    if state.covers_from:
+        query = query.filter(
+            RadAcct.acctstarttime >= datetime.combine(state.covers_from, datetime.min.time())
+        )
+    return {(username, _as_date(started)) for username, started in query.all() if username}
+
+
+def refresh_usage_rollup(now=None):
+    """Fold accounting changes since the last run into the rollup.
+
+    A no-op (returns None) until the rollup has been backfilled once — the read
+    path must never kick off a month-long backfill inside an HTTP request.
+    Otherwise commits and returns ``{'buckets': n, 'high_water': id}``.
+    """
+    now = now or datetime.now()
+    state = _state(lock=True)
+    if state is None:
+        return None
+
+    # Read the mark before scanning: a row inserted mid-scan is either picked
+    # up now or sits above the stored mark for next time.
+    high_water = db.session.query(func.max(RadAcct.radacctid)).scalar() or 0
+    keys = _changed_keys(state, now)
+    written = _recompute_buckets(keys) if keys else 0
+
+    state.last_radacctid = max(state.last_radacctid or 0, high_water)
+    state.last_refreshed_at = now
+    db.session.commit()
+    return {'buckets': written, 'high_water': state.last_radacctid}
+
+
+def backfill_usage_rollup(days=40, now=None):
+    """(Re)build the rollup for the last ``days`` days and start tracking.
+
+    Safe to re-run: every bucket in the window is recomputed. The default covers
+    a monthly FUP period plus a weekly one straddling the month boundary.
+    """
+    now = now or datetime.now()
+    covers_from = (now - timedelta(days=days)).date()
+    start = datetime.combine(covers_from, datetime.min.time())
+
+    state = _state(lock=True)
+    if state is None:
+        state = UsageRollupState(last_radacctid=0)
+        db.session.add(state)
+
+    high_water = db.session.query(func.max(RadAcct.radacctid)).scalar() or 0
+    rows = (
+        db.session.query(func.lower(RadAcct.username), RadAcct.acctstarttime)
+        .filter(RadAcct.acctstarttime >= start)
+        .distinct()
+        .all()
+    )
+    keys = {(username, _as_date(started)) for username, started in rows if username}
+    UsageRollupDaily.query.filter(UsageRollupDaily.day < covers_from).delete(
+        synchronize_session=False
+    )
+    written = _recompute_buckets(keys)
+
+    state.covers_from = covers_from
+    state.last_radacctid = high_water
+    state.last_refreshed_at = now
+    db.session.commit()
+    logger.info('Usage rollup backfilled from %s: %d buckets', covers_from, written)
+    return {'buckets': written, 'covers_from': covers_from.isoformat(),
+            'high_water': high_water}
+
+
+def refresh_usernames(usernames):
+    """Recompute every covered bucket for ``usernames`` (e.g. after relinking).
+
+    Does not commit — callers fold it into their own transaction.
+    """
+    state = _state()
+    wanted = {u.strip().lower() for u in usernames if u}
+    if state is None or not state.covers_from or not wanted:
+        return 0
+    start = datetime.combine(state.covers_from, datetime.min.time())
+    keys = set()
+    for chunk in _chunks(wanted):
+        for username, started in (
+            db.session.query(func.lower(RadAcct.username), RadAcct.acctstarttime)
+            .filter(func.lower(RadAcct.username).in_(chunk), RadAcct.acctstarttime >= start)
+            .all()
+        ):
+            keys.add((username, _as_date(started)))
+    return _recompute_buckets(keys)
+
+
+def prune_usage_rollup(keep_days, now=None, dry_run=False):
+    """Drop buckets older than ``keep_days`` and move ``covers_from`` up to match.
+
+    Called from data retention. Only the longest FUP cycle (a month) is ever
+    read, so anything past that is dead weight at one row per subscriber-day.
+    """
+    cutoff = ((now or datetime.now()) - timedelta(days=max(1, int(keep_days)))).date()
+    query = UsageRollupDaily.query.filter(UsageRollupDaily.day < cutoff)
+    if dry_run:
+        return query.count()
+    removed = query.delete(synchronize_session=False)
+    state = _state()
+    if state is not None and state.covers_from and state.covers_from < cutoff:
+        state.covers_from = cutoff
+    return removed
+
+
+def usage_maps(period_start, isp_id=None):
+    """``(by_customer_id, by_username)`` byte totals since ``period_start``.
+
+    Same shape as services.fup_monitoring's raw aggregation. Returns None when
+    the rollup does not cover ``period_start``, so the caller falls back.
+    """
+    state = _state()
+    if state is None or not state.covers_from or period_start.date() < state.covers_from:
+        return None
+
+    q = (
+        db.session.query(
+            UsageRollupDaily.customer_id,
+            UsageRollupDaily.username,
+            func.sum(UsageRollupDaily.input_octets + UsageRollupDaily.output_octets),
+        )
+        .filter(UsageRollupDaily.day >= period_start.date())
+    )
+    if isp_id:
+        q = q.filter(UsageRollupDaily.isp_id == isp_id)
+    q = q.group_by(UsageRollupDaily.customer_id, UsageRollupDaily.username)
+
+    by_id = {}
+    by_username = {}
+    for customer_id, username, total in q.all():
+        total = int(total or 0)
+        if customer_id:
+            by_id[customer_id] = by_id.get(customer_id, 0) + total
+        if username:
+            by_username[username] = by_username.get(username, 0) + total
+    return by_id, by_username
+
+
+def check_usage_rollup(period_start, isp_id=None):
+    """Compare the rollup with a raw radacct aggregation for one period.
+
+    Returns ``{'covered': bool, 'mismatches': [...]}``; each mismatch names the
+    key (``customer:<id>`` or ``username:<login>``) and both totals. An empty
+    list means the two agree to the byte.
+    """
+    from services.fup_monitoring import _raw_usage_maps
+
+    rolled = usage_maps(period_start, isp_id)
+    if rolled is None:
+        return {'covered': False, 'mismatches': []}
+    raw = _raw_usage_maps(period_start, isp_id)
+
+    mismatches = []
+    for label, rolled_map, raw_map in (
+        ('customer', rolled[0], raw[0]),
+        ('username', rolled[1], raw[1]),
+    ):
+        for key in sorted(set(rolled_map) | set(raw_map), key=str):
+            if rolled_map.get(key, 0) != raw_map.get(key, 0):
+                mismatches.append({
+                    'key': f'{label}:{key}',
+                    'rollup': rolled_map.get(key, 0),
+                    'raw': raw_map.get(key, 0),
+                })
+    return {'covered': True, 'mismatches': mismatches}
@@ -0,0 +1,175 @@
+"""In-process fake RouterOS API server for tests.
+
+Speaks the real wire protocol (length-prefixed words, tagged replies) on a
+localhost port, running on its own event loop in a background thread so both
+async tests and the synchronous ``run_fleet`` can talk to it. Supports login,
+``print`` with ``?field=value`` queries and ``.proplist``, ``remove``,
+``print follow`` / ``listen`` streams, ``/cancel`` and a per-command delay so
+pipelining is observable.
+"""
+import asyncio
+import itertools
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from routeros_api import encode_sentence, read_sentence  # noqa: E402
+
+
+class FakeRouterOS:
+    def __init__(self, username='admin', password='secret', tables=None, delay=0.0):
+        self.username = username
+        self.password = password
+        self.delay = delay
+        self.tables = {menu: [dict(row) for row in rows] for menu, rows in (tables or {}).items()}
+        self._ids = itertools.count(1)
+        for rows in self.tables.values():
+            for row in rows:
+                row.setdefault('.id', f'*{next(self._ids):X}')
+        self.commands = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._followers = []
+        self._loop = None
+        self._server = None
+        self.port = None
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self):
+        ready = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._client, '127.0.0.1', 0)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        async def _shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def push(self, menu, row):
+        """Add a row and deliver it to every open follow on ``menu``."""
+        def _add():
+            row.setdefault('.id', f'*{next(self._ids):X}')
+            self.tables.setdefault(menu, []).append(row)
+            for follow_menu, send, tag in list(self._followers):
+                if follow_menu == menu:
+                    send(['!re', *self._attrs(row), f'.tag={tag}'])
+
+        self._loop.call_soon_threadsafe(_add)
+
+    # -- protocol ------------------------------------------------------
+
+    @staticmethod
+    def _attrs(row, proplist=None):
+        keys = proplist or list(row)
+        return [f'={key}={row[key]}' for key in keys if key in row]
+
+    async def _client(self, reader, writer):
+        authed = False
+        tasks = set()
+        streams = {}
+
+        def send(words):
+            writer.write(encode_sentence(words))
+
+        try:
+            while True:
+                words = await read_sentence(reader)
+                if not words:
+                    continue
+                command = words[0]
+                attrs, query, tag = {}, [], None
+                for word in words[1:]:
+                    if word.startswith('.tag='):
+                        tag = word[5:]
+                    elif word.startswith('='):
+                        key, _, value = word[1:].partition('=')
+                        attrs[key] = value
+                    elif word.startswith('?'):
+                        key, _, value = word[1:].partition('=')
+                        query.append((key, value))
+                self.commands.append(command)
+                suffix = [f'.tag={tag}'] if tag else []
+
+                if command == '/login':
+                    if attrs.get('name') == self.username and attrs.get('password') == self.password:
+                        authed = True
+                        send(['!done', *suffix])
+                    else:
+                        send(['!trap', '=message=invalid user name or password (6)', *suffix])
+                        send(['!done', *suffix])
+                    continue
+                if not authed:
+                    send(['!fatal', 'not logged in'])
+                    break
+                if command == '/cancel':
+                    target = attrs.get('tag')
+                    entry = streams.pop(target, None)
+                    if entry is not None:
+                        self._followers.remove(entry)
+                        send(['!trap', '=category=2', '=message=interrupted', f'.tag={target}'])
+                        send(['!done', f'.tag={target}'])
+                    send(['!done', *suffix])
+                    continue
+
+                menu, _, verb = command.rpartition('/')
+                if verb in ('print', 'listen') and ('follow' in attrs or verb == 'listen'):
+                    for row in self._match(menu, query):
+                        send(['!re', *self._attrs(row), *suffix])
+                    entry = (menu, send, tag)
+                    self._followers.append(entry)
+                    streams[tag] = entry
+                    continue
+                task = asyncio.ensure_future(self._run(send, menu, verb, attrs, query, suffix))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for entry in streams.values():
+                self._followers.remove(entry)
+            writer.close()
+
+    def _match(self, menu, query):
+        return [row for row in self.tables.get(menu, [])
+                if all(row.get(key) == value for key, value in query)]
+
+    async def _run(self, send, menu, verb, attrs, query, suffix):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if menu not in self.tables:
+                send(['!trap', '=message=no such command prefix', *suffix])
+            elif verb == 'print':
+                proplist = attrs.get('.proplist')
+                for row in self._match(menu, query):
+                    send(['!re', *self._attrs(row, proplist.split(',') if proplist else None),
+                          *suffix])
+            elif verb == 'remove':
+                ids = set(attrs.get('.id', '').split(','))
+                self.tables[menu] = [row for row in self.tables[menu] if row['.id'] not in ids]
+            else:
+                send(['!trap', '=message=no such command', *suffix])
+            send(['!done', *suffix])
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,129 @@
+"""In-process fake SNMP agent for tests.
+
+Answers real SNMPv1/v2c GET, GETNEXT and GETBULK PDUs on a localhost UDP port
+from a dict of OID -> value, on a background thread, so the poller's pysnmp
+calls run unchanged. Every request PDU is recorded by type, which makes the
+batching (one GET for all scalars, few GETBULKs per table) observable.
+"""
+import socket
+import threading
+from collections import Counter
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api, rfc1902, rfc1905
+
+
+def if_table(interfaces):
+    """ifTable rows for ``[(ifIndex, descr, in_octets, out_octets)]``."""
+    mib = {}
+    for index, descr, in_octets, out_octets in interfaces:
+        mib[f'1.3.6.1.2.1.2.2.1.2.{index}'] = rfc1902.OctetString(descr)
+        mib[f'1.3.6.1.2.1.2.2.1.8.{index}'] = rfc1902.Integer(1)
+        mib[f'1.3.6.1.2.1.2.2.1.10.{index}'] = rfc1902.Counter32(in_octets)
+        mib[f'1.3.6.1.2.1.2.2.1.14.{index}'] = rfc1902.Counter32(0)
+        mib[f'1.3.6.1.2.1.2.2.1.16.{index}'] = rfc1902.Counter32(out_octets)
+        mib[f'1.3.6.1.2.1.2.2.1.20.{index}'] = rfc1902.Counter32(0)
+    return mib
+
+
+class FakeSnmpAgent:
+    def __init__(self, mib, community='public'):
+        self.community = community
+        self.mib = {rfc1902.ObjectName(oid): value for oid, value in mib.items()}
+        self._order = sorted(self.mib)
+        self.requests = Counter()
+        self.port = None
+        self._sock = None
+        self._stopped = threading.Event()
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.settimeout(0.1)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(2)
+        self._sock.close()
+
+    # -- MIB -----------------------------------------------------------
+
+    def _next(self, oid):
+        for candidate in self._order:
+            if candidate > oid:
+                return candidate
+        return None
+
+    # -- protocol ------------------------------------------------------
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                message, peer = self._sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            response = self._handle(message)
+            if response is not None:
+                self._sock.sendto(response, peer)
+
+    def _handle(self, message):
+        version = int(api.decodeMessageVersion(message))
+        p_mod = api.protoModules[version]
+        request, _rest = decoder.decode(message, asn1Spec=p_mod.Message())
+        if str(p_mod.apiMessage.getCommunity(request)) != self.community:
+            return None  # wrong community: agents stay silent
+        response = p_mod.apiMessage.getResponse(request)
+        req_pdu = p_mod.apiMessage.getPDU(request)
+        rsp_pdu = p_mod.apiMessage.getPDU(response)
+        end_of_view = rfc1905.endOfMibView if version else None
+
+        if req_pdu.isSameTypeWith(p_mod.GetRequestPDU()):
+            self.requests['get'] += 1
+            var_binds = [(oid, self.mib.get(oid, rfc1905.noSuchInstance))
+                         for oid, _ in p_mod.apiPDU.getVarBinds(req_pdu)]
+        elif req_pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
+            self.requests['getnext'] += 1
+            var_binds = []
+            for oid, _ in p_mod.apiPDU.getVarBinds(req_pdu):
+                following = self._next(oid)
+                if following is None:
+                    if not version:
+                        p_mod.apiPDU.setErrorStatus(rsp_pdu, 2)  # noSuchName
+                        p_mod.apiPDU.setErrorIndex(rsp_pdu, 1)
+                        var_binds = p_mod.apiPDU.getVarBinds(req_pdu)
+                        break
+                    var_binds.append((oid, end_of_view))
+                else:
+                    var_binds.append((following, self.mib[following]))
+        elif version and req_pdu.isSameTypeWith(p_mod.GetBulkRequestPDU()):
+            self.requests['getbulk'] += 1
+            non_repeaters = int(p_mod.apiBulkPDU.getNonRepeaters(req_pdu))
+            repetitions = int(p_mod.apiBulkPDU.getMaxRepetitions(req_pdu))
+            requested = [oid for oid, _ in p_mod.apiBulkPDU.getVarBinds(req_pdu)]
+            var_binds = []
+            for oid in requested[:non_repeaters]:
+                following = self._next(oid)
+                var_binds.append((following or oid, self.mib[following] if following else end_of_view))
+            cursors = requested[non_repeaters:]
+            for _ in range(repetitions):
+                if not cursors:
+                    break
+                advanced = []
+                for oid in cursors:
+                    following = self._next(oid)
+                    var_binds.append((following or oid,
+                                      self.mib[following] if following else end_of_view))
+                    advanced.append(following or oid)
+                cursors = advanced
+        else:
+            return None
+        p_mod.apiPDU.setVarBinds(rsp_pdu, var_binds)
+        return encoder.encode(response)
@@ -0,0 +1,257 @@
+"""Tests for the chunked client import and its background job.
+
+The batched path must write the same customers and RADIUS rows the per-row
+path always wrote, one bad row must cost only itself, and a job that dies
+half way must resume from its last committed chunk without creating anyone
+twice.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import json
+import os
+import sys
+import threading
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import (  # noqa: E402
+    Customer, CustomerImportError, CustomerImportJob, ISP, RadCheck, RadReply, RadUserGroup,
+    ServicePlan, User,
+)
+from routes.customers import customers_bp  # noqa: E402
+from services import commit_stamps  # noqa: E402
+from services import customer_import  # noqa: E402
+from services import customer_import_jobs as jobs  # noqa: E402
+from services.radius_provisioning import provision_customer_radius  # noqa: E402
+
+HEADER = 'name,login,password,email,phone,plan,status,subscription_end,static_ip\n'
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_stamps, '_STAMP_DIR', str(tmp_path))
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        JWT_SECRET_KEY='test-secret-long-enough-for-hs256-keys',
+    )
+    db.init_app(application)
+    JWTManager(application)
+    application.register_blueprint(customers_bp)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+@pytest.fixture()
+def tenant(app):
+    isp = _isp('acme')
+    plan = ServicePlan(name='Home 10', speed='10M', price=1500, plan_type='pppoe',
+                       features={}, bandwidth_limit=10, isp_id=isp.id)
+    db.session.add(plan)
+    db.session.commit()
+    return isp, plan
+
+
+def _csv(count, start=0):
+    return HEADER + ''.join(
+        f'User {n},user{n},pw{n},,07000{n:05d},Home 10,active,2026-12-31,'
+        f'{"10.9.0.%d" % n if n % 3 == 0 else ""}\n'
+        for n in range(start, start + count)
+    )
+
+
+def _radius_rows(model, username):
+    return sorted(
+        (row.attribute, row.value) if model is not RadUserGroup else (row.groupname, row.priority)
+        for row in model.query.filter_by(username=username)
+    )
+
+
+def test_bulk_rows_match_what_per_row_provisioning_writes(tenant):
+    isp, plan = tenant
+    summary = customer_import.process_import(isp, customer_import.parse_csv(_csv(4)),
+                                             dry_run=False)
+    assert summary['created'] == 4 and summary['failed'] == 0
+
+    imported = Customer.query.filter_by(radius_login='user3').one()
+    assert len({c.account_number for c in Customer.query}) == 4
+    expected = {model: _radius_rows(model, 'user3') for model in (RadCheck, RadReply, RadUserGroup)}
+
+    # Provision the same customer the per-row way, under a fresh login.
+    reference = Customer(full_name='Ref', radius_login='ref', phone='0700', package='Home 10',
+                         isp_id=isp.id, service_plan_id=plan.id,
+                         subscription_end=imported.subscription_end)
+    db.session.add(reference)
+    db.session.flush()
+    provision_customer_radius(reference, plan, isp, password='pw3')
+    db.session.add(RadReply(username='ref', attribute='Framed-IP-Address', op=':=',
+                            value='10.9.0.3', isp_id=isp.id, customer_id=reference.id))
+    db.session.commit()
+    for model, rows in expected.items():
+        assert rows == _radius_rows(model, 'ref'), model.__name__
+    assert {r.customer_id for r in RadCheck.query.filter_by(username='user3')} == {imported.id}
+
+
+def test_duplicates_in_file_and_database_fail_only_their_rows(tenant):
+    isp, _plan = tenant
+    customer_import.process_import(isp, customer_import.parse_csv(_csv(1)), dry_run=False)
+
+    rows = customer_import.parse_csv(_csv(3) + 'Again,user1,pw,,0700,Home 10,active,,\n')
+    summary = customer_import.process_import(isp, rows, dry_run=False)
+    assert summary['created'] == 2
+    failures = {r['row']: r['messages'] for r in summary['rows'] if r['status'] == 'error'}
+    assert list(failures) == [1, 4]
+    assert "login 'user0' already exists" in failures[1]
+    assert "duplicate login 'user1' within file" in failures[4]
+    assert Customer.query.count() == 3
+
+
+def test_failed_batch_falls_back_to_rows_and_isolates_the_bad_one(tenant, monkeypatch):
+    isp, _plan = tenant
+    monkeypatch.setattr(customer_import, '_bulk_create',
+                        lambda *_a: (_ for _ in ()).throw(RuntimeError('batch rejected')))
+    real_create = customer_import._create_customer
+
+    def flaky(cleaned, isp):
+        if cleaned['login'] == 'user1':
+            raise RuntimeError('bad row')
+        return real_create(cleaned, isp)
+
+    monkeypatch.setattr(customer_import, '_create_customer', flaky)
+    summary = customer_import.process_import(isp, customer_import.parse_csv(_csv(3)),
+                                             dry_run=False)
+    assert summary['created'] == 2 and summary['failed'] == 1
+    assert sorted(c.radius_login for c in Customer.query) == ['user0', 'user2']
+    assert RadUserGroup.query.count() == 2
+
+
+def test_job_resumes_after_a_crash_without_duplicates(tenant, monkeypatch):
+    isp, _plan = tenant
+    source = _csv(7) + 'No plan,nobody,pw,,0700,,active,,\n' + _csv(2, start=1)[len(HEADER):]
+    job = jobs.create_import_job(isp, source)
+    db.session.commit()
+
+    real_commit = customer_import.commit_rows
+    calls = []
+
+    def dying(isp, ctx, ready):
+        calls.append(len(ready))
+        if len(calls) == 2:
+            raise RuntimeError('worker restarted')
+        return real_commit(isp, ctx, ready)
+
+    monkeypatch.setattr(jobs, 'commit_rows', dying)
+    job = jobs.run_import_job(job.id, chunk_size=3)
+    assert (job.status, job.processed_rows, job.created) == ('failed', 3, 3)
+    assert 'worker restarted' in job.error
+    assert jobs.serialize_import_job(job)['resumable']
+
+    assert jobs.claim_for_resume(job)
+    assert not jobs.claim_for_resume(job)  # already running again
+    job = jobs.run_import_job(job.id, chunk_size=3)
+
+    assert job.status == 'completed'
+    assert (job.total_rows, job.processed_rows) == (10, 10)
+    assert (job.created, job.failed) == (7, 3)
+    assert Customer.query.count() == 7
+    assert RadUserGroup.query.count() == 7
+
+    report = [(e.row_number, json.loads(e.messages))
+              for e in CustomerImportError.query.order_by(CustomerImportError.row_number)]
+    assert [n for n, _m in report] == [8, 9, 10]
+    assert report[0][1] == ['plan is required']
+    assert report[1][1] == ["login 'user1' already exists"]
+    assert db.session.get(CustomerImportJob, job.id).source == source
+
+
+# --- /api/customers/import/jobs ----------------------------------------------
+
+def _headers(isp, email):
+    user = User(email=email, password_hash='x', first_name='A', last_name='B',
+                role='isp_admin', isp_id=isp.id)
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+
+def test_job_routes_start_report_and_resume(app, tenant, monkeypatch):
+    isp, _plan = tenant
+    # Run the job inline instead of on a thread, so the test can read its outcome.
+    monkeypatch.setattr(jobs, '_start_thread', lambda _app, job_id: jobs.run_import_job(job_id))
+    client = app.test_client()
+    headers = _headers(isp, 'ops@acme.test')
+
+    source = _csv(3) + 'No plan,nobody,pw,,0700,,active,,\n' + _csv(1)[len(HEADER):]
+    started = client.post('/api/customers/import/jobs', json={'csv': source}, headers=headers)
+    assert started.status_code == 202
+    job_id = started.get_json()['id']
+
+    status = client.get(f'/api/customers/import/jobs/{job_id}', headers=headers).get_json()
+    assert (status['status'], status['created'], status['failed']) == ('completed', 3, 2)
+
+    page = client.get(f'/api/customers/import/jobs/{job_id}/errors?limit=1', headers=headers)
+    assert page.get_json()['next_after'] == 4
+    assert page.get_json()['errors'][0]['messages'] == ['plan is required']
+    rest = client.get(f'/api/customers/import/jobs/{job_id}/errors?after=4', headers=headers)
+    assert [e['row'] for e in rest.get_json()['errors']] == [5]
+    assert rest.get_json()['next_after'] is None
+
+    # The CSV streams after the view returns. Read it on a thread of its own,
+    # where no app context outlives the request the way this test's does.
+    reports = []
+
+    def _download():
+        response = client.get(f'/api/customers/import/jobs/{job_id}/errors?format=csv',
+                              headers=headers)
+        reports.append((response.status_code, response.mimetype, response.get_data(as_text=True)))
+
+    reader = threading.Thread(target=_download)
+    reader.start()
+    reader.join()
+    code, mimetype, body = reports[0]
+    assert code == 200 and mimetype == 'text/csv'
+    assert body.splitlines() == [
+        'row,name,login,plan,errors',
+        '4,No plan,nobody,,plan is required',
+        "5,User 0,user0,Home 10,duplicate login 'user0' within file",
+    ]
+
+    # A completed job has nothing to resume.
+    finished = client.post(f'/api/customers/import/jobs/{job_id}/resume', headers=headers)
+    assert finished.status_code == 409
+    job = db.session.get(CustomerImportJob, job_id)
+    job.status, job.processed_rows, job.created = 'failed', 0, 0
+    Customer.query.delete()
+    CustomerImportError.query.delete()
+    RadCheck.query.delete()
+    RadReply.query.delete()
+    RadUserGroup.query.delete()
+    db.session.commit()
+    resumed = client.post(f'/api/customers/import/jobs/{job_id}/resume', headers=headers)
+    assert resumed.status_code == 202
+    assert db.session.get(CustomerImportJob, job_id).status == 'completed'
+    assert Customer.query.count() == 3
+
+    # Another tenant's operator cannot see or resume the job.
+    other = _headers(_isp('rival'), 'ops@rival.test')
+    assert client.get(f'/api/customers/import/jobs/{job_id}', headers=other).status_code == 404
+    assert client.post(f'/api/customers/import/jobs/{job_id}/resume',
+                       headers=other).status_code == 404
@@ -0,0 +1,137 @@
+"""Tests for the customer list endpoint's keyset paging and field projection.
+
+Walking a tenant with ``cursor`` must visit every customer exactly once (ties
+on the sort column included) without a COUNT, and a list page must not load
+plans or WireGuard peers row by row.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import Customer, ISP, ServicePlan, WireGuardPeer, WireGuardServer  # noqa: E402
+from routes import customers as customers_routes  # noqa: E402
+
+list_customers = customers_routes.get_customers.__wrapped__
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+@pytest.fixture()
+def tenant(app, monkeypatch):
+    isp, other = _isp('acme'), _isp('other')
+    plan = ServicePlan(name='Home 10', speed='10 Mbps', price=1500, plan_type='pppoe',
+                       features={}, isp_id=isp.id)
+    db.session.add(plan)
+    db.session.flush()
+    base = datetime(2026, 1, 1)
+    # Pairs share a created_at so the id tie-break is exercised.
+    db.session.add_all([
+        Customer(full_name=f'Customer {n:02d}', phone=f'07000000{n:02d}', package='Home',
+                 isp_id=isp.id, service_plan_id=plan.id,
+                 created_at=base + timedelta(minutes=n // 2))
+        for n in range(11)
+    ])
+    db.session.add(Customer(full_name='Elsewhere', phone='0711', package='Home',
+                            isp_id=other.id, created_at=base))
+    db.session.commit()
+    user = SimpleNamespace(role='isp_admin', isp_id=isp.id)
+    monkeypatch.setattr(customers_routes, 'get_current_user', lambda: user)
+    return isp, plan
+
+
+def _get(app, query):
+    with app.test_request_context(f'/api/customers?{query}'):
+        response, status = list_customers()
+        return status, response.get_json()
+
+
+def _walk(app, query):
+    seen, cursor, pages = [], '', 0
+    while True:
+        status, body = _get(app, f'{query}&cursor={cursor}')
+        assert status == 200
+        seen += [row['name'] for row in body['customers']]
+        pages += 1
+        if not body['has_more']:
+            assert body['next_cursor'] is None
+            return seen, pages
+        cursor = body['next_cursor']
+
+
+def test_cursor_walk_visits_each_tenant_customer_once_in_order(app, tenant):
+    names, pages = _walk(app, 'per_page=3')
+    assert names == [f'Customer {n:02d}' for n in (10, 9, 8, 7, 6, 5, 4, 3, 2, 1, 0)]
+    assert pages == 4
+
+    names, _pages = _walk(app, 'per_page=4&sort_by=full_name&sort_order=asc&search=customer 1')
+    assert names == ['Customer 10']
+
+    assert _get(app, 'cursor=not-a-cursor')[0] == 400
+    assert _get(app, 'cursor=&sort_by=balance')[0] == 400
+
+
+def test_fields_projection_and_batched_relationships(app, tenant):
+    isp, _plan = tenant
+    server = WireGuardServer(name='wg', endpoint='vpn.example.com', port=51820,
+                             subnet='10.8.0.0/24', server_address='10.8.0.1/32',
+                             public_key='srv', private_key_encrypted='x', isp_id=isp.id)
+    db.session.add(server)
+    db.session.flush()
+    for customer in Customer.query.filter_by(isp_id=isp.id).limit(5):
+        db.session.add(WireGuardPeer(customer_id=customer.id, server_id=server.id,
+                                     isp_id=isp.id, assigned_ip=f'10.8.0.{customer.id + 1}',
+                                     public_key=f'peer{customer.id}', private_key_encrypted='x',
+                                     is_active=True))
+    db.session.commit()
+    db.session.expunge_all()
+
+    selects = []
+    listener = lambda _c, _cur, statement, *_a: selects.append(statement)  # noqa: E731
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        status, body = _get(app, 'cursor=&per_page=20')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert status == 200
+    assert len(body['customers']) == 11
+    assert sum(1 for row in body['customers'] if row['wireguard_peer']) == 5
+    assert body['customers'][0]['service_plan']['name'] == 'Home 10'
+    # Customers, plans, peers (+ servers joined) — not one query per row.
+    assert len(selects) <= 3
+
+    status, body = _get(app, 'fields=id,name,status')
+    assert status == 200 and body['total'] == 11
+    assert set(body['customers'][0]) == {'id', 'name', 'status'}
+    assert _get(app, 'fields=id,password')[0] == 400
@@ -0,0 +1,161 @@
+"""Tests for the cached Overview dashboard snapshot.
+
+The snapshot folds dozens of per-tile queries into a few conditional
+aggregates, so the failures that matter are a figure landing in the wrong
+bucket (wrong period, wrong connection type, another tenant's money) and a
+cached snapshot that outlives the write it should reflect.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import (  # noqa: E402
+    Customer, CustomerStatus, ISP, Invoice, InvoiceStatus, Payment, PaymentStatus,
+    ServicePlan,
+)
+from services import commit_stamps  # noqa: E402
+from services import dashboard_snapshot as snap  # noqa: E402
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_stamps, '_STAMP_DIR', str(tmp_path))
+    snap.clear_dashboard_cache()
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        DASHBOARD_CACHE_TTL_SECONDS=300,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+    snap.clear_dashboard_cache()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _customer(isp, name, connection_type='pppoe', status=CustomerStatus.ACTIVE, plan=None):
+    customer = Customer(full_name=name, phone='0700000000', package='Home',
+                        connection_type=connection_type, status=status, isp_id=isp.id,
+                        service_plan_id=plan.id if plan else None)
+    db.session.add(customer)
+    db.session.flush()
+    return customer
+
+
+def _pay(customer, amount, when):
+    db.session.add(Payment(amount=amount, payment_method='mpesa', payment_date=when,
+                           payment_status=PaymentStatus.COMPLETED, customer_id=customer.id))
+    db.session.flush()
+
+
+def test_figures_are_bucketed_by_type_period_and_tenant(app):
+    now = datetime.now()
+    mine, theirs = _isp('mine'), _isp('theirs')
+    plan = ServicePlan(name='Home', speed='10 Mbps', price=1500, plan_type='pppoe',
+                       features={}, isp_id=mine.id)
+    db.session.add(plan)
+    db.session.flush()
+    home = _customer(mine, 'Home', plan=plan)
+    kiosk = _customer(mine, 'Kiosk', connection_type='hotspot')
+    _customer(mine, 'Gone', status=CustomerStatus.SUSPENDED)
+    other = _customer(theirs, 'Other')
+
+    _pay(home, 1000, now - timedelta(minutes=1))
+    _pay(kiosk, 50, now - timedelta(minutes=1))
+    _pay(kiosk, 20, now - timedelta(days=400))  # outside every window
+    _pay(other, 9999, now - timedelta(minutes=1))
+    db.session.add(Invoice(invoice_number='INV-1', amount=700, status=InvoiceStatus.PENDING,
+                           due_date=now - timedelta(days=1), customer_id=home.id,
+                           isp_id=mine.id))
+    db.session.commit()
+
+    result = snap.build_dashboard_snapshot(isp_id=mine.id, now=now)
+
+    summary = result['summary']
+    assert summary['total_customers'] == 3
+    assert (summary['pppoe_customers'], summary['hotspot_customers']) == (2, 1)
+    assert summary['suspended_customers'] == 1
+    assert summary['mrr'] == 1500
+    assert summary['today_payments'] == 1050
+    assert summary['mpesa_month_count'] == 2
+    assert (summary['overdue_invoices'], summary['overdue_invoice_amount']) == (1, 700)
+    assert result['revenue_by_type'] == {'pppoe': 1000, 'hotspot': 50}
+    assert result['hotspot_activity']['sales_today'] == 1
+    assert sum(h['amount'] for h in result['hotspot_hourly']) == 50
+    assert result['revenue_data'][-1]['payments'] == 1050
+    assert result['package_distribution'][0]['value'] == 1
+    assert result['subscribers']['pppoe']['active'] == 1
+    assert {p['customer'] for p in result['recent_payments']} == {'Home', 'Kiosk'}
+
+    everyone = snap.build_dashboard_snapshot(now=now)
+    assert everyone['summary']['today_payments'] == 1050 + 9999
+
+
+def test_snapshot_is_cached_until_a_payment_commits(app):
+    isp = _isp('acme')
+    customer = _customer(isp, 'Alice')
+    db.session.commit()
+
+    first = snap.get_dashboard_snapshot(isp.id)
+    assert snap.get_dashboard_snapshot(isp.id) is first
+
+    _pay(customer, 300, datetime.now())
+    db.session.commit()
+
+    fresh = snap.get_dashboard_snapshot(isp.id)
+    assert fresh is not first
+    assert fresh['summary']['today_payments'] == 300
+
+
+def test_another_tenants_write_keeps_the_cache(app):
+    mine, theirs = _isp('mine'), _isp('theirs')
+    db.session.commit()
+
+    cached = snap.get_dashboard_snapshot(mine.id)
+    _customer(theirs, 'Bob')
+    db.session.commit()
+
+    assert snap.get_dashboard_snapshot(mine.id) is cached
+    # The platform-wide view does include them, so it must not be served stale.
+    assert snap.get_dashboard_snapshot(None)['summary']['total_customers'] == 1
+
+
+def test_rolled_back_write_does_not_invalidate(app):
+    isp = _isp('acme')
+    db.session.commit()
+    cached = snap.get_dashboard_snapshot(isp.id)
+
+    _customer(isp, 'Draft')
+    db.session.rollback()
+
+    assert snap.get_dashboard_snapshot(isp.id) is cached
+
+
+def test_explicit_invalidation_for_bulk_writes(app):
+    isp = _isp('acme')
+    db.session.commit()
+    cached = snap.get_dashboard_snapshot(isp.id)
+
+    snap.invalidate_dashboard(isp.id)
+
+    assert snap.get_dashboard_snapshot(isp.id) is not cached
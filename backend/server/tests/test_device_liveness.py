@@ -0,0 +1,148 @@
+"""Tests for RADIUS accounting as router liveness evidence.
+
+The fleet query must give every router the same answer the per-router
+lookup did — its own tagged rows, plus untagged rows from its addresses, but
+never a row tagged to a neighbour behind the same NAT — in one statement,
+and the cached ``radius_last_seen_at`` must follow accounting as it arrives.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import ISP, MikrotikDevice, RadAcct  # noqa: E402
+from services import device_liveness as liveness  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+_next_id = iter(range(1, 10_000))
+
+
+@pytest.fixture()
+def app(monkeypatch):
+    monkeypatch.setattr(liveness, '_refreshed', {})
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _router(isp, ip, wg_ip=None):
+    device = MikrotikDevice(username='admin', password='x', device_name=f'r-{ip}',
+                            device_ip=ip, device_model='hEX', location='site',
+                            isp_id=isp.id, is_active=True, management_wg_ip=wg_ip)
+    db.session.add(device)
+    db.session.flush()
+    return device
+
+
+def _acct(nas, started, updated=None, stopped=None, device=None):
+    db.session.add(RadAcct(radacctid=next(_next_id), acctsessionid='s', acctuniqueid='u',
+                           username='sub', nasipaddress=nas, acctstarttime=started,
+                           acctupdatetime=updated, acctstoptime=stopped,
+                           mikrotik_device_id=device.id if device else None))
+
+
+def _three_max_queries(device):
+    """The per-router lookup the fleet query replaced."""
+    conditions = [RadAcct.mikrotik_device_id == device.id]
+    addresses = liveness._nas_addresses(device)
+    if addresses:
+        conditions.append(db.and_(RadAcct.mikrotik_device_id.is_(None),
+                                  RadAcct.nasipaddress.in_(addresses)))
+    values = [db.session.query(db.func.max(column)).filter(db.or_(*conditions)).scalar()
+              for column in (RadAcct.acctupdatetime, RadAcct.acctstoptime, RadAcct.acctstarttime)]
+    return max((v for v in values if v), default=None)
+
+
+def test_fleet_evidence_matches_per_router_lookups_in_one_query(app):
+    isp = ISP(name='a', company_name='a', email='a@example.com', slug='a', api_key='key_a')
+    db.session.add(isp)
+    db.session.flush()
+    tagged = _router(isp, '41.0.0.1')
+    behind_nat = _router(isp, '41.0.0.9', wg_ip='10.99.0.2/32')
+    neighbour = _router(isp, '41.0.0.9', wg_ip='10.99.0.3/32')
+    silent = _router(isp, '41.0.0.5')
+    _acct('41.0.0.1', NOW - timedelta(hours=3), stopped=NOW - timedelta(hours=1), device=tagged)
+    _acct('10.99.0.2', NOW - timedelta(days=2), updated=NOW - timedelta(minutes=3))
+    _acct('41.0.0.9', NOW - timedelta(minutes=40))                       # untagged, shared IP
+    _acct('41.0.0.9', NOW - timedelta(minutes=1), device=behind_nat)     # not the neighbour's
+    _acct('41.0.0.5', NOW, device=tagged)                                # tagged elsewhere
+    db.session.commit()
+    routers = [tagged, behind_nat, neighbour, silent]
+    for device in routers:
+        db.session.refresh(device)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        fleet = liveness.radius_evidence(routers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert len(statements) == 1
+    assert fleet == {d.id: _three_max_queries(d) for d in routers}
+    assert fleet[neighbour.id] == NOW - timedelta(minutes=40)
+    assert fleet[silent.id] is None
+
+
+def test_cached_evidence_follows_new_accounting(app, monkeypatch):
+    isp = ISP(name='a', company_name='a', email='a@example.com', slug='a', api_key='key_a')
+    db.session.add(isp)
+    db.session.flush()
+    router = _router(isp, '41.0.0.1')
+    _acct('41.0.0.1', NOW - timedelta(days=3), stopped=NOW - timedelta(days=3))  # past the lookback
+    _acct('41.0.0.1', NOW - timedelta(hours=2), updated=NOW - timedelta(minutes=30))
+    db.session.commit()
+
+    assert liveness.refresh_radius_evidence(now=NOW) == 1
+    assert router.radius_last_seen_at == NOW - timedelta(minutes=30)
+    # Refreshed moments ago: a second look is skipped, not re-queried.
+    _acct('41.0.0.1', NOW - timedelta(minutes=5), updated=NOW - timedelta(minutes=1))
+    db.session.commit()
+    assert liveness.refresh_radius_evidence([router], now=NOW) == 0
+
+    later = NOW + timedelta(minutes=1)
+    clock = type('clock', (datetime,), {'utcnow': staticmethod(lambda: later)})
+    monkeypatch.setattr(liveness, 'datetime', clock)
+    evidence = liveness.gather_evidence(router, probe=False)
+    assert router.radius_last_seen_at == NOW - timedelta(minutes=1)
+    assert evidence['alive'] and evidence['source'] == 'radius_accounting'
+
+
+def test_accounting_from_an_unknown_nas_is_reported_apart(app):
+    isp = ISP(name='a', company_name='a', email='a@example.com', slug='a', api_key='key_a')
+    db.session.add(isp)
+    db.session.flush()
+    known = _router(isp, '41.0.0.1')
+    other = _router(isp, '41.0.0.2')
+    _acct('41.0.0.1', NOW - timedelta(minutes=10))
+    _acct('41.0.0.2', NOW - timedelta(minutes=8))              # registered, just not asked for
+    _acct('198.51.100.7', NOW - timedelta(hours=2))
+    _acct('198.51.100.7', NOW - timedelta(minutes=20), updated=NOW - timedelta(minutes=4))
+    db.session.commit()
+
+    by_device, unknown = liveness.fleet_radius_evidence([known])
+    assert by_device == {known.id: NOW - timedelta(minutes=10)}
+    assert unknown == {'198.51.100.7': NOW - timedelta(minutes=4)}
+    assert other.id not in by_device
+    # The per-router lookup never reads addresses it does not own.
+    assert liveness.radius_evidence([known]) == by_device
+
+    assert liveness.unregistered_nas(now=NOW) == unknown
@@ -0,0 +1,167 @@
+"""Tests for the concurrent bulk router sync.
+
+What must hold: no more routers in flight than the pool allows, never more
+than the per-tenant cap for one tenant, results handed back as each router
+finishes (not when the slowest one does), a router somebody else is using
+reported busy rather than offline, and a poll seeing only results it has not
+seen yet.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import DeviceSyncRun, ISP, MikrotikDevice  # noqa: E402
+from services import device_config_ops  # noqa: E402
+from services import device_sweep as sweep  # noqa: E402
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        DEVICE_SYNC_WORKERS=4,
+        DEVICE_SYNC_PER_ISP=2,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def test_pool_and_per_group_caps_hold():
+    lock = threading.Lock()
+    in_flight = Counter()
+    peaks = Counter()
+
+    def work(item):
+        group = item[0]
+        with lock:
+            in_flight[group] += 1
+            in_flight['*'] += 1
+            peaks[group] = max(peaks[group], in_flight[group])
+            peaks['*'] = max(peaks['*'], in_flight['*'])
+        time.sleep(0.01)
+        with lock:
+            in_flight[group] -= 1
+            in_flight['*'] -= 1
+        return item
+
+    items = [('big', n) for n in range(12)] + [('small', n) for n in range(3)]
+    done = list(sweep.bounded_sweep(items, work, group_of=lambda i: i[0],
+                                    workers=3, per_group=2))
+
+    assert sorted(item for item, _result, _exc in done) == sorted(items)
+    assert peaks['big'] <= 2 and peaks['small'] <= 2
+    assert peaks['*'] <= 3
+
+
+def test_results_stream_before_the_slowest_router_finishes():
+    release = threading.Event()
+
+    def work(item):
+        if item == 'dead':
+            release.wait(5)
+        return item
+
+    stream = sweep.bounded_sweep(['dead', 'fast'], work, group_of=lambda i: i,
+                                 workers=2, per_group=1)
+    first = next(stream)
+    release.set()
+    rest = list(stream)
+
+    assert first[0] == 'fast'
+    assert [item for item, _r, _e in rest] == ['dead']
+
+
+def test_a_crashing_router_does_not_stop_the_sweep():
+    def work(item):
+        if item == 2:
+            raise RuntimeError('boom')
+        return item
+
+    done = {item: exc for item, _r, exc in sweep.bounded_sweep(
+        [1, 2, 3], work, group_of=lambda i: 0, workers=2, per_group=2)}
+
+    assert set(done) == {1, 2, 3}
+    assert isinstance(done[2], RuntimeError) and done[1] is None
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _device(isp, name):
+    device = MikrotikDevice(username='admin', password='x', device_name=name,
+                            device_ip='10.0.0.1', device_model='hEX', location='site',
+                            isp_id=isp.id, is_active=True)
+    db.session.add(device)
+    db.session.flush()
+    return device
+
+
+def test_locked_router_is_reported_busy_not_offline(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(device_config_ops, '_LOCK_DIR', str(tmp_path))
+    device = _device(_isp('acme'), 'core')
+    db.session.commit()
+
+    with device_config_ops._device_ssh_file_lock(device.id, wait=0):
+        result = sweep._sync_one(app, device.id, lock_wait=0)
+
+    assert result['outcome'] == sweep.OUTCOME_BUSY
+    assert result['device_name'] == 'core'
+
+
+def test_run_records_each_result_and_polls_incrementally(app):
+    isp = _isp('acme')
+    devices = [_device(isp, f'r{n}') for n in range(3)]
+    run = DeviceSyncRun(isp_id=isp.id, total=3)
+    db.session.add(run)
+    db.session.commit()
+
+    outcomes = {devices[0].id: sweep.OUTCOME_SYNCED,
+                devices[1].id: sweep.OUTCOME_OFFLINE,
+                devices[2].id: sweep.OUTCOME_BUSY}
+
+    def fake_sync(_app, device_id, _lock_wait):
+        return {'device_id': device_id, 'device_name': None, 'outcome': outcomes[device_id],
+                'device_status': None, 'error': None, 'elapsed_ms': 1}
+
+    sweep.run_bulk_sync(app, run.id, sync_one=fake_sync)
+
+    report = sweep.serialize_run(db.session.get(DeviceSyncRun, run.id))
+    assert report['status'] == 'completed'
+    assert (report['synced'], report['failed'], report['busy'], report['done']) == (1, 1, 1, 3)
+    assert len(report['results']) == 3
+
+    newer = sweep.serialize_run(run, after_id=report['results'][1]['id'])
+    assert [r['id'] for r in newer['results']] == [report['results'][2]['id']]
+
+
+def test_second_start_attaches_to_the_running_sweep(app):
+    isp = _isp('acme')
+    running = DeviceSyncRun(isp_id=isp.id, status='running')
+    db.session.add(running)
+    db.session.commit()
+
+    run, started = sweep.start_bulk_sync(app, isp_id=isp.id)
+
+    assert started is False and run.id == running.id
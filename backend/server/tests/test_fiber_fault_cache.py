@@ -0,0 +1,111 @@
+"""Tests for the per-tenant fiber fault cache.
+
+Suspects are served from cache until the plant changes or an ONT reading
+crosses a health band — but not for the tenth-of-a-dB jitter every Inform
+brings, which would otherwise keep the cache permanently cold.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import CpeDevice, FiberNode, ISP  # noqa: E402
+from services import commit_stamps  # noqa: E402
+from services import fiber_fault_cache as cache  # noqa: E402
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_stamps, '_STAMP_DIR', str(tmp_path))
+    cache.clear_fiber_fault_cache()
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _plant(isp):
+    olt = FiberNode(isp_id=isp.id, name='olt', kind='olt')
+    db.session.add(olt)
+    db.session.flush()
+    odb = FiberNode(isp_id=isp.id, name='odb', kind='odb', parent_id=olt.id)
+    db.session.add(odb)
+    db.session.flush()
+    onts = [CpeDevice(isp_id=isp.id, serial_key=f'{isp.slug}-{n}', fiber_node_id=odb.id,
+                      rx_power_dbm=-28.5) for n in range(3)]
+    db.session.add_all(onts)
+    db.session.commit()
+    return odb, onts
+
+
+def test_suspects_are_cached_until_a_reading_changes_band(app, monkeypatch):
+    isp = _isp('alpha')
+    odb, onts = _plant(isp)
+    builds = []
+    real = cache.localise_faults
+    monkeypatch.setattr(cache, 'localise_faults',
+                        lambda *args: builds.append(1) or real(*args))
+
+    first = cache.fault_suspects(isp.id)
+    assert first[0]['node_id'] == odb.id and first[0]['affected'] == 3
+    assert cache.fault_suspects(isp.id) == first and len(builds) == 1
+
+    onts[0].rx_power_dbm = -28.7  # still critical: jitter, not news
+    db.session.commit()
+    assert cache.fault_suspects(isp.id) == first and len(builds) == 1
+
+    odb.name = 'odb renamed'
+    db.session.commit()
+    assert cache.fault_suspects(isp.id)[0]['node_name'] == 'odb renamed' and len(builds) == 2
+
+    onts[0].rx_power_dbm = -20.0  # repaired: no longer the whole branch
+    db.session.commit()
+    assert cache.fault_suspects(isp.id) == [] and len(builds) == 3
+
+
+def test_one_tenants_changes_leave_anothers_cache_alone(app, monkeypatch):
+    alpha, beta = _isp('alpha'), _isp('beta')
+    _plant(alpha)
+    _odb, beta_onts = _plant(beta)
+    builds = []
+    real = cache.localise_faults
+    monkeypatch.setattr(cache, 'localise_faults',
+                        lambda *args: builds.append(1) or real(*args))
+    cache.fault_suspects(alpha.id)
+    cache.fault_suspects(beta.id)
+
+    beta_onts[0].fiber_node_id = None
+    db.session.commit()
+    cache.fault_suspects(alpha.id)
+    assert len(builds) == 2
+    assert cache.fault_suspects(beta.id)[0]['total_onts'] == 2 and len(builds) == 3
+
+    # An ONT handed to another tenant leaves both trees changed.
+    assert beta_onts[1].isp_id == beta.id  # loaded, as a request would have it
+    beta_onts[1].isp_id = alpha.id
+    db.session.commit()
+    assert cache.fault_suspects(beta.id) == [] and len(builds) == 4
+    cache.fault_suspects(alpha.id)
+    assert len(builds) == 5
@@ -207,6 +207,50 @@ def test_onts_without_readings_are_ignored():
     assert geo.localise_faults(nodes, [ont(1, 2, None), ont(2, 2, None)]) == []
 
 
+def _reference_suspects(nodes, onts, min_affected=2):
+    """The per-node subtree scan localise_faults replaced, kept as an oracle."""
+    by_id, children = geo.build_index(nodes)
+    out = []
+    for n in nodes:
+        ids = {n.id} | {d.id for d in geo.descendants(n.id, children)}
+        readings = [o.rx_power_dbm for o in onts
+                    if o.fiber_node_id in ids and o.rx_power_dbm is not None]
+        degraded = [r for r in readings if geo.optical_health(r) in ('marginal', 'critical')]
+        if (sum(1 for o in onts if o.fiber_node_id in ids) >= min_affected and readings
+                and len(degraded) >= min_affected and len(degraded) / len(readings) >= 0.8):
+            out.append((n.id, len(degraded), len(readings), min(readings),
+                        len(geo.walk_upstream(n, by_id))))
+    return sorted(out)
+
+
+def test_bottom_up_aggregation_matches_the_subtree_scan():
+    import random
+
+    rng = random.Random(7)
+    nodes = [node(1, 'olt')]
+    for id_ in range(2, 400):
+        nodes.append(node(id_, rng.choice(('splitter', 'odb')), parent=rng.randrange(1, id_)))
+    onts = []
+    for id_ in range(1, 1200):
+        # Whole branches go dark together so there is something to find.
+        where = rng.randrange(2, 400)
+        rx = rng.choice((-28.5, -29.0, -26.0)) if where % 7 == 0 else rng.choice((-20.0, -28.0, None))
+        onts.append(ont(id_, where, rx))
+
+    suspects = geo.localise_faults(nodes, onts)
+    assert suspects
+    assert sorted((s['node_id'], s['affected'], s['total_onts'], s['worst_dbm'], s['depth'])
+                  for s in suspects) == _reference_suspects(nodes, onts)
+
+
+def test_fault_localisation_survives_a_parent_cycle():
+    """Bad data must not hang the request or count an ONT twice."""
+    nodes = [node(1, 'odb', parent=2), node(2, 'splitter', parent=1)]
+    onts = [ont(1, 1, -28.5), ont(2, 1, -29.0)]
+    suspects = geo.localise_faults(nodes, onts)
+    assert {s['affected'] for s in suspects} == {2}
+
+
 # --- ports ------------------------------------------------------------------
 
 def test_port_occupancy_is_derived_from_splice_rows():
@@ -0,0 +1,179 @@
+"""Tests for the fiber plant's spatial lookups.
+
+The grid and the path boxes are only an index: every answer must match a
+brute-force scan of the whole plant, whether the viewport is a street or a
+country, and a cable counts as visible when its drawn route crosses the
+viewport — not when its bounding box happens to.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import CpeDevice, FiberCable, FiberNode, ISP  # noqa: E402
+from routes import fiber as fiber_routes  # noqa: E402
+from services import fiber_geo, fiber_spatial as spatial  # noqa: E402
+
+fiber_map = fiber_routes.fiber_map.__wrapped__
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _scatter(isp, count, seed=3):
+    """Nodes spread over ~0.3° around Nairobi, plus a few unplaced ones."""
+    rng = random.Random(seed)
+    nodes = [FiberNode(isp_id=isp.id, name=f'n{n}', kind=rng.choice(('odb', 'splitter', 'pole')),
+                       latitude=-1.3 + rng.uniform(-0.15, 0.15),
+                       longitude=36.8 + rng.uniform(-0.15, 0.15)) for n in range(count)]
+    nodes += [FiberNode(isp_id=isp.id, name=f'unplaced{n}', kind='odb') for n in range(3)]
+    db.session.add_all(nodes)
+    db.session.commit()
+    return nodes
+
+
+def _inside(node, bbox):
+    west, south, east, north = bbox
+    return (node.latitude is not None and south <= node.latitude <= north
+            and west <= node.longitude <= east)
+
+
+@pytest.mark.parametrize('bbox', [
+    (36.78, -1.32, 36.80, -1.30),        # a street or two
+    (36.70, -1.40, 36.95, -1.20),        # the city
+    (30.0, -5.0, 40.0, 5.0),             # past MAX_CELL_ROWS: coordinate range
+])
+def test_viewport_query_matches_a_full_scan(app, bbox):
+    isp, other = _isp('alpha'), _isp('beta')
+    nodes = _scatter(isp, 400)
+    _scatter(other, 50)
+    assert nodes[0].grid_cell == spatial.cell_of(nodes[0].latitude, nodes[0].longitude)
+
+    found = {n.id for n in spatial.nodes_in_bbox(isp.id, bbox)}
+    assert found == {n.id for n in nodes if _inside(n, bbox)}
+
+
+def test_moving_a_node_moves_its_cell(app):
+    isp = _isp('alpha')
+    node = FiberNode(isp_id=isp.id, name='odb', latitude=-1.30, longitude=36.80)
+    db.session.add(node)
+    db.session.commit()
+    node.latitude, node.longitude = -1.10, 37.00
+    db.session.commit()
+    assert spatial.nodes_in_bbox(isp.id, (36.99, -1.11, 37.01, -1.09)) == [node]
+    assert spatial.nodes_in_bbox(isp.id, (36.79, -1.31, 36.81, -1.29)) == []
+
+
+def test_cables_are_found_by_their_route_not_their_box(app):
+    isp = _isp('alpha')
+    anchor = FiberNode(isp_id=isp.id, name='olt', kind='olt')
+    db.session.add(anchor)
+    db.session.flush()
+    # An L-shaped route whose box covers the viewport but whose path skirts it,
+    # and a straight one crossing it with no vertex inside.
+    skirting = FiberCable(isp_id=isp.id, from_node_id=anchor.id, name='skirting',
+                          path=fiber_geo.serialize_path([[0.0, 0.0], [0.0, 1.0], [1.0, 1.0]]))
+    crossing = FiberCable(isp_id=isp.id, from_node_id=anchor.id, name='crossing',
+                          path=fiber_geo.serialize_path([[0.5, -1.0], [0.5, 2.0]]))
+    elsewhere = FiberCable(isp_id=isp.id, from_node_id=anchor.id, name='elsewhere',
+                           path=fiber_geo.serialize_path([[5.0, 5.0], [6.0, 6.0]]))
+    db.session.add_all([skirting, crossing, elsewhere])
+    db.session.commit()
+    assert (crossing.min_lat, crossing.min_lng, crossing.max_lat, crossing.max_lng) == (0.5, -1.0, 0.5, 2.0)
+
+    viewport = (0.2, 0.4, 0.6, 0.6)
+    assert [c.name for c in spatial.cables_in_bbox(isp.id, viewport)] == ['crossing']
+
+
+def test_nearest_nodes_match_a_full_scan(app):
+    isp = _isp('alpha')
+    nodes = _scatter(isp, 300)
+    rng = random.Random(11)
+    for _ in range(10):
+        lat, lng = -1.3 + rng.uniform(-0.2, 0.2), 36.8 + rng.uniform(-0.2, 0.2)
+        for kind in (None, 'splitter'):
+            expected = sorted(
+                (fiber_geo.haversine_m(lat, lng, n.latitude, n.longitude), n.id)
+                for n in nodes if n.latitude is not None and kind in (None, n.kind))[:7]
+            found = spatial.nearest_nodes(isp.id, lat, lng, limit=7, kind=kind)
+            assert [node.id for node, _m in found] == [node_id for _m, node_id in expected]
+
+
+def test_backfill_fills_rows_saved_before_the_columns(app):
+    isp = _isp('alpha')
+    nodes = _scatter(isp, 20)
+    cable = FiberCable(isp_id=isp.id, from_node_id=nodes[0].id,
+                       path=fiber_geo.serialize_path([[1.0, 2.0], [3.0, 4.0]]))
+    db.session.add(cable)
+    db.session.commit()
+    db.session.execute(FiberNode.__table__.update().values(grid_cell=None))
+    db.session.execute(FiberCable.__table__.update().values(min_lat=None))
+    db.session.commit()
+
+    assert spatial.backfill_spatial_columns(batch=7) == (20, 1)
+    assert spatial.backfill_spatial_columns() == (0, 0)
+    db.session.refresh(cable)
+    assert cable.min_lat == 1.0
+
+
+def test_map_viewport_returns_only_visible_features_with_full_predictions(app, monkeypatch):
+    isp = _isp('alpha')
+    olt = FiberNode(isp_id=isp.id, name='olt', kind='olt', latitude=-1.0, longitude=36.0)
+    db.session.add(olt)
+    db.session.flush()
+    odb = FiberNode(isp_id=isp.id, name='odb', kind='odb', parent_id=olt.id,
+                    latitude=-1.3, longitude=36.8)
+    db.session.add(odb)
+    db.session.flush()
+    db.session.add(FiberCable(isp_id=isp.id, from_node_id=olt.id, to_node_id=odb.id, length_m=40_000,
+                              path=fiber_geo.serialize_path([[-1.0, 36.0], [-1.3, 36.8]])))
+    db.session.add(CpeDevice(isp_id=isp.id, serial_key='ont-1', fiber_node_id=odb.id,
+                             latitude=-1.3001, longitude=36.8001, rx_power_dbm=-20.0))
+    db.session.commit()
+    user = SimpleNamespace(role='isp_admin', isp_id=isp.id)
+    monkeypatch.setattr(fiber_routes, 'get_current_user', lambda: user)
+
+    with app.test_request_context('/api/fiber/map'):
+        whole = fiber_map()[0].get_json()
+    with app.test_request_context('/api/fiber/map?bbox=36.79,-1.31,36.81,-1.29'):
+        body, status = fiber_map()
+    payload = body.get_json()
+    assert status == 200
+    assert [n['name'] for n in payload['nodes']] == ['odb']
+    assert [c['to_node_id'] for c in payload['cables']] == [odb.id]
+    # The OLT is off-screen, yet the ONT's loss budget still runs to it.
+    assert payload['onts'][0]['predicted_rx_dbm'] == whole['onts'][0]['predicted_rx_dbm']
+    assert payload['onts'][0]['predicted_rx_dbm'] < 0  # the 40 km feeder counted
+    assert payload['viewport'] == [36.79, -1.31, 36.81, -1.29]
+
+    with app.test_request_context('/api/fiber/map?bbox=nonsense'):
+        assert fiber_map()[1] == 400
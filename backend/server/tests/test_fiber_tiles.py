@@ -0,0 +1,164 @@
+"""Tests for the fiber map's z/x/y tiles.
+
+Across the tiles of any zoom, every placed node must be counted exactly once
+— drawn, or inside one cluster — and a browser revalidating a tile must get
+304 until the plant changes, then the new tile.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import json
+import math
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import FiberCable, FiberNode, ISP  # noqa: E402
+from routes import fiber as fiber_routes  # noqa: E402
+from services import commit_stamps  # noqa: E402
+from services import fiber_geo, fiber_tiles as tiles  # noqa: E402
+
+fiber_tile = fiber_routes.fiber_tile.__wrapped__
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_stamps, '_STAMP_DIR', str(tmp_path))
+    tiles.clear_fiber_tile_cache()
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _tile_of(lat, lng, z):
+    n = 2 ** z
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+def _features(isp_id, z, x, y):
+    return json.loads(tiles.render_tile(isp_id, z, x, y)[0])['features']
+
+
+def test_simplify_drops_only_what_a_pixel_cannot_show():
+    wiggle = [[0.0, i / 100] for i in range(101)]
+    wiggle[50] = [0.00001, 0.5]
+    assert tiles.simplify(wiggle, 0.001) == [[0.0, 0.0], [0.0, 1.0]]
+    corner = [[0.0, 0.0], [0.0, 0.5], [0.5, 0.5], [0.5, 1.0]]
+    assert tiles.simplify(corner, 0.001) == corner
+
+
+@pytest.mark.parametrize('z', [6, 12, 15, 17])
+def test_every_node_is_counted_once_across_tiles(app, z):
+    isp = _isp('alpha')
+    rng = random.Random(5)
+    nodes = [FiberNode(isp_id=isp.id, name=f'n{n}', kind='odb',
+                       latitude=-1.3 + rng.uniform(-0.02, 0.02),
+                       longitude=36.8 + rng.uniform(-0.02, 0.02)) for n in range(300)]
+    db.session.add_all(nodes)
+    db.session.commit()
+
+    covering = {_tile_of(n.latitude, n.longitude, z) for n in nodes}
+    counted = []
+    for x, y in covering:
+        for feature in _features(isp.id, z, x, y):
+            props = feature['properties']
+            counted.append(props['point_count'] if props['layer'] == 'cluster' else 1)
+            if z >= tiles.CLUSTER_MAX_ZOOM:
+                assert props['layer'] == 'node'
+    assert sum(counted) == len(nodes)
+    if z < tiles.CLUSTER_MAX_ZOOM:
+        assert len(counted) < len(nodes)
+
+
+def test_cables_appear_by_zoom_and_are_simplified(app):
+    isp = _isp('alpha')
+    anchor = FiberNode(isp_id=isp.id, name='olt', kind='olt', latitude=-1.3, longitude=36.8)
+    db.session.add(anchor)
+    db.session.flush()
+    route = [[-1.3, 36.8 + i * 0.0001] for i in range(200)]
+    db.session.add_all([
+        FiberCable(isp_id=isp.id, from_node_id=anchor.id, cable_type='feeder', name='feeder',
+                   path=fiber_geo.serialize_path(route)),
+        FiberCable(isp_id=isp.id, from_node_id=anchor.id, cable_type='drop', name='drop',
+                   path=fiber_geo.serialize_path(route[:20])),
+    ])
+    db.session.commit()
+
+    def cables(z):
+        x, y = _tile_of(-1.3, 36.801, z)
+        return {f['properties']['name']: f['geometry']['coordinates']
+                for f in _features(isp.id, z, x, y) if f['properties']['layer'] == 'cable'}
+
+    assert cables(6) == {}
+    assert set(cables(10)) == {'feeder'}
+    assert set(cables(14)) == {'feeder', 'drop'}
+    assert len(cables(14)['feeder']) == 2  # a straight run is its two ends
+
+
+def test_tiles_revalidate_until_the_plant_changes(app, monkeypatch):
+    isp = _isp('alpha')
+    node = FiberNode(isp_id=isp.id, name='odb', kind='odb', latitude=-1.3, longitude=36.8)
+    db.session.add(node)
+    db.session.commit()
+    user = SimpleNamespace(role='isp_admin', isp_id=isp.id)
+    monkeypatch.setattr(fiber_routes, 'get_current_user', lambda: user)
+    x, y = _tile_of(-1.3, 36.8, 17)
+    url = f'/api/fiber/tiles/17/{x}/{y}.geojson'
+
+    with app.test_request_context(url):
+        first = fiber_tile(17, x, y)
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    assert [f['properties']['name'] for f in first.get_json()['features']] == ['odb']
+
+    with app.test_request_context(url, headers={'If-None-Match': etag}):
+        assert fiber_tile(17, x, y).status_code == 304
+
+    node.name = 'odb renamed'
+    db.session.commit()
+    with app.test_request_context(url, headers={'If-None-Match': etag}):
+        changed = fiber_tile(17, x, y)
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert changed.get_json()['features'][0]['properties']['name'] == 'odb renamed'
+
+    with app.test_request_context('/api/fiber/tiles/3/9/0.geojson'):
+        assert fiber_tile(3, 9, 0)[1] == 404
+
+
+def test_moving_a_node_to_another_tenant_changes_both_versions(app):
+    alpha, beta = _isp('alpha'), _isp('beta')
+    node = FiberNode(isp_id=alpha.id, name='odb', kind='odb', latitude=-1.3, longitude=36.8)
+    db.session.add(node)
+    db.session.commit()
+    before = tiles._stamp(alpha.id), tiles._stamp(beta.id)
+
+    node = db.session.get(FiberNode, node.id)  # loaded, as a route would have it
+    node.isp_id = beta.id
+    db.session.commit()
+    after = tiles._stamp(alpha.id), tiles._stamp(beta.id)
+    assert before[0] != after[0] and before[1] != after[1]
@@ -0,0 +1,204 @@
+"""Tests for the set-based FUP enforcement run.
+
+The run touches every FUP-monitored subscriber at once, so the failure that
+matters is a transition applied to the wrong set: a subscriber throttled who is
+under their cap, a restore that never happens because they left monitoring, or
+another tenant's radreply rows swept up by a bulk delete.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import (  # noqa: E402
+    Customer, CustomerStatus, ISP, RadAcct, RadReply, RadUserGroup, ServicePlan,
+)
+from services import fup_enforcement as fup  # noqa: E402
+from services.radius_provisioning import (  # noqa: E402
+    provision_customer_radius, radius_username,
+)
+
+GB = 1024 ** 3
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _plan(isp, fup_enabled=True):
+    plan = ServicePlan(name='Home 10', speed='10 Mbps', price=1000, plan_type='pppoe',
+                       bandwidth_limit=10, isp_id=isp.id,
+                       features={'fup_enabled': fup_enabled, 'fup_threshold_gb': 1,
+                                 'fup_throttled_speed': '2M', 'fup_reset_cycle': 'monthly'})
+    db.session.add(plan)
+    db.session.flush()
+    return plan
+
+
+def _customer(isp, plan, login, status=CustomerStatus.ACTIVE):
+    customer = Customer(full_name=login, phone='0700000000', package=plan.name,
+                        radius_login=login, status=status, isp_id=isp.id,
+                        service_plan_id=plan.id)
+    db.session.add(customer)
+    db.session.flush()
+    provision_customer_radius(customer, plan, isp, password='secret')
+    return customer
+
+
+def _usage(customer, gigabytes, nas_ip='10.0.0.1'):
+    # radacctid is a BIGINT key, which SQLite will not autoincrement.
+    db.session.add(RadAcct(
+        radacctid=customer.id, acctsessionid=f's-{customer.id}',
+        acctuniqueid=f'u-{customer.id}', username=radius_username(customer), nasipaddress=nas_ip,
+        acctstarttime=datetime.now(), acctinputoctets=int(gigabytes * GB),
+        acctoutputoctets=0, isp_id=customer.isp_id, customer_id=customer.id,
+    ))
+    db.session.flush()
+
+
+def _rate_limit(customer):
+    row = RadReply.query.filter_by(
+        username=radius_username(customer), attribute='Mikrotik-Rate-Limit'
+    ).one()
+    return row.value
+
+
+def test_over_cap_is_throttled_and_under_cap_is_left_alone(app):
+    isp = _isp('acme')
+    plan = _plan(isp)
+    heavy = _customer(isp, plan, 'heavy')
+    light = _customer(isp, plan, 'light')
+    _usage(heavy, 2)
+    _usage(light, 0.1)
+    db.session.commit()
+
+    result = fup.apply_fup_enforcement(kick=False)
+
+    assert result['throttled'] == 1 and result['restored'] == 0
+    assert db.session.get(Customer, heavy.id).fup_throttled is True
+    assert db.session.get(Customer, light.id).fup_throttled is False
+    assert _rate_limit(heavy) == '2M/2M'
+    assert _rate_limit(light) == '10M/10M'
+    # The group membership survives the bulk rewrite.
+    assert RadUserGroup.query.filter_by(username='heavy').count() == 1
+    assert set(result['timings_ms']) == {'monitor', 'preload', 'plan', 'write', 'commit', 'kick'}
+
+
+def test_second_run_is_a_no_op(app):
+    """State lives on the flag, so a throttled subscriber is not rewritten and
+    kicked again every fifteen minutes."""
+    isp = _isp('acme')
+    plan = _plan(isp)
+    _usage(_customer(isp, plan, 'heavy'), 2)
+    db.session.commit()
+
+    fup.apply_fup_enforcement(kick=False)
+    again = fup.apply_fup_enforcement(kick=False)
+
+    assert (again['throttled'], again['restored'], again['cleared']) == (0, 0, 0)
+
+
+def test_subscriber_who_leaves_monitoring_is_restored(app):
+    isp = _isp('acme')
+    plan = _plan(isp)
+    heavy = _customer(isp, plan, 'heavy')
+    _usage(heavy, 2)
+    db.session.commit()
+    fup.apply_fup_enforcement(kick=False)
+
+    plan.features = {'fup_enabled': False}
+    db.session.commit()
+    result = fup.apply_fup_enforcement(kick=False)
+
+    assert result['restored'] == 1
+    assert db.session.get(Customer, heavy.id).fup_throttled is False
+    assert _rate_limit(heavy) == '10M/10M'
+
+
+def test_suspended_subscriber_only_has_the_flag_cleared(app):
+    isp = _isp('acme')
+    plan = _plan(isp)
+    customer = _customer(isp, plan, 'gone', status=CustomerStatus.SUSPENDED)
+    customer.fup_throttled = True
+    db.session.commit()
+
+    result = fup.apply_fup_enforcement(kick=False)
+
+    assert result['cleared'] == 1 and result['restored'] == 0
+    assert db.session.get(Customer, customer.id).fup_throttled is False
+
+
+def test_bulk_rewrite_never_touches_another_tenant(app):
+    """Two tenants can share a login string; the bulk delete is scoped by ISP."""
+    mine, theirs = _isp('mine'), _isp('theirs')
+    my_plan, their_plan = _plan(mine), _plan(theirs)
+    _usage(_customer(mine, my_plan, 'shared'), 2)
+    _customer(theirs, their_plan, 'shared')
+    db.session.commit()
+
+    fup.apply_fup_enforcement(isp_id=mine.id, kick=False)
+
+    theirs_rate = RadReply.query.filter_by(
+        username='shared', isp_id=theirs.id, attribute='Mikrotik-Rate-Limit'
+    ).one()
+    assert theirs_rate.value == '10M/10M'
+
+
+def test_kicks_reach_only_the_routers_holding_a_session(app, monkeypatch):
+    from models import MikrotikDevice
+    from services import device_config_ops, hotspot_disconnect
+
+    isp = _isp('acme')
+    plan = _plan(isp)
+    for login, nas_ip in (('a', '10.0.0.1'), ('b', '10.0.0.1'), ('c', '10.0.0.2')):
+        _usage(_customer(isp, plan, login), 2, nas_ip=nas_ip)
+    for n in range(1, 4):
+        db.session.add(MikrotikDevice(
+            username='admin', password='x', device_name=f'r{n}', device_ip=f'10.0.0.{n}',
+            device_model='hEX', location='site', isp_id=isp.id, is_active=True,
+        ))
+    db.session.commit()
+
+    calls = []
+
+    def fake_run(config, usernames):
+        calls.append((config.host, list(usernames)))
+        return True, None
+
+    monkeypatch.setattr(device_config_ops, '_api_failed_at', {})
+    # No router here offers the API, so every kick goes over SSH.
+    monkeypatch.setattr(hotspot_disconnect, '_run_api_kicks',
+                        lambda jobs: {job[0]: 'connection refused' for job in jobs})
+    monkeypatch.setattr(hotspot_disconnect, '_run_kicks', fake_run)
+
+    result = fup.apply_fup_enforcement()
+
+    assert sorted(calls) == [('10.0.0.1', ['a', 'b']), ('10.0.0.2', ['c'])]
+    assert (result['routers_kicked'], result['routers_total']) == (2, 2)
@@ -0,0 +1,132 @@
+"""Tests for bulk invoicing.
+
+Month-end billing must produce exactly one invoice (and line item) per valid
+customer, never bill another tenant's customer, and number invoices
+sequentially per tenant without gaps or collisions across chunks and runs.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import Customer, ISP, Invoice, InvoiceItem, InvoiceRun, ServicePlan  # noqa: E402
+from services import commit_stamps  # noqa: E402
+from services import invoice_batch as batch  # noqa: E402
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_stamps, '_STAMP_DIR', str(tmp_path))
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _customers(isp, count):
+    customers = [Customer(full_name=f'{isp.slug}-{n}', phone='0700', package='Home',
+                          isp_id=isp.id) for n in range(count)]
+    db.session.add_all(customers)
+    db.session.flush()
+    return [c.id for c in customers]
+
+
+def _run(isp_id, requested, plan=None):
+    run = InvoiceRun(isp_id=isp_id, amount=1500, requested=requested, billing_cycle='monthly',
+                     due_date=datetime.utcnow() + timedelta(days=30),
+                     service_plan_id=plan.id if plan else None)
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def test_one_numbered_invoice_and_item_per_valid_customer(app):
+    mine, theirs = _isp('mine'), _isp('theirs')
+    plan = ServicePlan(name='Home 10', speed='10 Mbps', price=1500, plan_type='pppoe',
+                       features={}, isp_id=mine.id)
+    db.session.add(plan)
+    ids = _customers(mine, 5)
+    foreign = _customers(theirs, 1)
+    db.session.commit()
+
+    requested = ids + [ids[0], foreign[0], 999_999, 'junk']
+    run = _run(mine.id, len(requested), plan)
+    batch.run_invoice_batch(run.id, requested, chunk_size=2)
+
+    run = db.session.get(InvoiceRun, run.id)
+    assert run.status == 'completed'
+    assert (run.created, run.skipped) == (5, 4)
+    assert float(run.total_amount) == 5 * 1500
+    assert (run.first_invoice_number, run.last_invoice_number) == (
+        f'INV-{mine.id}-000001', f'INV-{mine.id}-000005')
+    reasons = json.loads(run.summary)['skipped']
+    assert {r: v['count'] for r, v in reasons.items()} == {
+        'invalid': 1, 'duplicate': 1, 'not_found': 2}
+
+    invoices = Invoice.query.order_by(Invoice.id).all()
+    assert [i.customer_id for i in invoices] == ids
+    assert {i.isp_id for i in invoices} == {mine.id}
+    assert InvoiceItem.query.count() == 5
+    assert InvoiceItem.query.first().description == 'Home 10 (monthly)'
+
+
+def test_numbers_continue_across_runs_and_stay_per_tenant(app):
+    mine, theirs = _isp('mine'), _isp('theirs')
+    my_ids, their_ids = _customers(mine, 3), _customers(theirs, 2)
+    db.session.commit()
+
+    batch.run_invoice_batch(_run(mine.id, 3).id, my_ids)
+    # A platform admin run spanning both tenants.
+    batch.run_invoice_batch(_run(None, 5).id, my_ids + their_ids)
+
+    numbers = [n for (n,) in db.session.query(Invoice.invoice_number).order_by(Invoice.id)]
+    assert numbers == [f'INV-{mine.id}-{n:06d}' for n in range(1, 7)] + [
+        f'INV-{theirs.id}-{n:06d}' for n in (1, 2)]
+    assert db.session.get(ISP, mine.id).invoice_number_seq == 6
+
+
+def test_failed_chunk_gives_its_numbers_back(app, monkeypatch):
+    isp = _isp('acme')
+    ids = _customers(isp, 4)
+    db.session.commit()
+    real_insert = batch._insert_chunk
+    calls = []
+
+    def flaky(run, isp_id, chunk, description):
+        calls.append(chunk)
+        if len(calls) == 2:
+            batch.reserve_invoice_numbers(isp_id, len(chunk))
+            raise RuntimeError('connection lost')
+        return real_insert(run, isp_id, chunk, description)
+
+    monkeypatch.setattr(batch, '_insert_chunk', flaky)
+    run = batch.run_invoice_batch(_run(isp.id, 4).id, ids, chunk_size=2)
+
+    assert run.status == 'failed' and 'connection lost' in run.error
+    assert run.created == 2
+    assert db.session.get(ISP, isp.id).invoice_number_seq == 2
+    assert batch.next_invoice_number(isp.id) == f'INV-{isp.id}-000003'
@@ -0,0 +1,109 @@
+"""Tests for the leader-elected background job scheduler.
+
+Every worker runs a scheduler, so what matters is that only one of them starts
+jobs, that another takes over when it goes without rerunning what just ran,
+and that a job never overlaps itself. sqlite here, so the leases are the file
+locks; the PostgreSQL advisory locks follow the same acquire/held/release
+contract.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import JobRun  # noqa: E402
+from services import job_scheduler as scheduler  # noqa: E402
+from services.job_scheduler import Job, Scheduler  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+
+
+@pytest.fixture()
+def app(monkeypatch, tmp_path):
+    monkeypatch.setattr(scheduler, '_LOCK_DIR', str(tmp_path))
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        JOB_SCHEDULER_JITTER=0,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def test_only_the_lease_holder_runs_jobs_and_a_successor_picks_up(app):
+    calls = []
+    jobs = [Job('enforce-fup', lambda: calls.append('fup') or {'throttled': 2}, 300),
+            Job('sales-digest', lambda: calls.append('digest'), 900),
+            Job('poll-snmp', lambda: calls.append('snmp'), 0)]
+    workers = [Scheduler(app, jobs, threaded=False) for _ in range(4)]
+
+    started = [w.tick(NOW) for w in workers]
+    assert started[0] == ['enforce-fup', 'sales-digest']
+    assert started[1:] == [[], [], []]
+    assert calls == ['fup', 'digest']
+    assert workers[0].tick(NOW + timedelta(seconds=299)) == []
+    assert workers[0].tick(NOW + timedelta(seconds=300)) == ['enforce-fup']
+
+    # The leader goes away; the next worker to tick takes the lease and plans
+    # from the recorded runs instead of firing everything again.
+    workers[0].stop()
+    runs = JobRun.query.order_by(JobRun.id).all()
+    for run in runs:
+        run.started_at = NOW + timedelta(seconds=300 if run.id == runs[-1].id else 0)
+    db.session.commit()
+    assert workers[2].tick(NOW + timedelta(seconds=301)) == []
+    assert workers[1].tick(NOW + timedelta(seconds=302)) == []
+    assert workers[2].tick(NOW + timedelta(seconds=850)) == ['enforce-fup']
+    assert workers[2].tick(NOW + timedelta(seconds=900)) == ['sales-digest']
+    assert calls == ['fup', 'digest', 'fup', 'fup', 'digest']
+    assert runs[0].status == 'completed' and runs[0].result == '{"throttled": 2}'
+
+
+def test_a_job_never_overlaps_itself_and_failures_are_recorded(app):
+    def explode():
+        raise RuntimeError('router unreachable')
+
+    job = Job('enforce-expiry', explode, 60)
+    stale = JobRun(job='enforce-expiry', status='running', started_at=NOW - timedelta(hours=1))
+    db.session.add(stale)
+    db.session.commit()
+
+    # Another run (a cron `flask run-job`, say) holds the job's lock.
+    with scheduler.job_lock('enforce-expiry') as held:
+        assert held
+        assert scheduler.run_job(job) is None
+    assert JobRun.query.count() == 1
+
+    run = scheduler.run_job(job)
+    assert run.status == 'failed' and run.error == 'RuntimeError: router unreachable'
+    assert run.duration_ms is not None and run.finished_at is not None
+    # Nothing else could have held the lock, so the old row's worker is gone.
+    assert db.session.get(JobRun, stale.id).status == 'abandoned'
+
+
+def test_status_reports_last_run_and_durations(app):
+    job = Job('sync-wireguard-stats', lambda: None, 60)
+    for n, (status, ms) in enumerate([('completed', 100), ('completed', 300), ('failed', 50)]):
+        db.session.add(JobRun(job=job.name, status=status, duration_ms=ms, host='api-1:7',
+                              started_at=NOW + timedelta(minutes=n),
+                              error='OSError: wg missing' if status == 'failed' else None))
+    db.session.commit()
+
+    [row] = scheduler.job_status([job])
+    assert row['last_status'] == 'failed' and row['last_error'] == 'OSError: wg missing'
+    assert row['last_duration_ms'] == 50
+    assert (row['mean_duration_ms'], row['max_duration_ms'], row['recent_failures']) == (200, 300, 1)
+    assert scheduler.job_status([Job('purge-retention', None, 0)])[0]['last_status'] is None
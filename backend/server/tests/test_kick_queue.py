@@ -0,0 +1,204 @@
+"""Tests for the batched session-kick queue.
+
+A midnight expiry sweep used to log in to every router once per suspended
+subscriber. The queue must contact only the routers radacct says a login is
+on, each of them exactly once, and still reach a session it cannot place.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import socket
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from fake_routeros import FakeRouterOS  # noqa: E402
+from models import (  # noqa: E402
+    Customer, CustomerStatus, ISP, MikrotikDevice, RadAcct, RadCheck,
+)
+from services import device_config_ops, hotspot_disconnect  # noqa: E402
+from services.hotspot_disconnect import KickQueue  # noqa: E402
+
+_RUN_API_KICKS = hotspot_disconnect._run_api_kicks
+
+
+@pytest.fixture()
+def app(monkeypatch):
+    monkeypatch.setattr(device_config_ops, '_api_failed_at', {})
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        SECRET_KEY='test',
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def kicks(monkeypatch):
+    """Record (router host, usernames) instead of opening SSH sessions."""
+    calls = []
+
+    def fake_run(config, usernames):
+        calls.append((config.host, list(usernames)))
+        return True, None
+
+    monkeypatch.setattr(hotspot_disconnect, '_run_kicks', fake_run)
+    # Routers here offer no API, so every kick goes over SSH.
+    monkeypatch.setattr(hotspot_disconnect, '_run_api_kicks',
+                        lambda jobs: {job[0]: 'connection refused' for job in jobs})
+    return calls
+
+
+def _isp(slug='acme'):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _router(isp, ip, wg_ip=None):
+    device = MikrotikDevice(username='admin', password='x', device_name=f'r-{ip}',
+                            device_ip=ip, device_model='hEX', location='site',
+                            isp_id=isp.id, is_active=True, management_wg_ip=wg_ip)
+    db.session.add(device)
+    db.session.flush()
+    return device
+
+
+_ids = iter(range(1, 10_000))
+
+
+def _session(isp, username, nas_ip, device=None, closed=False):
+    now = datetime.now()
+    db.session.add(RadAcct(
+        radacctid=next(_ids), acctsessionid='s', acctuniqueid=f'u{next(_ids)}',
+        username=username, nasipaddress=nas_ip, acctstarttime=now - timedelta(hours=1),
+        acctstoptime=now if closed else None, isp_id=isp.id,
+        mikrotik_device_id=device.id if device else None,
+    ))
+    db.session.flush()
+
+
+def test_only_routers_carrying_the_session_are_contacted(app, kicks):
+    isp = _isp()
+    r1 = _router(isp, '192.0.2.1')
+    r2 = _router(isp, '192.0.2.2', wg_ip='10.99.0.2/32')
+    _router(isp, '192.0.2.3')
+    _session(isp, 'alice', '192.0.2.1', device=r1)
+    _session(isp, 'bob', '10.99.0.2')        # matched by tunnel address
+    _session(isp, 'carol', '192.0.2.1', closed=True)
+    db.session.commit()
+
+    queue = KickQueue()
+    for login in ('alice', 'bob', 'carol'):
+        queue.add(login, isp.id)
+    report = queue.flush()
+
+    assert sorted(kicks) == [('192.0.2.1', ['alice']), ('192.0.2.2', ['bob'])]
+    assert report['usernames'] == 3 and report['without_session'] == 1
+    assert {r['device_id'] for r in report['routers']} == {r1.id, r2.id}
+    assert all(r['ok'] and r['latency_ms'] is not None for r in report['routers'])
+    assert len(queue) == 0
+
+
+def test_unplaceable_session_falls_back_to_every_router(app, kicks):
+    isp = _isp()
+    _router(isp, '192.0.2.1')
+    _router(isp, '192.0.2.2')
+    _session(isp, 'dave', '203.0.113.9')
+    db.session.commit()
+
+    queue = KickQueue()
+    queue.add('dave', isp.id)
+    queue.flush()
+
+    assert sorted(host for host, _names in kicks) == ['192.0.2.1', '192.0.2.2']
+
+
+def test_many_logins_share_one_login_per_router():
+    names = [f'user{n}' for n in range(120)] + ['qu"o$te']
+    scripts = list(hotspot_disconnect._kick_scripts(names))
+
+    assert len(scripts) == 3
+    assert all(s.startswith(':foreach u in={') for s in scripts)
+    assert '"qu\\"o\\$te"' in scripts[-1]
+
+
+def test_expiry_sweep_kicks_once_per_router_after_commit(app, monkeypatch):
+    from services.subscription_expiry import enforce_expired_subscriptions
+
+    isp = _isp()
+    _router(isp, '192.0.2.1')
+    expired = datetime.utcnow() - timedelta(days=1)
+    for login in ('alice', 'bob'):
+        db.session.add(Customer(full_name=login, phone='0700', package='Home',
+                                radius_login=login, isp_id=isp.id,
+                                subscription_end=expired))
+        db.session.add(RadCheck(username=login, attribute='Cleartext-Password', op=':=',
+                                value='pw', isp_id=isp.id))
+        _session(isp, login, '192.0.2.1')
+    db.session.commit()
+
+    seen = []
+    real_route = KickQueue.route
+
+    def route_after_commit(queue):
+        # The radcheck rows must already be gone, or the re-auth succeeds.
+        assert RadCheck.query.count() == 0
+        return real_route(queue)
+
+    monkeypatch.setattr(KickQueue, 'route', route_after_commit)
+    monkeypatch.setattr(hotspot_disconnect, '_run_kicks',
+                        lambda config, usernames: (seen.append(sorted(usernames)), (True, None))[1])
+    monkeypatch.setattr(hotspot_disconnect, '_run_api_kicks',
+                        lambda jobs: {job[0]: 'connection refused' for job in jobs})
+
+    assert enforce_expired_subscriptions() == 2
+    assert seen == [['alice', 'bob']]
+    assert {c.status for c in Customer.query.all()} == {CustomerStatus.SUSPENDED}
+
+
+def test_api_routers_are_kicked_over_the_api_and_failures_fall_back(app, kicks, monkeypatch):
+    monkeypatch.setattr(hotspot_disconnect, '_run_api_kicks', _RUN_API_KICKS)
+    fake = FakeRouterOS(password='x', tables={
+        '/ppp/active': [{'name': 'alice'}], '/ip/hotspot/active': [{'user': 'bob'}],
+    }).start()
+    try:
+        isp = _isp()
+        on_api = _router(isp, '127.0.0.1')
+        on_api.api_port = fake.port
+        ssh_only = _router(isp, '192.0.2.2')
+        ssh_only.connection_type = 'ssh'
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            dead_port = sock.getsockname()[1]
+        api_down = _router(isp, '192.0.2.3')
+        api_down.api_port = dead_port
+        api_down.management_wg_enabled, api_down.management_wg_ip = True, '127.0.0.1'
+        db.session.commit()
+
+        targets = [(on_api, ['alice', 'bob']), (ssh_only, ['carol']), (api_down, ['dave'])]
+        report = hotspot_disconnect.kick_on_routers(targets)
+    finally:
+        fake.stop()
+
+    via = {r['device_id']: (r['via'], r['ok']) for r in report}
+    assert via == {on_api.id: ('api', True), ssh_only.id: ('ssh', True),
+                   api_down.id: ('ssh', True)}
+    assert fake.tables['/ppp/active'] == [] and fake.tables['/ip/hotspot/active'] == []
+    assert sorted(kicks) == [('127.0.0.1', ['dave']), ('192.0.2.2', ['carol'])]
+    # The router whose API failed goes straight to SSH next time.
+    assert not device_config_ops._api_preferred(api_down)
@@ -0,0 +1,153 @@
+"""Tests for downsampled per-device metric series.
+
+Points land in 1-minute buckets, age into 5-minute and then hourly ones, and
+a range query must return the same min/avg/max whichever tiers hold it.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import MetricBucket  # noqa: E402
+from services import metric_series  # noqa: E402
+from services.metric_series import (  # noqa: E402
+    FIVE_MINUTES, HOUR, MINUTE, SOURCE_ROUTER, SOURCE_SNMP, downsample, query_series, record_points,
+)
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+        METRIC_MINUTE_RETENTION_HOURS=2,
+        METRIC_5MIN_RETENTION_DAYS=1,
+        METRIC_HOURLY_RETENTION_DAYS=30,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+START = datetime(2026, 10, 1, 0, 0)
+
+
+def _record_every_minute(hours, value=lambda minute: minute % 60):
+    for minute in range(hours * 60):
+        at = START + timedelta(minutes=minute, seconds=10)
+        record_points(SOURCE_ROUTER, 1, {'cpu_load': value(minute), 'client_count': None}, at=at)
+        # A second writer in the same minute merges into the same bucket.
+        record_points(SOURCE_ROUTER, 1, {'cpu_load': 100}, at=at + timedelta(seconds=30))
+    db.session.commit()
+
+
+def _totals():
+    return db.session.query(
+        db.func.sum(MetricBucket.count), db.func.sum(MetricBucket.sum),
+        db.func.min(MetricBucket.min), db.func.max(MetricBucket.max)).one()
+
+
+def test_points_in_one_minute_merge_into_one_bucket(app):
+    _record_every_minute(1)
+    buckets = MetricBucket.query.order_by(MetricBucket.bucket_start).all()
+    assert len(buckets) == 60
+    first = buckets[0]
+    assert (first.resolution, first.bucket_start) == (MINUTE, START)
+    assert (first.count, first.sum, first.min, first.max) == (2, 100.0, 0.0, 100.0)
+    assert metric_series.list_metrics(SOURCE_ROUTER, 1) == ['cpu_load']
+
+
+def test_downsampling_folds_tiers_exactly_and_prunes(app):
+    _record_every_minute(6)
+    before = _totals()
+
+    # Six hours later the oldest four hours pass the 2-hour minute retention.
+    now = START + timedelta(hours=6)
+    assert downsample(now=now, dry_run=True) == {'folded': 4 * 60, 'pruned': 0}
+    assert downsample(now=now) == {'folded': 4 * 60, 'pruned': 0}
+    by_resolution = dict(db.session.query(MetricBucket.resolution, db.func.count())
+                         .group_by(MetricBucket.resolution))
+    assert by_resolution == {MINUTE: 2 * 60, FIVE_MINUTES: 4 * 12}
+    assert _totals() == before
+
+    # Two days on, everything is hourly; after the hourly retention, gone.
+    assert downsample(now=now + timedelta(days=2))['folded'] == 2 * 60 + 6 * 12
+    assert {r for (r,) in db.session.query(MetricBucket.resolution).distinct()} == {HOUR}
+    assert MetricBucket.query.count() == 6
+    assert _totals() == before
+    assert downsample(now=now + timedelta(days=31)) == {'folded': 0, 'pruned': 6}
+
+
+def test_range_query_reads_across_tiers(app):
+    _record_every_minute(6)
+    now = START + timedelta(hours=6)
+    exact = query_series(SOURCE_ROUTER, 1, 'cpu_load', START, now, max_points=6, now=now)
+    downsample(now=now)
+
+    series = query_series(SOURCE_ROUTER, 1, 'cpu_load', START, now, max_points=6, now=now)
+    assert series['step_seconds'] == HOUR
+    assert series == exact
+    hour = series['points'][0]
+    assert (hour['count'], hour['min'], hour['max']) == (120, 0.0, 100.0)
+    assert hour['avg'] == pytest.approx((sum(range(60)) + 60 * 100) / 120)
+
+    # A recent range still reads at minute resolution.
+    recent = query_series(SOURCE_ROUTER, 1, 'cpu_load', now - timedelta(minutes=30), now, now=now)
+    assert recent['step_seconds'] == MINUTE and len(recent['points']) == 30
+
+
+def test_series_request_lists_metrics_and_rejects_empty_ranges(app):
+    record_points(SOURCE_SNMP, 7, {'response_ms': 3.5}, at=START)
+    db.session.commit()
+    assert metric_series.series_request(SOURCE_SNMP, 7, {}) == {'metrics': ['response_ms']}
+    data = metric_series.series_request(SOURCE_SNMP, 7, {
+        'metric': 'response_ms', 'from': '2026-09-30T23:00:00Z', 'to': '2026-10-01T01:00:00Z',
+    }, now=START + timedelta(hours=1))
+    assert [p['avg'] for p in data['points']] == [3.5]
+    with pytest.raises(ValueError):
+        metric_series.series_request(SOURCE_SNMP, 7, {
+            'metric': 'response_ms', 'from': '2026-10-02T00:00:00', 'to': '2026-10-01T00:00:00'})
+
+
+def test_snmp_polls_record_latency_and_interface_rates(app):
+    pytest.importorskip('pysnmp')
+    from pysnmp.proto import rfc1902
+
+    from fake_snmp import FakeSnmpAgent, if_table
+    from models import SnmpDevice
+    from services import snmp_poller
+
+    mib = if_table([(1, 'ether1', 2 ** 32 - 1000, 5000), (2, 'ether2', 900, 0)])
+    agent = FakeSnmpAgent(mib).start()
+    try:
+        device = SnmpDevice(name='core', host='127.0.0.1', port=agent.port, snmp_version='2c',
+                            community='public', timeout=1, retries=0, poll_interval=60)
+        db.session.add(device)
+        db.session.commit()
+        snmp_poller.poll_due_devices(now=START)
+        # ether1 in wraps past 2**32; ether2 in resets (a reboot), so no rate.
+        agent.mib[rfc1902.ObjectName('1.3.6.1.2.1.2.2.1.10.1')] = rfc1902.Counter32(6500)
+        agent.mib[rfc1902.ObjectName('1.3.6.1.2.1.2.2.1.16.1')] = rfc1902.Counter32(12500)
+        agent.mib[rfc1902.ObjectName('1.3.6.1.2.1.2.2.1.10.2')] = rfc1902.Counter32(100)
+        snmp_poller.poll_due_devices(now=START + timedelta(seconds=60))
+    finally:
+        agent.stop()
+
+    metrics = metric_series.list_metrics(SOURCE_SNMP, device.id)
+    assert metrics == ['if.1.in_bps', 'if.1.out_bps', 'if.2.out_bps', 'response_ms']
+    rate = MetricBucket.query.filter_by(metric='if.1.in_bps').one()
+    assert (rate.count, rate.sum) == (1, 7500 * 8 / 60)
+    latency = MetricBucket.query.filter_by(metric='response_ms').order_by(MetricBucket.bucket_start)
+    assert [b.bucket_start for b in latency] == [START, START + timedelta(minutes=1)]
@@ -0,0 +1,68 @@
+"""Tests for radacct's monthly partition bookkeeping.
+
+The DDL itself only runs on PostgreSQL; what can go wrong anywhere is the
+month arithmetic — a partition missing for the month accounting is about to
+write into, or a month still in use being handed to the archive — and the
+index definitions read back from the catalog being rewritten for the new
+table.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from services import radacct_partitions as parts  # noqa: E402
+
+
+def test_months_are_created_ahead_and_gaps_filled():
+    now = datetime(2026, 11, 17, 9, 30)
+    assert [parts.partition_name(m) for m in parts.missing_months([], now, 2)] == [
+        'radacct_p2026_11', 'radacct_p2026_12', 'radacct_p2027_01']
+    # Nothing ran for two months: the gap after the newest partition is filled.
+    existing = ['radacct_pdefault', 'radacct_p2026_07', 'radacct_p2026_08']
+    assert [f'{m:%Y-%m}' for m in parts.missing_months(existing, now, 1)] == [
+        '2026-09', '2026-10', '2026-11', '2026-12']
+    assert parts.missing_months(existing + ['radacct_p2026_09', 'radacct_p2026_10',
+                                            'radacct_p2026_11', 'radacct_p2026_12'], now, 1) == []
+
+
+def test_only_whole_months_past_the_hot_window_are_archivable():
+    existing = ['radacct_pdefault'] + [f'radacct_p2026_{m:02d}' for m in range(1, 13)]
+    now = datetime(2026, 10, 1)
+    assert parts.archivable(existing, now, 0) == []
+    assert parts.archivable(existing, now, 6) == [f'radacct_p2026_{m:02d}' for m in range(1, 4)]
+    assert parts.partition_month('radacct_pdefault') is None
+    assert parts.add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+
+
+def test_catalog_index_definitions_are_moved_to_the_new_table():
+    ddl = ('CREATE INDEX ix_radacct_open_isp_nas ON public.radacct USING btree '
+           '(isp_id, nasipaddress, acctupdatetime) WHERE (acctstoptime IS NULL)')
+    assert parts._rename_index_ddl(ddl, '_p', 'radacct_partitioned') == (
+        'CREATE INDEX IF NOT EXISTS ix_radacct_open_isp_nas_p ON radacct_partitioned USING btree '
+        '(isp_id, nasipaddress, acctupdatetime) WHERE (acctstoptime IS NULL)')
+    unique = 'CREATE UNIQUE INDEX radacct_acctuniqueid_key ON public.radacct USING btree (acctuniqueid)'
+    assert parts._rename_index_ddl(unique, '_p', 'radacct_partitioned') == (
+        'CREATE UNIQUE INDEX IF NOT EXISTS radacct_acctuniqueid_key_p ON radacct_partitioned '
+        'USING btree (acctuniqueid, acctstarttime)')
+    with pytest.raises(ValueError):
+        parts._rename_index_ddl('CREATE INDEX "odd; name" ON public.radacct (x)', '_p', 't')
+    with pytest.raises(ValueError):
+        parts._rename_index_ddl('CREATE UNIQUE INDEX u ON public.radacct USING btree (lower(username))', '_p', 't')
+
+
+def test_everything_is_a_no_op_off_postgres():
+    application = Flask(__name__)
+    application.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///:memory:', RADACCT_HOT_MONTHS=1)
+    db.init_app(application)
+    with application.app_context():
+        assert parts.ensure_partitions() == []
+        assert parts.archive_partitions() == {'archived': [], 'kept_open': [], 'dropped': []}
+        assert parts.migrate_to_partitioned(echo=lambda _msg: None) is None
@@ -0,0 +1,181 @@
+"""Tests for the cached fallback RADIUS auth path.
+
+A repeated Access-Request should cost no lookups beyond recording the
+session, but a cache must never let a suspended customer, a changed password
+or a retired router keep authenticating.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import Customer, CustomerStatus, ISP, MikrotikDevice  # noqa: E402
+from routes.radius_api import radius_api_bp  # noqa: E402
+from services import commit_stamps  # noqa: E402
+from services import radius_auth_cache as cache  # noqa: E402
+from services.radius_provisioning import set_customer_radius_password  # noqa: E402
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(commit_stamps, '_STAMP_DIR', str(tmp_path))
+    monkeypatch.setattr(cache, '_seen_stamp', [0.0])
+    # Stamps are written moments before the first lookup here.
+    monkeypatch.setattr(cache, '_CLOCK_SLACK', 0.0)
+    cache.clear_radius_auth_cache()
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    application.register_blueprint(radius_api_bp)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+    cache.clear_radius_auth_cache()
+
+
+@pytest.fixture()
+def tenant(app):
+    isp = ISP(name='acme', company_name='acme', email='acme@example.com',
+              slug='acme', api_key='key_acme')
+    db.session.add(isp)
+    db.session.flush()
+    router = MikrotikDevice(username='admin', password='x', device_name='core',
+                            device_ip='192.0.2.1', device_model='hEX', location='site',
+                            isp_id=isp.id, is_active=True)
+    customer = Customer(full_name='Alice', phone='0700', package='Home', radius_login='Alice',
+                        isp_id=isp.id, status=CustomerStatus.ACTIVE)
+    set_customer_radius_password(customer, 'pw-1')
+    db.session.add_all([router, customer])
+    db.session.commit()
+    return isp, router, customer
+
+
+def _auth(app, username='alice', password='pw-1', nas_ip='192.0.2.1'):
+    response = app.test_client().post('/api/radius-api/auth', json={
+        'username': username, 'password': password, 'nas_ip': nas_ip,
+    })
+    return response.status_code, response.get_json()
+
+
+def _selects(app):
+    seen = []
+
+    def _record(_conn, _cursor, statement, *_args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            seen.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', _record)
+    return seen
+
+
+def test_repeat_auth_reads_nothing_but_records_the_session(app, tenant):
+    assert _auth(app)[0] == 200
+
+    selects = _selects(app)
+    status, body = _auth(app)
+
+    assert status == 200
+    assert body['data']['customer_name'] == 'Alice'
+    assert body['data']['device_name'] == 'core'
+    assert selects == []
+
+
+def test_suspension_and_password_change_take_effect_immediately(app, tenant):
+    _isp, _router, customer = tenant
+    assert _auth(app)[0] == 200
+
+    set_customer_radius_password(customer, 'pw-2')
+    db.session.commit()
+    assert _auth(app)[1]['code'] == 'INVALID_PASSWORD'
+    assert _auth(app, password='pw-2')[0] == 200
+
+    customer.status = CustomerStatus.SUSPENDED
+    db.session.commit()
+    assert _auth(app, password='pw-2')[1]['code'] == 'CUSTOMER_INACTIVE'
+
+
+def test_router_and_customer_changes_reach_cached_negatives(app, tenant):
+    isp, router, _customer = tenant
+    assert _auth(app, nas_ip='192.0.2.9')[1]['code'] == 'DEVICE_NOT_FOUND'
+    assert _auth(app, username='bob')[1]['code'] == 'USER_NOT_FOUND'
+
+    router.device_ip = '192.0.2.9'
+    bob = Customer(full_name='Bob', phone='0711', package='Home', radius_login='bob',
+                   isp_id=isp.id, status=CustomerStatus.ACTIVE)
+    set_customer_radius_password(bob, 'pw-b')
+    db.session.add(bob)
+    db.session.commit()
+
+    assert _auth(app, nas_ip='192.0.2.9')[0] == 200
+    assert _auth(app, username='bob', password='pw-b', nas_ip='192.0.2.9')[0] == 200
+
+
+def test_another_workers_commit_is_seen_through_the_stamp(app, tenant):
+    assert _auth(app)[0] == 200
+    _isp, _router, customer = tenant
+    # Simulate the write landing in a different process: change the row
+    # behind the cache's back, then touch the shared stamp only.
+    db.session.execute(db.update(Customer).where(Customer.id == customer.id)
+                       .values(status=CustomerStatus.SUSPENDED))
+    db.session.commit()
+    assert _auth(app)[0] == 200  # bulk statement: no ORM event, still cached
+
+    stamp = commit_stamps.stamp_path(cache._STAMP_NAME)
+    open(stamp, 'a').close()
+    os.utime(stamp, (cache._seen_stamp[0] + 5, cache._seen_stamp[0] + 5))
+
+    assert _auth(app)[1]['code'] == 'CUSTOMER_INACTIVE'
+
+
+def test_unrelated_commits_keep_the_cache_warm(app, tenant):
+    isp, router, customer = tenant
+    other = ISP(name='other', company_name='other', email='other@example.com',
+                slug='other', api_key='key_other')
+    db.session.add(other)
+    db.session.commit()
+    assert _auth(app)[0] == 200
+
+    # Router sync status and a rename of another tenant: not auth changes here.
+    router.cpu_load = 42.0
+    router.notes = 'rack 3'
+    other.name = 'Other Networks'
+    customer.phone = '0799'
+    db.session.commit()
+
+    selects = _selects(app)
+    assert _auth(app)[0] == 200
+    assert selects == []
+
+    other.radius_secret = 'rotated'
+    db.session.commit()
+    selects.clear()  # the test's own reload of the expired row
+    assert _auth(app)[0] == 200
+    assert selects == []
+
+
+def test_moving_a_customer_drops_the_old_tenants_entry(app, tenant):
+    isp, _router, customer = tenant
+    other = ISP(name='other', company_name='other', email='other@example.com',
+                slug='other', api_key='key_other')
+    db.session.add(other)
+    db.session.commit()
+    assert _auth(app)[0] == 200
+
+    customer.isp_id = other.id
+    db.session.commit()
+
+    # The login now belongs to a tenant with no router at this NAS.
+    assert _auth(app)[1]['code'] == 'DEVICE_NOT_FOUND'
@@ -0,0 +1,98 @@
+"""Tests for clients.conf regeneration.
+
+Every write restarts radiusd (the freeradius entrypoint watches the mtime), so
+an unchanged client list must not touch the file, and a burst of sync
+requests must collapse into one regeneration.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import errno
+import os
+import sys
+import time
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import RadiusClient  # noqa: E402
+from services import radius_clients_export as export  # noqa: E402
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('RADIUS_CLIENTS_CONF_PATH', str(tmp_path / 'clients.conf'))
+    monkeypatch.setattr(export, '_metrics', export.Counter())
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _client(name, host):
+    db.session.add(RadiusClient(name=name, host=host, secret='s3cret', is_active=True))
+    db.session.commit()
+
+
+def test_unchanged_clients_are_not_rewritten(app, tmp_path):
+    path = str(tmp_path / 'clients.conf')
+    _client('core', '10.0.0.1')
+    export.sync_radius_clients_conf()
+    first = open(path).read()
+    mtime = os.stat(path).st_mtime_ns
+    assert 'ipaddr = 10.0.0.1' in first
+
+    time.sleep(0.01)
+    export.sync_radius_clients_conf()
+    assert os.stat(path).st_mtime_ns == mtime
+
+    _client('edge', '10.0.0.2')
+    export.sync_radius_clients_conf()
+    assert 'ipaddr = 10.0.0.2' in open(path).read()
+    export.sync_radius_clients_conf(force=True)
+
+    metrics = export.clients_conf_metrics()
+    assert (metrics['generations'], metrics['skipped_unchanged'], metrics['writes']) == (4, 1, 3)
+    assert metrics['content_hash'] in open(path).read()
+    assert not [n for n in os.listdir(tmp_path) if n.startswith('.clients.conf.')]
+
+
+def test_burst_of_requests_coalesces_into_one_regeneration(app, tmp_path):
+    _client('core', '10.0.0.1')
+    for _ in range(5):
+        export.request_radius_clients_sync(app, delay=0.2)
+    assert export.clients_conf_metrics()['pending']
+    deadline = time.time() + 5
+    while export.clients_conf_metrics()['pending'] and time.time() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.1)
+
+    metrics = export.clients_conf_metrics()
+    assert (metrics['requests'], metrics['coalesced']) == (5, 4)
+    assert (metrics['generations'], metrics['writes']) == (1, 1)
+    assert os.path.exists(tmp_path / 'clients.conf')
+
+
+def test_bind_mounted_file_is_written_in_place(app, tmp_path, monkeypatch):
+    path = tmp_path / 'clients.conf'
+    path.write_text('old\n')
+    inode = os.stat(path).st_ino
+
+    def busy(_src, _dst):
+        raise OSError(errno.EBUSY, 'Device or resource busy')
+
+    monkeypatch.setattr(export.os, 'replace', busy)
+    export.sync_radius_clients_conf()
+    assert os.stat(path).st_ino == inode
+    assert 'client localhost' in path.read_text()
+    assert sorted(os.listdir(tmp_path)) == ['clients.conf']
@@ -0,0 +1,71 @@
+"""Tests for the sliding-window rate limiter and its backends.
+
+The limit has to hold across workers (the SQLite store), memory has to stay
+bounded however many clients show up (the in-process store), and the
+two-window estimate has to let a client back in as its burst slides out of
+the window.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import rate_limit  # noqa: E402
+from services.rate_limit import MemoryBackend, SqliteBackend  # noqa: E402
+
+T0 = 1_800_000_000.0  # a multiple of 60: the start of a window
+
+
+@pytest.fixture()
+def app(monkeypatch, tmp_path):
+    monkeypatch.setattr(rate_limit, '_backends', {})
+    application = Flask(__name__)
+    application.config.update(RATE_LIMIT_BACKEND='sqlite',
+                              RATE_LIMIT_SQLITE_PATH=str(tmp_path / 'limits.sqlite3'))
+    with application.app_context():
+        yield application
+
+
+def test_burst_slides_out_of_the_window():
+    backend = MemoryBackend()
+    hits = [backend.hit('login|1.2.3.4', 'login', 5, 60, T0 + n) for n in range(6)]
+    assert hits == [False] * 5 + [True]
+    # 45 s into the next window a quarter of the last one still overlaps:
+    # 6 * 0.25 + 1 = 2.5 hits, well under the limit.
+    assert backend.hit('login|1.2.3.4', 'login', 5, 60, T0 + 105) is False
+    # Two windows on, nothing is left of the burst.
+    assert backend.hit('login|1.2.3.4', 'login', 1, 60, T0 + 240) is False
+    assert backend.stats() == {'login': {'hits': 8, 'denied': 1}}
+
+
+def test_memory_backend_is_bounded():
+    backend = MemoryBackend(max_keys=100)
+    for n in range(1000):
+        backend.hit(f'portal|10.0.{n // 256}.{n % 256}', 'portal', 5, 60, T0)
+    assert len(backend) == 100
+    # The newest client kept its count; the oldest was forgotten.
+    assert backend.hit('portal|10.0.3.231', 'portal', 1, 60, T0) is True
+    assert backend.hit('portal|10.0.0.0', 'portal', 1, 60, T0) is False
+
+
+def test_sqlite_limit_holds_across_workers(app, tmp_path):
+    workers = [SqliteBackend(str(tmp_path / 'limits.sqlite3')) for _ in range(4)]
+    outcomes = [workers[n % 4].hit('provision-ip|5.6.7.8', 'provision-ip', 10, 60, T0 + n)
+                for n in range(20)]
+    assert outcomes == [False] * 10 + [True] * 10
+    assert workers[0].hit('provision-ip|5.6.7.8', 'provision-ip', 10, 60, T0 + 150) is False
+
+    # The module-level API reads the same store through the app's config.
+    assert rate_limit.is_rate_limited('provision-ip|5.6.7.8', 10, 60, now=T0 + 151) is False
+    assert rate_limit.stats() == {'provision-ip': {'hits': 22, 'denied': 10}}
+
+
+def test_unusable_store_falls_back_to_process_counters(app, tmp_path):
+    app.config['RATE_LIMIT_SQLITE_PATH'] = str(tmp_path / 'missing' / 'limits.sqlite3')
+    assert [rate_limit.is_rate_limited('cwmp-ip|9.9.9.9', 1, 60, now=T0) for _ in range(2)] == [
+        False, True]
@@ -8,6 +8,7 @@ export taken without ``show-sensitive``.
 
 Run: backend/.venv/bin/python -m pytest backend/server/tests -q
 """
+import io
 import os
 import sys
 
@@ -147,6 +148,20 @@ def test_export_profiles_and_pools():
     assert sections['pools'][0]['ranges'] == '10.20.0.10-10.20.3.254'
 
 
+def test_export_streams_identically_from_any_read_size():
+    expected = parser.export_to_sections(EXPORT_V6)
+    raw = ('\ufeff' + EXPORT_V6.replace('\n', '\r\n')).encode('utf-8')
+
+    class TinyReads(io.BytesIO):
+        def read(self, size=-1):
+            return super().read(min(size, 7) if size else size)
+
+    assert parser.export_to_sections(TinyReads(raw)) == expected
+    assert parser.export_to_sections(raw[i:i + 3] for i in range(0, len(raw), 3)) == expected
+    assert next(parser.iter_export(io.StringIO(EXPORT_V6))) == (
+        '/ppp profile', {'name': 'default', '_verb': 'set', '_selector': 'find default=yes'})
+
+
 # --- profiles: the direction convention ----------------------------------
 
 def test_rate_limit_is_upload_first():
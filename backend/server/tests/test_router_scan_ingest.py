@@ -0,0 +1,116 @@
+"""Tests for the chunk store behind the agent and export transports.
+
+The agent cuts a menu wherever its buffer fills and may retry or reorder
+uploads; reading the chunks back must give exactly the records the router
+printed, and an upload must not rewrite what came before it. An uploaded
+export is kept the same way and must re-parse to the same inventory.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import io
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import ISP, ImportRun, ImportRunChunk  # noqa: E402
+from services.router_scan import parser, scan  # noqa: E402
+from test_router_scan import EXPORT_V6  # noqa: E402
+
+
+def _stream(count):
+    return ''.join(
+        f'#REC\r\nname=user{n}\r\npassword=pass {n}\r\nprofile=10M\r\n' for n in range(count)
+    )
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def run(app):
+    isp = ISP(name='acme', company_name='acme', email='acme@example.com',
+              slug='acme', api_key='key_acme')
+    db.session.add(isp)
+    db.session.flush()
+    record = ImportRun(isp_id=isp.id, source='router-agent')
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def test_stream_parse_matches_whole_text_at_any_split():
+    text = _stream(7)
+    expected = parser.parse_records(text)
+    for size in (1, 5, 13, 64, len(text)):
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        assert parser.parse_record_stream(pieces) == expected
+
+
+def test_out_of_order_and_retried_chunks_assemble_in_seq_order(run):
+    secrets_text = _stream(10)
+    # Cut mid-line, so records span chunk boundaries.
+    cuts = [secrets_text[i:i + 70] for i in range(0, len(secrets_text), 70)]
+    for seq in reversed(range(len(cuts))):
+        scan.ingest_agent_chunk(run, 'ppp_secrets', seq, cuts[seq])
+    scan.ingest_agent_chunk(run, 'ppp_secrets', 0, 'garbage from a bad upload')
+    scan.ingest_agent_chunk(run, 'ppp_secrets', 0, cuts[0])  # the retry
+    scan.ingest_agent_chunk(run, 'ppp_profiles', 0, '#REC\nname=10M\nrate-limit=5M/10M\n')
+    db.session.commit()
+
+    assert ImportRunChunk.query.filter_by(run_id=run.id).count() == len(cuts) + 1
+    assert run.raw_blob is None
+
+    sections = scan.assemble_agent_chunks(run)
+    assert sections['ppp_secrets'] == parser.parse_records(secrets_text)
+    assert [r['name'] for r in sections['ppp_secrets']] == [f'user{n}' for n in range(10)]
+    assert sections['ppp_profiles'] == [{'name': '10M', 'rate-limit': '5M/10M'}]
+
+
+def test_run_ingested_into_the_old_blob_still_rebuilds(run):
+    run.raw_blob = json.dumps({'_chunks': {
+        'ppp_secrets:1': _stream(2)[30:],
+        'ppp_secrets:0': _stream(2)[:30],
+        '__done__:0': '',
+    }})
+    db.session.commit()
+
+    sections = scan.assemble_agent_chunks(run)
+    assert list(sections) == ['ppp_secrets']
+    assert sections['ppp_secrets'] == parser.parse_records(_stream(2))
+
+
+def test_uploaded_export_is_stored_in_chunks_and_rebuilds(run, monkeypatch):
+    monkeypatch.setattr(parser, '_READ_SIZE', 100)
+    isp = run.isp
+    export_run, inventory = scan.scan_from_export(isp, None, io.BytesIO(EXPORT_V6.encode()))
+
+    chunks = ImportRunChunk.query.filter_by(run_id=export_run.id).count()
+    assert chunks == -(-len(EXPORT_V6) // 100)
+    assert export_run.raw_blob is None
+    assert inventory['counts']['total'] == 2
+
+    sections, rebuilt = scan.rebuild_inventory(export_run)
+    assert sections == parser.export_to_sections(EXPORT_V6)
+    assert rebuilt['counts'] == inventory['counts']
+
+    with pytest.raises(scan.EmptyExport):
+        scan.scan_from_export(isp, None, io.BytesIO(b'\n  \n'))
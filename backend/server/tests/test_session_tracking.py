@@ -0,0 +1,106 @@
+"""Tests for the online-session definition and the open-session index.
+
+radacct keeps every session ever run; "who is online" must be answered from
+the open ones alone. The partial index only helps if the online queries carry
+its ``acctstoptime IS NULL`` predicate, so the plan is checked along with the
+answer.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import Customer, ISP, RadAcct  # noqa: E402
+from services import session_tracking  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+
+_next_id = iter(range(1, 10_000))
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+def _isp(slug):
+    isp = ISP(name=slug, company_name=slug, email=f'{slug}@example.com',
+              slug=slug, api_key=f'key_{slug}')
+    db.session.add(isp)
+    db.session.flush()
+    return isp
+
+
+def _session(isp, username, started, updated=None, stopped=None, customer=None, nas='10.0.0.1'):
+    row = RadAcct(radacctid=next(_next_id), acctsessionid=username,
+                  acctuniqueid=f'{username}-{started:%H%M}', username=username, nasipaddress=nas, acctstarttime=started,
+                  acctupdatetime=updated, acctstoptime=stopped, isp_id=isp.id,
+                  customer_id=customer.id if customer else None)
+    db.session.add(row)
+    return row
+
+
+def _plan(query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return ' '.join(row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+
+
+def test_online_is_open_and_recently_heard_from(app):
+    isp, other = _isp('alpha'), _isp('beta')
+    alice = Customer(full_name='Alice', phone='0700', package='Basic', radius_login='alice', isp_id=isp.id)
+    db.session.add(alice)
+    db.session.flush()
+    live = _session(isp, 'alice', NOW - timedelta(hours=2), updated=NOW - timedelta(minutes=4),
+                    customer=alice)
+    _session(isp, 'fresh', NOW - timedelta(minutes=1), nas='10.0.0.2')  # before its first interim
+    _session(isp, 'ghost', NOW - timedelta(days=3), updated=NOW - timedelta(hours=1))
+    for n in range(20):
+        _session(isp, f'old{n}', NOW - timedelta(days=n + 1), updated=NOW - timedelta(days=n),
+                 stopped=NOW - timedelta(days=n), customer=alice)
+    _session(other, 'bob', NOW - timedelta(minutes=30), updated=NOW - timedelta(minutes=2))
+    db.session.commit()
+
+    online = session_tracking.online_sessions_query(isp.id, now=NOW)
+    assert sorted(r.username for r in online) == ['alice', 'fresh']
+    assert 'ix_radacct_open_isp_nas' in _plan(online)
+    assert session_tracking.online_customer_ids(isp.id, now=NOW) == {alice.id}
+
+    # Accounting-Stop: the row leaves the registry with no other bookkeeping.
+    live.acctstoptime = NOW
+    db.session.commit()
+    assert session_tracking.online_customer_ids(isp.id, now=NOW) == set()
+    assert session_tracking.close_stale_sessions(now=NOW) == 1  # the ghost
+
+
+def test_linking_reads_only_unattributed_rows(app):
+    isp = _isp('alpha')
+    _session(isp, 'carol', NOW - timedelta(hours=1), updated=NOW)
+    db.session.commit()
+    pending = RadAcct.query.filter(RadAcct.customer_id.is_(None), RadAcct.username.isnot(None))
+    assert 'ix_radacct_unattributed' in _plan(pending)
+
+    carol = Customer(full_name='Carol', phone='0701', package='Basic', radius_login='carol',
+                     isp_id=isp.id)
+    db.session.add(carol)
+    db.session.commit()
+    assert session_tracking.link_unattributed_sessions() == 1
+    assert session_tracking.online_customer_ids(isp.id, now=NOW) == {carol.id}
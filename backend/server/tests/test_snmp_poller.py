@@ -0,0 +1,141 @@
+"""Tests for scheduled SNMP polling against a fake agent.
+
+A poll must read every scalar in one GET and walk ifTable in GETBULK pages,
+store all samples of a sweep, and only poll a device again once its own
+interval has passed — with a dead device costing only its own row.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import socket
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+pytest.importorskip('pysnmp')
+
+from pysnmp.proto import rfc1902  # noqa: E402
+
+from extensions import db  # noqa: E402
+from fake_snmp import FakeSnmpAgent, if_table  # noqa: E402
+from models import SnmpDevice, SnmpPollResult  # noqa: E402
+from services import snmp_poller  # noqa: E402
+
+
+def _mib(name, interfaces):
+    mib = {
+        '1.3.6.1.2.1.1.1.0': rfc1902.OctetString('RouterOS CCR2004'),
+        '1.3.6.1.2.1.1.3.0': rfc1902.TimeTicks(123456),
+        '1.3.6.1.2.1.1.5.0': rfc1902.OctetString(name),
+        # Past the end of ifTable, so the walk has to stop on its own.
+        '1.3.6.1.2.1.4.1.0': rfc1902.Integer(1),
+    }
+    mib.update(if_table([(n, f'ether{n}', n * 1000, n * 2000) for n in range(1, interfaces + 1)]))
+    return mib
+
+
+def _closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def agents():
+    started = [FakeSnmpAgent(_mib('core', 60)).start(), FakeSnmpAgent(_mib('edge', 4)).start()]
+    yield started
+    for agent in started:
+        agent.stop()
+
+
+def _device(name, port, version='2c', interval=300, **extra):
+    device = SnmpDevice(name=name, host='127.0.0.1', port=port, snmp_version=version,
+                        community='public', timeout=1, retries=0, poll_interval=interval, **extra)
+    db.session.add(device)
+    db.session.commit()
+    return device
+
+
+def test_sweep_batches_requests_and_stores_every_sample(app, agents):
+    core, edge = agents
+    _device('core', core.port)
+    _device('edge', edge.port, version='1', interval=60)
+    _device('dead', _closed_port())
+    _device('off', core.port, is_active=False)
+    now = datetime(2026, 10, 17, 12, 0)
+
+    result = snmp_poller.poll_due_devices(now=now, workers=4)
+    assert result == {'polled': 3, 'failed': 1, 'samples': (3 + 60 * 6) + (3 + 4 * 6) + 1}
+
+    # One GET for the three scalars; 60 rows at 25 per GETBULK. SNMPv1 has no
+    # GETBULK, so the edge walks row by row (one extra GETNEXT hits the end).
+    assert dict(core.requests) == {'get': 1, 'getbulk': 3}
+    assert dict(edge.requests) == {'get': 1, 'getnext': 5}
+
+    by_name = {d.name: d for d in SnmpDevice.query}
+    in_octets = SnmpPollResult.query.filter_by(
+        snmp_device_id=by_name['core'].id, oid='1.3.6.1.2.1.2.2.1.10.42').one()
+    assert (in_octets.value, in_octets.data_type, in_octets.poll_time) == ('42000', 'Counter32', now)
+    failure = SnmpPollResult.query.filter_by(snmp_device_id=by_name['dead'].id).one()
+    assert failure.status == 'timeout' and failure.value is None
+
+    assert by_name['core'].last_poll == now and by_name['dead'].last_poll is None
+    assert by_name['edge'].next_poll_at == now + timedelta(seconds=60)
+    assert by_name['dead'].next_poll_at == now + timedelta(seconds=300)
+    assert by_name['off'].next_poll_at is None
+
+
+def test_devices_are_polled_again_only_when_due(app, agents):
+    core, edge = agents
+    _device('core', core.port, interval=300)
+    _device('edge', edge.port, interval=60)
+    now = datetime(2026, 10, 17, 12, 0)
+    snmp_poller.poll_due_devices(now=now)
+
+    assert snmp_poller.poll_due_devices(now=now + timedelta(seconds=30))['polled'] == 0
+    result = snmp_poller.poll_due_devices(now=now + timedelta(seconds=61))
+    assert result['polled'] == 1
+    assert core.requests['get'] == 1 and edge.requests['get'] == 2
+
+
+def test_engines_are_reused_across_sweeps(app, agents, monkeypatch):
+    built = []
+
+    class CountingEngine(snmp_poller.SnmpEngine):
+        def __init__(self, *args, **kwargs):
+            built.append(1)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(snmp_poller, 'SnmpEngine', CountingEngine)
+    monkeypatch.setattr(snmp_poller, '_pool', None)
+    monkeypatch.setattr(snmp_poller, '_pool_key', None)
+    core, edge = agents
+    _device('core', core.port, interval=60)
+    _device('edge', edge.port, interval=60)
+    now = datetime(2026, 10, 17, 12, 0)
+
+    snmp_poller.poll_due_devices(now=now, workers=2)
+    first = len(built)
+    assert 1 <= first <= 2
+    assert snmp_poller.poll_due_devices(now=now + timedelta(seconds=61), workers=2)['polled'] == 2
+    assert len(built) == first
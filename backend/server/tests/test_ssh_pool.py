@@ -0,0 +1,166 @@
+"""Tests for the pooled MikroTik SSH sessions.
+
+The point of the pool is that back-to-back operations on a router share one
+login; the risks are reusing a session that is dead, belongs to other
+credentials, or was left mid-command by a caller that raised.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import device_config_ops, ssh_pool  # noqa: E402
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def is_authenticated(self):
+        return True
+
+    def set_keepalive(self, _seconds):
+        pass
+
+
+class FakeClient:
+    logins = []
+
+    def __init__(self, config):
+        self.config = config
+        self.ssh_client = None
+        self.closed = False
+
+    def connect(self):
+        FakeClient.logins.append(self.config.host)
+        transport = FakeTransport()
+        self.ssh_client = SimpleNamespace(get_transport=lambda: transport)
+        return True
+
+    def disconnect(self):
+        self.closed = True
+
+    def run_cli(self, command):
+        return 'ok\n', ''
+
+
+@pytest.fixture(autouse=True)
+def fake_ssh(monkeypatch, tmp_path):
+    monkeypatch.setattr(ssh_pool, 'MikroTikClient', FakeClient)
+    monkeypatch.setattr(ssh_pool, '_ensure_reaper', lambda *a: None)
+    monkeypatch.setattr(device_config_ops, '_LOCK_DIR', str(tmp_path))
+    FakeClient.logins = []
+    ssh_pool.get_pool().clear()
+    yield
+    ssh_pool.get_pool().clear()
+
+
+def _device(device_id=1, host='10.0.0.1', password='x'):
+    return SimpleNamespace(id=device_id, device_ip=host, ssh_port=22, username='admin',
+                           password=password, management_wg_enabled=False,
+                           management_wg_ip=None)
+
+
+def test_consecutive_operations_share_one_login():
+    device = _device()
+    with device_config_ops.mikrotik_ssh(device) as first:
+        pass
+    with device_config_ops.mikrotik_ssh(device) as second:
+        pass
+
+    assert second is first
+    assert FakeClient.logins == ['10.0.0.1']
+
+
+def test_a_raising_operation_closes_its_session():
+    device = _device()
+    with pytest.raises(RuntimeError):
+        with device_config_ops.mikrotik_ssh(device) as client:
+            raise RuntimeError('half-read channel')
+
+    assert client.closed
+    with device_config_ops.mikrotik_ssh(device):
+        pass
+    assert len(FakeClient.logins) == 2
+
+
+def test_dead_or_foreign_sessions_are_not_reused():
+    with device_config_ops.mikrotik_ssh(_device()) as client:
+        pass
+    with device_config_ops.mikrotik_ssh(_device(password='rotated')):
+        pass
+    assert len(FakeClient.logins) == 2
+
+    client.ssh_client.get_transport().active = False
+    with device_config_ops.mikrotik_ssh(_device()) as fresh:
+        pass
+    assert fresh is not client and len(FakeClient.logins) == 3
+
+
+def test_idle_and_lifetime_limits_close_sessions(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(ssh_pool.time, 'monotonic', lambda: clock[0])
+    device = _device()
+
+    with device_config_ops.mikrotik_ssh(device):
+        pass
+    clock[0] += ssh_pool._DEFAULT_IDLE_SECONDS + 1
+    with device_config_ops.mikrotik_ssh(device):
+        pass
+    assert len(FakeClient.logins) == 2
+
+    clock[0] += ssh_pool._DEFAULT_IDLE_SECONDS + 1
+    assert ssh_pool.get_pool().prune(ssh_pool._DEFAULT_IDLE_SECONDS,
+                                     ssh_pool._DEFAULT_MAX_LIFETIME_SECONDS) == 1
+    assert len(ssh_pool.get_pool()) == 0
+
+
+def test_reboot_forgets_the_session():
+    device = _device()
+    with device_config_ops.mikrotik_ssh(device):
+        pass
+
+    device_config_ops.reboot_device(device)
+
+    assert len(ssh_pool.get_pool()) == 0
+
+
+def test_a_failed_kick_command_closes_the_session(monkeypatch):
+    from services import hotspot_disconnect
+
+    def run_cli(self, command):
+        if command.startswith('/ip hotspot'):
+            raise OSError('no such menu')  # router without the hotspot package
+        self.ran = getattr(self, 'ran', []) + [command]
+        return '', ''
+
+    monkeypatch.setattr(FakeClient, 'run_cli', run_cli)
+    seen = []
+    monkeypatch.setattr(hotspot_disconnect, 'release_client',
+                        lambda client, ok=True: seen.append((client, ok)))
+
+    assert hotspot_disconnect.disconnect_username_on_device('alice', _device()) is True
+    [(client, ok)] = seen
+    assert ok is False
+    assert client.ran == ['/ppp active remove [find name="alice"]']
+
+
+def test_reuse_takes_the_callers_timeout_and_evict_survives_a_fork(monkeypatch):
+    device = _device()
+    with ssh_pool.pooled_client(device_config_ops._ssh_config(device, timeout=6)) as first:
+        pass
+    with ssh_pool.pooled_client(device_config_ops._ssh_config(device, timeout=30)) as second:
+        assert second is first and second.config.timeout == 30
+
+    pool = ssh_pool.get_pool()
+    monkeypatch.setattr(pool, '_pid', -1)  # as if inherited across a fork
+    assert pool.evict_host('10.0.0.1') == 0
+    assert not first.closed  # the parent's socket is left alone
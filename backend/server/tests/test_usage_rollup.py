@@ -0,0 +1,152 @@
+"""Tests for the daily usage rollup behind the FUP monitor.
+
+The rollup replaces a full-period radacct SUM, so the one property that matters
+is that it never disagrees with that SUM: not after an interim update grows a
+session in place, not after a refresh runs twice, and not after an
+unattributed session is linked to its subscriber.
+
+Run: backend/.venv/bin/python -m pytest backend/server/tests -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extensions import db  # noqa: E402
+from models import Customer, ISP, RadAcct, UsageRollupDaily  # noqa: E402
+from services import usage_rollup as rollup  # noqa: E402
+from services.fup_monitoring import _raw_usage_maps, fup_period_start  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 12, 0, 0)
+
+
+@pytest.fixture()
+def app():
+    application = Flask(__name__)
+    application.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        TESTING=True,
+    )
+    db.init_app(application)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def isp(app):
+    isp = ISP(name='Acme', company_name='Acme', email='acme@example.com',
+              slug='acme', api_key='key_acme')
+    db.session.add(isp)
+    db.session.commit()
+    return isp
+
+
+_next_id = iter(range(1, 10_000))
+
+
+def _session(isp, username, started, octets, customer_id=None, updated=None):
+    row = RadAcct(
+        radacctid=next(_next_id), acctsessionid=f's{started:%H%M%S}', acctuniqueid='u',
+        username=username, nasipaddress='10.0.0.1', acctstarttime=started,
+        acctupdatetime=updated, acctinputoctets=octets, acctoutputoctets=octets // 2,
+        isp_id=isp.id, customer_id=customer_id,
+    )
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+def _assert_agrees(period_start, isp_id=None):
+    assert rollup.usage_maps(period_start, isp_id) == _raw_usage_maps(period_start, isp_id)
+    assert rollup.check_usage_rollup(period_start, isp_id)['mismatches'] == []
+
+
+def test_not_used_until_backfilled(isp):
+    """An empty rollup would read as zero usage for everyone — the FUP monitor
+    must fall back to radacct rather than un-throttle the whole tenant."""
+    _session(isp, 'alice', NOW - timedelta(hours=1), 1000)
+
+    assert rollup.usage_maps(fup_period_start('monthly', NOW)) is None
+    assert rollup.refresh_usage_rollup(now=NOW) is None
+
+
+def test_backfill_matches_the_raw_aggregation(isp):
+    _session(isp, 'alice', NOW - timedelta(days=3), 1000, customer_id=1)
+    _session(isp, 'alice', NOW - timedelta(hours=2), 500, customer_id=1)
+    _session(isp, 'Bob', NOW - timedelta(days=20), 7000)
+
+    rollup.backfill_usage_rollup(days=40, now=NOW)
+
+    for cycle in ('daily', 'weekly', 'monthly'):
+        _assert_agrees(fup_period_start(cycle, NOW))
+    _assert_agrees(fup_period_start('monthly', NOW), isp.id)
+
+
+def test_period_older_than_the_backfill_falls_back(isp):
+    rollup.backfill_usage_rollup(days=2, now=NOW)
+    assert rollup.usage_maps(NOW - timedelta(days=10)) is None
+
+
+def test_interim_update_is_picked_up_without_double_counting(isp):
+    row = _session(isp, 'alice', NOW - timedelta(hours=1), 1000, customer_id=1)
+    rollup.backfill_usage_rollup(days=40, now=NOW)
+
+    later = NOW + timedelta(minutes=5)
+    row.acctinputoctets = 4000
+    row.acctupdatetime = later
+    db.session.commit()
+
+    rollup.refresh_usage_rollup(now=later)
+    rollup.refresh_usage_rollup(now=later)  # overlapping re-run is harmless
+
+    by_id, _ = rollup.usage_maps(fup_period_start('daily', NOW))
+    assert by_id[1] == 4000 + 500
+    _assert_agrees(fup_period_start('daily', NOW))
+
+
+def test_new_sessions_past_the_high_water_mark(isp):
+    rollup.backfill_usage_rollup(days=40, now=NOW)
+    _session(isp, 'carol', NOW + timedelta(minutes=1), 300)
+
+    result = rollup.refresh_usage_rollup(now=NOW + timedelta(minutes=2))
+
+    assert result['buckets'] == 1
+    _assert_agrees(fup_period_start('daily', NOW))
+
+
+def test_linking_an_unattributed_session_moves_its_bucket(isp):
+    from services.session_tracking import link_unattributed_sessions
+
+    _session(isp, 'dave', NOW - timedelta(hours=1), 800)
+    rollup.backfill_usage_rollup(days=40, now=NOW)
+    customer = Customer(full_name='Dave', phone='0700', package='Basic',
+                        radius_login='dave', isp_id=isp.id)
+    db.session.add(customer)
+    db.session.commit()
+
+    assert link_unattributed_sessions() == 1
+
+    buckets = UsageRollupDaily.query.filter_by(username='dave').all()
+    assert [b.customer_id for b in buckets] == [customer.id]
+    _assert_agrees(fup_period_start('daily', NOW))
+
+
+def test_monitor_reads_never_refresh(isp, monkeypatch):
+    """A page load must not take the rollup's row lock or write; the
+    usage-rollup job and FUP enforcement keep it current."""
+    from services.fup_monitoring import get_fup_monitor_rows
+
+    rollup.backfill_usage_rollup(days=40, now=NOW)
+    monkeypatch.setattr(rollup, 'refresh_usage_rollup',
+                        lambda *args, **kwargs: pytest.fail('refreshed on read'))
+
+    rows, _summary = get_fup_monitor_rows(isp_id=isp.id)
+    assert rows == []
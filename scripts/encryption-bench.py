@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Time per-call cost of encrypting and decrypting stored secrets.
+
+Compares the previous construction — derive the key with SHA-256 and build a
+new Fernet on every call — with the cached cipher in services/encryption.py,
+one value at a time and through the bulk calls. ``--previous-keys`` adds
+rotation keys, which only cost anything when a value was written under one of
+them.
+
+    python scripts/encryption-bench.py
+    python scripts/encryption-bench.py --calls 50000 --previous-keys 2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'server'))
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+from services import encryption  # noqa: E402
+
+
+def _uncached_encrypt(plaintext):
+    return Fernet(encryption._fernet_key()).encrypt(str(plaintext).encode()).decode()
+
+
+def _uncached_decrypt(ciphertext):
+    return Fernet(encryption._fernet_key()).decrypt(ciphertext.encode()).decode()
+
+
+def _timed(label, run, count):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f'{label:>24}: {elapsed / count * 1e6:8.2f} µs/value')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=20_000)
+    parser.add_argument('--previous-keys', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('ENCRYPTION_KEY', 'bench-key')
+    if args.previous_keys:
+        os.environ['ENCRYPTION_KEY_PREVIOUS'] = ','.join(
+            f'old-key-{n}' for n in range(args.previous_keys))
+    values = [f'password-{n}' for n in range(args.calls)]
+    tokens = encryption.encrypt_values(values)
+
+    print(f'{args.calls} values, {args.previous_keys} previous keys')
+    before = _timed('encrypt, new Fernet', lambda: [_uncached_encrypt(v) for v in values], args.calls)
+    after = _timed('encrypt, cached', lambda: [encryption.encrypt_value(v) for v in values], args.calls)
+    _timed('encrypt_values', lambda: encryption.encrypt_values(values), args.calls)
+    print(f'{"speed-up":>24}: {before / after:8.2f}x')
+
+    before = _timed('decrypt, new Fernet', lambda: [_uncached_decrypt(t) for t in tokens], args.calls)
+    after = _timed('decrypt, cached', lambda: [encryption.decrypt_value(t) for t in tokens], args.calls)
+    _timed('decrypt_values', lambda: encryption.decrypt_values(tokens), args.calls)
+    print(f'{"speed-up":>24}: {before / after:8.2f}x')
+
+    if encryption.decrypt_values(tokens) != values:
+        print('ROUND TRIP FAILED')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
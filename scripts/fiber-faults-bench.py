@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Time fiber fault localisation over a synthetic GPON plant.
+
+Builds a plant of ``--nodes`` nodes (50k by default), laid out as OLTs →
+cabinets → 1:8 splitters → 1:8 ODBs, each fed over a run of poles and joints,
+with ONTs hanging off the ODBs. About
+one ODB in forty has every ONT degraded, and a few cabinets have lost a
+feed, so there are suspects at several depths. ``localise_faults`` runs over
+the whole plant and the suspect count and wall time are printed.
+
+The per-node subtree scan it replaced is quadratic, so it is timed on a
+smaller plant (``--compare-nodes``, 5k by default) next to the current code
+on the same plant; both must agree.
+
+    python scripts/fiber-faults-bench.py
+    python scripts/fiber-faults-bench.py --nodes 200000 --compare-nodes 0
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'server'))
+
+from services import fiber_geo  # noqa: E402
+
+
+def _plant(size, seed):
+    rng = random.Random(seed)
+    nodes, onts = [], []
+
+    def add(kind, parent):
+        node = SimpleNamespace(id=len(nodes) + 1, kind=kind, name=f'{kind}-{len(nodes) + 1}',
+                               parent_id=parent.id if parent else None,
+                               latitude=None, longitude=None)
+        nodes.append(node)
+        return node
+
+    def _route(parent, poles):
+        # Aerial runs are daisy-chains of poles and joints: this is what
+        # makes real plants deep, and deep trees what made the scan slow.
+        for _ in range(poles):
+            parent = add(rng.choice(('pole', 'pole', 'joint')), parent)
+        return parent
+
+    while len(nodes) < size:
+        olt = add('olt', None)
+        for _ in range(16):
+            cabinet = add('cabinet', olt)
+            dark_feed = rng.random() < 0.02
+            for _ in range(8):
+                splitter = add('splitter', _route(cabinet, rng.randint(4, 12)))
+                for _ in range(8):
+                    odb = add('odb', _route(splitter, rng.randint(1, 4)))
+                    dark = dark_feed or rng.random() < 0.025
+                    for _ in range(rng.randint(2, 8)):
+                        rx = rng.uniform(-29.5, -27.2) if dark else rng.choice(
+                            (rng.uniform(-24, -16), rng.uniform(-24, -16), -28.0, None))
+                        onts.append(SimpleNamespace(id=len(onts) + 1, fiber_node_id=odb.id,
+                                                    rx_power_dbm=rx))
+                    if len(nodes) >= size:
+                        return nodes, onts
+    return nodes, onts
+
+
+def _subtree_scan(nodes, cpe_devices, min_affected=2):
+    """The previous implementation: every node collects its own subtree."""
+    by_id, children = fiber_geo.build_index(nodes)
+    onts_by_node = defaultdict(list)
+    for cpe in cpe_devices:
+        if cpe.fiber_node_id:
+            onts_by_node[cpe.fiber_node_id].append(cpe)
+    suspects = []
+    for node in nodes:
+        subtree = [node] + fiber_geo.descendants(node.id, children)
+        onts = [c for nid in (n.id for n in subtree) for c in onts_by_node.get(nid, [])]
+        if len(onts) < min_affected:
+            continue
+        readings = [c.rx_power_dbm for c in onts if c.rx_power_dbm is not None]
+        if not readings:
+            continue
+        degraded = [r for r in readings if fiber_geo.optical_health(r) in ('marginal', 'critical')]
+        if len(degraded) < min_affected or len(degraded) / len(readings) < 0.8:
+            continue
+        suspects.append((node.id, len(degraded), len(fiber_geo.walk_upstream(node, by_id))))
+    return suspects
+
+
+def _timed(label, run, nodes, onts):
+    started = time.perf_counter()
+    result = run(nodes, onts)
+    elapsed = time.perf_counter() - started
+    print(f'{label:>14}: {elapsed:8.3f} s  {len(nodes) / elapsed:10.0f} nodes/s  '
+          f'({len(result)} suspects)')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=50_000)
+    parser.add_argument('--compare-nodes', type=int, default=5_000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    nodes, onts = _plant(args.nodes, args.seed)
+    print(f'plant: {len(nodes)} nodes, {len(onts)} ONTs')
+    suspects = _timed('bottom-up', fiber_geo.localise_faults, nodes, onts)
+    print(f'deepest suspect: {suspects[0]["node_kind"]} {suspects[0]["node_name"]}'
+          if suspects else 'no suspects')
+
+    if args.compare_nodes:
+        nodes, onts = _plant(args.compare_nodes, args.seed)
+        print(f'\nplant: {len(nodes)} nodes, {len(onts)} ONTs')
+        current = _timed('bottom-up', fiber_geo.localise_faults, nodes, onts)
+        previous = _timed('subtree scan', _subtree_scan, nodes, onts)
+        same = sorted((s['node_id'], s['affected'], s['depth']) for s in current) == sorted(previous)
+        print('results agree' if same else 'RESULTS DIFFER')
+        if not same:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
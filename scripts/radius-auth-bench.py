@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Replay an auth storm against the fallback RADIUS endpoint.
+
+Seeds a throwaway database with customers spread over a few routers, then
+fires thousands of Access-Requests at /api/radius-api/auth the way a router
+full of subscribers does after a power cut (every login several times, in
+random order), once with the auth caches off and once with them on. Prints
+requests/second and SELECTs per request for both.
+
+    python scripts/radius-auth-bench.py
+    python scripts/radius-auth-bench.py --customers 2000 --requests 20000
+    python scripts/radius-auth-bench.py --database postgresql://... # real planner
+
+Runs in-process through Flask's test client, so it measures the handler and
+its queries, not HTTP.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'server'))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from extensions import db  # noqa: E402
+from models import Customer, CustomerStatus, ISP, MikrotikDevice  # noqa: E402
+from routes.radius_api import radius_api_bp  # noqa: E402
+from services import radius_auth_cache  # noqa: E402
+from services.encryption import encrypt_value  # noqa: E402
+
+
+def _seed(customers, routers):
+    isp = ISP(name='bench', company_name='bench', email='bench@example.com',
+              slug='bench', api_key='key_bench')
+    db.session.add(isp)
+    db.session.flush()
+    db.session.add_all([
+        MikrotikDevice(username='admin', password='x', device_name=f'r{n}',
+                       device_ip=f'10.20.0.{n + 1}', device_model='hEX', location='bench',
+                       isp_id=isp.id, is_active=True)
+        for n in range(routers)
+    ])
+    token = encrypt_value('secret')
+    db.session.add_all([
+        Customer(full_name=f'User {n}', phone='0700000000', package='Home',
+                 radius_login=f'user{n}', isp_id=isp.id, status=CustomerStatus.ACTIVE,
+                 radius_password_encrypted=token)
+        for n in range(customers)
+    ])
+    db.session.commit()
+
+
+def _replay(app, requests, customers, routers, seed):
+    rng = random.Random(seed)
+    selects = [0]
+
+    def _count(_conn, _cursor, statement, *_args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', _count)
+    client = app.test_client()
+    failures = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        n = rng.randrange(customers)
+        response = client.post('/api/radius-api/auth', json={
+            'username': f'user{n}', 'password': 'secret',
+            'nas_ip': f'10.20.0.{n % routers + 1}',
+        })
+        failures += response.status_code != 200
+    elapsed = time.perf_counter() - started
+    event.remove(db.engine, 'before_cursor_execute', _count)
+    return elapsed, selects[0], failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--routers', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--database', help='SQLAlchemy URL (default: a temp sqlite file)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.database
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        url = f'sqlite:///{tmp.name}'
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    app.register_blueprint(radius_api_bp)
+    radius_auth_cache._STAMP_DIR = tempfile.mkdtemp()
+
+    try:
+        with app.app_context():
+            db.create_all()
+            _seed(args.customers, args.routers)
+            for label, ttl in (('uncached', 0), ('cached', 30)):
+                app.config['RADIUS_AUTH_CACHE_TTL_SECONDS'] = ttl
+                app.config['RADIUS_AUTH_PASSWORD_TTL_SECONDS'] = ttl
+                radius_auth_cache.clear_radius_auth_cache()
+                elapsed, selects, failures = _replay(
+                    app, args.requests, args.customers, args.routers, args.seed
+                )
+                print(f'{label:>9}: {args.requests / elapsed:8.0f} req/s  '
+                      f'{selects / args.requests:5.2f} SELECTs/req  '
+                      f'{failures} rejected')
+            db.drop_all()
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Parse a synthetic core-router ``/export`` with the router-scan parser.
+
+Writes an export with ``--records`` entries (50k by default) to a temp
+file, mostly ``/ppp secret`` lines wrapped with RouterOS's backslash
+continuations and quoted comments, plus queues, leases and menus the scan
+ignores. It is then parsed twice:
+
+* read into one string first, the way uploads used to arrive;
+* streamed from the open file, the way ``scan_from_export`` reads them now.
+
+For each, it prints the wall time and the peak traced memory. Records are
+kept either way, because the inventory needs the whole roster; the
+difference is whether the text is held as well.
+
+    python scripts/router-export-bench.py
+    python scripts/router-export-bench.py --records 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'server'))
+
+from services.router_scan.parser import export_to_sections  # noqa: E402
+
+
+def _write_export(handle, records, seed):
+    rng = random.Random(seed)
+    handle.write('# oct/17/2026 02:00:00 by RouterOS 7.16\n')
+    handle.write('/ppp profile\nset [ find default=yes ] name=default\n')
+    for mbps in (5, 10, 20, 50):
+        handle.write(f'add local-address=10.20.0.1 name=PPPOE-{mbps}M '
+                     f'rate-limit={mbps // 2}M/{mbps}M remote-address=pppoe-pool\n')
+    secrets = int(records * 0.8)
+    handle.write('/ppp secret\n')
+    for n in range(secrets):
+        handle.write(
+            f'add comment="Subscriber {n} 07{rng.randrange(10**8):08d} exp 15/11/2026" '
+            f'name=user{n} password=\\\n    "pw {rng.randrange(10**6)}" '
+            f'profile=PPPOE-{rng.choice((5, 10, 20, 50))}M \\\n'
+            f'    remote-address=10.{20 + n // 65000}.{n // 250 % 256}.{n % 250 + 2} service=pppoe\n'
+        )
+    handle.write('/queue simple\n')
+    queues = (records - secrets) // 2
+    for n in range(queues):
+        handle.write(f'add max-limit=10M/10M name="static {n}" target=172.16.{n // 250}.{n % 250}/32\n')
+    handle.write('/interface ethernet\n')
+    for n in range(records - secrets - queues):
+        handle.write(f'set [ find default-name=ether{n} ] comment="port {n}" l2mtu=1598\n')
+
+
+def _measure(parse):
+    tracemalloc.start()
+    started = time.perf_counter()
+    sections = parse()
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, sum(len(rows) for rows in sections.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--records', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.rsc', delete=False) as handle:
+        _write_export(handle, args.records, args.seed)
+        path = handle.name
+    try:
+        size = os.path.getsize(path)
+        print(f'export: {args.records} records, {size / 1e6:.1f} MB')
+
+        def _whole():
+            with open(path, 'rb') as source:
+                return export_to_sections(source.read().decode('utf-8-sig', errors='replace'))
+
+        def _streamed():
+            with open(path, 'rb') as source:
+                return export_to_sections(source)
+
+        for label, parse in (('whole text', _whole), ('streamed', _streamed)):
+            elapsed, peak, kept = _measure(parse)
+            print(f'{label:>10}: {elapsed:6.2f} s  {args.records / elapsed:9.0f} records/s  '
+                  f'peak {peak / 1e6:6.1f} MB  ({kept} records kept)')
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()